@@ -181,6 +181,15 @@ class Config:
         self.use_cgroups = True
         self.sandbox_implementation = 'isolate'
         self.store_exe_in_db = True
+        self.sandbox_pool_size = 4
+        self.hardlink_sandbox_files = False
+        # Max size of the file cache shared by the services of a machine,
+        # in MiB (0 means unbounded).
+        self.shared_cache_max_size_mib = 0
+        # Job groups a Worker accepts while executing another one.
+        self.worker_prefetch_depth = 1
+        # Whether ES skips the testcases that cannot change the score.
+        self.short_circuit_evaluation = False
 
         # Sandbox.
         # Max size of each writable file during an evaluation step, in KiB.
@@ -211,6 +220,8 @@ class Config:
         self.tests_local_copy_path = "%s/tests/"
         self.is_proxy_used = None  # (deprecated in favor of num_proxies_used)
         self.num_proxies_used = None
+        self.sendfile_header = None
+        self.sendfile_prefix = None
         self.max_submission_length = 100_000  # 100 KB
         self.max_input_length = 5_000_000  # 5 MB
         self.stl_path = "/usr/share/cppreference/doc/html/"
@@ -68,6 +68,8 @@ __all__ = [
     "UserTestExecutable",
     # printjob
     "PrintJob",
+    # scorecache
+    "ParticipationTaskScore",
     # init
     "init_db",
     # drop
@@ -81,7 +83,7 @@ __all__ = [
 
 # Instantiate or import these objects.
 
-version = 44
+version = 45
 
 engine = create_engine(config.database, echo=config.database_debug,
                        pool_timeout=60, pool_recycle=120)
@@ -104,6 +106,7 @@ from .submission import Submission, File, Token, SubmissionResult, \
 from .usertest import UserTest, UserTestFile, UserTestManager, \
     UserTestResult, UserTestExecutable
 from .printjob import PrintJob
+from .scorecache import ParticipationTaskScore
 
 from .init import init_db
 from .drop import drop_db
@@ -116,7 +119,7 @@ from .util import test_db_connection, get_contest_list, is_contest_id, \
 configure_mappers()
 
 
-# The following is a method of Dataset that cannot be put in the right
+# The following are methods of Dataset that cannot be put in the right
 # file because of circular dependencies.
 
 def get_submission_results_for_dataset(self, dataset):
@@ -143,3 +146,35 @@ def get_submission_results_for_dataset(self, dataset):
 
 
 Dataset.get_submission_results = get_submission_results_for_dataset
+
+
+def drop_skipped_evaluations_for_dataset(self):
+    """Delete the skipped evaluations of the submission results against
+    this dataset, so that their testcases are evaluated again.
+
+    A testcase is skipped because the score type, with its parameters,
+    said that its outcome cannot change the score: this has to be done
+    after a change to them. The submission results involved are marked
+    as not evaluated (and not scored), so that ES evaluates the
+    missing testcases at its next sweep.
+
+    return (int): the number of submission results involved.
+
+    """
+    submission_results = self.sa_session\
+        .query(SubmissionResult)\
+        .filter(SubmissionResult.dataset == self)\
+        .filter(SubmissionResult.evaluations.any(
+            Evaluation.outcome.is_(None)))\
+        .options(subqueryload(SubmissionResult.evaluations))\
+        .all()
+    for submission_result in submission_results:
+        submission_result.evaluations = [
+            evaluation for evaluation in submission_result.evaluations
+            if not evaluation.skipped()]
+        submission_result.invalidate_score()
+        submission_result.evaluation_outcome = None
+    return len(submission_results)
+
+
+Dataset.drop_skipped_evaluations = drop_skipped_evaluations_for_dataset
@@ -26,9 +26,13 @@
 """
 
 import atexit
+import contextlib
+import functools
 import io
 import logging
+import multiprocessing
 import os.path
+import re
 import tempfile
 import fcntl
 from abc import ABCMeta, abstractmethod
@@ -37,7 +41,7 @@ import gevent
 from sqlalchemy.exc import IntegrityError
 
 from cms import config, mkdir, rmtree
-from cms.db import SessionGen, Digest, FSObject, LargeObject
+from cms.db import SessionGen, Digest, FSObject, LargeObject, engine
 from cmscommon.digest import Digester
 
 
@@ -45,7 +49,7 @@ logger = logging.getLogger(__name__)
 
 
 def copyfileobj(source_fobj, destination_fobj,
-                buffer_size=io.DEFAULT_BUFFER_SIZE):
+                buffer_size=io.DEFAULT_BUFFER_SIZE, max_buffer_size=None):
     """Read all content from one file object and write it to another.
 
     Repeatedly read from the given source file object, until no content
@@ -53,22 +57,95 @@ def copyfileobj(source_fobj, destination_fobj,
     file object. Never read or write more than the given buffer size.
     Be cooperative with other greenlets by yielding often.
 
+    If a maximum buffer size is given, the buffer doubles after each
+    read that fills it, up to that size: short files are copied with
+    small reads, long ones with few large reads. This matters when
+    each read is a round trip, as for large objects.
+
+    Binary sources are read into a single buffer, which is written
+    without further copies.
+
     source_fobj (fileobj): a file object open for reading, in either
         binary or text mode (doesn't need to be buffered).
     destination_fobj (fileobj): a file object open for writing, in the
         same mode as the source (doesn't need to be buffered).
     buffer_size (int): the size of the read/write buffer.
+    max_buffer_size (int|None): the maximum size the buffer can grow
+        to, or None to keep it at buffer_size.
 
     """
+    if max_buffer_size is None:
+        max_buffer_size = buffer_size
+    readinto = getattr(source_fobj, "readinto", None)
+    buffer = bytearray(buffer_size) if readinto is not None else None
     while True:
-        buffer = source_fobj.read(buffer_size)
-        if len(buffer) == 0:
+        if readinto is not None:
+            read = readinto(buffer)
+            if read is None:
+                read = 0
+            data = memoryview(buffer)[:read]
+        else:
+            data = source_fobj.read(buffer_size)
+            read = len(data)
+        if read == 0:
             break
-        while len(buffer) > 0:
+        while len(data) > 0:
             gevent.sleep(0)
-            written = destination_fobj.write(buffer)
-            buffer = buffer[written:]
+            written = destination_fobj.write(data)
+            data = data[written:]
         gevent.sleep(0)
+        if read == buffer_size and buffer_size < max_buffer_size:
+            buffer_size = min(2 * buffer_size, max_buffer_size)
+            if buffer is not None:
+                buffer = bytearray(buffer_size)
+
+
+# The ioctl asking Linux to make a file share the data of another.
+FICLONE = getattr(fcntl, "FICLONE", 0x40049409)
+
+
+def clonefileobj(source_fobj, destination_fobj):
+    """Make a file have the same content of another, without copying it.
+
+    On filesystems supporting it (e.g., Btrfs and XFS), the destination
+    becomes a copy-on-write clone (a "reflink") of the source: the two
+    files share the data blocks until one of them is modified.
+
+    As with copyfileobj, both file objects are then positioned at the
+    end of the files.
+
+    source_fobj (fileobj): a file object open for reading, backed by a
+        file on the disk, at its beginning.
+    destination_fobj (fileobj): a file object open for writing, backed
+        by an empty file on the same filesystem as the source, at its
+        beginning.
+
+    return (bool): whether the destination is now a clone of the
+        source; if False, nothing was written, the positions are
+        unchanged and the caller needs to copy the content.
+
+    """
+    try:
+        source_fd = source_fobj.fileno()
+        destination_fd = destination_fobj.fileno()
+    except (AttributeError, OSError, ValueError):
+        # Not real files.
+        return False
+    try:
+        # A clone is the whole file: it matches a copy only from the
+        # beginning of the source to the beginning of the destination.
+        if source_fobj.tell() != 0 or destination_fobj.tell() != 0:
+            return False
+        destination_fobj.flush()
+        if os.fstat(destination_fd).st_size != 0:
+            return False
+        fcntl.ioctl(destination_fd, FICLONE, source_fd)
+    except OSError:
+        # Different filesystems, or no support for reflinks.
+        return False
+    source_fobj.seek(0, os.SEEK_END)
+    destination_fobj.seek(0, os.SEEK_END)
+    return True
 
 
 class TombstoneError(RuntimeError):
@@ -79,6 +156,36 @@ class TombstoneError(RuntimeError):
     pass
 
 
+def _compute_digest(backend, chunk_size, max_chunk_size, digest):
+    """Compute the digest of the content of a file in a backend.
+
+    This is a function, rather than a method of FileCacher, to be run
+    in the processes of the pool of check_backend_integrity.
+
+    backend (FileCacherBackend): the backend storing the file.
+    chunk_size (int): the size of the first read of the file.
+    max_chunk_size (int): the maximum size of the following reads,
+        as in copyfileobj.
+    digest (unicode): the digest of the file, as recorded in the
+        backend.
+
+    return ((unicode, unicode|None)): the recorded digest and the one
+        of the content (None if the file cannot be found anymore).
+
+    """
+    d = Digester()
+    try:
+        with backend.get_file(digest) as fobj:
+            buf = fobj.read(chunk_size)
+            while len(buf) > 0:
+                d.update(buf)
+                chunk_size = min(2 * chunk_size, max_chunk_size)
+                buf = fobj.read(chunk_size)
+    except KeyError:
+        return digest, None
+    return digest, d.digest()
+
+
 class FileCacherBackend(metaclass=ABCMeta):
     """Abstract base class for all FileCacher backends.
 
@@ -181,6 +288,23 @@ class FileCacherBackend(metaclass=ABCMeta):
         """
         pass
 
+    def existing(self, digests):
+        """Return which of the given files are available in the storage.
+
+        digests ([unicode]): the digests of the files to look for.
+
+        return ({unicode}): the digests of those that are available.
+
+        """
+        result = set()
+        for digest in digests:
+            try:
+                self.describe(digest)
+            except KeyError:
+                continue
+            result.add(digest)
+        return result
+
 
 class FSBackend(FileCacherBackend):
     """This class implements a backend for FileCacher that keeps all
@@ -188,15 +312,21 @@ class FSBackend(FileCacherBackend):
     course this directory can be shared, for example with NFS, acting
     as an actual remote file storage.
 
+    To keep the directories small, each file is in a subdirectory
+    named after the first characters of its digest (e.g.,
+    'ROOT/ab/abcdef...'). Storages created before that keep their
+    files directly in the root (e.g., 'ROOT/abcdef...'): these files
+    are still found, and migrate() moves them to their subdirectory.
+
     TODO: Actually store the descriptions, that get discarded at the
     moment.
 
-    TODO: Use an additional level of directories, to alleviate the
-    work of the file system driver (e.g., 'ROOT/a/abcdef...' instead
-    of 'ROOT/abcdef...'.
-
     """
 
+    # Number of characters of the digest naming the subdirectory of a
+    # file.
+    SHARD_LENGTH = 2
+
     def __init__(self, path):
         """Initialize the backend.
 
@@ -211,13 +341,44 @@ class FSBackend(FileCacherBackend):
         except OSError:
             pass
 
+    def _path(self, digest):
+        """Return the path where a file is to be stored.
+
+        digest (unicode): the digest of the file.
+
+        return (string): the path of the file in its subdirectory.
+
+        """
+        return os.path.join(self.path, digest[:FSBackend.SHARD_LENGTH],
+                            digest)
+
+    def _find(self, digest):
+        """Return the path where a file is stored.
+
+        digest (unicode): the digest of the file.
+
+        return (string|None): the path of the file, in its subdirectory
+            or, if not migrated yet, in the root; None if not stored.
+
+        """
+        file_path = self._path(digest)
+        if os.path.exists(file_path):
+            return file_path
+        flat_path = os.path.join(self.path, digest)
+        if os.path.exists(flat_path):
+            return flat_path
+        # It might have been migrated between the two checks.
+        if os.path.exists(file_path):
+            return file_path
+        return None
+
     def get_file(self, digest):
         """See FileCacherBackend.get_file().
 
         """
-        file_path = os.path.join(self.path, digest)
+        file_path = self._find(digest)
 
-        if not os.path.exists(file_path):
+        if file_path is None:
             raise KeyError("File not found.")
 
         return open(file_path, 'rb')
@@ -228,9 +389,7 @@ class FSBackend(FileCacherBackend):
         """
         # Check if the file already exists. Return None if so, to inform the
         # caller they don't need to store the file.
-        file_path = os.path.join(self.path, digest)
-
-        if os.path.exists(file_path):
+        if self._find(digest) is not None:
             return None
 
         # Create a temporary file in the same directory
@@ -246,14 +405,15 @@ class FSBackend(FileCacherBackend):
         """
         fobj.close()
 
-        file_path = os.path.join(self.path, digest)
+        file_path = self._path(digest)
         # Move it into place in the cache. Skip if it already exists, and
         # delete the temporary file instead.
-        if not os.path.exists(file_path):
+        if self._find(digest) is None:
             # There is a race condition here if someone else puts the file here
             # between checking and renaming. Put it doesn't matter in practice,
             # because rename will replace the file anyway (which should be
             # identical).
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
             os.rename(fobj.name, file_path)
             return True
         else:
@@ -264,9 +424,7 @@ class FSBackend(FileCacherBackend):
         """See FileCacherBackend.describe().
 
         """
-        file_path = os.path.join(self.path, digest)
-
-        if not os.path.exists(file_path):
+        if self._find(digest) is None:
             raise KeyError("File not found.")
 
         return ""
@@ -275,9 +433,9 @@ class FSBackend(FileCacherBackend):
         """See FileCacherBackend.get_size().
 
         """
-        file_path = os.path.join(self.path, digest)
+        file_path = self._find(digest)
 
-        if not os.path.exists(file_path):
+        if file_path is None:
             raise KeyError("File not found.")
 
         return os.stat(file_path).st_size
@@ -286,18 +444,65 @@ class FSBackend(FileCacherBackend):
         """See FileCacherBackend.delete().
 
         """
-        file_path = os.path.join(self.path, digest)
-
-        try:
-            os.unlink(file_path)
-        except OSError:
-            pass
+        for file_path in [self._path(digest),
+                          os.path.join(self.path, digest)]:
+            try:
+                os.unlink(file_path)
+            except OSError:
+                pass
 
     def list(self):
         """See FileCacherBackend.list().
 
         """
-        return list((x, "") for x in os.listdir(self.path))
+        result = []
+        with os.scandir(self.path) as entries:
+            for entry in entries:
+                # Skip the temporary files.
+                if entry.name.startswith("."):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    result.extend((x, "") for x in os.listdir(entry.path))
+                else:
+                    result.append((entry.name, ""))
+        return result
+
+    def migrate(self):
+        """Move the files stored in the root to their subdirectory.
+
+        The storage can be used while the files are moved, and the
+        migration can be interrupted and run again.
+
+        return (int): the number of files moved.
+
+        """
+        count = 0
+        with os.scandir(self.path) as entries:
+            for entry in entries:
+                if entry.name.startswith(".") \
+                        or entry.is_dir(follow_symlinks=False):
+                    continue
+                file_path = self._path(entry.name)
+                os.makedirs(os.path.dirname(file_path), exist_ok=True)
+                target = os.readlink(entry.path) \
+                    if entry.is_symlink() else None
+                if target is not None and not os.path.isabs(target):
+                    # Relative links (as made by setup_fs_storage.sh)
+                    # need a new target, relative to the subdirectory.
+                    target = os.path.relpath(
+                        os.path.join(self.path, target),
+                        os.path.dirname(file_path))
+                    temp_path = os.path.join(self.path,
+                                             ".tmp.link." + entry.name)
+                    os.symlink(target, temp_path)
+                    os.rename(temp_path, file_path)
+                    os.unlink(entry.path)
+                else:
+                    os.rename(entry.path, file_path)
+                count += 1
+                if count % 10000 == 0:
+                    logger.info("%d files moved.", count)
+        return count
 
 
 class DBBackend(FileCacherBackend):
@@ -317,7 +522,9 @@ class DBBackend(FileCacherBackend):
             if fso is None:
                 raise KeyError("File not found.")
 
-            return fso.get_lobject(mode='rb')
+            # The transfers use large reads, better done without
+            # another layer of buffering.
+            return LargeObject(fso.loid, mode='rb')
 
     def create_file(self, digest):
         """See FileCacherBackend.create_file().
@@ -338,7 +545,7 @@ class DBBackend(FileCacherBackend):
             else:
                 # Create the large object first. This should be populated
                 # and committed before putting it into the FSObjects table.
-                return LargeObject(0, mode='wb').buffered()
+                return LargeObject(0, mode='wb')
 
     def commit_file(self, fobj, digest, desc=""):
         """See FileCacherBackend.commit_file().
@@ -349,7 +556,7 @@ class DBBackend(FileCacherBackend):
             with SessionGen() as session:
                 fso = FSObject(description=desc)
                 fso.digest = digest
-                fso.loid = fobj.raw.loid
+                fso.loid = fobj.loid
 
                 session.add(fso)
 
@@ -432,6 +639,14 @@ class DBBackend(FileCacherBackend):
             with SessionGen() as session:
                 return _list(session)
 
+    def existing(self, digests):
+        """See FileCacherBackend.existing().
+
+        """
+        with SessionGen() as session:
+            return set(digest for digest, in session.query(FSObject.digest)
+                       .filter(FSObject.digest.in_(digests)))
+
 
 class NullBackend(FileCacherBackend):
     """This backend is always empty, it just drops each file that
@@ -483,6 +698,25 @@ class FileCacher:
     # CHUNK_SIZE should be a multiple of these values.
     CHUNK_SIZE = 16 * 1024  # 16 KiB
 
+    # Copies between the backend and the file-system start with chunks
+    # of BACKEND_CHUNK_SIZE, which double up to MAX_BACKEND_CHUNK_SIZE:
+    # for the database backend each chunk is a round trip, so most
+    # files need one, and large ones few of them.
+    BACKEND_CHUNK_SIZE = 1024 * 1024  # 1 MiB
+    MAX_BACKEND_CHUNK_SIZE = 32 * 1024 * 1024  # 32 MiB
+
+    # When the shared cache exceeds its maximum size, the eviction
+    # brings it down to this fraction of it, so that it doesn't have to
+    # run again at the next file.
+    EVICTION_TARGET = 0.9
+
+    # How many times get_cached_path loads a file that gets evicted
+    # before giving up on serving it from the cache.
+    CACHED_PATH_ATTEMPTS = 3
+
+    # Names of the files in the cache directory that are cached files.
+    _CACHED_FILE_RE = re.compile("[0-9a-f]+")
+
     def __init__(self, service=None, path=None, null=False):
         """Initialize.
 
@@ -532,6 +766,20 @@ class FileCacher:
         # Just to make sure it was created.
         self._create_directory_or_die(self.file_dir)
 
+        # Only the shared cache is bounded: the others are used by a
+        # single, short-lived, process.
+        self.max_size = 0
+        if self.is_shared():
+            self.max_size = config.shared_cache_max_size_mib * 1024 * 1024
+        # Size of the cache as of the last eviction, plus the files added
+        # by this process since then (or None if never computed).
+        self._size = None
+        # If the last eviction could not bring the cache within its
+        # maximum size, the size it must reach before trying again.
+        self._evict_again_at = None
+        self.stats = {"hits": 0, "misses": 0,
+                      "evictions": 0, "evicted_bytes": 0}
+
     def is_shared(self):
         """Return whether the cache directory is shared with other services."""
         return self.service is not None
@@ -559,7 +807,18 @@ class FileCacher:
             None if the cache was already locked.
 
         """
-        lock_file = os.path.join(self.file_dir, "cache_lock")
+        return self._try_lock("cache_lock")
+
+    def _try_lock(self, name):
+        """Take an exclusive lock on the cache if nobody is holding it.
+
+        name (str): the name of the lock, there is one lock for each.
+
+        return (fileobj|None): The lock file if the lock was free. Closing
+            the file object will release the lock. None otherwise.
+
+        """
+        lock_file = os.path.join(self.file_dir, name)
         fobj = open(lock_file, 'w')
         returned = False
         try:
@@ -590,28 +849,210 @@ class FileCacher:
 
         if cache_only:
             if os.path.exists(cache_file_path):
+                self._hit(cache_file_path)
                 return
         else:
             try:
-                return open(cache_file_path, 'rb')
+                fobj = open(cache_file_path, 'rb')
             except FileNotFoundError:
                 pass
+            else:
+                self._hit(cache_file_path)
+                return fobj
 
         logger.debug("File %s not in cache, downloading "
                      "from database.", digest)
+        self.stats["misses"] += 1
 
+        fobj = None
         with tempfile.NamedTemporaryFile(dir=self.temp_dir, delete=False) as ftmp:
-            with self.backend.get_file(digest) as fobj:
-                copyfileobj(fobj, ftmp, self.CHUNK_SIZE)
+            with self.backend.get_file(digest) as src:
+                copyfileobj(src, ftmp, self.BACKEND_CHUNK_SIZE,
+                            self.MAX_BACKEND_CHUNK_SIZE)
+            size = ftmp.tell()
+
+            # Open it before moving it, as it could be evicted as soon as
+            # it is in the cache.
+            if not cache_only:
+                fobj = open(ftmp.name, 'rb')
 
             # Then move it to its real location (this operation is atomic
             # by POSIX requirement)
             os.rename(ftmp.name, cache_file_path)
 
         logger.debug("File %s downloaded.", digest)
+        self._added(size)
+
+        return fobj
+
+    def _hit(self, cache_file_path):
+        """Record the use of a file that was in the cache.
+
+        cache_file_path (str): the path of the file in the cache.
+
+        """
+        self.stats["hits"] += 1
+        if self.max_size > 0:
+            # The modification time of the cached files (which are never
+            # modified) tells how recently they were used.
+            try:
+                os.utime(cache_file_path)
+            except OSError:
+                pass
+
+    def _added(self, size):
+        """Record the addition of a file to the cache, and evict the
+        least recently used files if the cache became too big.
+
+        size (int): the size of the file added, in bytes.
+
+        """
+        if self.max_size == 0:
+            return
+        if self._size is not None:
+            self._size += size
+            if self._size <= self.max_size:
+                return
+            # Evicting again would find the same pinned or unstored
+            # files, so wait until enough new ones have been added.
+            if self._evict_again_at is not None \
+                    and self._size < self._evict_again_at:
+                return
+        self.evict_cache()
+
+    def pin(self, digests):
+        """Protect some files from eviction from the cache.
+
+        Each process has its own set of pinned files, which replaces
+        those it pinned before; the files pinned by any running process
+        using the same cache are protected.
+
+        digests ([unicode]): the digests of the files to pin.
+
+        """
+        with tempfile.NamedTemporaryFile('wt', encoding="utf-8",
+                                         dir=self.temp_dir,
+                                         delete=False) as f:
+            for digest in sorted(digests):
+                f.write("%s\n" % digest)
+        os.rename(f.name,
+                  os.path.join(self.file_dir, "pinned.%d" % os.getpid()))
+        # The files unpinned may now be evicted.
+        self._evict_again_at = None
+
+    def _get_pinned(self):
+        """Return the digests of the pinned files.
+
+        The files pinned by processes that are not running anymore are
+        removed.
+
+        return ({unicode}): the digests set by the last call to pin of
+            each running process.
+
+        """
+        pinned = set()
+        for entry in os.scandir(self.file_dir):
+            prefix, _, pid = entry.name.partition(".")
+            if prefix != "pinned" or not pid.isdigit():
+                continue
+            try:
+                os.kill(int(pid), 0)
+            except ProcessLookupError:
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+                continue
+            except PermissionError:
+                # Running, but owned by another user.
+                pass
+            try:
+                with open(entry.path, "rt", encoding="utf-8") as f:
+                    pinned.update(line.strip() for line in f)
+            except FileNotFoundError:
+                pass
+        return pinned
+
+    def evict_cache(self):
+        """Delete from the cache the least recently used files, until its
+        size is within the limit.
+
+        Only files that are not pinned and that can be retrieved again
+        from the backend are deleted. If another process is already
+        evicting files from the same cache, do nothing.
+
+        """
+        lock = self._try_lock("evict_lock")
+        if lock is None:
+            return
+        with lock:
+            files = []
+            size = 0
+            for entry in os.scandir(self.file_dir):
+                if self._CACHED_FILE_RE.fullmatch(entry.name) is None \
+                        or not entry.is_file(follow_symlinks=False):
+                    continue
+                try:
+                    st = entry.stat(follow_symlinks=False)
+                except FileNotFoundError:
+                    continue
+                files.append((st.st_mtime, st.st_size, entry.name))
+                size += st.st_size
+            self._size = size
+            if size <= self.max_size:
+                self._evict_again_at = None
+                return
+
+            target = self.max_size * self.EVICTION_TARGET
+            pinned = self._get_pinned()
+            candidates = [(file_size, digest)
+                          for _, file_size, digest in sorted(files)
+                          if digest not in pinned]
+            # Ask the backend in batches, as usually only the oldest
+            # files are needed.
+            batch_size = 1000
+            for i in range(0, len(candidates), batch_size):
+                if size <= target:
+                    break
+                batch = candidates[i:i + batch_size]
+                existing = self.backend.existing(
+                    [digest for _, digest in batch])
+                for file_size, digest in batch:
+                    if size <= target:
+                        break
+                    if digest not in existing:
+                        continue
+                    self.drop(digest)
+                    size -= file_size
+                    self.stats["evictions"] += 1
+                    self.stats["evicted_bytes"] += file_size
+            self._size = size
+
+        if size > self.max_size:
+            self._evict_again_at = \
+                size + self.max_size * (1 - self.EVICTION_TARGET)
+            logger.warning("The cache is still %d bytes over its maximum "
+                           "size, as the other files are pinned or not "
+                           "stored elsewhere.", size - self.max_size)
+        else:
+            self._evict_again_at = None
+            logger.info("Evicted files from the cache, which now uses %d "
+                        "bytes; statistics: %s.", size, self.stats)
+
+    def get_cache_stats(self):
+        """Return statistics about the use of the cache by this process.
 
-        if not cache_only:
-            return open(cache_file_path, 'rb')
+        return ({str: int|None}): the number of files found in the cache
+            ("hits") and downloaded ("misses"), the number of files and
+            of bytes evicted ("evictions" and "evicted_bytes"), the
+            estimated size of the cache (None if not known) and its
+            maximum size (0 if unbounded).
+
+        """
+        stats = dict(self.stats)
+        stats["size"] = self._size
+        stats["max_size"] = self.max_size
+        return stats
 
     def cache_file(self, digest):
         """Load a file into the cache.
@@ -633,6 +1074,19 @@ class FileCacher:
 
         self._load(digest, True)
 
+    def is_cached(self, digest):
+        """Return whether a file is currently in the cache.
+
+        As for cache_file, the file might be evicted right after this
+        function returns.
+
+        digest (unicode): the digest of the file to look for.
+
+        return (bool): whether the file is in the cache.
+
+        """
+        return os.path.exists(os.path.join(self.file_dir, digest))
+
     def get_file(self, digest):
         """Retrieve a file from the storage.
 
@@ -683,7 +1137,10 @@ class FileCacher:
         """Retrieve a file from the storage.
 
         See `get_file'. This method will write the content of the file
-        to the given file-object.
+        to the given file-object. If dst is an empty file on the same
+        filesystem as the cache, and the filesystem supports it, the
+        content is shared with the cached file instead of copied (see
+        `clonefileobj').
 
         digest (unicode): the digest of the file to get.
         dst (fileobj): a writable binary file-like object on which to
@@ -696,7 +1153,82 @@ class FileCacher:
         if digest == Digest.TOMBSTONE:
             raise TombstoneError()
         with self.get_file(digest) as src:
-            copyfileobj(src, dst, self.CHUNK_SIZE)
+            if not clonefileobj(src, dst):
+                copyfileobj(src, dst, self.CHUNK_SIZE)
+
+    def link_file_to_path(self, digest, dst_path):
+        """Make a file of the storage available at a path, as a hard link.
+
+        See `get_file'. This method creates dst_path as a hard link to the
+        cached file, which is therefore shared with all other users of the
+        cache: to protect it, it is made read-only (for everybody). The
+        caller must not change the permissions of dst_path.
+
+        digest (unicode): the digest of the file to get.
+        dst_path (string): the location on the file-system where to
+            create the link; it must not exist.
+
+        return (bool): whether the link was created; if False (e.g.,
+            because dst_path is on another filesystem), the caller needs
+            to copy the file.
+
+        raise (KeyError): if the file cannot be found.
+        raise (TombstoneError): if the digest is the tombstone
+
+        """
+        if digest == Digest.TOMBSTONE:
+            raise TombstoneError()
+        self._load(digest, True)
+        cache_file_path = os.path.join(self.file_dir, digest)
+        try:
+            os.chmod(cache_file_path, 0o444)
+            os.link(cache_file_path, dst_path)
+        except OSError:
+            # Among others, the cached file might have been deleted in
+            # the meantime.
+            logger.debug("Cannot link file %s to %s.", digest, dst_path,
+                         exc_info=True)
+            return False
+        return True
+
+    def get_cached_path(self, digest):
+        """Make a file of the storage available in the cache.
+
+        See `get_file'. This method returns the path of the cached
+        file, for other processes (e.g., a reverse proxy serving it) to
+        read it: to protect it, it is made read-only (for everybody).
+        As for cache_file, the file might be evicted right after this
+        function returns (but it is the most recently used one); if it
+        keeps being evicted while being loaded (e.g., because it does
+        not fit in the cache), None is returned and the caller has to
+        read the file through get_file.
+
+        digest (unicode): the digest of the file to get.
+
+        return (string|None): the absolute path of the cached file.
+
+        raise (KeyError): if the file cannot be found.
+        raise (TombstoneError): if the digest is the tombstone
+
+        """
+        if digest == Digest.TOMBSTONE:
+            raise TombstoneError()
+        cache_file_path = os.path.abspath(os.path.join(self.file_dir, digest))
+        for _ in range(self.CACHED_PATH_ATTEMPTS):
+            # Change the permissions through a file descriptor, as the
+            # file could be evicted right after being loaded, and then
+            # make sure that the path still leads to it.
+            with self._load(digest, False) as fobj:
+                os.fchmod(fobj.fileno(), 0o444)
+                try:
+                    if os.path.samestat(os.fstat(fobj.fileno()),
+                                        os.stat(cache_file_path)):
+                        return cache_file_path
+                except FileNotFoundError:
+                    pass
+            logger.debug("File %s evicted while being loaded, retrying.",
+                         digest)
+        return None
 
     def get_file_to_path(self, digest, dst_path):
         """Retrieve a file from the storage.
@@ -761,6 +1293,7 @@ class FileCacher:
                     buf = buf[written:]
                 buf = src.read(self.CHUNK_SIZE)
             digest = d.digest()
+            size = dst.tell()
             dst.flush()
 
             logger.debug("File has digest %s.", digest)
@@ -781,11 +1314,13 @@ class FileCacher:
                 with open(dst.name, 'rb') as src:
                     fobj = self.backend.create_file(digest)
                     if fobj is not None:
-                        copyfileobj(src, fobj, self.CHUNK_SIZE)
+                        copyfileobj(src, fobj, self.BACKEND_CHUNK_SIZE,
+                                    self.MAX_BACKEND_CHUNK_SIZE)
                         self.backend.commit_file(fobj, digest, desc)
 
             os.rename(dst.name, cache_file_path)
 
+        self._added(size)
         return digest
 
     def put_file_content(self, content, desc=""):
@@ -910,7 +1445,8 @@ class FileCacher:
         """
         return self.backend.list()
 
-    def check_backend_integrity(self, delete=False):
+    def check_backend_integrity(self, delete=False, processes=1,
+                                progress_path=None):
         """Check the integrity of the backend.
 
         Request all the files from the backend. For each of them the
@@ -921,23 +1457,86 @@ class FileCacher:
         severity. The method returns False if at least a mismatch is
         found, True otherwise.
 
+        The files can be read and hashed by many processes at once.
+        If a progress file is given, the outcome of each file is
+        appended to it as soon as it's known, and the files already
+        listed there are not checked again: an interrupted check can
+        be resumed by running it again with the same progress file
+        (which has to be removed to start from scratch).
+
         delete (bool): if True, files with wrong digest are deleted.
+        processes (int): the number of processes checking the files.
+        progress_path (string|None): the path of the progress file, or
+            None not to record the progress.
+
+        return (bool): whether all files have the right digest.
 
         """
         clean = True
-        for digest, _ in self.list():
-            d = Digester()
-            with self.backend.get_file(digest) as fobj:
-                buf = fobj.read(self.CHUNK_SIZE)
-                while len(buf) > 0:
-                    d.update(buf)
-                    buf = fobj.read(self.CHUNK_SIZE)
-            computed_digest = d.digest()
-            if digest != computed_digest:
-                logger.error("File with hash %s actually has hash %s",
-                             digest, computed_digest)
-                if delete:
-                    self.delete(digest)
-                clean = False
+        checked = set()
+        if progress_path is not None and os.path.exists(progress_path):
+            # Only complete lines are trusted: the last one may have been
+            # cut short if the check was interrupted, and it is removed
+            # so that the next outcome doesn't get appended to it.
+            complete_size = 0
+            with open(progress_path, "rb") as progress:
+                for line in progress:
+                    fields = line.split()
+                    if not line.endswith(b"\n") or len(fields) != 2:
+                        logger.warning("Ignoring malformed line %r in the "
+                                       "progress file.", line)
+                        continue
+                    complete_size = progress.tell()
+                    digest, computed_digest = \
+                        (field.decode("ascii") for field in fields)
+                    checked.add(digest)
+                    if digest != computed_digest:
+                        if delete:
+                            self.delete(digest)
+                        clean = False
+            if complete_size < os.path.getsize(progress_path):
+                os.truncate(progress_path, complete_size)
+            logger.info("%d files were already checked.", len(checked))
+
+        digests = [digest for digest, _ in self.list()
+                   if digest not in checked]
+        logger.info("Checking %d files.", len(digests))
+        check = functools.partial(
+            _compute_digest, self.backend, self.BACKEND_CHUNK_SIZE,
+            self.MAX_BACKEND_CHUNK_SIZE)
+
+        with contextlib.ExitStack() as stack:
+            progress = None
+            if progress_path is not None:
+                progress = stack.enter_context(
+                    open(progress_path, "at", encoding="utf-8"))
+            if processes > 1:
+                # The children must open their own connections to the
+                # database, rather than share those of the pool.
+                engine.dispose()
+                pool = stack.enter_context(multiprocessing.Pool(processes))
+                results = pool.imap_unordered(check, digests, chunksize=16)
+            else:
+                results = map(check, digests)
+
+            for count, (digest, computed_digest) in enumerate(results):
+                if count % 10000 == 0 and count > 0:
+                    logger.info("%d files checked.", count)
+                    if progress is not None:
+                        os.fsync(progress.fileno())
+                # The file was deleted in the meantime.
+                if computed_digest is None:
+                    continue
+                if progress is not None:
+                    # Flushed at each line, so that an interrupted check
+                    # loses at most the file being written.
+                    progress.write("%s %s\n" % (digest, computed_digest))
+                    progress.flush()
+                if digest != computed_digest:
+                    logger.error("File with hash %s actually has hash %s",
+                                 digest, computed_digest)
+                    if delete:
+                        self.delete(digest)
+                    clean = False
 
         return clean
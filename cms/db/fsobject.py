@@ -214,7 +214,9 @@ class LargeObject(io.RawIOBase):
         data = self._execute("SELECT loread(%(fd)s, %(len)s);",
                              {'fd': self._fd, 'len': len(buf)},
                              "Couldn't write to large object.")
-        buf[:len(data)] = data.tobytes()
+        # The data is a memoryview, that can be copied into the buffer
+        # directly, without an intermediate bytes object.
+        memoryview(buf).cast("B")[:len(data)] = data.cast("B")
         return len(data)
 
     def write(self, buf):
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Cache of the scores of the participations on the tasks.
+
+"""
+
+from sqlalchemy.schema import Column, ForeignKey
+from sqlalchemy.types import Boolean, Float, Integer, Unicode
+
+from . import Base, Participation, Task
+
+
+class ParticipationTaskScore(Base):
+    """Class to store the score of a participation on a task.
+
+    The score is the one computed by task_score, not rounded. It is
+    written by ScoringService after scoring a submission and read by
+    the ranking of AWS. As other changes (new submissions, tokens, a
+    different active dataset or score mode...) do not go through
+    ScoringService, each row also stores what the score was computed
+    from, and it is recomputed when it does not match anymore (see
+    cms.grading.scoring.get_task_scores).
+
+    The rows are not exported, as they can be computed again.
+
+    """
+    __tablename__ = 'participation_task_scores'
+
+    # Participation (id) and task (id) the score refers to.
+    participation_id = Column(
+        Integer,
+        ForeignKey(Participation.id,
+                   onupdate="CASCADE", ondelete="CASCADE"),
+        primary_key=True)
+    task_id = Column(
+        Integer,
+        ForeignKey(Task.id,
+                   onupdate="CASCADE", ondelete="CASCADE"),
+        primary_key=True,
+        index=True)
+
+    # The score, and whether some submissions were not scored yet.
+    score = Column(
+        Float,
+        nullable=False)
+    partial = Column(
+        Boolean,
+        nullable=False)
+
+    # The active dataset (id) and the score mode of the task, the
+    # number of official submissions, the id of the last one, the
+    # number of those tokened and of those scored on the dataset,
+    # when the score was computed. They are only compared with the
+    # current ones, so the dataset id is not a foreign key.
+    dataset_id = Column(
+        Integer,
+        nullable=False)
+    score_mode = Column(
+        Unicode,
+        nullable=False)
+    submissions = Column(
+        Integer,
+        nullable=False)
+    last_submission_id = Column(
+        Integer,
+        nullable=False)
+    tokens = Column(
+        Integer,
+        nullable=False)
+    scored = Column(
+        Integer,
+        nullable=False)
@@ -711,7 +711,7 @@ class Evaluation(Base):
 
     # String containing the outcome of the evaluation (usually 1.0,
     # ...) not necessary the points awarded, that will be computed by
-    # the score type.
+    # the score type. None if the testcase was skipped.
     outcome = Column(
         Unicode,
         nullable=True)
@@ -750,3 +750,15 @@ class Evaluation(Base):
     def codename(self):
         """Return the codename of the testcase."""
         return self.testcase.codename
+
+    def skipped(self):
+        """Return whether the testcase was skipped.
+
+        ES writes a skipped evaluation, instead of evaluating the
+        testcase, when the score type tells that its outcome cannot
+        change the score (see ScoreType.testcases_to_skip).
+
+        return (bool): True if skipped, False otherwise.
+
+        """
+        return self.outcome is None
@@ -489,7 +489,7 @@ class Dataset(Base):
         clone_managers (bool): copy dataset managers.
         clone_testcases (bool): copy dataset testcases.
         clone_results (bool): copy submission results (will also copy
-            managers and testcases).
+            managers and testcases), except the skipped evaluations.
 
         """
         new_testcases = dict()
@@ -521,11 +521,20 @@ class Dataset(Base):
                     new_e = old_e.clone()
                     new_e.submission_result = new_sr
 
-                # Create evaluations.
+                # Create evaluations. Skipped ones hold only for the
+                # score type of the old dataset, so they are left out
+                # and their testcases evaluated again.
+                skipped = False
                 for old_e in old_sr.evaluations:
+                    if old_e.skipped():
+                        skipped = True
+                        continue
                     new_e = old_e.clone()
                     new_e.submission_result = new_sr
                     new_e.testcase = new_testcases[old_e.codename]
+                if skipped:
+                    new_sr.invalidate_score()
+                    new_sr.evaluation_outcome = None
 
         self.sa_session.flush()
 
@@ -558,15 +558,30 @@ class EvaluationJob(Job):
         # only if it is True.
 
         sr.evaluations += [Evaluation(
-            text=self.text,
-            outcome=self.outcome,
-            execution_time=self.plus.get('execution_time'),
-            execution_wall_clock_time=self.plus.get(
+            testcase=sr.dataset.testcases[self.operation.testcase_codename],
+            **self.get_evaluation_values())]
+
+    def get_evaluation_values(self):
+        """Return the values of the evaluation described by the job.
+
+        This is used by to_submission, and directly by who needs to
+        insert many evaluations at once without going through the ORM.
+
+        return ({str: object}): the values of the columns of the
+            Evaluation, except the ones identifying the submission
+            result and the testcase.
+
+        """
+        return {
+            "text": self.text,
+            "outcome": self.outcome,
+            "execution_time": self.plus.get('execution_time'),
+            "execution_wall_clock_time": self.plus.get(
                 'execution_wall_clock_time'),
-            execution_memory=self.plus.get('execution_memory'),
-            evaluation_shard=self.shard,
-            evaluation_sandbox=":".join(self.sandboxes),
-            testcase=sr.dataset.testcases[self.operation.testcase_codename])]
+            "execution_memory": self.plus.get('execution_memory'),
+            "evaluation_shard": self.shard,
+            "evaluation_sandbox": ":".join(self.sandboxes),
+        }
 
     @staticmethod
     def from_user_test(operation, user_test, dataset):
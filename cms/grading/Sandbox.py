@@ -214,6 +214,10 @@ class SandboxBase(metaclass=ABCMeta):
         self.set_env = {}
         self.verbosity = 0
 
+        # The device and inode numbers of the files linked from the
+        # file cacher by create_file_from_storage.
+        self._linked_files = set()
+
         self.max_processes = 1
 
         # Set common environment variables.
@@ -360,11 +364,23 @@ class SandboxBase(metaclass=ABCMeta):
     def create_file_from_storage(self, path, digest, executable=False):
         """Write a file taken from FS in the sandbox.
 
+        If hardlink_sandbox_files is set in the configuration, plain
+        files are not copied but linked from the file cacher, read-only.
+        Executables are always copied, as the permissions of a link are
+        those of the cached file.
+
         path (string): relative path of the file inside the sandbox.
         digest (string): digest of the file in FS.
         executable (bool): to set permissions.
 
         """
+        if config.hardlink_sandbox_files and not executable:
+            logger.debug("Linking file %s in sandbox.", path)
+            real_path = self.relative_path(path)
+            if self.file_cacher.link_file_to_path(digest, real_path):
+                st = os.lstat(real_path)
+                self._linked_files.add((st.st_dev, st.st_ino))
+                return
         with self.create_file(path, executable) as dest_fobj:
             self.file_cacher.get_file_to_fobj(digest, dest_fobj)
 
@@ -523,6 +539,20 @@ class SandboxBase(metaclass=ABCMeta):
         """
         pass
 
+    def reset(self):
+        """Bring the sandbox back to the state it had when created.
+
+        This allows to reuse the sandbox for another job instead of
+        cleaning it up and creating a new one. It must remove all the
+        files and restore all the parameters, so that nothing of the
+        previous job is visible to the next one.
+
+        return (bool): whether the sandbox was reset; if False, the
+            sandbox cannot be reused and must be cleaned up.
+
+        """
+        return False
+
 
 class StupidSandbox(SandboxBase):
     """A stupid sandbox implementation. It has very few features and
@@ -847,6 +877,9 @@ class IsolateSandbox(SandboxBase):
     """
     next_id = 0
 
+    # Box ids of the sandboxes initialized and not yet cleaned up.
+    box_ids_in_use = set()
+
     # If the command line starts with this command name, we are just
     # going to execute it without sandboxing, and with all permissions
     # on the current directory.
@@ -864,15 +897,24 @@ class IsolateSandbox(SandboxBase):
         # the range [(shard+1)*10, (shard+2)*10) to each Worker and keep the
         # range [0, 10) for other uses (command-line scripts like cmsMake or
         # direct console users of isolate). Inside each range ids are assigned
-        # sequentially, with a wrap-around.
+        # sequentially, with a wrap-around, skipping those still in use (for
+        # example by the sandboxes kept in a SandboxPool).
         # FIXME This is the only use of FileCacher.service, and it's an
         # improper use! Avoid it!
         if file_cacher is not None and file_cacher.service is not None:
-            box_id = ((file_cacher.service.shard + 1) * 10
-                      + (IsolateSandbox.next_id % 10)) % config.num_boxes
+            first_box_id = (file_cacher.service.shard + 1) * 10
+        else:
+            first_box_id = 0
+        for _ in range(10):
+            box_id = (first_box_id
+                      + IsolateSandbox.next_id % 10) % config.num_boxes
+            IsolateSandbox.next_id += 1
+            if box_id not in IsolateSandbox.box_ids_in_use:
+                break
         else:
-            box_id = IsolateSandbox.next_id % 10
-        IsolateSandbox.next_id += 1
+            # Reusing an id would wipe the box of a live sandbox.
+            raise SandboxInterfaceException(
+                "All the box ids from %d are in use." % first_box_id)
 
         # We create a directory "home" inside the outer temporary directory,
         # that will be bind-mounted to "/tmp" inside the sandbox (some
@@ -899,9 +941,22 @@ class IsolateSandbox(SandboxBase):
         logger.debug("Sandbox in `%s' created, using box `%s'.",
                      self._home, self.box_exec)
 
-        # Default parameters for isolate
         self.box_id = box_id           # -b
         self.cgroup = config.use_cgroups  # --cg
+        # Directory of the box created by isolate, see initialize_isolate.
+        self._box_dir = None
+        self._set_default_parameters()
+
+        # Tell isolate to get the sandbox ready. We do our best to cleanup
+        # after ourselves, but we might have missed something if a previous
+        # worker was interrupted in the middle of an execution, so we issue an
+        # idempotent cleanup.
+        self.cleanup()
+        self.initialize_isolate()
+
+    def _set_default_parameters(self):
+        """Set the parameters of the sandbox to their default values."""
+        # Default parameters for isolate
         self.chdir = self._home_dest   # -c
         self.dirs = []                 # -d
         self.preserve_env = False      # -e
@@ -917,6 +972,7 @@ class IsolateSandbox(SandboxBase):
         self.verbosity = 0             # -v
         self.wallclock_timeout = None  # -w
         self.extra_timeout = None      # -x
+        self.max_processes = 1         # -p
 
         self.add_mapped_directory(
             self._home, dest=self._home_dest, options="rw")
@@ -935,13 +991,6 @@ class IsolateSandbox(SandboxBase):
         # particular, the System.Native assembly.
         self.maybe_add_mapped_directory("/etc/mono", options="noexec")
 
-        # Tell isolate to get the sandbox ready. We do our best to cleanup
-        # after ourselves, but we might have missed something if a previous
-        # worker was interrupted in the middle of an execution, so we issue an
-        # idempotent cleanup.
-        self.cleanup()
-        self.initialize_isolate()
-
     def add_mapped_directory(self, src, dest=None, options=None,
                              ignore_if_not_existing=False):
         """Add src to the directory to be mapped inside the sandbox.
@@ -965,13 +1014,32 @@ class IsolateSandbox(SandboxBase):
         return self.add_mapped_directory(src, dest, options,
                                          ignore_if_not_existing=True)
 
+    def _chmod_unless_linked(self, path, mode):
+        """Change the permissions of a file, unless it is linked from
+        the file cacher.
+
+        The links created by create_file_from_storage share the
+        permissions with the cached file, which must stay read-only.
+        Other hard links (which the sandboxed programs can create) are
+        changed as any file: the files are recognized by their inodes,
+        not by their number of links.
+
+        path (str): the file.
+        mode (int): the new permissions.
+
+        """
+        st = os.lstat(path)
+        if (st.st_dev, st.st_ino) not in self._linked_files:
+            os.chmod(path, mode)
+
     def allow_writing_all(self):
         """Set permissions in such a way that any operation is allowed.
 
         """
         os.chmod(self._home, 0o777)
         for filename in os.listdir(self._home):
-            os.chmod(os.path.join(self._home, filename), 0o777)
+            self._chmod_unless_linked(os.path.join(self._home, filename),
+                                      0o777)
 
     def allow_writing_none(self):
         """Set permissions in such a way that the user cannot write anything.
@@ -979,7 +1047,8 @@ class IsolateSandbox(SandboxBase):
         """
         os.chmod(self._home, 0o755)
         for filename in os.listdir(self._home):
-            os.chmod(os.path.join(self._home, filename), 0o755)
+            self._chmod_unless_linked(os.path.join(self._home, filename),
+                                      0o755)
 
     def allow_writing_only(self, inner_paths):
         """Set permissions in so that the user can write only some paths.
@@ -1018,7 +1087,7 @@ class IsolateSandbox(SandboxBase):
         # Close everything, then open only the specified.
         self.allow_writing_none()
         for path in outer_paths:
-            os.chmod(path, 0o722)
+            self._chmod_unless_linked(path, 0o722)
 
     def get_root_path(self):
         """Return the toplevel path of the sandbox.
@@ -1415,41 +1484,111 @@ class IsolateSandbox(SandboxBase):
             + (["--cg"] if self.cgroup else [])
             + ["--box-id=%d" % self.box_id, "--init"])
         try:
-            subprocess.check_output(init_cmd, stderr=subprocess.STDOUT)
+            output = subprocess.check_output(init_cmd, stderr=subprocess.PIPE)
         except subprocess.CalledProcessError as e:
             raise SandboxInterfaceException(
-                "Failed to initialize sandbox. Isolate output: %s" % e.output) from e
+                "Failed to initialize sandbox. Isolate output: %s"
+                % (e.output + e.stderr)) from e
+        IsolateSandbox.box_ids_in_use.add(self.box_id)
 
-    def cleanup(self, delete=False):
-        """See Sandbox.cleanup()."""
-        # The user isolate assigns within the sandbox might have created
-        # subdirectories and files therein, making the user outside the sandbox
-        # unable to delete the whole tree. If the caller asked us to delete the
-        # sandbox, we first issue a chmod within isolate to make sure that we
-        # will be able to delete everything. If not, we leave the files as they
-        # are to avoid masking possible problems the admin wanted to debug.
+        # Isolate prints the path of the directory it created for the box,
+        # which is visible inside the sandbox as /box.
+        lines = output.decode("utf-8", errors="replace").splitlines()
+        if len(lines) > 0 and os.path.isabs(lines[-1].strip()):
+            self._box_dir = os.path.join(lines[-1].strip(), "box")
+
+    def _allow_deleting_all(self):
+        """Make all files created inside the sandbox deletable by us.
+
+        The user isolate assigns within the sandbox might have created
+        subdirectories and files therein, making the user outside the
+        sandbox unable to delete them. We issue a chmod within isolate to
+        be able to delete everything.
+
+        """
+        # Ignore exit status as some files may be owned by our user
+        subprocess.call(
+            [self.box_exec]
+            + (["--cg"] if self.cgroup else [])
+            + ["--box-id=%d" % self.box_id,
+               "--dir=%s=%s:rw" % (self._home_dest, self._home),
+               "--run", "--",
+               "/bin/chmod", "777", "-R", self._home_dest, "/box"],
+            stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
+
+    @staticmethod
+    def _empty_directory(path):
+        """Delete everything inside a directory, but not the directory.
+
+        path (str): the directory to empty.
+
+        raise (OSError): if some file cannot be deleted.
+
+        """
+        for filename in os.listdir(path):
+            file_path = os.path.join(path, filename)
+            if os.path.isdir(file_path) and not os.path.islink(file_path):
+                rmtree(file_path)
+            else:
+                os.remove(file_path)
+
+    def reset(self):
+        """See Sandbox.reset().
+
+        The box stays initialized: we only delete the files in the home
+        directory and in isolate's box directory, together with the logs
+        of the previous executions. Isolate prepares a fresh control
+        group at the start of each execution, so there is nothing else
+        to reset.
 
-        exe = [self.box_exec] \
-            + (["--cg"] if self.cgroup else []) \
-            + ["--box-id=%d" % self.box_id]
+        """
+        if self._box_dir is None:
+            return False
+        try:
+            try:
+                self._empty_directory(self._home)
+                self._empty_directory(self._box_dir)
+            except OSError:
+                # Probably files created by the sandboxed user, try
+                # again after making them deletable.
+                self._allow_deleting_all()
+                self._empty_directory(self._home)
+                self._empty_directory(self._box_dir)
+            for filename in os.listdir(self._outer_dir):
+                if filename != os.path.basename(self._home):
+                    os.remove(os.path.join(self._outer_dir, filename))
+            self._linked_files.clear()
+        except OSError:
+            logger.warning("Couldn't reset sandbox in %s.", self._outer_dir,
+                           exc_info=True)
+            return False
+
+        self.log = None
+        self.exec_num = -1
+        self._set_default_parameters()
+        self.allow_writing_all()
+        return True
 
+    def cleanup(self, delete=False):
+        """See Sandbox.cleanup()."""
+        # If the caller asked us to delete the sandbox, we first make sure
+        # that we will be able to delete everything. If not, we leave the
+        # files as they are to avoid masking possible problems the admin
+        # wanted to debug.
         if delete:
-            # Ignore exit status as some files may be owned by our user
-            subprocess.call(
-                exe + [
-                    "--dir=%s=%s:rw" % (self._home_dest, self._home),
-                    "--run", "--",
-                    "/bin/chmod", "777", "-R", self._home_dest],
-                stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
+            self._allow_deleting_all()
 
         # Tell isolate to cleanup the sandbox.
         try:
             subprocess.check_output(
-                exe + ["--cleanup"],
+                [self.box_exec]
+                + (["--cg"] if self.cgroup else [])
+                + ["--box-id=%d" % self.box_id, "--cleanup"],
                 stderr=subprocess.STDOUT)
         except subprocess.CalledProcessError as e:
             raise SandboxInterfaceException(
                 "Failed to cleanup sandbox. Isolate output: %s" % e.output) from e
+        IsolateSandbox.box_ids_in_use.discard(self.box_id)
 
         if delete:
             logger.debug("Deleting sandbox in %s.", self._outer_dir)
@@ -1461,3 +1600,84 @@ Sandbox = {
     'stupid': StupidSandbox,
     'isolate': IsolateSandbox,
     }[config.sandbox_implementation]
+
+
+class SandboxPool:
+    """A bounded set of idle sandboxes, to be reused by the next jobs.
+
+    Creating and deleting a sandbox can take longer than running a
+    small testcase in it, as it requires to initialize and cleanup the
+    box. A sandbox released by a job is instead reset (which is cheap)
+    and kept here, ready for the next job that needs one. The pool is
+    empty and disabled (with size 0) unless someone resizes it.
+
+    """
+
+    def __init__(self, size=0):
+        """Initialization.
+
+        size (int): the maximum number of idle sandboxes to keep.
+
+        """
+        self.size = size
+        self._sandboxes = []
+
+    def resize(self, size):
+        """Change the maximum number of idle sandboxes to keep.
+
+        size (int): the new size; 0 disables the pool.
+
+        """
+        self.size = size
+        while len(self._sandboxes) > self.size:
+            self._discard(self._sandboxes.pop())
+
+    def acquire(self, file_cacher, name=None):
+        """Take an idle sandbox from the pool.
+
+        file_cacher (FileCacher): the file cacher the sandbox must use.
+        name (str|None): the new name of the sandbox.
+
+        return (SandboxBase|None): a sandbox ready to be used, or None
+            if there are no idle sandboxes.
+
+        """
+        if len(self._sandboxes) == 0:
+            return None
+        sandbox = self._sandboxes.pop()
+        sandbox.file_cacher = file_cacher
+        sandbox.name = name if name is not None else "unnamed"
+        logger.debug("Reusing sandbox in %s.", sandbox.get_root_path())
+        return sandbox
+
+    def release(self, sandbox):
+        """Give a sandbox that is not needed anymore to the pool.
+
+        The pool keeps the sandbox only if there is space and it can be
+        reset; otherwise, the caller is still responsible for it.
+
+        sandbox (SandboxBase): the sandbox to release.
+
+        return (bool): whether the pool kept the sandbox.
+
+        """
+        if len(self._sandboxes) >= self.size or not sandbox.reset():
+            return False
+        self._sandboxes.append(sandbox)
+        return True
+
+    def clear(self):
+        """Delete all the idle sandboxes."""
+        while len(self._sandboxes) > 0:
+            self._discard(self._sandboxes.pop())
+
+    @staticmethod
+    def _discard(sandbox):
+        try:
+            sandbox.cleanup(delete=True)
+        except (OSError, SandboxInterfaceException):
+            logger.warning("Couldn't delete sandbox.", exc_info=True)
+
+
+# The sandboxes this process can reuse; only the Worker enables it.
+sandbox_pool = SandboxPool()
@@ -46,3 +46,8 @@ class GroupMin(ScoreTypeGroup):
     def reduce(self, outcomes, unused_parameter):
         """See ScoreTypeGroup."""
         return min(outcomes)
+
+    def is_decisive(self, outcome, unused_parameter):
+        """See ScoreTypeGroup."""
+        # Outcomes are never negative, so the minimum is this one.
+        return outcome <= 0.0
@@ -48,3 +48,7 @@ class GroupMul(ScoreTypeGroup):
     def reduce(self, outcomes, unused_parameter):
         """See ScoreTypeGroup."""
         return reduce(lambda x, y: x * y, outcomes)
+
+    def is_decisive(self, outcome, unused_parameter):
+        """See ScoreTypeGroup."""
+        return outcome == 0.0
@@ -53,3 +53,8 @@ class GroupThreshold(ScoreTypeGroup):
             return 1.0
         else:
             return 0.0
+
+    def is_decisive(self, outcome, parameter):
+        """See ScoreTypeGroup."""
+        threshold = parameter[2]
+        return not 0.0 < outcome <= threshold
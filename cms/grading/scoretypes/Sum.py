@@ -127,8 +127,16 @@ class Sum(ScoreTypeAlone):
         public_score = 0.0
 
         for idx in indices:
-            this_score = float(evaluations[idx].outcome) * self.parameters
-            tc_outcome = self.get_public_outcome(this_score)
+            # No testcase is skipped with this score type, but the
+            # evaluations may have been made with another one: a
+            # skipped testcase is then counted as failed.
+            if evaluations[idx].skipped():
+                this_score = 0.0
+                tc_outcome = N_("Skipped")
+            else:
+                this_score = \
+                    float(evaluations[idx].outcome) * self.parameters
+                tc_outcome = self.get_public_outcome(this_score)
             score += this_score
             testcases.append({
                 "idx": idx,
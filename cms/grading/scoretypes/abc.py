@@ -168,6 +168,25 @@ class ScoreType(metaclass=ABCMeta):
         """
         pass
 
+    def testcases_to_skip(self, unused_outcomes):
+        """Return the testcases whose outcome cannot change the score.
+
+        When short-circuit evaluation is enabled, ES calls this method
+        as the evaluations of a submission arrive, and does not
+        evaluate the testcases returned (see Evaluation.skipped);
+        compute_score must then give the same score it would have
+        given with any outcome for them. By default, all testcases
+        are evaluated.
+
+        unused_outcomes ({str: float}): the outcomes of the testcases
+            evaluated so far, indexed by codename.
+
+        return ({str}): the codenames of the testcases, not evaluated
+            yet, that can be skipped.
+
+        """
+        return set()
+
 
 class ScoreTypeAlone(ScoreType):
     """Intermediate class to manage tasks where the score of a
@@ -192,11 +211,13 @@ class ScoreTypeGroup(ScoreTypeAlone):
     expression of the names of target testcases. All t must have the same type.
 
     A subclass must implement the method 'get_public_outcome' and
-    'reduce'.
+    'reduce'. It can implement 'is_decisive' to allow skipping the
+    rest of a group after some outcomes.
 
     """
     # Mark strings for localization.
     N_("Subtask %(index)s")
+    N_("Skipped")
     N_("#")
     N_("Outcome")
     N_("Details")
@@ -264,6 +285,8 @@ class ScoreTypeGroup(ScoreTypeAlone):
                 <tr class="correct">
             {% elif tc["outcome"] == "Not correct" %}
                 <tr class="notcorrect">
+            {% elif tc["outcome"] == "Skipped" %}
+                <tr class="skipped">
             {% else %}
                 <tr class="partiallycorrect">
             {% endif %}
@@ -394,29 +417,44 @@ class ScoreTypeGroup(ScoreTypeAlone):
             public_testcases = []
             previous_tc_all_correct = True
             for tc_idx in target:
-                tc_outcome = self.get_public_outcome(
-                    float(evaluations[tc_idx].outcome), parameter)
+                evaluation = evaluations[tc_idx]
+                if evaluation.skipped():
+                    tc_outcome = N_("Skipped")
+                else:
+                    tc_outcome = self.get_public_outcome(
+                        float(evaluation.outcome), parameter)
 
                 testcases.append({
                     "idx": tc_idx,
                     "outcome": tc_outcome,
-                    "text": evaluations[tc_idx].text,
-                    "time": evaluations[tc_idx].execution_time,
-                    "memory": evaluations[tc_idx].execution_memory,
+                    "text": evaluation.text,
+                    "time": evaluation.execution_time,
+                    "memory": evaluation.execution_memory,
                     "show_in_restricted_feedback": previous_tc_all_correct})
                 if self.public_testcases[tc_idx]:
                     public_testcases.append(testcases[-1])
                     # Only block restricted feedback if this is the first
                     # *public* non-correct testcase, otherwise we might be
-                    # leaking info on private testcases.
-                    if tc_outcome != "Correct":
+                    # leaking info on private testcases. Skipped testcases
+                    # say nothing about the submission, so they do not
+                    # block it.
+                    if tc_outcome != "Correct" and not evaluation.skipped():
                         previous_tc_all_correct = False
                 else:
                     public_testcases.append({"idx": tc_idx})
 
-            st_score_fraction = self.reduce(
-                [float(evaluations[tc_idx].outcome) for tc_idx in target],
-                parameter)
+            # Skipped testcases cannot change the result of reduce, as
+            # long as another outcome in the group is decisive; if none
+            # is (e.g., the groups or parameters changed after the
+            # evaluation), they are counted as failed.
+            outcomes = [float(evaluations[tc_idx].outcome)
+                        for tc_idx in target
+                        if not evaluations[tc_idx].skipped()]
+            if len(outcomes) < len(target) and not any(
+                    self.is_decisive(outcome, parameter)
+                    for outcome in outcomes):
+                outcomes += [0.0] * (len(target) - len(outcomes))
+            st_score_fraction = self.reduce(outcomes, parameter)
             st_score = st_score_fraction * parameter[0]
 
             score += st_score
@@ -438,6 +476,41 @@ class ScoreTypeGroup(ScoreTypeAlone):
 
         return score, subtasks, public_score, public_subtasks, ranking_details
 
+    def testcases_to_skip(self, outcomes):
+        """See ScoreType.testcases_to_skip.
+
+        A testcase can be skipped if each group containing it already
+        has a decisive outcome (see is_decisive).
+
+        """
+        targets = self.retrieve_target_testcases()
+        decided = [any(self.is_decisive(outcomes[tc_idx], parameter)
+                       for tc_idx in target if tc_idx in outcomes)
+                   for target, parameter in zip(targets, self.parameters)]
+        groups = {}
+        for st_idx, target in enumerate(targets):
+            for tc_idx in target:
+                groups.setdefault(tc_idx, []).append(st_idx)
+        return set(tc_idx for tc_idx, st_idxs in groups.items()
+                   if tc_idx not in outcomes
+                   and all(decided[st_idx] for st_idx in st_idxs))
+
+    def is_decisive(self, unused_outcome, unused_parameter):
+        """Return whether an outcome alone decides the group score.
+
+        If it does, the other testcases of the group do not need to
+        be evaluated, as reduce returns the same value whatever their
+        outcomes. By default, no outcome is decisive.
+
+        unused_outcome (float): the outcome of the submission in a
+            testcase of the group.
+        unused_parameter (list): the parameters of the group.
+
+        return (bool): whether the outcome decides the group score.
+
+        """
+        return False
+
     @abstractmethod
     def get_public_outcome(self, unused_outcome, unused_parameter):
         """Return a public outcome from an outcome.
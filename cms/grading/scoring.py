@@ -25,15 +25,18 @@
 
 from collections import namedtuple
 
+from sqlalchemy import and_, func, tuple_
 from sqlalchemy.orm import joinedload
 
-from cms.db import Submission
+from cms.db import Participation, ParticipationTaskScore, Submission, \
+    SubmissionResult, Task, Token
 from cmscommon.constants import \
     SCORE_MODE_MAX, SCORE_MODE_MAX_SUBTASK, SCORE_MODE_MAX_TOKENED_LAST
 
 
 __all__ = [
-    "compute_changes_for_dataset", "task_score",
+    "compute_changes_for_dataset", "task_score", "get_task_scores",
+    "update_task_scores",
 ]
 
 
@@ -136,6 +139,24 @@ def task_score(participation, task,
 
     submissions = [s for s in participation.submissions
                    if s.task is task and s.official]
+    score, partial = _task_score(submissions, task, public, only_tokened)
+    if rounded:
+        score = round(score, task.score_precision)
+    return score, partial
+
+
+def _task_score(submissions, task, public=False, only_tokened=False):
+    """Return the score of a contest's user on a task.
+
+    submissions ([Submission]): the official submissions of the user
+        on the task.
+    task (Task): the task for which to compute the score.
+    public (bool): see task_score.
+    only_tokened (bool): see task_score.
+
+    return ((float, bool)): see task_score (the score is not rounded).
+
+    """
     if len(submissions) == 0:
         return 0.0, False
 
@@ -169,11 +190,154 @@ def task_score(participation, task,
         score = _task_score_max_tokened_last(score_details_tokened)
     else:
         raise ValueError("Unknown score mode '%s'" % task.score_mode)
-    if rounded:
-        score = round(score, task.score_precision)
     return score, partial
 
 
+# Keeping the scores of the participations on the tasks, for rankings.
+
+def update_task_scores(session, keys):
+    """Compute and store the scores of some users on some tasks.
+
+    The submissions of each task are loaded with a couple of queries,
+    and the score of each pair is stored in the cache (see
+    ParticipationTaskScore), in the session's transaction.
+
+    session (Session): the DB session to use.
+    keys ({(int, int)}): pairs of participation id and task id.
+
+    return ({(int, int): (float, bool)}): the score of each pair (not
+        rounded), and whether it is partial (see task_score).
+
+    """
+    participation_ids_by_task = dict()
+    for participation_id, task_id in keys:
+        participation_ids_by_task.setdefault(task_id, set()).add(
+            participation_id)
+
+    existing = dict()
+    if len(keys) > 0:
+        for row in session.query(ParticipationTaskScore)\
+                .filter(tuple_(ParticipationTaskScore.participation_id,
+                               ParticipationTaskScore.task_id).in_(keys))\
+                .all():
+            existing[(row.participation_id, row.task_id)] = row
+
+    scores = dict()
+    for task_id, participation_ids in participation_ids_by_task.items():
+        task = session.query(Task).get(task_id)
+        if task is None or task.active_dataset_id is None:
+            continue
+        submissions = session.query(Submission)\
+            .filter(Submission.task_id == task_id)\
+            .filter(Submission.participation_id.in_(participation_ids))\
+            .filter(Submission.official.is_(True))\
+            .options(joinedload(Submission.token))\
+            .order_by(Submission.id)\
+            .all()
+        # Load the results in the identity map, where get_result finds
+        # them.
+        session.query(SubmissionResult)\
+            .filter(SubmissionResult.dataset_id == task.active_dataset_id)\
+            .filter(SubmissionResult.submission_id.in_(
+                [s.id for s in submissions]))\
+            .all()
+
+        submissions_by_participation = dict(
+            (participation_id, []) for participation_id in participation_ids)
+        for s in submissions:
+            submissions_by_participation[s.participation_id].append(s)
+
+        for participation_id, p_submissions in \
+                submissions_by_participation.items():
+            key = (participation_id, task_id)
+            scores[key] = _task_score(p_submissions, task)
+            values = {
+                "score": scores[key][0],
+                "partial": scores[key][1],
+                "dataset_id": task.active_dataset_id,
+                "score_mode": task.score_mode,
+                "submissions": len(p_submissions),
+                "last_submission_id":
+                    p_submissions[-1].id if len(p_submissions) > 0 else 0,
+                "tokens": sum(1 for s in p_submissions if s.tokened()),
+                "scored": sum(1 for s in p_submissions
+                              if s.get_result() is not None
+                              and s.get_result().score is not None),
+            }
+            row = existing.get(key)
+            if row is None:
+                row = ParticipationTaskScore(**values)
+                row.participation_id = participation_id
+                row.task_id = task_id
+                session.add(row)
+            else:
+                row.set_attrs(values)
+
+    return scores
+
+
+def get_task_scores(session, contest):
+    """Return the scores of all users of a contest on all its tasks.
+
+    The scores are read from the cache (see ParticipationTaskScore);
+    those computed from something different from what is in the
+    database now are computed again and stored. The check needs just
+    one query, that aggregates the official submissions.
+
+    session (Session): the DB session to use.
+    contest (Contest): the contest.
+
+    return ({(int, int): (float, bool)}): the score (not rounded) of
+        each participation (id) on each task (id), and whether it is
+        partial (see task_score). Pairs without official submissions
+        are missing.
+
+    """
+    current = dict()
+    for participation_id, task_id, dataset_id, score_mode, submissions, \
+            last_submission_id, tokens, scored in session.query(
+                Submission.participation_id,
+                Submission.task_id,
+                Task.active_dataset_id,
+                Task.score_mode,
+                func.count(Submission.id),
+                func.max(Submission.id),
+                func.count(Token.id),
+                func.count(SubmissionResult.score))\
+            .join(Task, Task.id == Submission.task_id)\
+            .join(Participation,
+                  Participation.id == Submission.participation_id)\
+            .outerjoin(Token, Token.submission_id == Submission.id)\
+            .outerjoin(SubmissionResult, and_(
+                SubmissionResult.submission_id == Submission.id,
+                SubmissionResult.dataset_id == Task.active_dataset_id))\
+            .filter(Task.contest_id == contest.id)\
+            .filter(Participation.contest_id == contest.id)\
+            .filter(Submission.official.is_(True))\
+            .group_by(Submission.participation_id, Submission.task_id,
+                      Task.active_dataset_id, Task.score_mode)\
+            .all():
+        current[(participation_id, task_id)] = (
+            dataset_id, score_mode, submissions, last_submission_id,
+            tokens, scored)
+
+    scores = dict()
+    for row in session.query(ParticipationTaskScore)\
+            .join(Task, Task.id == ParticipationTaskScore.task_id)\
+            .filter(Task.contest_id == contest.id)\
+            .all():
+        key = (row.participation_id, row.task_id)
+        if current.get(key) == (
+                row.dataset_id, row.score_mode, row.submissions,
+                row.last_submission_id, row.tokens, row.scored):
+            scores[key] = (row.score, row.partial)
+
+    stale = set(current.keys()) - set(scores.keys())
+    if len(stale) > 0:
+        scores.update(update_task_scores(session, stale))
+    return scores
+
+
 def _task_score_max_tokened_last(score_details_tokened):
     """Compute score using the "max tokened last" score mode.
 
@@ -38,35 +38,91 @@ logger = logging.getLogger(__name__)
 # are in the ASCII range.
 _WHITES = [b' ', b'\t', b'\n', b'\x0b', b'\x0c', b'\r']
 
+# How many bytes we read from each file at a time.
+_CHUNK_SIZE = 1024 * 1024
 
-def _white_diff_canonicalize(string):
-    """Convert the input string to a canonical form for the white diff
-    algorithm; that is, the strings a and b are mapped to the same
-    string by _white_diff_canonicalize() if and only if they have to be
-    considered equivalent for the purposes of the white-diff
-    algorithm.
+# Translation table mapping all whitespaces except the newline to a
+# space, so that afterwards only two separators are left.
+_TO_SPACE = bytes.maketrans(
+    b''.join(c for c in _WHITES if c != b'\n'),
+    b' ' * (len(_WHITES) - 1))
+_SEPARATORS = b' \n'
 
-    More specifically, this function strips all the leading and
-    trailing whitespaces from s and collapse all the runs of
-    consecutive whitespaces into just one copy of one specific
-    whitespace.
 
-    string (str): the string to canonicalize.
-    return (str): the canonicalized string.
+def _white_diff_canonicalize_body(body):
+    """Canonicalize a buffer that begins and ends with a token.
+
+    body (bytes): the buffer, with no whitespaces other than spaces and
+        newlines.
+
+    return (bytes): the buffer with runs of spaces collapsed into one
+        space, and spaces adjacent to a newline removed.
 
     """
-    # Replace all the whitespaces with copies of " ", making the rest
-    # of the algorithm simpler
-    for char in _WHITES[1:]:
-        string = string.replace(char, _WHITES[0])
+    # Each pass halves the length of the runs of spaces; outputs
+    # usually have none, and the check is much cheaper than a pass.
+    while b'  ' in body:
+        body = body.replace(b'  ', b' ')
+    if b' \n' in body:
+        body = body.replace(b' \n', b'\n')
+    if b'\n ' in body:
+        body = body.replace(b'\n ', b'\n')
+    return body
+
+
+def _white_diff_canonical_chunks(fobj):
+    """Yield the canonical form of a file for the white diff algorithm.
+
+    The canonical form is the sequence of the tokens (maximal runs of
+    non-whitespaces) of the file, where two consecutive tokens are
+    separated by as many newlines as there are between them in the
+    file or, if there are none, by one space. The newlines before the
+    first token are kept, anything after the last token is dropped.
+    Two files have to be considered equivalent by the white diff
+    algorithm if and only if their canonical forms are equal.
+
+    The file is read in chunks of _CHUNK_SIZE bytes, and each chunk
+    is canonicalized with a few operations on the whole buffer; only
+    the separators at the boundary between two chunks need to be
+    carried over.
 
-    # Split the string according to " ", filter out empty tokens and
-    # join again the string using just one copy of the first
-    # whitespace; this way, runs of more than one whitespaces are
-    # collapsed into just one copy.
-    string = _WHITES[0].join([x for x in string.split(_WHITES[0])
-                              if len(x) > 0])
-    return string
+    fobj (fileobj): the file to canonicalize, opened in binary mode.
+
+    yield (bytes): consecutive non-empty pieces of the canonical form.
+
+    """
+    # Number of newlines, and whether there was any separator at all,
+    # since the last token yielded.
+    newlines = 0
+    separated = False
+    seen_token = False
+    while True:
+        chunk = fobj.read(_CHUNK_SIZE)
+        if len(chunk) == 0:
+            return
+        chunk = chunk.translate(_TO_SPACE)
+        body = chunk.strip(_SEPARATORS)
+        if len(body) == 0:
+            newlines += chunk.count(b'\n')
+            separated = True
+            continue
+
+        # The first byte of body is its first occurrence in chunk,
+        # because everything before it is a separator.
+        body_start = chunk.index(body[:1])
+        body_end = body_start + len(body)
+        newlines += chunk.count(b'\n', 0, body_start)
+        separated = separated or body_start > 0
+
+        if newlines > 0:
+            yield b'\n' * newlines
+        elif separated and seen_token:
+            yield b' '
+        yield _white_diff_canonicalize_body(body)
+        seen_token = True
+
+        newlines = chunk.count(b'\n', body_end)
+        separated = body_end < len(chunk)
 
 
 def _white_diff(output, res):
@@ -80,34 +136,41 @@ def _white_diff(output, res):
     'sequence of characters ending with \n or EOF and beginning right
     after BOF or \n'. In particular, every line has *at most* one \n.
 
+    The files are compared in chunks, and the comparison stops at the
+    first difference.
+
     output (file): the first file to compare.
     res (file): the second file to compare.
     return (bool): True if the two file are equal as explained above.
 
     """
+    output_chunks = _white_diff_canonical_chunks(output)
+    res_chunks = _white_diff_canonical_chunks(res)
+    # The chunks of the two files have different lengths, so we keep
+    # the current chunk of each with the position of the first byte
+    # not compared yet.
+    output_chunk, output_pos = b'', 0
+    res_chunk, res_pos = memoryview(b''), 0
 
     while True:
-        lout = output.readline()
-        lres = res.readline()
-
-        # Both files finished: comparison succeded
-        if len(lres) == 0 and len(lout) == 0:
-            return True
-
-        # Only one file finished: ok if the other contains only blanks
-        elif len(lres) == 0 or len(lout) == 0:
-            lout = lout.strip(b''.join(_WHITES))
-            lres = lres.strip(b''.join(_WHITES))
-            if len(lout) > 0 or len(lres) > 0:
-                return False
-
-        # Both file still have lines to go: ok if they agree except
-        # for the number of whitespaces
-        else:
-            lout = _white_diff_canonicalize(lout)
-            lres = _white_diff_canonicalize(lres)
-            if lout != lres:
-                return False
+        if output_pos == len(output_chunk):
+            output_chunk, output_pos = next(output_chunks, b''), 0
+        if res_pos == len(res_chunk):
+            res_chunk, res_pos = memoryview(next(res_chunks, b'')), 0
+
+        # At least one file finished: since the canonical forms have
+        # no trailing separators, the other must have finished too.
+        if len(output_chunk) == 0 or len(res_chunk) == 0:
+            return len(output_chunk) == len(res_chunk)
+
+        # startswith with a memoryview compares without copying.
+        length = min(len(output_chunk) - output_pos,
+                     len(res_chunk) - res_pos)
+        if not output_chunk.startswith(
+                res_chunk[res_pos:res_pos + length], output_pos):
+            return False
+        output_pos += length
+        res_pos += length
 
 
 def white_diff_fobj_step(output_fobj, correct_output_fobj):
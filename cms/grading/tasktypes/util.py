@@ -34,9 +34,10 @@ import os
 import shutil
 
 from cms import config
+from cms.db.filecacher import clonefileobj
 from cms.grading import JobException
 from cms.grading.Job import CompilationJob, EvaluationJob
-from cms.grading.Sandbox import Sandbox
+from cms.grading.Sandbox import Sandbox, sandbox_pool
 from cms.grading.steps import EVALUATION_MESSAGES, checker_step, \
     white_diff_fobj_step
 
@@ -48,7 +49,7 @@ EVAL_USER_OUTPUT_FILENAME = "user_output.txt"
 
 
 def create_sandbox(file_cacher, name=None):
-    """Create a sandbox, and return it.
+    """Create a sandbox (or reuse an idle one), and return it.
 
     file_cacher (FileCacher): a file cacher instance.
     name (str): name to include in the path of the sandbox.
@@ -58,6 +59,9 @@ def create_sandbox(file_cacher, name=None):
     raise (JobException): if the sandbox cannot be created.
 
     """
+    sandbox = sandbox_pool.acquire(file_cacher, name=name)
+    if sandbox is not None:
+        return sandbox
     try:
         sandbox = Sandbox(file_cacher, name=name)
     except OSError:
@@ -70,6 +74,9 @@ def create_sandbox(file_cacher, name=None):
 def delete_sandbox(sandbox, success=True, keep_sandbox=False):
     """Delete the sandbox, if the configuration and job was ok.
 
+    If the sandbox would be deleted, it is instead given to the sandbox
+    pool, if enabled, for reuse by later jobs.
+
     sandbox (Sandbox): the sandbox to delete.
     success (boolean): if the job succeeded (no system errors).
     keep_sandbox (bool): whether to keep the sandbox regardless of other
@@ -82,6 +89,8 @@ def delete_sandbox(sandbox, success=True, keep_sandbox=False):
                        sandbox.get_root_path())
 
     delete = success and not config.keep_sandbox and not keep_sandbox
+    if delete and sandbox_pool.release(sandbox):
+        return
     try:
         sandbox.cleanup(delete=delete)
     except OSError:
@@ -244,10 +253,15 @@ def eval_output(file_cacher, job, checker_codename,
         sandbox = create_sandbox(file_cacher, name="check")
         job.sandboxes.append(sandbox.get_root_path())
 
-        # Put user output in the sandbox.
+        # Put user output in the sandbox, sharing the data if the
+        # filesystem allows it.
         if user_output_path is not None:
-            shutil.copyfile(user_output_path,
-                            sandbox.relative_path(EVAL_USER_OUTPUT_FILENAME))
+            dst_path = sandbox.relative_path(EVAL_USER_OUTPUT_FILENAME)
+            with open(user_output_path, "rb") as src_fobj, \
+                    open(dst_path, "wb") as dst_fobj:
+                cloned = clonefileobj(src_fobj, dst_fobj)
+            if not cloned:
+                shutil.copyfile(user_output_path, dst_path)
         else:
             sandbox.create_file_from_storage(EVAL_USER_OUTPUT_FILENAME,
                                              user_output_digest)
@@ -262,6 +276,11 @@ def eval_output(file_cacher, job, checker_codename,
         return success, outcome, text
 
     else:
+        # Identical files are trivially equal for the white diff, no
+        # need to read them.
+        if user_output_digest is not None and user_output_digest == job.output:
+            return True, 1.0, [EVALUATION_MESSAGES.get("success").message]
+
         if user_output_path is not None:
             user_output_fobj = open(user_output_path, "rb")
         else:
@@ -38,7 +38,11 @@ together the three data point: item, priority, and timestamp.
 
 """
 
+import bisect
+import heapq
+from collections import deque
 from functools import total_ordering
+from itertools import islice
 
 from gevent.event import Event
 
@@ -92,6 +96,96 @@ class QueueEntry:
                < (other.priority, other.timestamp, other.index)
 
 
+class _Bucket:
+
+    """The entries of a PriorityQueue with the same priority.
+
+    Entries are usually pushed in order of timestamp, and they go at
+    the end of a deque; the others go in a min-heap. The first entry
+    of the bucket is the smallest between the heads of the two.
+
+    Removed entries are not taken out of the deque or the heap
+    immediately, but only when they get at their head, or when they
+    are so many that it's worth rebuilding them.
+
+    """
+
+    def __init__(self):
+        # Entries pushed in order.
+        self.fifo = deque()
+        # Entries pushed out of order.
+        self.heap = []
+        # Number of entries not removed.
+        self.count = 0
+
+    def push(self, entry):
+        """Add an entry to the bucket.
+
+        entry (QueueEntry): the entry to add.
+
+        """
+        if len(self.fifo) == 0 or not entry < self.fifo[-1]:
+            self.fifo.append(entry)
+        else:
+            heapq.heappush(self.heap, entry)
+        self.count += 1
+
+    def clean(self, live):
+        """Drop the removed entries at the heads of the bucket.
+
+        live (function): tell whether an entry has not been removed.
+
+        """
+        while len(self.fifo) > 0 and not live(self.fifo[0]):
+            self.fifo.popleft()
+        while len(self.heap) > 0 and not live(self.heap[0]):
+            heapq.heappop(self.heap)
+        # Rebuild the bucket when most entries are removed ones, so
+        # that they do not take more than a constant factor of space.
+        if len(self.fifo) + len(self.heap) > 2 * self.count + 16:
+            self.fifo = deque(entry for entry in self.fifo if live(entry))
+            self.heap = [entry for entry in self.heap if live(entry)]
+            heapq.heapify(self.heap)
+
+    def top(self):
+        """Return the first entry, assuming the bucket is clean.
+
+        return (QueueEntry|None): the first entry, or None if empty.
+
+        """
+        if len(self.heap) == 0:
+            return self.fifo[0] if len(self.fifo) > 0 else None
+        if len(self.fifo) == 0 or self.heap[0] < self.fifo[0]:
+            return self.heap[0]
+        return self.fifo[0]
+
+    def pop_top(self):
+        """Extract the first entry, assuming the bucket is clean.
+
+        return (QueueEntry): the first entry.
+
+        """
+        top = self.top()
+        if len(self.heap) > 0 and top is self.heap[0]:
+            heapq.heappop(self.heap)
+        else:
+            self.fifo.popleft()
+        self.count -= 1
+        return top
+
+    def entries(self, live):
+        """Iterate over the entries in order.
+
+        live (function): tell whether an entry has not been removed.
+
+        return (iterable of QueueEntry): the entries not removed.
+
+        """
+        return (entry
+                for entry in heapq.merge(self.fifo, sorted(self.heap))
+                if live(entry))
+
+
 class PriorityQueue:
 
     """A priority queue.
@@ -99,9 +193,10 @@ class PriorityQueue:
     It is greenlet-safe, and offers the ability of changing priorities
     and removing arbitrary items.
 
-    The queue is implemented as a custom min-heap. The priority is a
-    mix of a discrete priority level and of the timestamp. The
-    elements of the queue are QueueItems.
+    The priority is a mix of a discrete priority level and of the
+    timestamp. The entries of each level are kept in a separate bucket
+    where, as timestamps are usually increasing, pushing and popping
+    take constant time. The elements of the queue are QueueItems.
 
     """
 
@@ -113,12 +208,13 @@ class PriorityQueue:
 
     def __init__(self):
         """Create a priority queue."""
-        # The queue: a min-heap whose elements are of the form
-        # (priority, timestamp, item), where item is the actual data.
-        self._queue = []
+        # The buckets of the entries, indexed by priority, and the
+        # priorities of the buckets, sorted.
+        self._buckets = {}
+        self._priorities = []
 
         # Reverse lookup for the items in the queue: a dictionary
-        # associating the index in the queue to each item.
+        # associating its entry to each item.
         self._reverse = {}
 
         # Event to signal that there are items in the queue.
@@ -128,7 +224,17 @@ class PriorityQueue:
         self._next_index = 0
 
     def __len__(self):
-        return len(self._queue)
+        return len(self._reverse)
+
+    def _live(self, entry):
+        """Return whether an entry in a bucket has not been removed.
+
+        entry (QueueEntry): an entry in one of the buckets.
+
+        return (bool): whether the entry is in the queue.
+
+        """
+        return self._reverse.get(entry.item) is entry
 
     def _verify(self):
         """Make sure that the internal state of the queue is consistent.
@@ -136,16 +242,22 @@ class PriorityQueue:
         This is used only for testing.
 
         """
-        if len(self._queue) != len(self._reverse):
-            return False
-        if len(self._queue) != self.length():
+        if len(self._reverse) != self.length():
             return False
         if self.empty() != (self.length() == 0):
             return False
         if self._event.isSet() == self.empty():
             return False
-        for item, idx in self._reverse.items():
-            if self._queue[idx].item != item:
+        if sorted(self._buckets) != self._priorities:
+            return False
+        if sum(bucket.count for bucket in self._buckets.values()) \
+                != len(self._reverse):
+            return False
+        for priority, bucket in self._buckets.items():
+            entries = list(bucket.entries(self._live))
+            if len(entries) != bucket.count:
+                return False
+            if any(entry.priority != priority for entry in entries):
                 return False
         return True
 
@@ -159,70 +271,32 @@ class PriorityQueue:
         """
         return item in self._reverse
 
-    def _swap(self, idx1, idx2):
-        """Swap two elements in the queue, keeping their reverse
-        indices up to date.
+    def _push_entry(self, entry):
+        """Add an entry to the bucket of its priority.
 
-        idx1 (int): the index of the first element.
-        idx2 (int): the index of the second element.
+        entry (QueueEntry): the entry to add.
 
         """
-        self._queue[idx1], self._queue[idx2] = \
-            self._queue[idx2], self._queue[idx1]
-        self._reverse[self._queue[idx1].item] = idx1
-        self._reverse[self._queue[idx2].item] = idx2
+        bucket = self._buckets.get(entry.priority)
+        if bucket is None:
+            bucket = self._buckets[entry.priority] = _Bucket()
+            bisect.insort(self._priorities, entry.priority)
+        bucket.push(entry)
+        self._reverse[entry.item] = entry
 
-    def _up_heap(self, idx):
-        """Take the element in position idx up in the heap until its
-        position is the right one.
+    def _top_bucket(self):
+        """Return the bucket containing the first entry.
 
-        idx (int): the index of the element to lift.
-
-        return (int): the new index of the element.
+        return (_Bucket|None): the non-empty bucket with the highest
+            priority (clean), or None if the queue is empty.
 
         """
-        while idx > 0:
-            parent = (idx - 1) // 2
-            if self._queue[idx] < self._queue[parent]:
-                self._swap(parent, idx)
-                idx = parent
-            else:
-                break
-        return idx
-
-    def _down_heap(self, idx):
-        """Take the element in position idx down in the heap until its
-        position is the right one.
-
-        idx (int): the index of the element to lower.
-
-        return (int): the new index of the element.
-
-        """
-        last = len(self._queue) - 1
-        while 2 * idx + 1 <= last:
-            child = 2 * idx + 1
-            if 2 * idx + 2 <= last and \
-                    self._queue[2 * idx + 2] < self._queue[child]:
-                child = 2 * idx + 2
-            if self._queue[child] < self._queue[idx]:
-                self._swap(child, idx)
-                idx = child
-            else:
-                break
-        return idx
-
-    def _updown_heap(self, idx):
-        """Perform both operations of up_heap and down_heap on an
-        element.
-
-        idx (int): the index of the element to lift.
-
-        return (int): the new index of the element.
-
-        """
-        idx = self._up_heap(idx)
-        return self._down_heap(idx)
+        for priority in self._priorities:
+            bucket = self._buckets[priority]
+            if bucket.count > 0:
+                bucket.clean(self._live)
+                return bucket
+        return None
 
     def push(self, item, priority=None, timestamp=None):
         """Push an item in the queue. If timestamp is not specified,
@@ -249,10 +323,7 @@ class PriorityQueue:
         index = self._next_index
         self._next_index += 1
 
-        self._queue.append(QueueEntry(item, priority, timestamp, index))
-        last = len(self._queue) - 1
-        self._reverse[item] = last
-        self._up_heap(last)
+        self._push_entry(QueueEntry(item, priority, timestamp, index))
 
         # Signal to listener greenlets that there might be something.
         self._event.set()
@@ -269,17 +340,13 @@ class PriorityQueue:
         raise (LookupError): on empty queue if wait was false.
 
         """
-        if not self.empty():
-            return self._queue[0]
-        else:
+        while True:
+            bucket = self._top_bucket()
+            if bucket is not None:
+                return bucket.top()
             if not wait:
                 raise LookupError("Empty queue.")
-            else:
-                while True:
-                    if self.empty():
-                        self._event.wait()
-                        continue
-                    return self._queue[0]
+            self._event.wait()
 
     def pop(self, wait=False):
         """Extract (and return) the first element in the queue.
@@ -291,17 +358,11 @@ class PriorityQueue:
         raise (LookupError): on empty queue, if wait was false.
 
         """
-        top = self.top(wait)
-        last = len(self._queue) - 1
-        self._swap(0, last)
-
+        self.top(wait)
+        top = self._top_bucket().pop_top()
         del self._reverse[top.item]
-        del self._queue[last]
 
-        # last is 0 when the queue becomes empty.
-        if last > 0:
-            self._down_heap(0)
-        else:
+        if self.empty():
             # Signal that there is nothing left for listeners.
             self._event.clear()
         return top
@@ -316,16 +377,10 @@ class PriorityQueue:
         raise (KeyError): if item not present.
 
         """
-        pos = self._reverse[item]
-        entry = self._queue[pos]
-
-        last = len(self._queue) - 1
-        self._swap(pos, last)
-
-        del self._reverse[item]
-        del self._queue[last]
-        if pos != last:
-            self._updown_heap(pos)
+        entry = self._reverse.pop(item)
+        bucket = self._buckets[entry.priority]
+        bucket.count -= 1
+        bucket.clean(self._live)
 
         if self.empty():
             self._event.clear()
@@ -342,9 +397,10 @@ class PriorityQueue:
         raise (LookupError): if item not present.
 
         """
-        pos = self._reverse[item]
-        self._queue[pos].priority = priority
-        self._updown_heap(pos)
+        entry = self.remove(item)
+        self._push_entry(
+            QueueEntry(item, priority, entry.timestamp, entry.index))
+        self._event.set()
 
     def length(self):
         """Return the number of elements in the queue.
@@ -352,7 +408,7 @@ class PriorityQueue:
         return (int): length of the queue
 
         """
-        return len(self._queue)
+        return len(self._reverse)
 
     def empty(self):
         """Return if the queue is empty.
@@ -362,19 +418,58 @@ class PriorityQueue:
         """
         return self.length() == 0
 
-    def get_status(self):
-        """Return the content of the queue. Note that the order may be not
-        correct, but the first element is the one at the top.
+    def _entries(self):
+        """Iterate over the entries in the queue, in order.
+
+        return (iterable of QueueEntry): the entries.
+
+        """
+        for priority in self._priorities:
+            yield from self._buckets[priority].entries(self._live)
+
+    def get_status(self, offset=0, limit=None):
+        """Return the content of the queue, in order.
+
+        As the queue can be very long, it can be returned one page at
+        a time.
+
+        offset (int): the number of entries to skip.
+        limit (int|None): the maximum number of entries to return, or
+            None to return all of them.
 
         return ([QueueEntry]): a list of entries containing the
             representation of the item, the priority and the
             timestamp.
 
         """
+        stop = offset + limit if limit is not None else None
         return [{'item': entry.item.to_dict(),
                  'priority': entry.priority,
                  'timestamp': make_timestamp(entry.timestamp)}
-                for entry in self._queue]
+                for entry in islice(self._entries(), offset, stop)]
+
+    def get_summary(self):
+        """Return the number of entries in the queue, by priority.
+
+        This takes constant time (in the length of the queue), so it
+        can be called often even when the queue is very long.
+
+        return ({"length": int, "priorities": [dict]}): the number of
+            entries in the queue and, for each priority with at least
+            one entry, the priority, the number of entries ("count") and
+            the timestamp of the oldest one ("oldest").
+
+        """
+        priorities = []
+        for priority in self._priorities:
+            bucket = self._buckets[priority]
+            if bucket.count > 0:
+                bucket.clean(self._live)
+                priorities.append({
+                    'priority': priority,
+                    'count': bucket.count,
+                    'oldest': make_timestamp(bucket.top().timestamp)})
+        return {'length': self.length(), 'priorities': priorities}
 
 
 # Fake objects for testing follow.
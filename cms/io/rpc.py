@@ -25,8 +25,10 @@ import ipaddress
 import json
 import logging
 import socket
+import struct
 import traceback
 import uuid
+import zlib
 from weakref import WeakSet
 
 import gevent
@@ -40,6 +42,20 @@ from cms import Address, get_service_address
 logger = logging.getLogger(__name__)
 
 
+# The pseudo-method a client calls, as its first request, to ask the
+# server to switch to the binary protocol. Servers not knowing it
+# answer with an error, and both ends keep the line-based protocol.
+NEGOTIATION_METHOD = "__negotiate"
+
+# Header of the messages in the binary protocol: the length of the
+# payload (as sent) and some flags.
+_FRAME_HEADER = struct.Struct("!IB")
+_FLAG_ZLIB = 0x01
+
+# Compression algorithms we support, in order of preference.
+COMPRESSIONS = ["zlib"]
+
+
 class RPCError(Exception):
     """Generic error during RPC communication."""
     pass
@@ -74,11 +90,24 @@ class RemoteServiceBase:
     When the state changes the on_connect or on_disconnect handlers
     will be fired.
 
+    Messages are exchanged in one of two formats. In the line-based
+    protocol each message is terminated by "\r\n". In the binary
+    protocol each message is preceded by a header with its length and
+    flags, and it can be compressed. Every connection starts with the
+    line-based protocol, and switches to the binary protocol if the
+    client asks for it with its first request and the server agrees.
+
     """
-    # Incoming messages larger than 1 MiB are dropped to avoid DOS
-    # attacks. XXX Check that this size is sensible.
+    # Incoming messages larger than 1 MiB (before compression) are
+    # dropped to avoid DOS attacks. XXX Check that this size is
+    # sensible.
     MAX_MESSAGE_SIZE = 1024 * 1024
 
+    # Messages shorter than this are not worth compressing.
+    COMPRESSION_THRESHOLD = 4 * 1024
+    # The zlib compression level, favoring speed over size.
+    COMPRESSION_LEVEL = 1
+
     def __init__(self, remote_address):
         """Prepare to handle a connection with the given remote address.
 
@@ -97,6 +126,11 @@ class RemoteServiceBase:
         self._reader = None
         self._writer = None
 
+        # Whether the binary protocol is in use, and the compression
+        # algorithm agreed on (None if messages are not compressed).
+        self._binary = False
+        self._compression = None
+
         self._read_lock = gevent.lock.RLock()
         self._write_lock = gevent.lock.RLock()
 
@@ -151,8 +185,16 @@ class RemoteServiceBase:
             raise RuntimeError("Already connected.")
 
         self._socket = sock
+        # Messages are written whole, so there is no point in waiting
+        # to coalesce them, and the latency would hurt.
+        try:
+            self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except OSError:
+            pass
         self._reader = self._socket.makefile('rb')
         self._writer = self._socket.makefile('wb')
+        self._binary = False
+        self._compression = None
         self._connection_event.set()
         # IPv4 addresses have two elements (host and port), IPv6 ones
         # have 4 elements (host, port, flowinfo and scopeid). We will
@@ -214,10 +256,13 @@ class RemoteServiceBase:
     def _read(self):
         """Receive a message from the socket.
 
-        Read from the socket until a "\\r\\n" is found. That is what we
-        consider a "message" in the communication protocol.
+        In the line-based protocol, read from the socket until a
+        "\\r\\n" is found. In the binary protocol, read the header and
+        then as many bytes as it says. That is what we consider a
+        "message" in the communication protocol.
 
-        return (bytes): the retrieved message.
+        return (bytes): the retrieved message (empty if the connection
+            was closed).
 
         raise (OSError): if reading fails.
 
@@ -229,17 +274,10 @@ class RemoteServiceBase:
             with self._read_lock:
                 if not self.connected:
                     raise OSError("Not connected.")
-                data = self._reader.readline(self.MAX_MESSAGE_SIZE)
-                # If there weren't a "\r\n" between the last message
-                # and the EOF we would have a false positive here.
-                # Luckily there is one.
-                if len(data) > 0 and not data.endswith(b"\r\n"):
-                    logger.error(
-                        "The client sent a message larger than %d bytes (that "
-                        "is MAX_MESSAGE_SIZE). Consider raising that value if "
-                        "the message seemed legit.", self.MAX_MESSAGE_SIZE)
-                    self.finalize("Client misbehaving.")
-                    raise OSError("Message too long.")
+                if self._binary:
+                    data = self._read_frame()
+                else:
+                    data = self._read_line()
         except OSError as error:
             if self.connected:
                 logger.warning("Failed reading from socket: %s.", error)
@@ -252,10 +290,72 @@ class RemoteServiceBase:
 
         return data
 
+    def _message_too_long(self):
+        """Close the connection after receiving a message too long.
+
+        raise (OSError): always.
+
+        """
+        logger.error(
+            "The client sent a message larger than %d bytes (that "
+            "is MAX_MESSAGE_SIZE). Consider raising that value if "
+            "the message seemed legit.", self.MAX_MESSAGE_SIZE)
+        self.finalize("Client misbehaving.")
+        raise OSError("Message too long.")
+
+    def _read_line(self):
+        """Receive a message in the line-based protocol.
+
+        return (bytes): the message, including the "\\r\\n".
+
+        raise (OSError): if reading fails.
+
+        """
+        data = self._reader.readline(self.MAX_MESSAGE_SIZE)
+        # If there weren't a "\r\n" between the last message
+        # and the EOF we would have a false positive here.
+        # Luckily there is one.
+        if len(data) > 0 and not data.endswith(b"\r\n"):
+            self._message_too_long()
+        return data
+
+    def _read_frame(self):
+        """Receive a message in the binary protocol.
+
+        return (bytes): the message, decompressed.
+
+        raise (OSError): if reading fails.
+
+        """
+        header = self._reader.read(_FRAME_HEADER.size)
+        if len(header) == 0:
+            return b""
+        if len(header) < _FRAME_HEADER.size:
+            raise OSError("Connection closed in the middle of a message.")
+        length, flags = _FRAME_HEADER.unpack(header)
+        if length > self.MAX_MESSAGE_SIZE:
+            self._message_too_long()
+
+        data = self._reader.read(length)
+        if len(data) < length:
+            raise OSError("Connection closed in the middle of a message.")
+
+        if flags & _FLAG_ZLIB:
+            decompressor = zlib.decompressobj()
+            try:
+                data = decompressor.decompress(data, self.MAX_MESSAGE_SIZE)
+            except zlib.error as error:
+                raise OSError("Cannot decompress message: %s." % error)
+            if decompressor.unconsumed_tail:
+                self._message_too_long()
+        return data
+
     def _write(self, data):
         """Send a message to the socket.
 
-        Automatically append "\\r\\n" to make it a correct message.
+        Automatically append "\\r\\n" (in the line-based protocol) or
+        prepend the header (in the binary protocol, compressing the
+        message if it is long enough) to make it a correct message.
 
         data (bytes): the message to transmit.
 
@@ -265,7 +365,7 @@ class RemoteServiceBase:
         if not self.connected:
             raise OSError("Not connected.")
 
-        if len(data + b'\r\n') > self.MAX_MESSAGE_SIZE:
+        if len(data) + len(b'\r\n') > self.MAX_MESSAGE_SIZE:
             logger.error(
                 "A message wasn't sent to %r because it was larger than %d "
                 "bytes (that is MAX_MESSAGE_SIZE). Consider raising that "
@@ -278,14 +378,35 @@ class RemoteServiceBase:
             with self._write_lock:
                 if not self.connected:
                     raise OSError("Not connected.")
-                # Does the same as self._socket.sendall.
-                self._writer.write(data + b'\r\n')
+                # Does the same as self._socket.sendall, without
+                # copying the message to add the delimiters.
+                if self._binary:
+                    self._write_frame(data)
+                else:
+                    self._writer.write(data)
+                    self._writer.write(b'\r\n')
                 self._writer.flush()
         except OSError as error:
             self.finalize("Write failed.")
             logger.warning("Failed writing to socket: %s.", error)
             raise error
 
+    def _write_frame(self, data):
+        """Write a message in the binary protocol, without flushing.
+
+        data (bytes): the message to transmit.
+
+        """
+        flags = 0
+        if self._compression == "zlib" \
+                and len(data) >= self.COMPRESSION_THRESHOLD:
+            compressed = zlib.compress(data, self.COMPRESSION_LEVEL)
+            if len(compressed) < len(data):
+                data = compressed
+                flags |= _FLAG_ZLIB
+        self._writer.write(_FRAME_HEADER.pack(len(data), flags))
+        self._writer.write(data)
+
 
 class RemoteServiceServer(RemoteServiceBase):
     """The server side of a RPC communication.
@@ -333,6 +454,7 @@ class RemoteServiceServer(RemoteServiceBase):
         it's therefore advisable to spawn a greenlet to call it.
 
         """
+        first = True
         while True:
             try:
                 data = self._read()
@@ -343,8 +465,51 @@ class RemoteServiceServer(RemoteServiceBase):
                 self.finalize("Connection closed.")
                 break
 
+            # The request to switch protocol must be handled before
+            # reading the next message, which could use the new one.
+            if first:
+                first = False
+                if self._accept_negotiation(data):
+                    continue
+
             gevent.spawn(self.process_data, data)
 
+    def _accept_negotiation(self, data):
+        """Switch to the binary protocol if the message asks for it.
+
+        data (bytes): the first message read from the socket.
+
+        return (bool): whether the message was a negotiation request
+            (and has been answered).
+
+        """
+        try:
+            request = json.loads(data.decode('utf-8'))
+            if request["__method"] != NEGOTIATION_METHOD:
+                return False
+            offer = request["__data"]
+            if "binary" not in offer["framing"]:
+                return False
+            compression = next((algorithm
+                                for algorithm in offer.get("compression", [])
+                                if algorithm in COMPRESSIONS), None)
+            response = {"__id": request["__id"],
+                        "__data": {"framing": "binary",
+                                   "compression": compression},
+                        "__error": None}
+        except (ValueError, KeyError, TypeError):
+            # Let process_data deal with it.
+            return False
+
+        try:
+            self._write(json.dumps(response).encode('utf-8'))
+        except OSError:
+            # Log messages have already been produced.
+            return True
+        self._binary = True
+        self._compression = compression
+        return True
+
     def process_data(self, data):
         """Handle the message.
 
@@ -512,11 +677,57 @@ class RemoteServiceClient(RemoteServiceBase):
             while not self.connected and self.auto_retry is not None:
                 gevent.sleep(self.auto_retry)
                 self._connect()
+            if self.connected:
+                self._negotiate()
             if self.connected:
                 self.run()
             if self.auto_retry is None:
                 break
 
+    def _negotiate(self):
+        """Ask the server to switch to the binary protocol.
+
+        Called right after connecting, before any other request; the
+        write lock is held until the end of the negotiation, so other
+        requests wait for the protocol to be decided. If the server
+        does not support the binary protocol, stay with the line-based
+        one.
+
+        """
+        request = {"__id": uuid.uuid4().hex,
+                   "__method": NEGOTIATION_METHOD,
+                   "__data": {"framing": ["binary"],
+                              "compression": COMPRESSIONS}}
+        with self._write_lock:
+            try:
+                self._write(json.dumps(request).encode('utf-8'))
+                data = self._read()
+            except OSError:
+                return
+            if len(data) == 0:
+                self.finalize("Connection closed.")
+                return
+
+            try:
+                response = json.loads(data.decode('utf-8'))
+                error = response["__error"]
+                accepted = error is None \
+                    and response["__data"]["framing"] == "binary"
+                compression = response["__data"]["compression"] \
+                    if accepted else None
+            except (ValueError, KeyError, TypeError):
+                self.disconnect("Bad response received")
+                logger.warning("Cannot parse negotiation response.")
+                return
+
+            if not accepted:
+                logger.info("%s does not support the binary protocol, using "
+                            "the line-based one.", self._repr_remote())
+                return
+            self._binary = True
+            self._compression = \
+                compression if compression in COMPRESSIONS else None
+
     def connect(self):
         """Connect and start the main loop.
 
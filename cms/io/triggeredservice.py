@@ -70,16 +70,28 @@ class Executor(metaclass=ABCMeta):
         """
         return item in self._operation_queue
 
-    def get_status(self):
+    def get_status(self, offset=0, limit=None):
         """Return a the status of the queues.
 
-        More precisely, a list of entries in the executor's queue. The
-        first item is the top item, the others are not in order.
+        More precisely, a list of entries in the executor's queue, in
+        order, possibly restricted to a page.
+
+        offset (int): the number of entries to skip.
+        limit (int|None): the maximum number of entries to return, or
+            None to return all of them.
 
         return ([QueueEntry]): the list with the queued elements.
 
         """
-        return self._operation_queue.get_status()
+        return self._operation_queue.get_status(offset, limit)
+
+    def get_summary(self):
+        """Return the number of entries in the queue, by priority.
+
+        return (dict): see PriorityQueue.get_summary.
+
+        """
+        return self._operation_queue.get_summary()
 
     def enqueue(self, item, priority=None, timestamp=None):
         """Add an item to the queue.
@@ -358,14 +370,19 @@ class TriggeredService(Service):
         self._sweeper_event.set()
 
     @rpc_method
-    def queue_status(self):
+    def queue_status(self, offset=0, limit=None):
         """Return the status of the queues.
 
         More precisely, a list indexed by each executor, whose
-        elements are the list of entries in the executor's queue. The
-        first item is the top item, the others are not in order.
+        elements are the list of entries in the executor's queue, in
+        order, possibly restricted to a page.
+
+        offset (int): the number of entries of each queue to skip.
+        limit (int|None): the maximum number of entries of each queue
+            to return, or None to return all of them.
 
         return ([[QueueEntry]]): the list with the queued elements.
 
         """
-        return [executor.get_status() for executor in self._executors]
+        return [executor.get_status(offset, limit)
+                for executor in self._executors]
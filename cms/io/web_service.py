@@ -38,7 +38,7 @@ from werkzeug.contrib.fixers import ProxyFix
 from werkzeug.wsgi import DispatcherMiddleware, SharedDataMiddleware
 
 from cms.db.filecacher import FileCacher
-from cms.server.file_middleware import FileServerMiddleware
+from cms.server.file_middleware import FileServerMiddleware, WSGIHandler
 from .service import Service
 from .web_rpc import RPCMiddleware
 
@@ -64,6 +64,8 @@ class WebService(Service):
         auth_middleware = parameters.pop('auth_middleware', None)
         is_proxy_used = parameters.pop('is_proxy_used', None)
         num_proxies_used = parameters.pop('num_proxies_used', None)
+        sendfile_header = parameters.pop('sendfile_header', None)
+        sendfile_prefix = parameters.pop('sendfile_prefix', None)
 
         self.wsgi_app = tornado_wsgi.WSGIApplication(handlers, **parameters)
         self.wsgi_app.service = self
@@ -77,7 +79,9 @@ class WebService(Service):
                 fallback_mimetype="application/octet-stream")
 
         self.file_cacher = FileCacher(self)
-        self.wsgi_app = FileServerMiddleware(self.file_cacher, self.wsgi_app)
+        self.wsgi_app = FileServerMiddleware(
+            self.file_cacher, self.wsgi_app,
+            sendfile_header=sendfile_header, sendfile_prefix=sendfile_prefix)
 
         if rpc_enabled:
             self.wsgi_app = DispatcherMiddleware(
@@ -108,7 +112,8 @@ class WebService(Service):
 
         logger.info("%s listening on '%s' at port %d",
             type(self).__name__, listen_address, listen_port)
-        self.web_server = WSGIServer((listen_address, listen_port), self)
+        self.web_server = WSGIServer((listen_address, listen_port), self,
+                                     handler_class=WSGIHandler)
 
     def __call__(self, environ, start_response):
         """Execute this instance as a WSGI application.
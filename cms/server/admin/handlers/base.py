@@ -227,6 +227,7 @@ class BaseHandler(CommonRequestHandler):
                 "Operation failed.", "%s" % error)
             return False
         else:
+            self.service.invalidate_contest_cache()
             self.service.add_notification(
                 make_datetime(),
                 "Operation successful.", "")
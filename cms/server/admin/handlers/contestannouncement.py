@@ -57,7 +57,9 @@ class AddAnnouncementHandler(BaseHandler):
             ann = Announcement(make_datetime(), subject, text,
                                contest=self.contest, admin=self.current_user)
             self.sql_session.add(ann)
-            self.try_commit()
+            if self.try_commit():
+                self.service.notify_communication(
+                    ann.timestamp, contest_id=self.contest.id)
         else:
             self.service.add_notification(
                 make_datetime(), "Subject is mandatory.", "")
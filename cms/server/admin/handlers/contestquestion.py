@@ -108,6 +108,9 @@ class QuestionReplyHandler(BaseHandler):
                         question.participation.user.username,
                         question.participation.contest.name,
                         question_id)
+            self.service.notify_communication(
+                question.reply_timestamp,
+                participation_id=question.participation_id)
 
         self.redirect(ref)
 
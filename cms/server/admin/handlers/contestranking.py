@@ -29,10 +29,11 @@
 import csv
 import io
 
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import joinedload
 
 from cms.db import Contest
-from cms.grading.scoring import task_score
+from cms.grading.scoring import get_task_scores
 from .base import BaseHandler, require_permission
 
 
@@ -43,16 +44,23 @@ class RankingHandler(BaseHandler):
     @require_permission(BaseHandler.AUTHENTICATED)
     def get(self, contest_id, format="online"):
         # This validates the contest id.
-        self.safe_get_item(Contest, contest_id)
+        contest = self.safe_get_item(Contest, contest_id)
+
+        # The scores are read from the cache, where ScoringService
+        # keeps them up to date; only the stale ones are computed
+        # again, loading just their submissions.
+        scores = get_task_scores(self.sql_session, contest)
+        try:
+            self.sql_session.commit()
+        except IntegrityError:
+            # Someone else stored them at the same time.
+            self.sql_session.rollback()
 
-        # This massive joined load gets all the information which we will need
-        # to generating the rankings.
         self.contest = self.sql_session.query(Contest)\
             .filter(Contest.id == contest_id)\
             .options(joinedload('participations'))\
-            .options(joinedload('participations.submissions'))\
-            .options(joinedload('participations.submissions.token'))\
-            .options(joinedload('participations.submissions.results'))\
+            .options(joinedload('participations.user'))\
+            .options(joinedload('participations.team'))\
             .first()
 
         # Preprocess participations: get data about teams, scores
@@ -64,7 +72,8 @@ class RankingHandler(BaseHandler):
             total_score = 0.0
             partial = False
             for task in self.contest.tasks:
-                t_score, t_partial = task_score(p, task, rounded=True)
+                t_score, t_partial = scores.get((p.id, task.id), (0.0, False))
+                t_score = round(t_score, task.score_precision)
                 p.scores.append((t_score, t_partial))
                 total_score += t_score
                 partial = partial or t_partial
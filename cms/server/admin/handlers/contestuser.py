@@ -275,5 +275,7 @@ class MessageHandler(BaseHandler):
         if self.try_commit():
             logger.info("Message submitted to user %s in contest %s.",
                         user.username, self.contest.name)
+            self.service.notify_communication(
+                message.timestamp, participation_id=participation.id)
 
         self.redirect(self.url("contest", contest_id, "user", user_id, "edit"))
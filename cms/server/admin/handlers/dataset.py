@@ -300,7 +300,7 @@ class ActivateDatasetHandler(BaseHandler):
         datetime = make_datetime()
 
         r = re.compile('notify_([0-9]+)$')
-        count = 0
+        participations = []
         for k in self.request.arguments:
             m = r.match(k)
             if not m:
@@ -311,12 +311,15 @@ class ActivateDatasetHandler(BaseHandler):
                               self.get_argument("message_text", ""),
                               participation=participation)
             self.sql_session.add(message)
-            count += 1
+            participations.append(participation)
 
         if self.try_commit():
+            for participation in participations:
+                self.service.notify_communication(
+                    datetime, participation_id=participation.id)
             self.service.add_notification(
                 make_datetime(),
-                "Messages sent to %d users." % count, "")
+                "Messages sent to %d users." % len(participations), "")
 
         self.redirect(self.url("task", task.id))
 
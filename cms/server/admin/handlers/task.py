@@ -176,9 +176,12 @@ class TaskHandler(BaseHandler):
             self.redirect(self.url("task", task_id))
             return
 
+        reevaluate = False
         for dataset in task.datasets:
             try:
                 attrs = dataset.get_attrs()
+                old_score_type = (attrs["score_type"],
+                                  attrs["score_type_parameters"])
 
                 self.get_time_limit(attrs, "time_limit_%d" % dataset.id)
                 self.get_memory_limit(attrs, "memory_limit_%d" % dataset.id)
@@ -190,6 +193,12 @@ class TaskHandler(BaseHandler):
                 # Update the dataset.
                 dataset.set_attrs(attrs)
 
+                # The testcases skipped may now affect the score.
+                if (attrs["score_type"], attrs["score_type_parameters"]) \
+                        != old_score_type \
+                        and dataset.drop_skipped_evaluations() > 0:
+                    reevaluate = True
+
             except Exception as error:
                 self.service.add_notification(
                     make_datetime(), "Invalid field(s)", repr(error))
@@ -214,6 +223,8 @@ class TaskHandler(BaseHandler):
             # Update the task and score on RWS.
             self.service.proxy_service.dataset_updated(
                 task_id=task.id)
+            if reevaluate:
+                self.service.evaluation_service.search_operations_not_done()
         self.redirect(self.url("task", task_id))
 
 
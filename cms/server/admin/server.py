@@ -26,14 +26,16 @@
 """
 
 import logging
+import time
 
-from sqlalchemy import func, not_, literal_column
+from sqlalchemy import and_, case, func, not_
 
 from cms import config, ServiceCoord, get_service_shards
-from cms.db import SessionGen, Dataset, Submission, SubmissionResult, Task
+from cms.db import SessionGen, Submission, SubmissionResult, Task
 from cms.io import WebService, rpc_method
 from cms.service import EvaluationService
 from cmscommon.binary import hex_to_bin
+from cmscommon.datetime import make_timestamp
 from .authentication import AWSAuthMiddleware
 from .handlers import HANDLERS
 from .jinja2_toolbox import AWS_ENVIRONMENT
@@ -89,6 +91,11 @@ class AdminWebServer(WebService):
                 ServiceCoord("ResourceService", i)))
         self.logservice = self.connect_to(ServiceCoord("LogService", 0))
 
+        self.contest_web_servers = []
+        for i in range(get_service_shards("ContestWebServer")):
+            self.contest_web_servers.append(self.connect_to(
+                ServiceCoord("ContestWebServer", i)))
+
     def is_rpc_authorized(self, service, shard, method):
         return rpc_authorization_checker(self.auth_handler.admin_id,
                                          service, shard, method)
@@ -104,6 +111,123 @@ class AdminWebServer(WebService):
         """
         self.notifications.append((timestamp, subject, text))
 
+    def invalidate_contest_cache(self):
+        """Tell all the shards of CWS that the data may have changed.
+
+        To be called after each edit (see ContestCache).
+
+        """
+        for contest_web_server in self.contest_web_servers:
+            contest_web_server.invalidate_cache()
+
+    def notify_communication(self, timestamp, contest_id=None,
+                             participation_id=None):
+        """Report a new communication to all the shards of CWS.
+
+        To be called once the communication has been committed.
+
+        timestamp (datetime): the time of the communication.
+        contest_id (int|None): the contest of a new announcement.
+        participation_id (int|None): the recipient of a new message
+            or answer to a question.
+
+        """
+        for contest_web_server in self.contest_web_servers:
+            contest_web_server.new_communication(
+                timestamp=make_timestamp(timestamp), contest_id=contest_id,
+                participation_id=participation_id)
+
+    # The statistics about the submissions are computed at most once
+    # every SUBMISSIONS_STATUS_TTL seconds, for all tasks together. The
+    # cache belongs to the process (AWS, or the Prometheus exporter),
+    # and it is never invalidated: submissions are created by CWS and
+    # re-evaluated by ES (AWS only forwards the requests of the admins
+    # to it), so any change shows up at most SUBMISSIONS_STATUS_TTL
+    # seconds later, in each process independently.
+    SUBMISSIONS_STATUS_TTL = 5.0
+    _submissions_status_cache = None
+
+    @classmethod
+    def submissions_status_by_task(cls):
+        """Return statistics about the submissions of each task.
+
+        Compute, in a single query, the statistics of submissions_status
+        for each task with some submissions. The result may be up to
+        SUBMISSIONS_STATUS_TTL seconds old.
+
+        return ({int: (str, int, int, dict)}): for each task id, the
+            name and the contest id of the task, the number of its
+            submissions with a result on the active dataset, and its
+            statistics.
+
+        """
+        now = time.monotonic()
+        if cls._submissions_status_cache is not None \
+                and now - cls._submissions_status_cache[0] \
+                <= cls.SUBMISSIONS_STATUS_TTL:
+            return cls._submissions_status_cache[1]
+
+        max_compilations = \
+            EvaluationService.EvaluationService.MAX_COMPILATION_TRIES
+        max_evaluations = \
+            EvaluationService.EvaluationService.MAX_EVALUATION_TRIES
+        compiled = SubmissionResult.filter_compiled()
+        evaluated = and_(compiled, SubmissionResult.filter_evaluated())
+        not_compiled = not_(compiled)
+        not_evaluated = and_(compiled,
+                             SubmissionResult.filter_compilation_succeeded(),
+                             not_(SubmissionResult.filter_evaluated()))
+
+        conditions = {}
+        conditions['compiling'] = and_(
+            not_compiled,
+            SubmissionResult.compilation_tries < max_compilations)
+        conditions['max_compilations'] = and_(
+            not_compiled,
+            SubmissionResult.compilation_tries >= max_compilations)
+        conditions['compilation_fail'] = \
+            SubmissionResult.filter_compilation_failed()
+        conditions['evaluating'] = and_(
+            not_evaluated,
+            SubmissionResult.evaluation_tries < max_evaluations)
+        conditions['max_evaluations'] = and_(
+            not_evaluated,
+            SubmissionResult.evaluation_tries >= max_evaluations)
+        conditions['scoring'] = and_(
+            evaluated, not_(SubmissionResult.filter_scored()))
+        conditions['scored'] = and_(
+            evaluated, SubmissionResult.filter_scored())
+
+        # The status of a submission is checked on its result for the
+        # active dataset of its task; without one, it is compiling.
+        # Conditions on a missing result are null, hence not counted.
+        keys = list(conditions.keys())
+        with SessionGen() as session:
+            rows = session.query(
+                Task.id, Task.name, Task.contest_id,
+                func.count(Submission.id),
+                func.count(SubmissionResult.submission_id),
+                *(func.sum(case([(conditions[key], 1)], else_=0))
+                  for key in keys))\
+                .select_from(Submission)\
+                .join(Task, Submission.task_id == Task.id)\
+                .outerjoin(SubmissionResult, and_(
+                    SubmissionResult.submission_id == Submission.id,
+                    SubmissionResult.dataset_id == Task.active_dataset_id))\
+                .group_by(Task.id)\
+                .all()
+
+        result = {}
+        for task_id, task_name, contest_id, total, results, *counts \
+                in rows:
+            stats = dict(zip(keys, (int(count) for count in counts)))
+            stats['compiling'] += total - sum(stats.values())
+            stats['total'] = total
+            result[task_id] = (task_name, contest_id, results, stats)
+
+        cls._submissions_status_cache = (now, result)
+        return result
+
     @staticmethod
     @rpc_method
     def submissions_status(contest_id):
@@ -116,7 +240,8 @@ class AdminWebServer(WebService):
         should not happen and require a check from the admin.
 
         The status of a submission is checked on its result for the
-        active dataset of its task.
+        active dataset of its task. The statistics may be up to
+        SUBMISSIONS_STATUS_TTL seconds old.
 
         contest_id (int|None): counts are restricted to this contest,
             or None for no restrictions.
@@ -127,66 +252,14 @@ class AdminWebServer(WebService):
         # TODO: at the moment this counts all submission results for
         # the live datasets. It is interesting to show also numbers
         # for the datasets with autojudge, and for all datasets.
-        stats = {}
-        with SessionGen() as session:
-            base_query = session\
-                .query(func.count(SubmissionResult.submission_id))\
-                .select_from(SubmissionResult)\
-                .join(Dataset)\
-                .join(Task, Dataset.task_id == Task.id)\
-                .filter(Task.active_dataset_id == SubmissionResult.dataset_id)
-            if contest_id is not None:
-                base_query = base_query\
-                    .filter(Task.contest_id == contest_id)
-
-            compiled = base_query.filter(SubmissionResult.filter_compiled())
-            evaluated = compiled.filter(SubmissionResult.filter_evaluated())
-            not_compiled = base_query.filter(
-                not_(SubmissionResult.filter_compiled()))
-            not_evaluated = compiled.filter(
-                SubmissionResult.filter_compilation_succeeded(),
-                not_(SubmissionResult.filter_evaluated()))
-
-            queries = {}
-            queries['compiling'] = not_compiled.filter(
-                SubmissionResult.compilation_tries <
-                EvaluationService.EvaluationService.MAX_COMPILATION_TRIES)
-            queries['max_compilations'] = not_compiled.filter(
-                SubmissionResult.compilation_tries >=
-                EvaluationService.EvaluationService.MAX_COMPILATION_TRIES)
-            queries['compilation_fail'] = base_query.filter(
-                SubmissionResult.filter_compilation_failed())
-            queries['evaluating'] = not_evaluated.filter(
-                SubmissionResult.evaluation_tries <
-                EvaluationService.EvaluationService.MAX_EVALUATION_TRIES)
-            queries['max_evaluations'] = not_evaluated.filter(
-                SubmissionResult.evaluation_tries >=
-                EvaluationService.EvaluationService.MAX_EVALUATION_TRIES)
-            queries['scoring'] = evaluated.filter(
-                not_(SubmissionResult.filter_scored()))
-            queries['scored'] = evaluated.filter(
-                SubmissionResult.filter_scored())
-
-            total_query = session\
-                .query(func.count(Submission.id))\
-                .select_from(Submission)\
-                .join(Task, Submission.task_id == Task.id)
-            if contest_id is not None:
-                total_query = total_query\
-                    .filter(Task.contest_id == contest_id)
-            queries['total'] = total_query
-
-            # Add a "key" column for keeping track of each stats, in case they
-            # get shuffled.
-            for key, query in queries.items():
-                key_column = literal_column("'%s'" % key).label("key")
-                queries[key] = query.add_column(key_column)
-
-            keys = list(queries.keys())
-            results = queries[keys[0]].union_all(
-                *(queries[key] for key in keys[1:])).all()
-
-        stats = {key: value for value, key in results}
-        stats['compiling'] += 2 * stats['total'] - sum(stats.values())
+        stats = dict.fromkeys(
+            ['compiling', 'max_compilations', 'compilation_fail',
+             'evaluating', 'max_evaluations', 'scoring', 'scored',
+             'total'], 0)
+        for _, task_contest_id, _, task_stats in \
+                AdminWebServer.submissions_status_by_task().values():
+            if contest_id is None or task_contest_id == contest_id:
+                for key, value in task_stats.items():
+                    stats[key] += value
 
         return stats
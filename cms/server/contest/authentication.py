@@ -147,7 +147,8 @@ class AmbiguousIPAddress(Exception):
 
 
 def authenticate_request(
-        sql_session, contest, timestamp, cookie, ip_address):
+        sql_session, contest, timestamp, cookie, ip_address,
+        contest_cache=None):
     """Authenticate a user returning to the site, with a cookie.
 
     Given the information the user's browser provided (the cookie) and
@@ -180,6 +181,8 @@ def authenticate_request(
         request (if any).
     ip_address (IPv4Address|IPv6Address): the IP address the request
         came from.
+    contest_cache (ContestCache|None): if given, the cache to get the
+        participation from, when authenticating with the cookie.
 
     return ((Participation, bytes|None)|(None, None)): if the user
         couldn't be authenticated then return None, otherwise return
@@ -202,7 +205,7 @@ def authenticate_request(
     if participation is None \
             and contest.allow_password_authentication:
         participation, cookie = _authenticate_request_from_cookie(
-            sql_session, contest, timestamp, cookie)
+            sql_session, contest, timestamp, cookie, contest_cache)
 
     if participation is None:
         return None, None
@@ -282,7 +285,8 @@ def _authenticate_request_by_ip_address(sql_session, contest, ip_address):
     return participation
 
 
-def _authenticate_request_from_cookie(sql_session, contest, timestamp, cookie):
+def _authenticate_request_from_cookie(sql_session, contest, timestamp, cookie,
+                                      contest_cache=None):
     """Return the current participation based on the cookie.
 
     If a participation can be extracted, the cookie is refreshed.
@@ -293,6 +297,8 @@ def _authenticate_request_from_cookie(sql_session, contest, timestamp, cookie):
     timestamp (datetime): the date and the time of the request.
     cookie (bytes|None): the cookie the user's browser provided in the
         request (if any).
+    contest_cache (ContestCache|None): if given, the cache to get the
+        participation from.
 
     return ((Participation, bytes)|(None, None)): the participation
         extracted from the cookie and the cookie to set/refresh, or
@@ -327,12 +333,16 @@ def _authenticate_request_from_cookie(sql_session, contest, timestamp, cookie):
         return None, None
 
     # Load participation from DB and make sure it exists.
-    participation = sql_session.query(Participation) \
-        .join(Participation.user) \
-        .options(contains_eager(Participation.user)) \
-        .filter(Participation.contest == contest) \
-        .filter(User.username == username) \
-        .first()
+    if contest_cache is not None:
+        participation = contest_cache.get_participation(
+            sql_session, contest, username)
+    else:
+        participation = sql_session.query(Participation) \
+            .join(Participation.user) \
+            .options(contains_eager(Participation.user)) \
+            .filter(Participation.contest == contest) \
+            .filter(User.username == username) \
+            .first()
     if participation is None:
         log_failed_attempt("user not registered to contest")
         return None, None
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Cache of the contests and of the participations, for CWS.
+
+"""
+
+import time
+
+from sqlalchemy.orm import contains_eager, joinedload, selectinload
+
+from cms.db import Contest, Participation, SessionGen, Task, User
+
+
+class ContestCache:
+    """Cache of the contests and of the participations.
+
+    Almost every request to CWS needs the contest, with its tasks, and
+    the participation of the contestant, with their user, which only
+    change when they are edited in AWS (or when the contestant starts
+    the contest, for the participation). This class keeps detached
+    copies of them, loaded from the database (in a session of its own)
+    at the first request, and merges them in the session of each
+    request without querying the database. The copies must not be
+    modified.
+
+    The cache is versioned: AWS invalidates all of it after each of its
+    edits (see invalidate), and the entries of the previous versions
+    are loaded again at the next request. They are also loaded again
+    after CACHE_TTL seconds, for the edits made outside of AWS (e.g. by
+    the import scripts).
+
+    """
+
+    CACHE_TTL = 60.0
+
+    def __init__(self):
+        self._version = 0
+        # Number of invalidations, to detect those happening while an
+        # entry is being loaded.
+        self._invalidations = 0
+        # Dictionaries from the id or name of a contest and from the
+        # contest id and username of a participation to a tuple: the
+        # version and (monotonic) time at which the object was loaded,
+        # and the (detached) object.
+        self._contests = dict()
+        self._participations = dict()
+
+    def invalidate(self, contest_id=None, username=None):
+        """Forget the cached objects.
+
+        contest_id (int|None): the contest of the participation to
+            forget.
+        username (str|None): the user of the participation to forget,
+            or None to forget everything.
+
+        """
+        self._invalidations += 1
+        if username is None:
+            self._version += 1
+        else:
+            self._participations.pop((contest_id, username), None)
+
+    def _get(self, sql_session, cache, key, load):
+        """Return a cached object, loading it if needed.
+
+        sql_session (Session): the session to merge the object in.
+        cache (dict): the cache to use.
+        key (object): the key of the object in the cache.
+        load (function): a function that, given a session, loads the
+            object from the database and returns it, or None if it
+            does not exist.
+
+        return (Base|None): the object, merged in sql_session, or None
+            if it does not exist.
+
+        """
+        now = time.monotonic()
+        entry = cache.get(key)
+        if entry is None or entry[0] != self._version \
+                or now - entry[1] > self.CACHE_TTL:
+            version = self._version
+            invalidations = self._invalidations
+            with SessionGen() as session:
+                obj = load(session)
+                # Detach the objects before the rollback expires them.
+                session.expunge_all()
+            if obj is None:
+                cache.pop(key, None)
+                return None
+            # If the object was invalidated meanwhile, what was loaded
+            # may be outdated already: load it again next time.
+            if invalidations == self._invalidations:
+                cache[key] = (version, now, obj)
+        else:
+            obj = entry[2]
+        return sql_session.merge(obj, load=False)
+
+    def get_contest(self, sql_session, contest_id=None, name=None):
+        """Return a contest, with its tasks.
+
+        The tasks are loaded with their active dataset, statements and
+        attachments.
+
+        sql_session (Session): the session of the request.
+        contest_id (int|None): the id of the contest.
+        name (str|None): the name of the contest, if the id is not
+            given.
+
+        return (Contest|None): the contest, or None if not found.
+
+        """
+        def load(session):
+            query = session.query(Contest).options(
+                selectinload(Contest.tasks)
+                .joinedload(Task.active_dataset),
+                selectinload(Contest.tasks)
+                .selectinload(Task.statements),
+                selectinload(Contest.tasks)
+                .selectinload(Task.attachments))
+            if contest_id is not None:
+                query = query.filter(Contest.id == contest_id)
+            else:
+                query = query.filter(Contest.name == name)
+            return query.first()
+
+        key = ("id", contest_id) if contest_id is not None \
+            else ("name", name)
+        return self._get(sql_session, self._contests, key, load)
+
+    def get_participation(self, sql_session, contest, username):
+        """Return a participation, with its user and team.
+
+        sql_session (Session): the session of the request.
+        contest (Contest): the contest of the participation.
+        username (str): the username of its user.
+
+        return (Participation|None): the participation, or None if
+            the user does not participate in the contest.
+
+        """
+        def load(session):
+            return session.query(Participation) \
+                .join(Participation.user) \
+                .options(contains_eager(Participation.user)) \
+                .options(joinedload(Participation.team)) \
+                .filter(Participation.contest_id == contest.id) \
+                .filter(User.username == username) \
+                .first()
+
+        return self._get(sql_session, self._participations,
+                         (contest.id, username), load)
@@ -28,13 +28,18 @@
 """
 
 import logging
+import time
+from weakref import WeakSet
 
 import gevent
 import requests
+from gevent.queue import Queue
+from sqlalchemy import func
 
 from cms import config
 from cms.db import Question, Announcement, Message
-from cmscommon.datetime import make_timestamp
+from cmscommon.datetime import make_datetime, make_timestamp
+from cmscommon.eventsource import Subscriber
 
 
 logger = logging.getLogger(__name__)
@@ -172,7 +177,7 @@ def get_communications(sql_session, participation, timestamp, after=None):
 
     # Announcements
     query = sql_session.query(Announcement) \
-        .filter(Announcement.contest == participation.contest) \
+        .filter(Announcement.contest_id == participation.contest_id) \
         .filter(Announcement.timestamp <= timestamp)
     if after is not None:
         query = query.filter(Announcement.timestamp > after)
@@ -184,7 +189,7 @@ def get_communications(sql_session, participation, timestamp, after=None):
 
     # Private messages
     query = sql_session.query(Message) \
-        .filter(Message.participation == participation) \
+        .filter(Message.participation_id == participation.id) \
         .filter(Message.timestamp <= timestamp)
     if after is not None:
         query = query.filter(Message.timestamp > after)
@@ -196,7 +201,7 @@ def get_communications(sql_session, participation, timestamp, after=None):
 
     # Answers to questions
     query = sql_session.query(Question) \
-        .filter(Question.participation == participation) \
+        .filter(Question.participation_id == participation.id) \
         .filter(Question.reply_timestamp.isnot(None)) \
         .filter(Question.reply_timestamp <= timestamp)
     if after is not None:
@@ -214,3 +219,222 @@ def get_communications(sql_session, participation, timestamp, after=None):
                     "text": text})
 
     return res
+
+
+class CommunicationWatcher:
+    """Keep track of the latest communications of the participations.
+
+    The pages of the contestants wait for their new communications
+    (see get_communications). Not to query the database each time,
+    this class remembers the time of the latest announcement of each
+    contest and of the latest message or answer of each participation,
+    as found in the database, and keeps them up to date with the new
+    communications, that AWS reports to all the shards of CWS (see
+    notify). In case a report was lost, every CHECK_INTERVAL seconds
+    the recent communications of the whole shard are looked up. Each
+    report wakes up the requests waiting for the contest, participation
+    or user it is about.
+
+    """
+
+    # As long as the pages wait for new communications (see
+    # NotificationsHandler.WAIT_TIMEOUT): if a report is lost, the
+    # communication is delayed by at most one more wait.
+    CHECK_INTERVAL = 30.0
+
+    def __init__(self):
+        # Dictionaries from contest id and from participation id to
+        # the timestamp of the latest communication (or None).
+        self._contests = dict()
+        self._participations = dict()
+        # Number of reports received, to detect those received while
+        # the database was being queried.
+        self._reports = 0
+        # Dictionary from ("contest", contest id), ("participation",
+        # participation id) and ("user", username) to the set of the
+        # queues of the requests waiting for them.
+        self._queues = dict()
+        # The time of the last check for lost reports.
+        self._last_check = time.time()
+
+    def notify(self, contest_id=None, participation_id=None,
+               timestamp=None, username=None):
+        """Report a new communication and wake up the waiting requests.
+
+        contest_id (int|None): the contest of a new announcement.
+        participation_id (int|None): the recipient of a new message
+            or answer.
+        timestamp (float|None): the time of the communication.
+        username (str|None): the recipient of a new notification
+            (which is not in the database, and has no timestamp).
+
+        """
+        self._reports += 1
+        self._update(self._contests, contest_id, timestamp)
+        self._update(self._participations, participation_id, timestamp)
+        self._wake([("contest", contest_id),
+                    ("participation", participation_id),
+                    ("user", username)])
+
+    @staticmethod
+    def _update(cache, key, timestamp):
+        """Record a communication in a cache, if the key is in it.
+
+        cache (dict): the cache to update.
+        key (int|None): the key of the value in the cache.
+        timestamp (float|None): the time of the communication.
+
+        return (bool): whether the value in the cache changed.
+
+        """
+        if key not in cache:
+            return False
+        latest = cache[key]
+        if latest is not None and timestamp <= latest:
+            return False
+        cache[key] = timestamp
+        return True
+
+    def _wake(self, keys):
+        """Wake up the requests waiting for any of the keys.
+
+        keys ([(str, object)]): the keys, as in _queues.
+
+        """
+        for key in keys:
+            queues = self._queues.get(key)
+            if queues is None:
+                continue
+            for queue in queues:
+                queue.put(None)
+            # The queues vanish with their requests.
+            if len(queues) == 0:
+                del self._queues[key]
+
+    def _check(self, sql_session):
+        """Look for the communications whose reports were lost.
+
+        At most once every CHECK_INTERVAL seconds, query the latest
+        communications of the contests and participations that had
+        some since before the previous check (in case they were
+        committed late), and handle those not yet known as reports.
+
+        sql_session (Session): the SQLAlchemy database session to use.
+
+        """
+        now = time.time()
+        if now - self._last_check < self.CHECK_INTERVAL:
+            return
+        since = make_datetime(self._last_check - self.CHECK_INTERVAL)
+        self._last_check = now
+
+        queries = [
+            (self._contests, "contest",
+             sql_session.query(Announcement.contest_id,
+                               func.max(Announcement.timestamp))
+             .filter(Announcement.timestamp > since)
+             .group_by(Announcement.contest_id)),
+            (self._participations, "participation",
+             sql_session.query(Message.participation_id,
+                               func.max(Message.timestamp))
+             .filter(Message.timestamp > since)
+             .group_by(Message.participation_id)),
+            (self._participations, "participation",
+             sql_session.query(Question.participation_id,
+                               func.max(Question.reply_timestamp))
+             .filter(Question.reply_timestamp > since)
+             .group_by(Question.participation_id)),
+        ]
+        for cache, kind, query in queries:
+            for key, latest in query.all():
+                if self._update(cache, key, make_timestamp(latest)):
+                    logger.info("Found a lost report of a communication "
+                                "to %s %s.", kind, key)
+                    self._wake([(kind, key)])
+        # Lookups running in the meantime might have missed them.
+        self._reports += 1
+
+    def _get(self, cache, key, query):
+        """Return the cached timestamp, querying it if needed.
+
+        cache (dict): the cache to use.
+        key (int): the key of the value in the cache.
+        query (Query): a query for the latest datetimes.
+
+        return (float|None): the latest timestamp.
+
+        """
+        if key in cache:
+            return cache[key]
+        reports = self._reports
+        latest = max((make_timestamp(value)
+                      for value in query.one() if value is not None),
+                     default=None)
+        # A communication reported during the query may be missing
+        # from the result: look it up again next time.
+        if reports == self._reports:
+            cache[key] = latest
+        return latest
+
+    def get_latest(self, sql_session, participation):
+        """Return the time of the latest communication to a contestant.
+
+        sql_session (Session): the SQLAlchemy database session to use.
+        participation (Participation): the participation.
+
+        return (float|None): the timestamp of the latest announcement,
+            message or answer to the participation, or None if there
+            were none.
+
+        """
+        self._check(sql_session)
+        contest_latest = self._get(
+            self._contests, participation.contest_id,
+            sql_session.query(func.max(Announcement.timestamp))
+            .filter(Announcement.contest_id == participation.contest_id))
+        participation_latest = self._get(
+            self._participations, participation.id,
+            sql_session.query(
+                sql_session.query(func.max(Message.timestamp))
+                .filter(Message.participation_id == participation.id)
+                .as_scalar(),
+                sql_session.query(func.max(Question.reply_timestamp))
+                .filter(Question.participation_id == participation.id)
+                .as_scalar()))
+        return max((value for value in [contest_latest,
+                                        participation_latest]
+                    if value is not None),
+                   default=None)
+
+    def subscribe(self, participation):
+        """Return a subscriber to the reports for a contestant.
+
+        participation (Participation): the participation whose
+            communications and notifications to wait for.
+
+        return (Subscriber): the subscriber, to pass to wait.
+
+        """
+        queue = Queue()
+        for key in [("contest", participation.contest_id),
+                    ("participation", participation.id),
+                    ("user", participation.user.username)]:
+            self._queues.setdefault(key, WeakSet()).add(queue)
+        return Subscriber(queue)
+
+    @staticmethod
+    def wait(subscriber, timeout):
+        """Wait for a report.
+
+        subscriber (Subscriber): a subscriber, from subscribe.
+        timeout (float): the maximum time to wait, in seconds.
+
+        return (bool): whether a report was received (since the last
+            call, or since the subscriber was created).
+
+        """
+        with gevent.Timeout(timeout, False):
+            for _ in subscriber.get():
+                pass
+            return True
+        return False
@@ -45,7 +45,7 @@ except ImportError:
     import tornado.web as tornado_web
 
 from cms import config, TOKEN_MODE_MIXED
-from cms.db import Contest, Submission, Task, UserTest
+from cms.db import Contest, Submission, UserTest
 from cms.locale import filter_language_codes
 from cms.server import FileHandlerMixin
 from cms.server.contest.authentication import authenticate_request
@@ -108,8 +108,8 @@ class ContestHandler(BaseHandler):
             contest_name = self.path_args[0]
 
             # Select the correct contest or return an error
-            self.contest = self.sql_session.query(Contest)\
-                .filter(Contest.name == contest_name).first()
+            self.contest = self.service.contest_cache.get_contest(
+                self.sql_session, name=contest_name)
             if self.contest is None:
                 self.contest = Contest(
                     name=contest_name, description=contest_name)
@@ -121,8 +121,8 @@ class ContestHandler(BaseHandler):
                 raise tornado_web.HTTPError(404)
         else:
             # Select the contest specified on the command line
-            self.contest = Contest.get_from_id(
-                self.service.contest_id, self.sql_session)
+            self.contest = self.service.contest_cache.get_contest(
+                self.sql_session, contest_id=self.service.contest_id)
 
     def get_current_user(self):
         """Return the currently logged in participation.
@@ -159,7 +159,8 @@ class ContestHandler(BaseHandler):
             return None
 
         participation, cookie = authenticate_request(
-            self.sql_session, self.contest, self.timestamp, cookie, ip_address)
+            self.sql_session, self.contest, self.timestamp, cookie, ip_address,
+            contest_cache=self.service.contest_cache)
 
         if cookie is None:
             self.clear_cookie(cookie_name)
@@ -232,10 +233,11 @@ class ContestHandler(BaseHandler):
         return (Task|None): the corresponding task object, if found.
 
         """
-        return self.sql_session.query(Task) \
-            .filter(Task.contest == self.contest) \
-            .filter(Task.name == task_name) \
-            .one_or_none()
+        # The tasks of the contest are cached, see ContestCache.
+        for task in self.contest.tasks:
+            if task.name == task_name:
+                return task
+        return None
 
     def get_submission(self, task, submission_num):
         """Return the num-th contestant's submission on the given task.
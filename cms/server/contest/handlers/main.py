@@ -33,6 +33,7 @@ import json
 import logging
 import os.path
 import re
+import time
 
 import collections
 try:
@@ -266,9 +267,15 @@ class StartHandler(ContestHandler):
     def post(self):
         participation = self.current_user
 
-        logger.info("Starting now for user %s", participation.user.username)
-        participation.starting_time = self.timestamp
-        self.sql_session.commit()
+        # The participation may come from the cache of this shard,
+        # which may not know yet that the user started on another one.
+        self.sql_session.refresh(participation)
+        if participation.starting_time is None:
+            logger.info("Starting now for user %s",
+                        participation.user.username)
+            participation.starting_time = self.timestamp
+            self.sql_session.commit()
+            self.service.invalidate_participation(participation)
 
         self.redirect(self.contest_url())
 
@@ -286,33 +293,61 @@ class LogoutHandler(ContestHandler):
 class NotificationsHandler(ContestHandler):
     """Displays notifications.
 
+    If asked to, wait until there are some to display, or until
+    WAIT_TIMEOUT seconds have passed.
+
     """
 
     refresh_cookie = False
 
+    WAIT_TIMEOUT = 30.0
+
     @tornado_web.authenticated
     @multi_contest
     def get(self):
         participation = self.current_user
+        username = participation.user.username
+        watcher = self.service.communication_watcher
 
         last_notification = self.get_argument("last_notification", None)
         if last_notification is not None:
-            last_notification = make_datetime(float(last_notification))
-
-        res = get_communications(self.sql_session, participation,
-                                 self.timestamp, after=last_notification)
-
-        # Simple notifications
-        notifications = self.service.notifications
-        username = participation.user.username
-        if username in notifications:
-            for notification in notifications[username]:
-                res.append({"type": "notification",
-                            "timestamp": make_timestamp(notification[0]),
-                            "subject": notification[1],
-                            "text": notification[2],
-                            "level": notification[3]})
-            del notifications[username]
+            last_notification = float(last_notification)
+
+        deadline = time.monotonic()
+        if self.get_argument("wait", "no") == "yes":
+            deadline += self.WAIT_TIMEOUT
+
+        # Subscribe first, not to miss what arrives in the meantime.
+        subscriber = watcher.subscribe(participation)
+        while True:
+            # Query the db only if there is something new.
+            res = []
+            latest = watcher.get_latest(self.sql_session, participation)
+            if latest is not None and (last_notification is None
+                                       or latest > last_notification):
+                res = get_communications(
+                    self.sql_session, participation, self.timestamp,
+                    after=make_datetime(last_notification)
+                    if last_notification is not None else None)
+
+            # Simple notifications
+            notifications = self.service.notifications
+            if username in notifications:
+                for notification in notifications[username]:
+                    res.append({"type": "notification",
+                                "timestamp": make_timestamp(notification[0]),
+                                "subject": notification[1],
+                                "text": notification[2],
+                                "level": notification[3]})
+                del notifications[username]
+
+            remaining = deadline - time.monotonic()
+            if len(res) > 0 or remaining <= 0:
+                break
+            # Do not hold a connection to the db while waiting.
+            self.sql_session.close()
+            watcher.wait(subscriber, remaining)
+            self.timestamp = make_datetime()
 
         self.write(json.dumps(res))
 
@@ -42,10 +42,12 @@ import logging
 from werkzeug.wsgi import SharedDataMiddleware
 
 from cms import ConfigError, ServiceCoord, config
-from cms.io import WebService
+from cms.io import WebService, rpc_method
 from cms.locale import get_translations
+from cms.server.contest.cache import ContestCache
+from cms.server.contest.communication import CommunicationWatcher
 from cms.server.contest.jinja2_toolbox import CWS_ENVIRONMENT
-from cms.util import is_shard_ephemeral
+from cms.util import get_service_shards, is_shard_ephemeral
 from cmscommon.binary import hex_to_bin
 from .handlers import HANDLERS
 from .handlers.base import ContestListHandler
@@ -70,6 +72,8 @@ class ContestWebServer(WebService):
             "debug": config.tornado_debug,
             "is_proxy_used": config.is_proxy_used,
             "num_proxies_used": config.num_proxies_used,
+            "sendfile_header": config.sendfile_header,
+            "sendfile_prefix": config.sendfile_prefix,
             "xsrf_cookies": True,
         }
 
@@ -118,6 +122,13 @@ class ContestWebServer(WebService):
         # of tuples (timestamp, subject, text).
         self.notifications = {}
 
+        # The latest communications (handled by the db) of the users,
+        # and a broadcast of the new ones, reported by AWS.
+        self.communication_watcher = CommunicationWatcher()
+
+        # The contests and participations, invalidated by AWS.
+        self.contest_cache = ContestCache()
+
         # Retrieve the available translations.
         self.translations = get_translations()
 
@@ -136,6 +147,12 @@ class ContestWebServer(WebService):
             ServiceCoord("PrintingService", 0),
             must_be_present=printing_enabled)
 
+        self.contest_web_servers = []
+        for i in range(get_service_shards("ContestWebServer")):
+            if i != shard:
+                self.contest_web_servers.append(self.connect_to(
+                    ServiceCoord("ContestWebServer", i)))
+
     def add_notification(self, username, timestamp, subject, text, level):
         """Store a new notification to send to a user at the first
         opportunity (i.e., at the first request fot db notifications).
@@ -150,3 +167,46 @@ class ContestWebServer(WebService):
         if username not in self.notifications:
             self.notifications[username] = []
         self.notifications[username].append((timestamp, subject, text, level))
+        self.communication_watcher.notify(username=username)
+
+    @rpc_method
+    def new_communication(self, timestamp, contest_id=None,
+                          participation_id=None):
+        """Report a new communication to the contestants.
+
+        The requests waiting for new notifications are woken up.
+
+        timestamp (float): the time of the communication.
+        contest_id (int|None): the contest of a new announcement.
+        participation_id (int|None): the recipient of a new message
+            or answer to a question.
+
+        """
+        self.communication_watcher.notify(contest_id, participation_id,
+                                          timestamp)
+
+    @rpc_method
+    def invalidate_cache(self, contest_id=None, username=None):
+        """Forget the cached contests and participations.
+
+        contest_id (int|None): the contest of the participation to
+            forget.
+        username (str|None): the user of the participation to forget,
+            or None to forget everything.
+
+        """
+        self.contest_cache.invalidate(contest_id, username)
+
+    def invalidate_participation(self, participation):
+        """Forget a participation on all the shards of CWS.
+
+        To be called once its changes have been committed.
+
+        participation (Participation): the participation that changed.
+
+        """
+        username = participation.user.username
+        self.contest_cache.invalidate(participation.contest_id, username)
+        for contest_web_server in self.contest_web_servers:
+            contest_web_server.invalidate_cache(
+                contest_id=participation.contest_id, username=username)
@@ -65,11 +65,18 @@ CMS.CWSUtils.create_url_builder = function(url_root) {
 };
 
 
-CMS.CWSUtils.prototype.update_notifications = function(hush) {
+CMS.CWSUtils.prototype.update_notifications = function(hush, wait) {
     var self = this;
-    $.get(
+    var params = {};
+    if (this.last_notification !== null) {
+        params["last_notification"] = this.last_notification;
+    }
+    if (wait) {
+        params["wait"] = "yes";
+    }
+    return $.get(
         this.contest_url("notifications"),
-        this.last_notification !== null ? {"last_notification": this.last_notification} : {},
+        params,
         function(data) {
             for (var i = 0; i < data.length; i += 1) {
                 self.display_notification(
@@ -88,6 +95,20 @@ CMS.CWSUtils.prototype.update_notifications = function(hush) {
 };
 
 
+/**
+ * Keep asking for new notifications, each request being answered by
+ * the server only when there are some (or after a timeout).
+ */
+CMS.CWSUtils.prototype.watch_notifications = function() {
+    var self = this;
+    this.update_notifications(false, true).always(function(a, status) {
+        // After an error, wait before trying again.
+        setTimeout(function() { self.watch_notifications(); },
+                   status == "success" ? 1000 : 30000);
+    });
+};
+
+
 CMS.CWSUtils.prototype.display_notification = function(type, timestamp,
                                                        subject, text,
                                                        level, hush) {
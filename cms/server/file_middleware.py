@@ -17,9 +17,13 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import os
+
+from gevent import pywsgi
+from gevent.socket import wait_write
 from werkzeug.exceptions import HTTPException, NotFound, ServiceUnavailable
 from werkzeug.wrappers import Response, Request
-from werkzeug.wsgi import responder, wrap_file
+from werkzeug.wsgi import FileWrapper, responder, wrap_file
 
 from cms.db.filecacher import FileCacher, TombstoneError
 
@@ -41,20 +45,42 @@ class FileServerMiddleware:
     streams back the file that was requested, using a proper compliant
     way.
 
+    Streaming the files still keeps the greenlets of the server busy,
+    which matters when many contestants download the same statement at
+    the same time. When the server runs behind a reverse proxy that
+    supports it, the middleware can instead just make sure that the
+    file is in the cache of the file cacher and reply with a header
+    (X-Accel-Redirect for nginx, X-Sendfile for Apache and lighttpd)
+    telling the proxy to serve the cached file by itself. Otherwise,
+    the file is returned wrapped in the wsgi.file_wrapper of the
+    server which, when it is a SendfileWrapper, lets WSGIHandler send
+    it with sendfile.
+
     """
 
     DIGEST_HEADER = "X-CMS-File-Digest"
     FILENAME_HEADER = "X-CMS-File-Filename"
 
-    def __init__(self, file_cacher, app):
+    def __init__(self, file_cacher, app, sendfile_header=None,
+                 sendfile_prefix=None):
         """Create an instance.
 
         file_cacher (FileCacher): the cacher to retrieve files from.
         app (function): the WSGI application to wrap.
+        sendfile_header (str|None): if given, the header telling the
+            reverse proxy which file to serve (e.g., X-Accel-Redirect
+            or X-Sendfile); if None, files are served by this
+            middleware.
+        sendfile_prefix (str|None): the value of the header is this
+            prefix followed by the digest of the file (e.g., the
+            internal location of nginx aliasing the cache directory);
+            if None, it is the absolute path of the cached file.
 
         """
         self.file_cacher = file_cacher
         self.wrapped_app = app
+        self.sendfile_header = sendfile_header
+        self.sendfile_prefix = sendfile_prefix
 
     def __call__(self, environ, start_response):
         """Execute this instance as a WSGI application.
@@ -86,8 +112,12 @@ class FileServerMiddleware:
         mimetype = original_response.mimetype
 
         try:
-            fobj = self.file_cacher.get_file(digest)
-            size = self.file_cacher.get_size(digest)
+            path = None
+            if self.sendfile_header is not None:
+                path = self.file_cacher.get_cached_path(digest)
+            if path is None:
+                fobj = self.file_cacher.get_file(digest)
+                size = self.file_cacher.get_size(digest)
         except KeyError:
             return NotFound()
         except TombstoneError:
@@ -105,9 +135,25 @@ class FileServerMiddleware:
         response.set_etag(digest)
         response.cache_control.no_cache = True
         response.cache_control.private = True
+
+        if path is not None:
+            try:
+                # This takes care of conditional requests, the proxy
+                # of partial ones.
+                response.make_conditional(request)
+            except HTTPException as exc:
+                return exc
+            if response.status_code == 200:
+                response.headers[self.sendfile_header] = \
+                    path if self.sendfile_prefix is None \
+                    else self.sendfile_prefix + digest
+            return response
+
         response.response = \
             wrap_file(environ, fobj, buffer_size=FileCacher.CHUNK_SIZE)
         response.direct_passthrough = True
+        # Without it, the server would have to send the file chunked.
+        response.content_length = size
 
         try:
             # This takes care of conditional and partial requests.
@@ -117,3 +163,80 @@ class FileServerMiddleware:
             return exc
 
         return response
+
+
+class SendfileWrapper(FileWrapper):
+    """The wsgi.file_wrapper provided by WSGIHandler.
+
+    It is what FileServerMiddleware (through Werkzeug's wrap_file)
+    returns as the body of the files it serves. It can be iterated as
+    required by the WSGI specification, but WSGIHandler sends the file
+    it wraps with sendfile when it can, so that the content is copied
+    to the socket by the kernel rather than in chunks by the greenlet.
+
+    """
+
+    def fileno(self):
+        """Return the file descriptor of the wrapped file.
+
+        return (int|None): the file descriptor, or None if the wrapped
+            file-like object is not backed by one.
+
+        """
+        try:
+            return self.file.fileno()
+        except (AttributeError, OSError):
+            return None
+
+    def sendfile(self, sock):
+        """Send the rest of the file to a socket.
+
+        The socket is non-blocking, so os.sendfile copies as much as
+        fits in the socket buffer and the greenlet waits for the socket
+        to be writable again without blocking the others.
+
+        sock (socket): the (gevent) socket to send the file to.
+
+        return (int): the number of bytes sent.
+
+        """
+        fd = self.fileno()
+        offset = self.file.tell()
+        size = os.fstat(fd).st_size
+        sent = 0
+        while offset + sent < size:
+            try:
+                count = os.sendfile(sock.fileno(), fd, offset + sent,
+                                    size - offset - sent)
+            except BlockingIOError:
+                wait_write(sock.fileno(), timeout=sock.gettimeout())
+                continue
+            if count == 0:
+                break
+            sent += count
+        return sent
+
+
+class WSGIHandler(pywsgi.WSGIHandler):
+    """The handler of the requests of the WSGI server of gevent, that
+    sends the files returned by the application with sendfile.
+
+    """
+
+    def get_environ(self):
+        environ = super().get_environ()
+        environ["wsgi.file_wrapper"] = SendfileWrapper
+        return environ
+
+    def process_result(self):
+        if not isinstance(self.result, SendfileWrapper) \
+                or self.result.fileno() is None:
+            return super().process_result()
+
+        # Send the headers, which also decides how the body is framed:
+        # sendfile can only be used without chunking (i.e., when the
+        # application sets the content length).
+        self.write(b"")
+        if self.response_use_chunked:
+            return super().process_result()
+        self.response_length += self.result.sendfile(self.socket)
@@ -31,23 +31,28 @@ the current ranking.
 """
 
 import logging
+import time
 from collections import defaultdict
 from datetime import timedelta
 from functools import wraps
 
 import gevent.lock
-from sqlalchemy import func
+from sqlalchemy import func, tuple_
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import subqueryload
 
-from cms import ServiceCoord, get_service_shards
+from cms import ServiceCoord, config, get_service_shards
 from cmscommon.datetime import make_timestamp
 from cms.db import SessionGen, Digest, Dataset, Evaluation, Submission, \
-    SubmissionResult, Testcase, UserTest, UserTestResult, get_submissions, \
+    SubmissionResult, UserTest, UserTestResult, get_submissions, \
     get_submission_results, get_datasets_to_judge
 from cms.grading.Job import JobGroup
-from cms.io import Executor, TriggeredService, rpc_method
+from cms.grading.steps import EVALUATION_MESSAGES
+from cms.io import Executor, PriorityQueue, QueueItem, TriggeredService, \
+    rpc_method
 from .esoperations import ESOperation, get_relevant_operations, \
-    get_submissions_operations, get_user_tests_operations, \
+    get_submissions_operations, get_submissions_window, \
+    get_user_tests_operations, get_user_tests_window, \
     submission_get_operations, submission_to_evaluate, \
     user_test_get_operations
 from .flushingdict import FlushingDict
@@ -57,6 +62,33 @@ from .workerpool import WorkerPool
 logger = logging.getLogger(__name__)
 
 
+class _CumulativeItem(QueueItem):
+
+    """The operations in the queue with the same short key and priority.
+
+    """
+
+    def __init__(self, key, item_entry):
+        """Create the item.
+
+        key (tuple): the short key of the operations, and the priority.
+        item_entry (dict): the representation of the operations, with
+            their multiplicity.
+
+        """
+        self.key = key
+        self.item_entry = item_entry
+
+    def __eq__(self, other):
+        return self.key == other.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def to_dict(self):
+        return self.item_entry
+
+
 class EvaluationExecutor(Executor):
 
     # Real maximum number of operations to be sent to a worker.
@@ -83,9 +115,16 @@ class EvaluationExecutor(Executor):
         # As evaluate operations are split by testcases, there are too
         # many entries in the queue to display, so we just take only one
         # operation of each (type, object_id, dataset_id, priority) tuple.
-        # This dictionary maps any such tuple to a "queue entry" (lacking
-        # the testcase codename) and keeps track of multiplicity.
+        # This dictionary maps any such tuple to a _CumulativeItem (whose
+        # representation lacks the testcase codename) that keeps track
+        # of multiplicity; the items are also kept in a queue, ordered
+        # like the operations, so that they can be listed one page at a
+        # time.
         self.queue_status_cumulative = dict()
+        self._queue_status_order = PriorityQueue()
+        # Number of entries of queue_status_cumulative by operation
+        # type, kept up to date to avoid going through all of them.
+        self.queue_status_types = defaultdict(int)
 
         for i in range(get_service_shards("Worker")):
             worker = ServiceCoord("Worker", i)
@@ -158,13 +197,17 @@ class EvaluationExecutor(Executor):
             # Add the item to the cumulative status dictionary.
             key = item.short_key() + (priority,)
             if key in self.queue_status_cumulative:
-                self.queue_status_cumulative[key]["item"]["multiplicity"] += 1
+                self.queue_status_cumulative[key].item_entry[
+                    "multiplicity"] += 1
             else:
                 item_entry = item.to_dict()
                 del item_entry["testcase_codename"]
                 item_entry["multiplicity"] = 1
-                entry = {"item": item_entry, "priority": priority, "timestamp": make_timestamp(timestamp)}
-                self.queue_status_cumulative[key] = entry
+                cumulative = _CumulativeItem(key, item_entry)
+                self.queue_status_cumulative[key] = cumulative
+                self._queue_status_order.push(cumulative, priority,
+                                              timestamp)
+                self.queue_status_types[item.type_] += 1
         return success
 
     def dequeue(self, operation):
@@ -197,12 +240,156 @@ class EvaluationExecutor(Executor):
         self._remove_from_cumulative_status(queue_entry)
         return queue_entry
 
+    def get_cumulative_status(self, offset=0, limit=None):
+        """Return the collected entries of the queue, in order.
+
+        offset (int): the number of collected entries to skip.
+        limit (int|None): the maximum number of collected entries to
+            return, or None to return all of them.
+
+        return ([QueueEntry]): the page of the collected entries, each
+            with the multiplicity of its operations.
+
+        """
+        return self._queue_status_order.get_status(offset, limit)
+
     def _remove_from_cumulative_status(self, queue_entry):
         # Remove the item from the cumulative status dictionary.
         key = queue_entry.item.short_key() + (queue_entry.priority,)
-        self.queue_status_cumulative[key]["item"]["multiplicity"] -= 1
-        if self.queue_status_cumulative[key]["item"]["multiplicity"] == 0:
+        cumulative = self.queue_status_cumulative[key]
+        cumulative.item_entry["multiplicity"] -= 1
+        if cumulative.item_entry["multiplicity"] == 0:
             del self.queue_status_cumulative[key]
+            self._queue_status_order.remove(cumulative)
+            type_ = queue_entry.item.type_
+            self.queue_status_types[type_] -= 1
+            if self.queue_status_types[type_] == 0:
+                del self.queue_status_types[type_]
+
+
+def _get_by_ids(session, cls, ids):
+    """Load many objects of the same class with a single query.
+
+    session (Session): the DB session to use.
+    cls (type): the class of the objects, with an id primary key.
+    ids ({int}): the ids of the objects.
+
+    return ({int: object}): the objects found, indexed by id.
+
+    """
+    if len(ids) == 0:
+        return dict()
+    return {obj.id: obj
+            for obj in session.query(cls).filter(cls.id.in_(ids)).all()}
+
+
+def _get_datasets(session, dataset_ids):
+    """Load many datasets, with their testcases, with two queries.
+
+    session (Session): the DB session to use.
+    dataset_ids ({int}): the ids of the datasets.
+
+    return ({int: Dataset}): the datasets found, indexed by id.
+
+    """
+    if len(dataset_ids) == 0:
+        return dict()
+    return {dataset.id: dataset
+            for dataset in session.query(Dataset)
+            .filter(Dataset.id.in_(dataset_ids))
+            .options(subqueryload(Dataset.testcases))
+            .all()}
+
+
+def _get_results(session, cls, object_id_column, keys):
+    """Load many submission or user test results with a single query.
+
+    session (Session): the DB session to use.
+    cls (type): SubmissionResult or UserTestResult.
+    object_id_column (Column): the column of cls referring to the
+        submission or the user test.
+    keys ({(int, int)}): pairs of object id and dataset id.
+
+    return ({(int, int): SubmissionResult|UserTestResult}): the
+        results found, indexed by object id and dataset id.
+
+    """
+    if len(keys) == 0:
+        return dict()
+    results = session.query(cls)\
+        .filter(tuple_(object_id_column, cls.dataset_id).in_(keys))\
+        .all()
+    return {(getattr(result, object_id_column.key), result.dataset_id):
+            result for result in results}
+
+
+def _get_evaluated_testcases(session, keys):
+    """Return the testcases already evaluated for some submissions.
+
+    session (Session): the DB session to use.
+    keys ({(int, int)}): pairs of submission id and dataset id.
+
+    return ({(int, int, int)}): the (submission id, dataset id,
+        testcase id) triplets having an evaluation.
+
+    """
+    if len(keys) == 0:
+        return set()
+    return set(session.query(Evaluation.submission_id,
+                             Evaluation.dataset_id,
+                             Evaluation.testcase_id)
+               .filter(tuple_(Evaluation.submission_id,
+                              Evaluation.dataset_id).in_(keys))
+               .all())
+
+
+def _get_evaluation_outcomes(session, keys):
+    """Return the outcomes of the evaluations of some submissions.
+
+    session (Session): the DB session to use.
+    keys ({(int, int)}): pairs of submission id and dataset id.
+
+    return ({(int, int): {int: str|None}}): the outcome of each
+        evaluation of each submission result having at least one,
+        indexed by testcase id.
+
+    """
+    if len(keys) == 0:
+        return dict()
+    outcomes = defaultdict(dict)
+    for submission_id, dataset_id, testcase_id, outcome in session.query(
+            Evaluation.submission_id,
+            Evaluation.dataset_id,
+            Evaluation.testcase_id,
+            Evaluation.outcome)\
+            .filter(tuple_(Evaluation.submission_id,
+                           Evaluation.dataset_id).in_(keys))\
+            .all():
+        outcomes[(submission_id, dataset_id)][testcase_id] = outcome
+    return outcomes
+
+
+def _count_evaluations(session, keys):
+    """Count the evaluations of some submission results in one query.
+
+    session (Session): the DB session to use.
+    keys ({(int, int)}): pairs of submission id and dataset id.
+
+    return ({(int, int): int}): the number of evaluations of each
+        submission result having at least one.
+
+    """
+    if len(keys) == 0:
+        return dict()
+    return {(submission_id, dataset_id): count
+            for submission_id, dataset_id, count in session.query(
+                Evaluation.submission_id,
+                Evaluation.dataset_id,
+                func.count(Evaluation.id))
+            .filter(tuple_(Evaluation.submission_id,
+                           Evaluation.dataset_id).in_(keys))
+            .group_by(Evaluation.submission_id, Evaluation.dataset_id)
+            .all()}
 
 
 def with_post_finish_lock(func):
@@ -252,9 +439,18 @@ class EvaluationService(TriggeredService):
 
     # How many worker results we accumulate before processing them.
     RESULT_CACHE_SIZE = 100
-    # The maximum time since the last result before processing.
+    # The maximum time since the oldest result before processing.
     MAX_FLUSHING_TIME_SECONDS = 2
 
+    # How many sweeps can be incremental before we run a full one.
+    FULL_SWEEP_EVERY = 10
+    # For how many consecutive sweeps an object that still has
+    # operations to do can keep the incremental sweeps from advancing.
+    MAX_SWEEP_HOLDS = 3
+
+    # How many evaluations we write with a single INSERT statement.
+    EVALUATIONS_PER_INSERT = 1000
+
     def __init__(self, shard, contest_id=None):
         super().__init__(shard)
 
@@ -290,6 +486,19 @@ class EvaluationService(TriggeredService):
         # operations in state 4.
         self.post_finish_lock = gevent.lock.RLock()
 
+        # Low water marks for the incremental sweeps: submissions and
+        # user tests with smaller ids had nothing left to do at the
+        # time of the last sweep, so they are skipped until the next
+        # full sweep. For each submission and user test with operations
+        # to do, the number of consecutive sweeps that found it.
+        self._sweep_min_submission_id = None
+        self._sweep_min_user_test_id = None
+        self._sweep_submission_holders = dict()
+        self._sweep_user_test_holders = dict()
+        self._sweeps_since_full = 0
+        self._full_sweep_requested = True
+        self._last_sweep_status = None
+
         self.scoring_service = self.connect_to(
             ServiceCoord("ScoringService", 0))
 
@@ -359,22 +568,140 @@ class EvaluationService(TriggeredService):
         evaluated for no good reasons. Put the missing operation in
         the queue.
 
+        Most sweeps are incremental: they only look at the submissions
+        and user tests starting from the oldest one that still had
+        something to do at the previous sweep. Every FULL_SWEEP_EVERY
+        sweeps (or when explicitly requested) we look at everything,
+        to catch changes to older objects (e.g., new testcases).
+
+        The database does not record when results and evaluations
+        change, so the window is by object id, not by modification:
+        an incremental sweep still runs the same queries as a full
+        one, restricted to the objects in the window. Its cost is
+        proportional to the size of the window, which is what the
+        sweep statistics report (not the rows read by the database).
+
         """
+        full = self._full_sweep_requested \
+            or self._sweeps_since_full + 1 >= \
+            EvaluationService.FULL_SWEEP_EVERY
+        if full:
+            self._full_sweep_requested = False
+            self._sweep_min_submission_id = None
+            self._sweep_min_user_test_id = None
+            self._sweeps_since_full = 0
+        else:
+            self._sweeps_since_full += 1
+
+        start_time = time.monotonic()
         counter = 0
         with SessionGen() as session:
-
-            for operation, timestamp, priority in \
-                    get_submissions_operations(session, self.contest_id):
+            num_submissions, max_submission_id = get_submissions_window(
+                session, self.contest_id, self._sweep_min_submission_id)
+            operations = get_submissions_operations(
+                session, self.contest_id, self._sweep_min_submission_id)
+            for operation, timestamp, priority in operations:
                 if self.enqueue(operation, timestamp, priority):
                     counter += 1
-
-            for operation, timestamp, priority in \
-                    get_user_tests_operations(session, self.contest_id):
+            self._sweep_min_submission_id, self._sweep_submission_holders = \
+                self._next_low_water_mark(
+                    operations, max_submission_id,
+                    self._sweep_min_submission_id,
+                    self._sweep_submission_holders)
+
+            num_user_tests, max_user_test_id = get_user_tests_window(
+                session, self.contest_id, self._sweep_min_user_test_id)
+            operations = get_user_tests_operations(
+                session, self.contest_id, self._sweep_min_user_test_id)
+            for operation, timestamp, priority in operations:
                 if self.enqueue(operation, timestamp, priority):
                     counter += 1
+            self._sweep_min_user_test_id, self._sweep_user_test_holders = \
+                self._next_low_water_mark(
+                    operations, max_user_test_id,
+                    self._sweep_min_user_test_id,
+                    self._sweep_user_test_holders)
+
+        self._last_sweep_status = {
+            "full": full,
+            "timestamp": make_timestamp(),
+            "duration": time.monotonic() - start_time,
+            "submissions_in_window": num_submissions,
+            "user_tests_in_window": num_user_tests,
+            "operations_enqueued": counter,
+        }
 
         return counter
 
+    @staticmethod
+    def _next_low_water_mark(operations, max_id, current, holders):
+        """Compute where the next incremental sweep should start.
+
+        The next sweep starts from the oldest object that still has
+        operations to do, unless that object has had operations for
+        more than MAX_SWEEP_HOLDS consecutive sweeps (e.g., it is
+        retrying, or waiting in a long queue): then it is left to the
+        full sweeps, so that it does not turn every incremental sweep
+        into a full one.
+
+        operations ([(ESOperation, int, datetime)]): the operations
+            found by the current sweep.
+        max_id (int|None): the largest object id seen by the current
+            sweep, or None if it did not see any object.
+        current (int|None): the low water mark used by the current
+            sweep.
+        holders ({int: int}): for each object id found with operations
+            by the previous sweeps, the number of consecutive sweeps
+            that found it.
+
+        return ((int|None, {int: int})): the smallest object id that
+            the next incremental sweep needs to look at, and the
+            updated holders.
+
+        """
+        # The objects before the window were not looked at, keep their
+        # count for the next full sweep.
+        new_holders = {object_id: sweeps
+                       for object_id, sweeps in holders.items()
+                       if current is not None and object_id < current}
+        for operation, _, _ in operations:
+            new_holders[operation.object_id] = \
+                holders.get(operation.object_id, 0) + 1
+        holding = [operation.object_id for operation, _, _ in operations
+                   if new_holders[operation.object_id]
+                   <= EvaluationService.MAX_SWEEP_HOLDS]
+        if len(holding) > 0:
+            return min(holding), new_holders
+        if max_id is not None:
+            return max_id + 1, new_holders
+        return current, new_holders
+
+    def _lower_sweep_low_water_mark(self, submission_ids):
+        """Make sure the next incremental sweeps look at some submissions.
+
+        submission_ids ([int]): ids of the submissions that need to be
+            swept again.
+
+        """
+        for submission_id in submission_ids:
+            self._sweep_submission_holders.pop(submission_id, None)
+        if self._sweep_min_submission_id is not None \
+                and len(submission_ids) > 0:
+            self._sweep_min_submission_id = min(
+                self._sweep_min_submission_id, min(submission_ids))
+
+    @rpc_method
+    def search_operations_not_done(self):
+        """Make the sweeper loop fire a full sweep as soon as possible.
+
+        This is called after changes that can create operations for
+        old submissions (e.g., a new active dataset), so the
+        incremental sweep would not be enough.
+
+        """
+        self._full_sweep_requested = True
+        super().search_operations_not_done()
+
     @rpc_method
     def workers_status(self):
         """Returns a dictionary (indexed by shard number) whose values
@@ -440,12 +767,14 @@ class EvaluationService(TriggeredService):
         return super().enqueue(operation, priority, timestamp) > 0
 
     @with_post_finish_lock
-    def action_finished(self, data, shard, error=None):
+    def action_finished(self, data, shard, error=None, operations=None):
         """Callback from a worker, to signal that is finished some
         action (compilation or evaluation).
 
         data (dict): the JobGroup, exported to dict.
         shard (int): the shard finishing the action.
+        operations ([ESOperation]): the operations of the job group,
+            as given to the worker pool.
 
         """
         # We notify the pool that the worker is available again for
@@ -456,7 +785,7 @@ class EvaluationService(TriggeredService):
         # this method and do nothing because in that case we know the
         # operation has returned to the queue and perhaps already been
         # reassigned to another worker.
-        to_ignore = self.get_executor().pool.release_worker(shard)
+        to_ignore = self.get_executor().pool.release_worker(shard, operations)
         if to_ignore is True:
             logger.info("Ignored result from worker %s as requested.", shard)
             return
@@ -496,9 +825,11 @@ class EvaluationService(TriggeredService):
 
         Grouping results together by object (i.e., submission result
         or user test result) and type (compilation or evaluation)
-        allows this method to talk less to the DB, for example by
-        retrieving datasets and submission results only once instead
-        of once for every result.
+        allows this method to talk less to the DB. All the objects
+        involved are loaded with a few queries at the beginning, the
+        successful evaluations (the bulk of the results) are inserted
+        with multi-row statements, and the number of evaluations of
+        each submission result is computed with a single query.
 
         items ([(operation, Result)]): the results received by ES but
             not yet written to the db.
@@ -514,11 +845,41 @@ class EvaluationService(TriggeredService):
             t = (operation.type_, operation.object_id, operation.dataset_id)
             by_object_and_type[t].append((operation, result))
 
+        submission_keys = set()
+        user_test_keys = set()
+        evaluation_keys = set()
+        for type_, object_id, dataset_id in by_object_and_type.keys():
+            if type_ in [ESOperation.COMPILATION, ESOperation.EVALUATION]:
+                submission_keys.add((object_id, dataset_id))
+            else:
+                user_test_keys.add((object_id, dataset_id))
+            if type_ == ESOperation.EVALUATION:
+                evaluation_keys.add((object_id, dataset_id))
+
         with SessionGen() as session:
+            datasets = _get_datasets(
+                session, set(k[1] for k in submission_keys | user_test_keys))
+            submissions = _get_by_ids(
+                session, Submission, set(k[0] for k in submission_keys))
+            user_tests = _get_by_ids(
+                session, UserTest, set(k[0] for k in user_test_keys))
+            submission_results = _get_results(
+                session, SubmissionResult, SubmissionResult.submission_id,
+                submission_keys)
+            user_test_results = _get_results(
+                session, UserTestResult, UserTestResult.user_test_id,
+                user_test_keys)
+            evaluated_testcases = _get_evaluated_testcases(
+                session, evaluation_keys)
+
+            # The results we are going to write, by key.
+            object_results = dict()
+            # The successful evaluations, to be inserted at once.
+            new_evaluations = []
             for key, operation_results in by_object_and_type.items():
                 type_, object_id, dataset_id = key
 
-                dataset = Dataset.get_from_id(dataset_id, session)
+                dataset = datasets.get(dataset_id)
                 if dataset is None:
                     logger.error("Could not find dataset %d in the database.",
                                  dataset_id)
@@ -526,68 +887,214 @@ class EvaluationService(TriggeredService):
 
                 # Get submission or user test results.
                 if type_ in [ESOperation.COMPILATION, ESOperation.EVALUATION]:
-                    object_ = Submission.get_from_id(object_id, session)
+                    object_ = submissions.get(object_id)
                     if object_ is None:
                         logger.error("Could not find submission %d "
                                      "in the database.", object_id)
                         continue
-                    object_result = object_.get_result_or_create(dataset)
+                    object_result = submission_results.get(
+                        (object_id, dataset_id))
+                    if object_result is None:
+                        object_result = SubmissionResult(
+                            submission=object_, dataset=dataset)
                 else:
-                    object_ = UserTest.get_from_id(object_id, session)
+                    object_ = user_tests.get(object_id)
                     if object_ is None:
                         logger.error("Could not find user test %d "
                                      "in the database.", object_id)
                         continue
-                    object_result = object_.get_result_or_create(dataset)
+                    object_result = user_test_results.get(
+                        (object_id, dataset_id))
+                    if object_result is None:
+                        object_result = UserTestResult(
+                            user_test=object_, dataset=dataset)
+                object_results[key] = object_result
+
+                if type_ == ESOperation.EVALUATION:
+                    new_evaluations += self.get_new_evaluations(
+                        dataset, operation_results, evaluated_testcases)
+                    operation_results = [
+                        (operation, result)
+                        for operation, result in operation_results
+                        if not result.job_success]
 
                 self.write_results_one_object_and_type(
                     session, object_result, operation_results)
 
-            logger.info("Committing evaluations...")
-            session.commit()
+            session.flush()
+            self.insert_evaluations(session, new_evaluations)
+            if config.short_circuit_evaluation:
+                self.insert_evaluations(session, self.get_skipped_evaluations(
+                    session, datasets, evaluation_keys))
 
-            num_testcases_per_dataset = dict()
-            for type_, object_id, dataset_id in by_object_and_type.keys():
-                if type_ == ESOperation.EVALUATION:
-                    if dataset_id not in num_testcases_per_dataset:
-                        num_testcases_per_dataset[dataset_id] = session\
-                            .query(func.count(Testcase.id))\
-                            .filter(Testcase.dataset_id == dataset_id).scalar()
-                    num_evaluations = session\
-                        .query(func.count(Evaluation.id)) \
-                        .filter(Evaluation.dataset_id == dataset_id) \
-                        .filter(Evaluation.submission_id == object_id).scalar()
-                    if num_evaluations == num_testcases_per_dataset[dataset_id]:
-                        submission_result = SubmissionResult.get_from_id(
-                            (object_id, dataset_id), session)
-                        submission_result.set_evaluation_outcome()
-
-            logger.info("Committing evaluation outcomes...")
+            num_evaluations = _count_evaluations(session, evaluation_keys)
+            for key, object_result in object_results.items():
+                type_, object_id, dataset_id = key
+                if type_ == ESOperation.EVALUATION and \
+                        num_evaluations.get((object_id, dataset_id), 0) \
+                        == len(datasets[dataset_id].testcases):
+                    object_result.set_evaluation_outcome()
+
+            logger.info("Committing evaluations and evaluation outcomes...")
             session.commit()
 
+            # The commit expired all objects; reload the results in
+            # bulk instead of one at a time.
+            _get_results(session, SubmissionResult,
+                         SubmissionResult.submission_id, submission_keys)
+            _get_results(session, UserTestResult,
+                         UserTestResult.user_test_id, user_test_keys)
+
             logger.info("Ending operations for %s objects...",
-                        len(by_object_and_type))
-            for type_, object_id, dataset_id in by_object_and_type.keys():
+                        len(object_results))
+            for key, object_result in object_results.items():
+                type_ = key[0]
                 if type_ == ESOperation.COMPILATION:
-                    submission_result = SubmissionResult.get_from_id(
-                        (object_id, dataset_id), session)
-                    self.compilation_ended(submission_result)
+                    self.compilation_ended(object_result)
                 elif type_ == ESOperation.EVALUATION:
-                    submission_result = SubmissionResult.get_from_id(
-                        (object_id, dataset_id), session)
-                    if submission_result.evaluated():
-                        self.evaluation_ended(submission_result)
+                    if object_result.evaluated():
+                        self.evaluation_ended(object_result)
                 elif type_ == ESOperation.USER_TEST_COMPILATION:
-                    user_test_result = UserTestResult.get_from_id(
-                        (object_id, dataset_id), session)
-                    self.user_test_compilation_ended(user_test_result)
+                    self.user_test_compilation_ended(object_result)
                 elif type_ == ESOperation.USER_TEST_EVALUATION:
-                    user_test_result = UserTestResult.get_from_id(
-                        (object_id, dataset_id), session)
-                    self.user_test_evaluation_ended(user_test_result)
+                    self.user_test_evaluation_ended(object_result)
 
         logger.info("Done")
 
+    def get_new_evaluations(self, dataset, operation_results,
+                            evaluated_testcases):
+        """Return the rows for the successful evaluations of a result.
+
+        dataset (Dataset): the dataset of the operations.
+        operation_results ([(ESOperation, WorkerResult)]): the
+            evaluation operations and corresponding worker results
+            received for a submission result.
+        evaluated_testcases ({(int, int, int)}): the (submission id,
+            dataset id, testcase id) triplets already having an
+            evaluation; updated with the new rows.
+
+        return ([{str: object}]): the values of the Evaluation rows to
+            insert.
+
+        """
+        rows = []
+        for operation, result in operation_results:
+            if not result.job_success:
+                continue
+            testcase = dataset.testcases.get(operation.testcase_codename)
+            if testcase is None:
+                logger.error("Could not find testcase %s in dataset %d.",
+                             operation.testcase_codename, dataset.id)
+                continue
+            key = (operation.object_id, dataset.id, testcase.id)
+            if key in evaluated_testcases:
+                logger.warning("Evaluation for `%s' already in the "
+                               "database, ignoring result.", operation)
+                continue
+            evaluated_testcases.add(key)
+            logger.info("Writing result to db for %s", operation)
+            row = result.job.get_evaluation_values()
+            row.update({
+                "submission_id": operation.object_id,
+                "dataset_id": dataset.id,
+                "testcase_id": testcase.id,
+            })
+            rows.append(row)
+        return rows
+
+    def get_skipped_evaluations(self, session, datasets, keys):
+        """Return the rows for the evaluations that can be skipped.
+
+        The score type of each dataset tells which testcases cannot
+        change the score given the outcomes received so far; they are
+        removed from the queue and written as skipped evaluations.
+        Results for them already being computed by a worker will be
+        ignored as duplicates.
+
+        session (Session): the DB session to use.
+        datasets ({int: Dataset}): the datasets, indexed by id.
+        keys ({(int, int)}): pairs of submission id and dataset id
+            with new evaluations.
+
+        return ([{str: object}]): the values of the Evaluation rows to
+            insert.
+
+        """
+        text = [EVALUATION_MESSAGES.get("skipped").message]
+        rows = []
+        for key, outcomes in _get_evaluation_outcomes(session, keys).items():
+            submission_id, dataset_id = key
+            dataset = datasets[dataset_id]
+            if len(outcomes) == len(dataset.testcases):
+                continue
+            codenames = {testcase.id: codename
+                         for codename, testcase in dataset.testcases.items()}
+            try:
+                to_skip = dataset.score_type_object.testcases_to_skip(
+                    {codenames[testcase_id]: float(outcome)
+                     for testcase_id, outcome in outcomes.items()
+                     if outcome is not None})
+            except Exception:
+                logger.error("Couldn't get the testcases to skip for "
+                             "dataset %d.", dataset_id, exc_info=True)
+                continue
+            for codename in sorted(to_skip):
+                testcase = dataset.testcases[codename]
+                if testcase.id in outcomes:
+                    continue
+                operation = ESOperation(ESOperation.EVALUATION,
+                                        submission_id, dataset_id, codename)
+                try:
+                    self.get_executor().dequeue(operation)
+                except KeyError:
+                    pass
+                logger.info("Skipping %s.", operation)
+                rows.append({
+                    "submission_id": submission_id,
+                    "dataset_id": dataset_id,
+                    "testcase_id": testcase.id,
+                    "outcome": None,
+                    "text": text,
+                })
+        return rows
+
+    def insert_evaluations(self, session, rows):
+        """Insert many evaluations with as few statements as possible.
+
+        If inserting a chunk fails, its rows are inserted one at a
+        time so that a poisonous row does not prevent the others from
+        being written.
+
+        session (Session): the DB session to use.
+        rows ([{str: object}]): the values of the Evaluation rows.
+
+        """
+        table = Evaluation.__table__
+        chunk_size = EvaluationService.EVALUATIONS_PER_INSERT
+        for i in range(0, len(rows), chunk_size):
+            chunk = rows[i:i + chunk_size]
+            try:
+                with session.begin_nested():
+                    session.execute(table.insert().values(chunk))
+                continue
+            except Exception:
+                logger.warning("Error while inserting %d worker results, "
+                               "inserting them one at a time.", len(chunk),
+                               exc_info=True)
+            for row in chunk:
+                try:
+                    with session.begin_nested():
+                        session.execute(table.insert().values(row))
+                except IntegrityError:
+                    logger.warning(
+                        "Integrity error while inserting worker result.",
+                        exc_info=True)
+                except Exception:
+                    # See write_results_one_object_and_type.
+                    logger.error(
+                        "Unexpected exception while inserting worker result.",
+                        exc_info=True)
+
     def write_results_one_object_and_type(
             self, session, object_result, operation_results):
         """Write to the DB the results for one object and type.
@@ -982,9 +1489,12 @@ class EvaluationService(TriggeredService):
                     submission_result.invalidate_evaluation()
 
             # Finally, we re-enqueue the operations for the
-            # submissions.
+            # submissions, and make sure the sweeper looks at them
+            # again in case some operations get lost.
             for submission in submissions:
                 self.submission_enqueue_operations(submission)
+            self._lower_sweep_low_water_mark(
+                [submission.id for submission in submissions])
 
             session.commit()
         logger.info("Invalidate successfully completed.")
@@ -1031,7 +1541,7 @@ class EvaluationService(TriggeredService):
         return True
 
     @rpc_method
-    def queue_status(self):
+    def queue_status(self, offset=0, limit=None):
         """Return the status of the queue.
 
         Parent method returns list of queues of each executor, but in
@@ -1045,11 +1555,37 @@ class EvaluationService(TriggeredService):
         in the queue status.
 
         The entries are then ordered by priority and timestamp (the
-        same criteria used to look at what to complete next).
-
-        return ([QueueEntry]): the list with the queued elements.
+        same criteria used to look at what to complete next). As even
+        the collected entries can be many, only a page of them can be
+        requested; "total" is the number of all of them, "types" their
+        number by operation type, and "summary" the number of entries
+        in the actual queue (see PriorityQueue.get_summary).
+
+        Together with the queue, we return statistics about the last
+        sweep for missing operations (None if no sweep has completed
+        yet): whether it was full, when it ended, its duration in
+        seconds, the number of submissions and user tests it looked
+        at, and the number of operations it enqueued. We also return
+        statistics about the results waiting to be written to the DB
+        (see FlushingDict.get_status).
+
+        offset (int): the number of collected entries to skip.
+        limit (int|None): the maximum number of collected entries to
+            return, or None to return all of them.
+
+        return ({"queue": [QueueEntry], "total": int,
+            "types": {str: int}, "summary": dict, "sweeper": dict|None,
+            "result_cache": dict}): the page of the queued elements,
+            the statistics about the queue, the sweeper statistics and
+            the result cache statistics.
 
         """
-        return sorted(
-            self.get_executor().queue_status_cumulative.values(),
-            key=lambda x: (x["priority"], x["timestamp"]))
+        executor = self.get_executor()
+        return {
+            "queue": executor.get_cumulative_status(offset, limit),
+            "total": len(executor.queue_status_cumulative),
+            "types": dict(executor.queue_status_types),
+            "summary": executor.get_summary(),
+            "sweeper": self._last_sweep_status,
+            "result_cache": self.result_cache.get_status(),
+        }
@@ -28,6 +28,7 @@
 
 """
 
+import gzip
 import json
 import logging
 import string
@@ -38,6 +39,7 @@ import gevent.queue
 import requests
 import requests.exceptions
 from sqlalchemy import not_
+from sqlalchemy.orm import joinedload
 
 from cms import config
 from cms.db import SessionGen, Contest, Participation, Task, Submission, \
@@ -53,6 +55,19 @@ class CannotSendError(Exception):
     pass
 
 
+class DataRejectedError(CannotSendError):
+    """The ranking answered that the data is wrong: do not retry."""
+    pass
+
+
+class ServerError(CannotSendError):
+    """The ranking failed while handling the data: retry, but not
+    forever, as it may fail on that data every time.
+
+    """
+    pass
+
+
 def encode_id(entity_id):
     """Encode the id using only A-Za-z0-9_.
 
@@ -69,35 +84,75 @@ def encode_id(entity_id):
     return encoded_id
 
 
-def safe_put_data(ranking, resource, data, operation):
+def make_session(ranking):
+    """Return a session to send data to a ranking.
+
+    The session keeps the connections alive between the requests.
+
+    ranking (str): the URL of ranking server.
+
+    return (requests.Session): the session.
+
+    """
+    session = requests.Session()
+    # XXX With requests-1.2 auth is automatically extracted from
+    # the URL: there is no need for this.
+    auth = urlsplit(ranking)
+    session.auth = (auth.username, auth.password)
+    session.verify = config.https_certfile
+    return session
+
+
+def safe_put_data(session, ranking, resource, data, operation,
+                  compress=False):
     """Send some data to ranking using a PUT request.
 
+    session (requests.Session): the session to use.
     ranking (bytes): the URL of ranking server.
     resource (bytes): the relative path of the entity.
-    data (dict): the data to JSON-encode and send.
+    data (object): the data to JSON-encode and send.
     operation (unicode): a human-readable description of the operation
         we're performing (to produce log messages).
+    compress (bool): whether to gzip the request body.
 
-    raise (CannotSendError): in case of communication errors.
+    return (int): the status code of the response.
+
+    raise (CannotSendError): in case of communication errors, or if
+        the ranking is unavailable (502, 503 and 504 status codes).
+    raise (ServerError): in case of the other server errors (5xx
+        status codes).
+    raise (DataRejectedError): if the ranking rejected the data (4xx
+        status codes, except 404 and 405, which are returned).
 
     """
+    body = json.dumps(data).encode("utf-8")
+    headers = {'content-type': 'application/json'}
+    if compress:
+        body = gzip.compress(body)
+        headers['content-encoding'] = 'gzip'
     try:
         url = urljoin(ranking, resource)
-        # XXX With requests-1.2 auth is automatically extracted from
-        # the URL: there is no need for this.
-        auth = urlsplit(url)
-        res = requests.put(url, json.dumps(data),
-                           auth=(auth.username, auth.password),
-                           headers={'content-type': 'application/json'},
-                           verify=config.https_certfile)
+        res = session.put(url, data=body, headers=headers,
+                          timeout=ProxyExecutor.TIMEOUT)
     except requests.exceptions.RequestException as error:
         msg = "%s while %s: %s." % (type(error).__name__, operation, error)
         logger.warning(msg)
         raise CannotSendError(msg)
-    if 400 <= res.status_code < 600:
+    if res.status_code in (404, 405):
+        return res.status_code
+    if 400 <= res.status_code < 500:
+        msg = "Status %s while %s." % (res.status_code, operation)
+        logger.warning(msg)
+        raise DataRejectedError(msg)
+    if res.status_code in (502, 503, 504):
         msg = "Status %s while %s." % (res.status_code, operation)
         logger.warning(msg)
         raise CannotSendError(msg)
+    if 500 <= res.status_code < 600:
+        msg = "Status %s while %s." % (res.status_code, operation)
+        logger.warning(msg)
+        raise ServerError(msg)
+    return res.status_code
 
 
 def safe_url(url):
@@ -135,8 +190,10 @@ class ProxyExecutor(Executor):
 
     It maintains a queue of data to send. At each "round" the queue is
     emptied (i.e. all jobs are fetched) and the data is then "combined"
-    to minimize the number of actual HTTP requests: they'll be at most
-    one per entity type.
+    and sent, gzipped, with a single request to the bulk endpoint of
+    the ranking. Rankings without the bulk endpoint receive (at most)
+    one request per entity type. The requests share a session, that
+    keeps the connection alive.
 
     Each entity type is identified by a integral class-level constant.
 
@@ -164,10 +221,24 @@ class ProxyExecutor(Executor):
     # How many different entity types we know about.
     TYPE_COUNT = len(RESOURCE_PATHS)
 
+    # The resource path of the endpoint accepting all the types at
+    # once, relative to the self.ranking URL.
+    BULK_PATH = "bulk/"
+
     # How long we wait after having failed to push data to a ranking
-    # before trying again.
+    # before trying again: the wait starts from the minimum and
+    # doubles after each consecutive failure, up to the maximum.
+    MIN_FAILURE_WAIT = 1.0
     FAILURE_WAIT = 60.0
 
+    # How many consecutive server errors on the same data make us drop
+    # it, as the ranking would likely fail on it forever, blocking all
+    # the data that follows.
+    MAX_SERVER_ERRORS = 5
+
+    # Timeout (in seconds) of the requests to the ranking.
+    TIMEOUT = 60.0
+
     def __init__(self, ranking):
         """Create a proxy for the ranking at the given URL.
 
@@ -180,16 +251,22 @@ class ProxyExecutor(Executor):
 
         self._ranking = ranking
         self._visible_ranking = safe_url(ranking)
+        self._session = make_session(ranking)
+        # Whether the ranking has the bulk endpoint (we assume so
+        # until it answers otherwise).
+        self._bulk = True
+        self._failure_wait = self.MIN_FAILURE_WAIT
 
     def execute(self, entries):
         """Consume (i.e. send) the data put in the queue, forever.
 
         Pick all operations found in the queue (if there aren't any,
         block waiting until there are), combine them and send HTTP
-        requests to the target ranking. Do it until something very bad
-        happens (i.e. some exception is raised). If communication fails
-        don't stop, just wait FAILURE_WAIT seconds before restarting
-        the loop.
+        requests to the target ranking. If communication fails, wait
+        (longer at each consecutive failure, up to FAILURE_WAIT
+        seconds) and send the data again; if the ranking rejects the
+        data, or fails on it MAX_SERVER_ERRORS consecutive times, drop
+        it.
 
         Do all this cooperatively: yield at every blocking operation
         (queue fetch, request send, failure wait, etc.). Since the
@@ -206,28 +283,95 @@ class ProxyExecutor(Executor):
         for entry in entries:
             data[entry.item.type_].update(entry.item.data)
 
-        try:
-            for i in range(self.TYPE_COUNT):
-                # Send entities of type i.
-                if len(data[i]) > 0:
-                    # We abuse the resource path as the English
-                    # (plural) name for the entity type.
-                    name = self.RESOURCE_PATHS[i]
-                    operation = "sending %s to ranking %s" % (
-                                    name, self._visible_ranking)
-
-                    logger.debug(operation.capitalize())
-                    safe_put_data(
-                        self._ranking, "%s/" % name, data[i], operation)
-                    data[i].clear()
+        server_errors = 0
+        while True:
+            try:
+                self._send(data)
+            except DataRejectedError:
+                # A log message has already been produced.
+                break
+            except ServerError:
+                server_errors += 1
+                if server_errors >= self.MAX_SERVER_ERRORS:
+                    logger.error("Dropping data not sent to ranking %s "
+                                 "after %d server errors: %s.",
+                                 self._visible_ranking, server_errors,
+                                 self._describe(data))
+                    self._failure_wait = self.MIN_FAILURE_WAIT
+                    break
+                gevent.sleep(self._failure_wait)
+                self._failure_wait = min(2 * self._failure_wait,
+                                         self.FAILURE_WAIT)
+            except CannotSendError:
+                # A log message has already been produced.
+                gevent.sleep(self._failure_wait)
+                self._failure_wait = min(2 * self._failure_wait,
+                                         self.FAILURE_WAIT)
+            except:
+                # Whoa! That's unexpected!
+                logger.error("Unexpected error.", exc_info=True)
+                gevent.sleep(self.FAILURE_WAIT)
+                break
+            else:
+                self._failure_wait = self.MIN_FAILURE_WAIT
+                break
+
+    def _describe(self, data):
+        """Return a description of some data, for log messages.
+
+        data ([dict]): for each entity type, the entities.
+
+        return (str): the entity types, with the ids of the entities.
+
+        """
+        return "; ".join(
+            "%s %s" % (self.RESOURCE_PATHS[i], ", ".join(sorted(data[i])))
+            for i in range(self.TYPE_COUNT) if len(data[i]) > 0)
+
+    def _send(self, data):
+        """Send the data to the ranking.
 
-        except CannotSendError:
-            # A log message has already been produced.
-            gevent.sleep(self.FAILURE_WAIT)
-        except:
-            # Whoa! That's unexpected!
-            logger.error("Unexpected error.", exc_info=True)
-            gevent.sleep(self.FAILURE_WAIT)
+        data ([dict]): for each entity type, the entities to send;
+            those sent successfully are removed.
+
+        raise (CannotSendError): in case of communication errors.
+
+        """
+        if self._bulk:
+            # We abuse the resource path as the English (plural) name
+            # for the entity type.
+            bulk_data = list([self.RESOURCE_PATHS[i], data[i]]
+                             for i in range(self.TYPE_COUNT)
+                             if len(data[i]) > 0)
+            operation = "sending %s to ranking %s" % (
+                ", ".join(name for name, _ in bulk_data),
+                self._visible_ranking)
+            logger.debug(operation.capitalize())
+            if safe_put_data(self._session, self._ranking, self.BULK_PATH,
+                             bulk_data, operation, compress=True) \
+                    not in (404, 405):
+                for i in range(self.TYPE_COUNT):
+                    data[i].clear()
+                return
+            logger.info("Ranking %s has no bulk endpoint, sending each "
+                        "entity type separately.", self._visible_ranking)
+            self._bulk = False
+
+        for i in range(self.TYPE_COUNT):
+            # Send entities of type i.
+            if len(data[i]) > 0:
+                name = self.RESOURCE_PATHS[i]
+                operation = "sending %s to ranking %s" % (
+                                name, self._visible_ranking)
+
+                logger.debug(operation.capitalize())
+                status = safe_put_data(self._session, self._ranking,
+                                       "%s/" % name, data[i], operation)
+                if status in (404, 405):
+                    msg = "Status %s while %s." % (status, operation)
+                    logger.warning(msg)
+                    raise DataRejectedError(msg)
+                data[i].clear()
 
 
 class ProxyService(TriggeredService):
@@ -477,30 +621,66 @@ class ProxyService(TriggeredService):
                              "unexistent submission id %s.", submission_id)
                 raise KeyError("Submission not found.")
 
-            # ScoringService sent us a submission of another contest, they
-            # do not know about our contest_id in multicontest setup.
-            if submission.task.contest_id != self.contest_id:
-                logger.debug("Ignoring submission %d of contest %d "
-                             "(this ProxyService considers contest %d only).",
-                             submission.id, submission.task.contest_id,
-                             self.contest_id)
-                return
+            self._submission_scored(submission)
 
-            if submission.participation.hidden:
-                logger.info("[submission_scored] Score for submission %d "
-                            "not sent because the participation is hidden.",
-                            submission_id)
-                return
+    @rpc_method
+    def submissions_scored(self, submission_ids):
+        """Notice that many submissions have been scored.
 
-            if not submission.official:
-                logger.info("[submission_scored] Score for submission %d "
-                            "not sent because the submission is not official.",
-                            submission_id)
-                return
+        Same as submission_scored, but for many submissions at once,
+        which are loaded with a single query.
 
-            # Update RWS.
-            for operation in self.operations_for_score(submission):
-                self.enqueue(operation)
+        submission_ids ([int]): the ids of the submissions that changed.
+
+        """
+        with SessionGen() as session:
+            submissions = session.query(Submission)\
+                .filter(Submission.id.in_(submission_ids))\
+                .options(joinedload(Submission.participation)
+                         .joinedload(Participation.user))\
+                .options(joinedload(Submission.task))\
+                .options(joinedload(Submission.results))\
+                .all()
+
+            missing = set(submission_ids) - set(s.id for s in submissions)
+            if len(missing) > 0:
+                logger.error("[submissions_scored] Received score request "
+                             "for unexistent submission ids %s.",
+                             ", ".join("%s" % id_ for id_ in sorted(missing)))
+
+            for submission in submissions:
+                self._submission_scored(submission)
+
+    def _submission_scored(self, submission):
+        """Send the score of a submission to the rankings, if needed.
+
+        submission (Submission): the submission that changed.
+
+        """
+        # ScoringService sent us a submission of another contest, they
+        # do not know about our contest_id in multicontest setup.
+        if submission.task.contest_id != self.contest_id:
+            logger.debug("Ignoring submission %d of contest %d "
+                         "(this ProxyService considers contest %d only).",
+                         submission.id, submission.task.contest_id,
+                         self.contest_id)
+            return
+
+        if submission.participation.hidden:
+            logger.info("[submission_scored] Score for submission %d "
+                        "not sent because the participation is hidden.",
+                        submission.id)
+            return
+
+        if not submission.official:
+            logger.info("[submission_scored] Score for submission %d "
+                        "not sent because the submission is not official.",
+                        submission.id)
+            return
+
+        # Update RWS.
+        for operation in self.operations_for_score(submission):
+            self.enqueue(operation)
 
     @rpc_method
     def submission_tokened(self, submission_id):
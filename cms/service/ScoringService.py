@@ -27,8 +27,13 @@
 
 import logging
 
+from sqlalchemy import tuple_
+from sqlalchemy.orm import joinedload, subqueryload
+
 from cms import ServiceCoord, config
-from cms.db import SessionGen, Submission, Dataset, get_submission_results
+from cms.db import SessionGen, Submission, SubmissionResult, Evaluation, \
+    get_submission_results
+from cms.grading.scoring import update_task_scores
 from cms.io import Executor, TriggeredService, rpc_method
 from cmscommon.datetime import make_datetime
 from .scoringoperations import ScoringOperation, get_operations
@@ -37,79 +42,165 @@ from .scoringoperations import ScoringOperation, get_operations
 logger = logging.getLogger(__name__)
 
 
+def _get_submission_results(session, keys):
+    """Load many submission results, ready to be scored.
+
+    The submissions (with their tasks), the datasets and the
+    evaluations (with their testcases) are loaded together with the
+    results, with a few queries in total.
+
+    session (Session): the DB session to use.
+    keys ({(int, int)}): pairs of submission id and dataset id.
+
+    return ({(int, int): SubmissionResult}): the results found,
+        indexed by submission id and dataset id.
+
+    """
+    if len(keys) == 0:
+        return dict()
+    results = session.query(SubmissionResult)\
+        .filter(tuple_(SubmissionResult.submission_id,
+                       SubmissionResult.dataset_id).in_(keys))\
+        .options(joinedload(SubmissionResult.submission)
+                 .joinedload(Submission.task))\
+        .options(joinedload(SubmissionResult.dataset))\
+        .options(subqueryload(SubmissionResult.evaluations)
+                 .joinedload(Evaluation.testcase))\
+        .all()
+    return {(result.submission_id, result.dataset_id): result
+            for result in results}
+
+
 class ScoringExecutor(Executor):
+
+    # Maximum number of submission results scored in a transaction.
+    MAX_OPERATIONS_PER_BATCH = 100
+
     def __init__(self, proxy_service):
-        super().__init__()
+        super().__init__(batch_executions=True)
         self.proxy_service = proxy_service
 
-    def execute(self, entry):
-        """Assign a score to a submission result.
+    def max_operations_per_batch(self):
+        """See Executor.max_operations_per_batch."""
+        return ScoringExecutor.MAX_OPERATIONS_PER_BATCH
+
+    def execute(self, entries):
+        """Assign a score to some submission results.
 
-        This is the core of ScoringService: here we retrieve the result
-        from the database, check if it is in the correct status,
-        instantiate its ScoreType, compute its score, store it back in
-        the database and tell ProxyService to update RWS if needed.
+        This is the core of ScoringService: here we retrieve the results
+        from the database, check if they are in the correct status,
+        instantiate their ScoreType, compute their score, store them
+        back in the database and tell ProxyService to update RWS if
+        needed.
 
-        entry (QueueEntry): entry containing the operation to perform.
+        All the results are loaded together and scored in a single
+        transaction, and each dataset instantiates its ScoreType once.
+        An operation that cannot be performed is logged and skipped,
+        without affecting the others.
+
+        entries ([QueueEntry]): entries containing the operations to
+            perform.
 
         """
-        operation = entry.item
+        operations = [entry.item for entry in entries]
+        to_notify = []
+        # The participations and tasks whose score may have changed.
+        task_score_keys = set()
         with SessionGen() as session:
-            # Obtain submission.
-            submission = Submission.get_from_id(operation.submission_id,
-                                                session)
-            if submission is None:
-                raise ValueError("Submission %d not found in the database." %
-                                 operation.submission_id)
-
-            # Obtain dataset.
-            dataset = Dataset.get_from_id(operation.dataset_id, session)
-            if dataset is None:
-                raise ValueError("Dataset %d not found in the database." %
-                                 operation.dataset_id)
-
-            # Obtain submission result.
-            submission_result = submission.get_result(dataset)
-
-            # It means it was not even compiled (for some reason).
-            if submission_result is None:
-                raise ValueError("Submission result %d(%d) was not found." %
+            submission_results = _get_submission_results(
+                session, {(operation.submission_id, operation.dataset_id)
+                          for operation in operations})
+            # Instantiating the score types can be expensive, and it
+            # is done only once for each dataset.
+            score_types = dict()
+
+            for operation in operations:
+                submission_result = submission_results.get(
+                    (operation.submission_id, operation.dataset_id))
+                try:
+                    scored = self._score(operation, submission_result,
+                                         score_types)
+                except Exception:
+                    logger.error("Unexpected error when executing operation "
+                                 "`%s'.", operation, exc_info=True)
+                    continue
+                if scored:
+                    submission = submission_result.submission
+                    # If dataset is the active one, update RWS.
+                    if submission_result.dataset is \
+                            submission.task.active_dataset:
+                        logger.info(
+                            "Submission scored %.1f seconds after submission",
+                            (make_datetime() -
+                             submission.timestamp).total_seconds())
+                        to_notify.append(submission.id)
+                        task_score_keys.add((submission.participation_id,
+                                             submission.task_id))
+
+            # Keep the scores shown in the ranking up to date; this is
+            # just a cache, failing must not prevent storing the scores.
+            try:
+                with session.begin_nested():
+                    update_task_scores(session, task_score_keys)
+            except Exception:
+                logger.error("Couldn't update the scores on the tasks.",
+                             exc_info=True)
+
+            # Store them.
+            session.commit()
+
+        if len(to_notify) > 0:
+            self.proxy_service.submissions_scored(submission_ids=to_notify)
+
+    @staticmethod
+    def _score(operation, submission_result, score_types):
+        """Assign a score to a submission result.
+
+        operation (ScoringOperation): the operation to perform.
+        submission_result (SubmissionResult|None): the submission
+            result of the operation, if it exists.
+        score_types ({int: ScoreType}): the score types already
+            instantiated, indexed by dataset id.
+
+        return (bool): whether the result was scored (False if it was
+            already).
+
+        raise (ValueError): if the result cannot be scored.
+
+        """
+        # It means it was not even compiled (for some reason), or the
+        # submission or the dataset do not exist.
+        if submission_result is None:
+            raise ValueError("Submission result %d(%d) was not found." %
+                             (operation.submission_id,
+                              operation.dataset_id))
+
+        # Check if it's ready to be scored.
+        if not submission_result.needs_scoring():
+            if submission_result.scored():
+                logger.info("Submission result %d(%d) is already scored.",
+                            operation.submission_id, operation.dataset_id)
+                return False
+            else:
+                raise ValueError("The state of the submission result "
+                                 "%d(%d) doesn't allow scoring." %
                                  (operation.submission_id,
                                   operation.dataset_id))
 
-            # Check if it's ready to be scored.
-            if not submission_result.needs_scoring():
-                if submission_result.scored():
-                    logger.info("Submission result %d(%d) is already scored.",
-                                operation.submission_id, operation.dataset_id)
-                    return
-                else:
-                    raise ValueError("The state of the submission result "
-                                     "%d(%d) doesn't allow scoring." %
-                                     (operation.submission_id,
-                                      operation.dataset_id))
-
-            # Instantiate the score type.
-            score_type = dataset.score_type_object
-
-            # Compute score and fill it in the database.
-            submission_result.score, \
-                submission_result.score_details, \
-                submission_result.public_score, \
-                submission_result.public_score_details, \
-                submission_result.ranking_score_details = \
-                score_type.compute_score(submission_result)
-
-            # Store it.
-            session.commit()
-
-            # If dataset is the active one, update RWS.
-            if dataset is submission.task.active_dataset:
-                logger.info(
-                    "Submission scored %.1f seconds after submission",
-                    (make_datetime() - submission.timestamp).total_seconds())
-                self.proxy_service.submission_scored(
-                    submission_id=submission.id)
+        # Instantiate the score type.
+        dataset = submission_result.dataset
+        if dataset.id not in score_types:
+            score_types[dataset.id] = dataset.score_type_object
+        score_type = score_types[dataset.id]
+
+        # Compute score and fill it in the database.
+        submission_result.score, \
+            submission_result.score_details, \
+            submission_result.public_score, \
+            submission_result.public_score_details, \
+            submission_result.ranking_score_details = \
+            score_type.compute_score(submission_result)
+        return True
 
 
 class ScoringService(TriggeredService):
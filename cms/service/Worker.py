@@ -27,14 +27,19 @@
 
 import logging
 import time
+from datetime import datetime
 
 import gevent.lock
+import gevent.pool
+from sqlalchemy import func
 
-from cms import ServiceCoord
-from cms.db import SessionGen, Contest, enumerate_files
+from cms import ServiceCoord, config
+from cms.db import SessionGen, Contest, Submission, Task, \
+    enumerate_files
 from cms.db.filecacher import FileCacher, TombstoneError
 from cms.grading import JobException
 from cms.grading.Job import CompilationJob, EvaluationJob, JobGroup
+from cms.grading.Sandbox import sandbox_pool
 from cms.grading.tasktypes import get_task_type
 from cms.io import Service, rpc_method
 
@@ -53,11 +58,19 @@ class Worker(Service):
     JOB_TYPE_COMPILATION = "compile"
     JOB_TYPE_EVALUATION = "evaluate"
 
+    # How many files are downloaded at the same time when precaching.
+    PRECACHE_CONCURRENCY = 8
+    # How often (in seconds) to check the progress of another worker
+    # precaching in the same cache.
+    PRECACHE_WAIT = 1.0
+
     def __init__(self, shard, fake_worker_time=None):
         Service.__init__(self, shard)
         self.file_cacher = FileCacher(self)
 
         self.work_lock = gevent.lock.RLock()
+        # Number of job groups waiting for the lock.
+        self._waiting = 0
         self._last_end_time = None
         self._total_free_time = 0
         self._total_busy_time = 0
@@ -65,6 +78,14 @@ class Worker(Service):
 
         self._fake_worker_time = fake_worker_time
 
+        self._precache_status = {
+            "contest_id": None,
+            "state": "idle",
+            "ready": False,
+            "total": 0,
+            "done": 0,
+        }
+
         self.evaluation_service = self.connect_to(
             ServiceCoord("EvaluationService", 0),
             on_connect=self.on_es_connection)
@@ -72,48 +93,195 @@ class Worker(Service):
     def on_es_connection(self, address):
         self.evaluation_service.add_worker(coord=self._my_coord)
 
+    def run(self):
+        """See Service.run.
+
+        While running, the sandboxes released by a job can be reused by
+        the next ones; they are deleted at the end.
+
+        """
+        sandbox_pool.resize(config.sandbox_pool_size)
+        try:
+            return super().run()
+        finally:
+            sandbox_pool.resize(0)
+
     @rpc_method
     def precache_files(self, contest_id):
         """RPC to ask the worker to precache of files in the contest.
 
+        The files needed to evaluate the submissions on the active
+        datasets are downloaded first, starting from the tasks that
+        received a submission most recently; the call returns when
+        those are in the cache, and the remaining files are downloaded
+        in the background. Up to PRECACHE_CONCURRENCY files are
+        downloaded at the same time.
+
         contest_id (int): the id of the contest
 
         """
+        self._precache_status = {
+            "contest_id": contest_id,
+            "state": "waiting",
+            "ready": False,
+            "total": 0,
+            "done": 0,
+        }
+        status = self._precache_status
+
+        # In order to avoid a long-living connection, first fetch the
+        # complete list of files and then download the files; since
+        # this is just pre-caching, possible race conditions are not
+        # dangerous
+        with SessionGen() as session:
+            contest = Contest.get_from_id(contest_id, session)
+            priority, pinned = Worker._precache_priority_files(contest)
+            files = enumerate_files(session,
+                                    contest,
+                                    skip_submissions=True,
+                                    skip_user_tests=True,
+                                    skip_print_jobs=True)
+        files = priority + sorted(files.difference(priority))
+        status["total"] = len(files)
+
         lock = self.file_cacher.precache_lock()
         if lock is None:
-            # Another worker is already precaching. Hence, this worker doesn't
-            # need to do anything.
+            # Another worker is already precaching in the same cache,
+            # so this worker only needs to wait for the files it needs
+            # first, unless the other stops before downloading them.
             logger.info("Another worker is already precaching files for "
                         "contest %d.", contest_id)
-            return
-        with lock:
-            # In order to avoid a long-living connection, first fetch the
-            # complete list of files and then download the files; since
-            # this is just pre-caching, possible race conditions are not
-            # dangerous
-            logger.info("Precaching files for contest %d.", contest_id)
-            with SessionGen() as session:
-                contest = Contest.get_from_id(contest_id, session)
-                files = enumerate_files(session,
-                                        contest,
-                                        skip_submissions=True,
-                                        skip_user_tests=True,
-                                        skip_print_jobs=True)
-            for digest in files:
-                try:
-                    self.file_cacher.cache_file(digest)
-                except KeyError:
-                    # No problem (at this stage) if we cannot find the
-                    # file
-                    pass
-
-            logger.info("Precaching finished.")
+            while not all(self.file_cacher.is_cached(digest)
+                          for digest in priority):
+                gevent.sleep(Worker.PRECACHE_WAIT)
+                lock = self.file_cacher.precache_lock()
+                if lock is not None:
+                    break
+            else:
+                status["state"] = "done"
+                status["ready"] = True
+                logger.info("Files for contest %d precached by another "
+                            "worker.", contest_id)
+                return
+
+        logger.info("Precaching files for contest %d.", contest_id)
+        # From here, the lock is released by precache_others, once it
+        # is started: release it if anything fails before.
+        try:
+            status["state"] = "running"
+            self.file_cacher.pin(pinned)
+            pool = gevent.pool.Pool(Worker.PRECACHE_CONCURRENCY)
+            # The pool blocks when full, so the files are downloaded in
+            # order of priority.
+            for digest in priority:
+                pool.spawn(self._precache_file, digest)
+            pool.join()
+            status["ready"] = True
+            logger.info("Precached the files of the active datasets of "
+                        "contest %d.", contest_id)
+
+            def precache_others():
+                with lock:
+                    for digest in files[len(priority):]:
+                        pool.spawn(self._precache_file, digest)
+                    pool.join()
+                    status["state"] = "done"
+                    logger.info("Precaching finished.")
+
+            gevent.spawn(precache_others)
+        except BaseException:
+            lock.close()
+            raise
+
+    @staticmethod
+    def _precache_priority_files(contest):
+        """Return the files a worker should precache first.
+
+        contest (Contest): the contest to precache.
+
+        return ([unicode], {unicode}): the digests of the managers and
+            testcases of the active datasets, starting from the tasks
+            that received a submission most recently; and the subset of
+            those that should be pinned in the cache (the testcases).
+
+        """
+        session = contest.sa_session
+        last_submission = dict(
+            session.query(Submission.task_id, func.max(Submission.timestamp))
+            .join(Submission.task)
+            .filter(Task.contest_id == contest.id)
+            .group_by(Submission.task_id)
+            .all())
+        # The sort is stable, so tasks without submissions keep their
+        # order, at the end.
+        tasks = sorted(
+            contest.tasks,
+            key=lambda t: last_submission.get(t.id) or datetime.min,
+            reverse=True)
+
+        priority = []
+        pinned = set()
+        for task in tasks:
+            dataset = task.active_dataset
+            if dataset is None:
+                continue
+            priority.extend(manager.digest
+                            for manager in dataset.managers.values())
+            for testcase in dataset.testcases.values():
+                priority.extend([testcase.input, testcase.output])
+                pinned.update([testcase.input, testcase.output])
+        # Remove duplicates, keeping the first occurrence.
+        priority = list(dict.fromkeys(priority))
+        return priority, pinned
+
+    def _precache_file(self, digest):
+        """Download a file in the cache during precaching.
+
+        digest (unicode): the digest of the file.
+
+        """
+        try:
+            self.file_cacher.cache_file(digest)
+        except (KeyError, TombstoneError):
+            # No problem (at this stage) if we cannot find the file
+            pass
+        except Exception:
+            logger.warning("Could not precache file %s.", digest,
+                           exc_info=True)
+        finally:
+            self._precache_status["done"] += 1
+
+    @rpc_method
+    def precache_status(self):
+        """Return the progress of the last precaching.
+
+        return ({str: object}): the id of the contest ("contest_id"),
+            the state ("idle", "waiting" for another worker to precache,
+            "running" or "done"), whether the files needed first are
+            cached ("ready"), and how many files are to be precached
+            ("total") and have been processed ("done").
+
+        """
+        return dict(self._precache_status)
+
+    @rpc_method
+    def file_cache_status(self):
+        """Return statistics about the use of the file cache.
+
+        return ({str: int|None}): see FileCacher.get_cache_stats.
+
+        """
+        return self.file_cacher.get_cache_stats()
 
     @rpc_method
     def execute_job_group(self, job_group_dict):
         """Receive a group of jobs in a list format and executes them one by
         one.
 
+        If the worker is executing another job group, up to
+        worker_prefetch_depth job groups wait for it to finish, in
+        order; further ones are declined.
+
         job_group_dict ({}): a JobGroup exported to dict.
 
         return ({}): the same JobGroup in dict format, but containing
@@ -123,7 +291,18 @@ class Worker(Service):
         start_time = time.time()
         job_group = JobGroup.import_from_dict(job_group_dict)
 
-        if self.work_lock.acquire(False):
+        acquired = self.work_lock.acquire(False)
+        if not acquired and self._waiting < config.worker_prefetch_depth:
+            logger.info("Job group queued.")
+            self._waiting += 1
+            try:
+                acquired = self.work_lock.acquire()
+            finally:
+                self._waiting -= 1
+            # The time spent waiting is not busy time.
+            start_time = time.time()
+
+        if acquired:
             try:
                 logger.info("Starting job group.")
                 for job in job_group.jobs:
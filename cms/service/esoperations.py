@@ -28,7 +28,7 @@ compute sets of operations to do.
 
 import logging
 
-from sqlalchemy import case, literal
+from sqlalchemy import case, func, literal
 
 from cms.db import Dataset, Evaluation, Submission, SubmissionResult, \
     Task, Testcase, UserTest, UserTestResult
@@ -283,12 +283,88 @@ def get_relevant_operations(level, submissions, dataset_id=None):
     return operations
 
 
-def get_submissions_operations(session, contest_id=None):
+def _min_id_filter(column, min_id):
+    """Return a filter selecting the rows with column at least min_id.
+
+    column (Column): the id column to filter on.
+    min_id (int|None): the smallest id to select, or None to select
+        all rows.
+
+    return (ColumnElement): the filter.
+
+    """
+    if min_id is None:
+        return literal(True)
+    return column >= min_id
+
+
+def get_submissions_window(session, contest_id=None,
+                           min_submission_id=None):
+    """Return the size and the upper end of a window of submissions.
+
+    This is used by incremental sweeps to know how many rows they are
+    looking at and where the next window should start.
+
+    session (Session): the database session to use.
+    contest_id (int|None): the contest of the submissions, or None for
+        any contest.
+    min_submission_id (int|None): the smallest submission id in the
+        window, or None to start from the first submission.
+
+    return ((int, int|None)): the number of submissions in the window
+        and the largest submission id (None if the window is empty).
+
+    """
+    if contest_id is None:
+        contest_filter = literal(True)
+    else:
+        contest_filter = Task.contest_id == contest_id
+
+    return session.query(Submission)\
+        .join(Submission.task)\
+        .filter(
+            contest_filter &
+            _min_id_filter(Submission.id, min_submission_id))\
+        .with_entities(func.count(Submission.id), func.max(Submission.id))\
+        .one()
+
+
+def get_user_tests_window(session, contest_id=None, min_user_test_id=None):
+    """Return the size and the upper end of a window of user tests.
+
+    session (Session): the database session to use.
+    contest_id (int|None): the contest of the user tests, or None for
+        any contest.
+    min_user_test_id (int|None): the smallest user test id in the
+        window, or None to start from the first user test.
+
+    return ((int, int|None)): the number of user tests in the window
+        and the largest user test id (None if the window is empty).
+
+    """
+    if contest_id is None:
+        contest_filter = literal(True)
+    else:
+        contest_filter = Task.contest_id == contest_id
+
+    return session.query(UserTest)\
+        .join(UserTest.task)\
+        .filter(
+            contest_filter &
+            _min_id_filter(UserTest.id, min_user_test_id))\
+        .with_entities(func.count(UserTest.id), func.max(UserTest.id))\
+        .one()
+
+
+def get_submissions_operations(session, contest_id=None,
+                               min_submission_id=None):
     """Return all the operations to do for submissions in the contest.
 
     session (Session): the database session to use.
     contest_id (int|None): the contest for which we want the operations.
         If none, get operations for any contest.
+    min_submission_id (int|None): if given, only consider submissions
+        with an id at least this value.
 
     return ([ESOperation, float, int]): a list of operation, timestamp
         and priority.
@@ -300,6 +376,8 @@ def get_submissions_operations(session, contest_id=None):
         contest_filter = literal(True)
     else:
         contest_filter = Task.contest_id == contest_id
+    contest_filter = contest_filter & \
+        _min_id_filter(Submission.id, min_submission_id)
 
     # Retrieve the compilation operations for all submissions without
     # the corresponding result for a dataset to judge. Since we have
@@ -390,12 +468,15 @@ def get_submissions_operations(session, contest_id=None):
     return operations
 
 
-def get_user_tests_operations(session, contest_id=None):
+def get_user_tests_operations(session, contest_id=None,
+                              min_user_test_id=None):
     """Return all the operations to do for user tests in the contest.
 
     session (Session): the database session to use.
     contest_id (int|None): the contest for which we want the operations.
         If none, get operations for any contest.
+    min_user_test_id (int|None): if given, only consider user tests
+        with an id at least this value.
 
     return ([ESOperation, float, int]): a list of operation, timestamp
         and priority.
@@ -407,6 +488,8 @@ def get_user_tests_operations(session, contest_id=None):
         contest_filter = literal(True)
     else:
         contest_filter = Task.contest_id == contest_id
+    contest_filter = contest_filter & \
+        _min_id_filter(UserTest.id, min_user_test_id)
 
     # Retrieve the compilation operations for all user tests without
     # the corresponding result for a dataset to judge. Since we have
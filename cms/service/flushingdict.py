@@ -17,32 +17,84 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import bisect
 import logging
 import time
 
 import gevent
+from gevent.event import Event
 from gevent.lock import RLock
 
 
 logger = logging.getLogger(__name__)
 
 
+class Histogram:
+    """Distribution of a quantity, counted in buckets.
+
+    """
+
+    # Upper bounds of the buckets, in seconds.
+    BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+               10.0]
+
+    def __init__(self):
+        # Number of observations in each bucket, the last for those
+        # larger than all the bounds.
+        self.counts = [0] * (len(Histogram.BUCKETS) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        """Record an observation.
+
+        value (float): the observed value.
+
+        """
+        self.counts[bisect.bisect_left(Histogram.BUCKETS, value)] += 1
+        self.sum += value
+
+    def get_status(self):
+        """Return the distribution, in the format used by Prometheus.
+
+        return ({"buckets": [(float, int)], "sum": float, "count": int}):
+            the cumulative number of observations less than or equal
+            to each bound, their sum and their number (that is, the
+            count of the implicit last bucket, with infinite bound).
+
+        """
+        buckets = []
+        total = 0
+        for bound, count in zip(Histogram.BUCKETS, self.counts):
+            total += count
+            buckets.append((bound, total))
+        total += self.counts[-1]
+        return {"buckets": buckets, "sum": self.sum, "count": total}
+
+
 class FlushingDict:
     """A dict that periodically flushes its content to a callback.
 
-    The dict flushes after a specified time since the latest entry
-    was added, or when it has reached its maximum size.
+    The dict flushes when it has reached its maximum size, or when
+    the oldest entry not flushed yet has waited long enough. How long
+    depends on the duration of the previous flushes, but it is never
+    more than the specified latency: there is little point in waiting
+    to collect a larger batch if flushing is cheap.
 
     This dict is thread safe. Keys must be hashable. New values for an
     existing keys will overwrite the previous values.
 
     """
 
+    # Weight of the latest flush in the estimate of the duration of a
+    # flush.
+    DURATION_WEIGHT = 0.2
+
     def __init__(self, size, flush_latency_seconds, callback):
         # Elements contained in the dict that force a flush.
         self.size = size
 
-        # How much time we wait for other key-values before flushing.
+        # The maximum time we wait for other key-values before
+        # flushing.
         self.flush_latency_seconds = flush_latency_seconds
 
         # Function to flush the data to.
@@ -55,44 +107,116 @@ class FlushingDict:
         # This contains all the key-values that are currently being flushed
         self.fd = dict()
 
-        # The greenlet that checks if the dict should be flushed or not
-        # TODO: do something if the FlushingDict is deleted
-        self.flush_greenlet = gevent.spawn(self._check_flush)
-
         # This lock ensures that if a key-value arrives while flush is
         # executing, it is not inserted in the dict until flush
         # terminates.
         self.d_lock = RLock()
 
-        # Time when an item was last inserted in the dict
-        self.last_insert = time.monotonic()
+        # Time when the oldest item not flushed yet was inserted in the
+        # dict (None if the dict is empty).
+        self.first_insert = None
+
+        # Estimate of the duration of a flush, in seconds.
+        self.flush_duration = 0.0
+
+        # Time between the insertion of the oldest item of each flush
+        # and the end of the flush, and duration of each flush.
+        self.latency_histogram = Histogram()
+        self.duration_histogram = Histogram()
+
+        # Set when the greenlet might need to flush: when the dict
+        # stops being empty, and when it reaches its maximum size.
+        self._wakeup = Event()
+
+        # The greenlet that flushes the dict when needed.
+        # TODO: do something if the FlushingDict is deleted
+        self.flush_greenlet = gevent.spawn(self._flush_loop)
 
     def add(self, key, value):
         logger.debug("Adding item %s", key)
         with self.d_lock:
             self.d[key] = value
-            self.last_insert = time.monotonic()
+            if self.first_insert is None:
+                self.first_insert = time.monotonic()
+                self._wakeup.set()
+            if len(self.d) >= self.size:
+                self._wakeup.set()
 
     def flush(self):
         logger.debug("Flushing items")
         with self.d_lock:
             self.fd = self.d
             self.d = dict()
-        self.callback(list(self.fd.items()))
-        self.fd = dict()
+            first_insert = self.first_insert
+            self.first_insert = None
+        start = time.monotonic()
+        try:
+            self.callback(list(self.fd.items()))
+        finally:
+            self.fd = dict()
+            end = time.monotonic()
+            duration = end - start
+            self.flush_duration += FlushingDict.DURATION_WEIGHT * (
+                duration - self.flush_duration)
+            self.duration_histogram.observe(duration)
+            if first_insert is not None:
+                self.latency_histogram.observe(end - first_insert)
 
     def __contains__(self, key):
         with self.d_lock:
             return key in self.d or key in self.fd
 
-    def _check_flush(self):
+    def _deadline(self):
+        """Return when the items in the dict have to be flushed.
+
+        return (float|None): a time, as returned by time.monotonic, or
+            None if the dict is empty.
+
+        """
+        if self.first_insert is None:
+            return None
+        return self.first_insert + min(self.flush_latency_seconds,
+                                       self.flush_duration)
+
+    def get_status(self):
+        """Return statistics about the items and the flushes.
+
+        return (dict): the number of items waiting to be flushed
+            ("pending"), the age in seconds of the oldest one ("oldest",
+            None if there are none), and the histograms of the latency
+            of the flushes (from the insertion of their oldest item to
+            their end, "latency") and of their duration ("duration").
+            See Histogram.get_status for their format.
+
+        """
+        with self.d_lock:
+            pending = len(self.d)
+            oldest = None
+            if self.first_insert is not None:
+                oldest = time.monotonic() - self.first_insert
+        return {
+            "pending": pending,
+            "oldest": oldest,
+            "latency": self.latency_histogram.get_status(),
+            "duration": self.duration_histogram.get_status(),
+        }
+
+    def _flush_loop(self):
         while True:
-            while True:
-                with self.d_lock:
-                    since_last_insert = time.monotonic() - self.last_insert
-                    if len(self.d) != 0 and (
-                            len(self.d) >= self.size or
-                            since_last_insert > self.flush_latency_seconds):
-                        break
-                gevent.sleep(0.05)
-            self.flush()
+            self._wakeup.wait()
+            with self.d_lock:
+                self._wakeup.clear()
+                deadline = self._deadline()
+                if deadline is None:
+                    continue
+                full = len(self.d) >= self.size
+                timeout = deadline - time.monotonic()
+            if full or timeout <= 0:
+                self.flush()
+                # Items added during the flush, if any, have to be
+                # looked at.
+                self._wakeup.set()
+            else:
+                # Until the deadline, or until the dict is full.
+                self._wakeup.wait(timeout)
+                self._wakeup.set()
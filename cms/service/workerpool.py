@@ -25,6 +25,7 @@
 
 """
 
+import functools
 import logging
 import random
 from datetime import timedelta
@@ -32,6 +33,7 @@ from datetime import timedelta
 import gevent.lock
 from gevent.event import Event
 
+from cms import config
 from cms.db import SessionGen
 from cms.grading.Job import JobGroup
 from cmscommon.datetime import make_datetime, make_timestamp
@@ -60,24 +62,27 @@ class WorkerPool:
         self._service = service
         self._worker = {}
         # These dictionary stores data about the workers (identified
-        # by their shard number). Schedule disabling to True means
-        # that we are going to disable the worker as soon as possible
-        # (when it finishes the current operations). The current
-        # operations are also discarded because we already re-assigned
-        # it. Ignore is true if the next results coming from the
-        # worker should be discarded. Operations is the list of
-        # operations currently executing. Operations to ignore is the
-        # list of operations to ignore in the next batch of results.
+        # by their shard number). Operations is the list of operations
+        # currently assigned to the worker, or one of WORKER_INACTIVE
+        # and WORKER_DISABLED. Job groups are the lists of operations
+        # sent together to the worker, in the same order: the worker
+        # executes the first one while the others wait (up to
+        # worker_prefetch_depth of them). Operations to ignore is the
+        # list of operations whose result is to be discarded. Start
+        # time is when the worker started executing the first job
+        # group.
         # Type: {int: [ESOperation]}
         self._operations = {}
+        # Type: {int: [[ESOperation]]}
+        self._job_groups = {}
         # Type: {int: [ESOperation]}
         self._operations_to_ignore = {}
         # Type: {int: Datetime|None}
         self._start_time = {}
+        # Precaching is true while the worker is downloading the files
+        # it needs first; it gets no operations in the meantime.
         # Type: {int: bool}
-        self._schedule_disabling = {}
-        # Type: {int: bool}
-        self._ignore = {}
+        self._precaching = {}
 
         # TODO: given the number of pieces data associated to each
         # worker, this class could be simplified by creating a new
@@ -119,24 +124,48 @@ class WorkerPool:
         with self._operation_lock:
             operations = self._operations[shard]
             self._operations[shard] = new_operation
+            self._job_groups[shard] = []
             if isinstance(operations, list):
                 for operation in operations:
                     del self._operations_reverse[operation]
 
     def _add_operations(self, shard, operations):
-        """Assigns new operations to a currently inactive worker.
+        """Assigns new operations, as a job group, to a worker.
 
         shard (int): shard of the worker.
         operations ([ESOperation]) operations to assign to the worker.
 
         """
-        if self._operations[shard] != WorkerPool.WORKER_INACTIVE:
-            raise ValueError("Shard %s is already doing an operation.", shard)
+        if self._operations[shard] == WorkerPool.WORKER_DISABLED:
+            raise ValueError("Shard %s is disabled.", shard)
         with self._operation_lock:
-            self._operations[shard] = operations
+            if self._operations[shard] == WorkerPool.WORKER_INACTIVE:
+                self._operations[shard] = []
+            self._operations[shard] = self._operations[shard] + operations
+            self._job_groups[shard].append(operations)
             for operation in operations:
                 self._operations_reverse[operation] = shard
 
+    def _remove_job_group(self, shard, operations):
+        """Safely remove a job group from a worker.
+
+        shard (int): the worker from which to remove the job group.
+        operations ([ESOperation]): the operations of the job group.
+
+        """
+        with self._operation_lock:
+            self._job_groups[shard] = [
+                job_group for job_group in self._job_groups[shard]
+                if job_group is not operations]
+            if len(self._job_groups[shard]) == 0:
+                self._operations[shard] = WorkerPool.WORKER_INACTIVE
+            else:
+                self._operations[shard] = [
+                    operation for operation in self._operations[shard]
+                    if operation not in operations]
+            for operation in operations:
+                del self._operations_reverse[operation]
+
     def wait_for_workers(self):
         """Wait until a worker might be available."""
         self._workers_available_event.wait()
@@ -158,17 +187,18 @@ class WorkerPool:
 
         # And we fill all data.
         self._operations[shard] = WorkerPool.WORKER_INACTIVE
+        self._job_groups[shard] = []
         self._operations_to_ignore[shard] = []
         self._start_time[shard] = None
-        self._schedule_disabling[shard] = False
-        self._ignore[shard] = False
+        self._precaching[shard] = False
         self._workers_available_event.set()
         logger.debug("Worker %s added.", shard)
 
     def on_worker_connected(self, worker_coord):
         """To be called when a worker comes alive after being
         offline. We use this callback to instruct the worker to
-        precache all files concerning the contest.
+        precache all files concerning the contest; until the most
+        needed of them are cached, the worker is not given operations.
 
         worker_coord (ServiceCoord): the coordinates of the worker
                                      that came online.
@@ -177,9 +207,11 @@ class WorkerPool:
         shard = worker_coord.shard
         logger.info("Worker %s online again.", shard)
         if self._service.contest_id is not None:
+            self._precaching[shard] = True
             self._worker[shard].precache_files(
-                contest_id=self._service.contest_id
-            )
+                contest_id=self._service.contest_id,
+                callback=self._precache_finished,
+                plus=shard)
         # We don't requeue the operation, because a connection lost
         # does not invalidate a potential result given by the worker
         # (as the problem was the connection and not the machine on
@@ -187,6 +219,24 @@ class WorkerPool:
         # so we wake up the consumers.
         self._workers_available_event.set()
 
+    def _precache_finished(self, unused_data, shard, error=None):
+        """To be called when a worker finished precaching the files it
+        needs first, so that it can start working.
+
+        unused_data (None): the return value of the RPC.
+        shard (int): the worker that finished precaching.
+        error (str|None): the error of the RPC, if any.
+
+        """
+        if error is not None:
+            # The worker will download the files when it needs them.
+            logger.warning("Worker %s could not precache files: %s.",
+                           shard, error)
+        else:
+            logger.info("Worker %s finished precaching.", shard)
+        self._precaching[shard] = False
+        self._workers_available_event.set()
+
     def on_worker_disconnected(self, worker_coord, ephemeral):
         """If the worker is ephemeral, disable and the remove the worker
         form the pool.
@@ -210,6 +260,10 @@ class WorkerPool:
         are available then this returns None, otherwise this returns
         the chosen worker.
 
+        Workers are available if they are executing fewer than
+        worker_prefetch_depth + 1 job groups; idle workers are chosen
+        first.
+
         operations ([ESOperation]): the operations to assign to a worker.
 
         return (int|None): None if no workers are available, the worker
@@ -218,9 +272,7 @@ class WorkerPool:
         """
         # We look for an available worker.
         try:
-            shard = self.find_worker(WorkerPool.WORKER_INACTIVE,
-                                     require_connection=True,
-                                     random_worker=True)
+            shard = self._find_available_worker()
         except LookupError:
             self._workers_available_event.clear()
             return None
@@ -229,7 +281,8 @@ class WorkerPool:
         self._add_operations(shard, operations)
 
         logger.debug("Worker %s acquired.", shard)
-        self._start_time[shard] = make_datetime()
+        if self._start_time[shard] is None:
+            self._start_time[shard] = make_datetime()
 
         with SessionGen() as session:
             job_group_dict = \
@@ -238,55 +291,109 @@ class WorkerPool:
         logger.info("Asking worker %s to %s.", shard,
                     ", ".join("`%s'" % operation for operation in operations))
 
+        # The operations identify the job group when the worker
+        # finishes it.
         self._worker[shard].execute_job_group(
             job_group_dict=job_group_dict,
-            callback=self._service.action_finished,
+            callback=functools.partial(self._service.action_finished,
+                                       operations=operations),
             plus=shard)
         return shard
 
-    def release_worker(self, shard):
-        """To be called by ES when it receives a notification that an
-        operation finished.
+    def _find_available_worker(self):
+        """Return a worker that can receive a job group.
+
+        return (int): the shard of a connected, enabled worker which
+            is not precaching and has room for another job group,
+            chosen at random amongst those with the fewest job groups.
+
+        raise (LookupError): if no worker is available.
+
+        """
+        pool = []
+        for shard, worker_operation in self._operations.items():
+            if worker_operation == WorkerPool.WORKER_DISABLED \
+                    or not self._worker[shard].connected \
+                    or self._precaching[shard]:
+                continue
+            job_groups = len(self._job_groups[shard])
+            if job_groups <= config.worker_prefetch_depth:
+                pool.append((job_groups, shard))
+        if pool == []:
+            raise LookupError("No available worker.")
+        min_job_groups = min(pool)[0]
+        return random.choice([shard for job_groups, shard in pool
+                              if job_groups == min_job_groups])
+
+    def release_worker(self, shard, operations):
+        """To be called by ES when it receives a notification that a
+        job group finished.
 
-        Note: if the worker is scheduled to be disabled, then we
-        disable it, and notify the ES to discard the outcome obtained
-        by the worker.
+        Note: if the worker has been disabled, or its operations given
+        back to ES, after it received the job group, then we notify
+        ES to discard the outcome obtained by the worker.
 
         shard (int): the worker to release.
+        operations ([ESOperation]): the operations of the job group,
+            as given to acquire_worker.
 
         return (bool|[ESOperation]): if boolean, whether the result is
             to be ignored; if a list, the list of operation for which
             the results should be ignored.
 
         """
+        if not any(job_group is operations
+                   for job_group in self._job_groups[shard]):
+            return True
+
+        with self._operation_lock:
+            to_ignore = [operation
+                         for operation in self._operations_to_ignore[shard]
+                         if operation in operations]
+            self._operations_to_ignore[shard] = [
+                operation for operation in self._operations_to_ignore[shard]
+                if operation not in operations]
+            self._remove_job_group(shard, operations)
+
         if self._operations[shard] == WorkerPool.WORKER_INACTIVE:
-            err_msg = "Trying to release worker while it's inactive."
-            logger.error(err_msg)
-            raise ValueError(err_msg)
+            self._start_time[shard] = None
+            logger.debug("Worker %s released.", shard)
+        else:
+            # The worker starts the next job group now.
+            self._start_time[shard] = make_datetime()
+        self._workers_available_event.set()
+        if to_ignore != []:
+            return to_ignore
+        else:
+            return False
 
-        # If the worker has already been disabled, ignore the result
-        # and keep the worker disabled.
-        if self._operations[shard] == WorkerPool.WORKER_DISABLED:
-            return True
+    def _release_all(self, shard, new_operation):
+        """Take back all the job groups assigned to a worker.
+
+        The results of those job groups will be ignored when they
+        arrive.
 
-        ret = self._ignore[shard]
+        shard (int): the worker to release.
+        new_operation (unicode|None): the new status of the worker,
+            INACTIVE or DISABLED.
+
+        return ([ESOperation]): the operations assigned to the worker,
+            except those to ignore.
+
+        """
+        lost_operations = []
         with self._operation_lock:
-            to_ignore = self._operations_to_ignore[shard]
+            if isinstance(self._operations[shard], list):
+                to_ignore = self._operations_to_ignore[shard]
+                lost_operations = [operation
+                                   for operation in self._operations[shard]
+                                   if operation not in to_ignore]
             self._operations_to_ignore[shard] = []
+            self._remove_operations(shard, new_operation)
         self._start_time[shard] = None
-        self._ignore[shard] = False
-        if self._schedule_disabling[shard]:
-            self._remove_operations(shard, WorkerPool.WORKER_DISABLED)
-            self._schedule_disabling[shard] = False
-            logger.info("Worker %s released and disabled.", shard)
-        else:
-            self._remove_operations(shard, WorkerPool.WORKER_INACTIVE)
+        if new_operation == WorkerPool.WORKER_INACTIVE:
             self._workers_available_event.set()
-            logger.debug("Worker %s released.", shard)
-        if ret is False and to_ignore != []:
-            return to_ignore
-        else:
-            return ret
+        return lost_operations
 
     def find_worker(self, operation, require_connection=False,
                     random_worker=False):
@@ -357,7 +464,8 @@ class WorkerPool:
                                for operation in self._operations[shard]]
                 if isinstance(self._operations[shard], list)
                 else self._operations[shard],
-                'start_time': s_time}
+                'start_time': s_time,
+                'precaching': self._precaching[shard]}
         return result
 
     def check_timeouts(self):
@@ -387,20 +495,13 @@ class WorkerPool:
                                WorkerPool.WORKER_DISABLED)
                     assert is_busy
 
-                    # We return the operation so ES can do what it needs.
-                    if not self._ignore[shard] and \
-                            isinstance(self._operations[shard], list):
-                        for operation in self._operations[shard]:
-                            if operation not in \
-                                    self._operations_to_ignore[shard]:
-                                lost_operations.append(operation)
-
-                    # Also, we are not trusting it, so we are not
-                    # assigning it new operations even if it comes back to
-                    # life.
-                    self._schedule_disabling[shard] = True
-                    self._ignore[shard] = True
-                    self.release_worker(shard)
+                    # We return the operations (including those of
+                    # the job groups waiting) so ES can do what it
+                    # needs. Also, we are not trusting it, so we are
+                    # not assigning it new operations even if it comes
+                    # back to life.
+                    lost_operations += self._release_all(
+                        shard, WorkerPool.WORKER_DISABLED)
                     self._worker[shard].quit(
                         reason="No response in %s." % active_for)
 
@@ -423,26 +524,10 @@ class WorkerPool:
             logger.warning(err_msg)
             raise ValueError(err_msg)
 
-        lost_operations = []
-        if self._operations[shard] == WorkerPool.WORKER_INACTIVE:
-            self._operations[shard] = WorkerPool.WORKER_DISABLED
-
-        else:
-            # We return all non-ignored operations so ES can do what
-            # it needs.
-            if not self._ignore[shard]:
-                to_ignore = self._operations_to_ignore[shard]
-                if isinstance(self._operations[shard], list):
-                    for operation in self._operations[shard]:
-                        if operation not in to_ignore:
-                            lost_operations.append(operation)
-
-            # And we mark the worker as disabled (until another action
-            # is taken).
-            self._schedule_disabling[shard] = True
-            self._operations_to_ignore[shard] = []
-            self._ignore[shard] = True
-            self.release_worker(shard)
+        # We return all non-ignored operations so ES can do what it
+        # needs, and we mark the worker as disabled (until another
+        # action is taken).
+        lost_operations = self._release_all(shard, WorkerPool.WORKER_DISABLED)
 
         logger.info("Worker %s disabled.", shard)
         return lost_operations
@@ -480,8 +565,7 @@ class WorkerPool:
                     self._operations[shard] not in [
                         WorkerPool.WORKER_DISABLED,
                         WorkerPool.WORKER_INACTIVE]:
-                if not self._ignore[shard]:
-                    lost_operations += self._operations[shard]
-                self.release_worker(shard)
+                lost_operations += self._release_all(
+                    shard, WorkerPool.WORKER_INACTIVE)
 
         return lost_operations
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""This script checks that the content of every file in the file store
+matches its digest, possibly deleting those that don't.
+
+"""
+
+import argparse
+import logging
+import os
+import sys
+
+from cms.db.filecacher import FileCacher
+
+
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Check the integrity of the files in the file store.")
+    parser.add_argument(
+        "-j", "--jobs", action="store", type=int, default=os.cpu_count(),
+        help="number of processes checking the files (default: the "
+        "number of CPUs)")
+    parser.add_argument(
+        "-p", "--progress", action="store",
+        help="file recording the files already checked; if it exists, "
+        "the check resumes from where it was interrupted")
+    parser.add_argument(
+        "-s", "--fs-storage", action="store",
+        help="directory of a file-system storage to check, instead of "
+        "the database")
+    parser.add_argument(
+        "-d", "--delete", action="store_true",
+        help="delete the files whose content doesn't match the digest")
+    args = parser.parse_args()
+
+    file_cacher = FileCacher(path=args.fs_storage)
+    clean = file_cacher.check_backend_integrity(
+        delete=args.delete, processes=args.jobs,
+        progress_path=args.progress)
+    if clean:
+        logger.info("All files have the right content.")
+    return 0 if clean else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""This script moves the files of a file-system storage, created when
+all files were in its root directory, to the subdirectories used now.
+
+It can be run while the storage is in use, and stopped and run again.
+
+"""
+
+import argparse
+import logging
+import os
+import sys
+
+from cms.db.filecacher import FSBackend
+
+
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Move the files of a file-system storage to the "
+        "sharded layout.")
+    parser.add_argument(
+        "path", action="store",
+        help="directory of the file-system storage")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.path):
+        logger.critical("%s is not a directory.", args.path)
+        return 1
+
+    count = FSBackend(args.path).migrate()
+    logger.info("%d files moved.", count)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -27,7 +27,8 @@ import sys
 import time
 
 from prometheus_client import start_http_server
-from prometheus_client.core import REGISTRY, CounterMetricFamily, GaugeMetricFamily
+from prometheus_client.core import REGISTRY, CounterMetricFamily, GaugeMetricFamily, \
+    HistogramMetricFamily
 from sqlalchemy import func, distinct
 
 from cms import ServiceCoord
@@ -83,22 +84,16 @@ class PrometheusExporter(Service):
             metric.add_metric([status], count)
         yield metric
 
+        # From the same (cached) statistics: the submissions with a
+        # result on the active dataset of each task.
         metric = CounterMetricFamily(
             "cms_task_submissions",
             "Number of submissions per task",
             labels=["task"],
         )
-        data = (
-            session.query(Task.name, func.count(SubmissionResult.submission_id))
-            .select_from(SubmissionResult)
-            .join(Dataset)
-            .join(Task, Dataset.task_id == Task.id)
-            .filter(Task.active_dataset_id == SubmissionResult.dataset_id)
-            .group_by(Task.name)
-            .all()
-        )
-        for task_name, count in data:
-            metric.add_metric([task_name], count)
+        for task_name, _, results, _ in \
+                AdminWebServer.submissions_status_by_task().values():
+            metric.add_metric([task_name], results)
         yield metric
 
         metric = CounterMetricFamily(
@@ -133,10 +128,11 @@ class PrometheusExporter(Service):
         yield metric
 
     def collect_queue(self):
-        status = self.evaluation_service.queue_status().get()
+        # Only the statistics are needed, not the entries.
+        queue_status = self.evaluation_service.queue_status(limit=0).get()
 
         metric = GaugeMetricFamily("cms_queue_length", "Number of entries in the queue")
-        metric.add_metric([], len(status))
+        metric.add_metric([], queue_status["total"])
         yield metric
 
         metric = GaugeMetricFamily(
@@ -144,12 +140,7 @@ class PrometheusExporter(Service):
             "Types of items in the queue",
             labels=["type"],
         )
-        types = {}
-        for item in status:
-            typ = item["item"]["type"]
-            types.setdefault(typ, 0)
-            types[typ] += 1
-        for typ, count in types.items():
+        for typ, count in queue_status["types"].items():
             metric.add_metric([typ], count)
         yield metric
 
@@ -157,11 +148,71 @@ class PrometheusExporter(Service):
             "cms_queue_oldest_job",
             "Timestamp of the oldest job in the queue",
         )
-        if status:
-            oldest = min(status, key=lambda x: x["timestamp"])
-            metric.add_metric([], oldest["timestamp"])
+        priorities = queue_status["summary"]["priorities"]
+        if priorities:
+            metric.add_metric([], min(p["oldest"] for p in priorities))
         yield metric
 
+        metric = GaugeMetricFamily(
+            "cms_queue_operations",
+            "Number of operations in the queue",
+            labels=["priority"],
+        )
+        for p in priorities:
+            metric.add_metric([str(p["priority"])], p["count"])
+        yield metric
+
+        sweeper = queue_status["sweeper"]
+        if sweeper is not None:
+            metric = GaugeMetricFamily(
+                "cms_sweeper_duration_seconds",
+                "Duration of the last sweep for missing operations",
+                labels=["mode"],
+            )
+            mode = "full" if sweeper["full"] else "incremental"
+            metric.add_metric([mode], sweeper["duration"])
+            yield metric
+
+            metric = GaugeMetricFamily(
+                "cms_sweeper_window_objects",
+                "Submissions and user tests in the window of the last "
+                "sweep for missing operations",
+                labels=["type"],
+            )
+            metric.add_metric(["submission"],
+                              sweeper["submissions_in_window"])
+            metric.add_metric(["user_test"], sweeper["user_tests_in_window"])
+            yield metric
+
+        result_cache = queue_status["result_cache"]
+        metric = GaugeMetricFamily(
+            "cms_result_cache_pending",
+            "Number of results waiting to be written to the database",
+        )
+        metric.add_metric([], result_cache["pending"])
+        yield metric
+
+        metric = GaugeMetricFamily(
+            "cms_result_cache_oldest_seconds",
+            "Age of the oldest result waiting to be written to the database",
+        )
+        if result_cache["oldest"] is not None:
+            metric.add_metric([], result_cache["oldest"])
+        yield metric
+
+        for name, description in [
+            ("latency", "Time from the oldest result of a write to its end"),
+            ("duration", "Duration of the writes of results"),
+        ]:
+            histogram = result_cache[name]
+            metric = HistogramMetricFamily(
+                "cms_result_cache_flush_%s_seconds" % name, description
+            )
+            buckets = [(str(bound), count) for bound, count in histogram["buckets"]]
+            buckets.append(("+Inf", histogram["count"]))
+            metric.add_metric([], buckets, histogram["sum"])
+            yield metric
+
     def collect_communications(self, session):
         metric = CounterMetricFamily(
             "cms_questions",
@@ -161,7 +161,8 @@ class SpoolExporter:
                                  "wt", encoding="utf-8") as res2_file:
                         total = 0.0
                         for evaluation in result.evaluations:
-                            outcome = float(evaluation.outcome)
+                            outcome = 0.0 if evaluation.skipped() \
+                                else float(evaluation.outcome)
                             total += outcome
                             line = (
                                 "Executing on file with codename '%s' %s (%.4f)"
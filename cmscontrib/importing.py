@@ -261,6 +261,8 @@ def _update_list_with_key(old_list, new_list, key,
 
 def update_dataset(old_dataset, new_dataset, parent=None):
     """Update old_dataset with information from new_dataset"""
+    old_score_type = (old_dataset.score_type,
+                      old_dataset.score_type_parameters)
     _update_object(old_dataset, new_dataset, {
         # Since we know it, hardcode to ignore the parent relationship.
         Dataset.task: False,
@@ -268,6 +270,10 @@ def update_dataset(old_dataset, new_dataset, parent=None):
         Dataset.managers: True,
         Dataset.testcases: True,
     }, parent=parent)
+    # The testcases skipped may now affect the score.
+    if (old_dataset.score_type, old_dataset.score_type_parameters) \
+            != old_score_type:
+        old_dataset.drop_skipped_evaluations()
 
 
 def update_task(old_task, new_task, parent=None, get_statements=True):
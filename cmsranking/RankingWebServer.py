@@ -18,6 +18,8 @@
 
 import argparse
 import functools
+import gzip
+import hashlib
 import json
 import logging
 import os
@@ -69,6 +71,33 @@ class CustomUnauthorized(Unauthorized):
         return response
 
 
+def load_json(request):
+    """Parse the (possibly gzipped) JSON body of a request.
+
+    request (Request): the request.
+
+    return (object): the parsed body.
+
+    raise (BadRequest): if the body is not valid (gzipped) JSON.
+
+    """
+    try:
+        if request.content_encoding == "gzip":
+            return json.loads(gzip.decompress(request.get_data()))
+        return json.load(request.stream)
+    except (TypeError, ValueError, OSError, EOFError):
+        logger.warning("Wrong JSON.",
+                       extra={'location': request.url})
+        raise BadRequest()
+
+
+def authorized(request, username, password):
+    return request.authorization is not None and \
+        request.authorization.type == "basic" and \
+        request.authorization.username == username and \
+        request.authorization.password == password
+
+
 class StoreHandler:
 
     def __init__(self, store, username, password, realm_name):
@@ -123,10 +152,7 @@ class StoreHandler:
         return response
 
     def authorized(self, request):
-        return request.authorization is not None and \
-            request.authorization.type == "basic" and \
-            request.authorization.username == self.username and \
-            request.authorization.password == self.password
+        return authorized(request, self.username, self.password)
 
     def get(self, request, response, key):
         # Limit charset of keys.
@@ -161,12 +187,7 @@ class StoreHandler:
                                   'details': request.mimetype})
             raise UnsupportedMediaType()
 
-        try:
-            data = json.load(request.stream)
-        except (TypeError, ValueError):
-            logger.warning("Wrong JSON.",
-                           extra={'location': request.url})
-            raise BadRequest()
+        data = load_json(request)
 
         try:
             if key not in self.store:
@@ -193,12 +214,7 @@ class StoreHandler:
                                   'details': request.mimetype})
             raise UnsupportedMediaType()
 
-        try:
-            data = json.load(request.stream)
-        except (TypeError, ValueError):
-            logger.warning("Wrong JSON.",
-                           extra={'location': request.url})
-            raise BadRequest()
+        data = load_json(request)
 
         try:
             self.store.merge_list(data)
@@ -238,6 +254,80 @@ class StoreHandler:
         response.status_code = 204
 
 
+class BulkHandler:
+    """Create or update entities of many types with a single request.
+
+    The body of the PUT request is a list of pairs, each with the name
+    of an entity type (as in the URL of its store) and a dictionary of
+    entities, merged in that order as by a PUT on the store.
+
+    """
+
+    def __init__(self, stores, username, password, realm_name):
+        """Create the handler.
+
+        stores ({str: Store}): the stores, by the name of their type.
+
+        """
+        self.stores = stores
+        self.username = username
+        self.password = password
+        self.realm_name = realm_name
+
+        self.router = Map([
+            Rule("/", methods=["PUT"], endpoint="put"),
+        ], encoding_errors="strict")
+
+    def __call__(self, environ, start_response):
+        return self.wsgi_app(environ, start_response)
+
+    @responder
+    def wsgi_app(self, environ, start_response):
+        route = self.router.bind_to_environ(environ)
+        try:
+            route.match()
+        except HTTPException as exc:
+            return exc
+
+        request = Request(environ)
+        request.encoding_errors = "strict"
+
+        try:
+            self.put(request)
+        except HTTPException as exc:
+            return exc
+
+        return Response(status=204)
+
+    def put(self, request):
+        if not authorized(request, self.username, self.password):
+            logger.warning("Unauthorized request.",
+                           extra={'location': request.url,
+                                  'details': repr(request.authorization)})
+            raise CustomUnauthorized(self.realm_name)
+        if request.mimetype != "application/json":
+            logger.warning("Unsupported MIME type.",
+                           extra={'location': request.url,
+                                  'details': request.mimetype})
+            raise UnsupportedMediaType()
+
+        data = load_json(request)
+
+        try:
+            if not isinstance(data, list) or \
+                    not all(isinstance(item, list) and len(item) == 2
+                            and item[0] in self.stores for item in data):
+                raise InvalidData("Not a list of entity types and "
+                                  "entities")
+            for name, entities in data:
+                self.stores[name].merge_list(entities)
+        except InvalidData as err:
+            logger.warning("Invalid data: %s" % str(err), exc_info=False,
+                           extra={'location': request.url,
+                                  'details': pprint.pformat(data)})
+            raise BadRequest()
+
+
 class DataWatcher(EventSource):
     """Receive the messages from the entities store and redirect them."""
 
@@ -329,10 +419,127 @@ class SubListHandler:
         return response(environ, start_response)
 
 
+class CachedDocument:
+    """A JSON document, computed and serialized once until it changes.
+
+    The document is computed again (when requested) only after
+    invalidate is called, typically by a callback of the stores. It is
+    kept serialized and gzipped, with an ETag, so that serving it to
+    many clients costs just a copy (or nothing, if they have it).
+
+    """
+    def __init__(self, compute):
+        """Create a document.
+
+        compute (function): the function, without arguments, that
+            computes the value of the document.
+
+        """
+        self._compute = compute
+        self._valid = False
+        self.timestamp = None
+        self.value = None
+        self.etag = None
+        self.data = None
+        self.gzipped_data = None
+
+    def invalidate(self, *args):
+        """Mark the document as changed.
+
+        Any argument is ignored, so that this can be a callback.
+
+        """
+        self._valid = False
+
+    def update(self):
+        """Compute the document again, if it changed."""
+        if self._valid:
+            return
+        # Events after this time are not reflected in the document.
+        timestamp = time.time()
+        self.value = self._compute()
+        data = json.dumps(self.value).encode("utf-8")
+        self._valid = True
+        # Invalidations don't necessarily change the document: in that
+        # case it keeps its timestamp (and everything else).
+        if data == self.data:
+            return
+        self.timestamp = timestamp
+        self.data = data
+        self.gzipped_data = gzip.compress(self.data)
+        self.etag = hashlib.sha1(self.data).hexdigest()
+
+    def make_response(self, request):
+        """Return a response with the document for the request.
+
+        request (Request): the request.
+
+        return (Response): the response, possibly a 304 Not Modified
+            if the client has the current document.
+
+        """
+        self.update()
+        response = Response()
+        response.status_code = 200
+        response.headers['Timestamp'] = "%0.6f" % self.timestamp
+        response.mimetype = "application/json"
+        response.vary.add("Accept-Encoding")
+        if request.accept_encodings["gzip"] > 0:
+            response.content_encoding = "gzip"
+            response.data = self.gzipped_data
+            response.set_etag(self.etag + "-gzip")
+        else:
+            response.data = self.data
+            response.set_etag(self.etag)
+        return response.make_conditional(request)
+
+
 class HistoryHandler:
+    """Serve the global history of the scores.
+
+    Each response has a Version header, made of an epoch, different
+    for each run of the server, and of a number, increasing every time
+    the history changes. With the since query argument (a version),
+    serve only the changes added to the history after that version: as
+    changes can be added anywhere in the history (e.g., for a
+    submission made long ago and scored only now), their times cannot
+    be used for this. If changes were also removed after that version
+    (e.g., as a past submission was scored again), or if the version
+    is not of this run of the server, the whole history is served, and
+    the Reset header is set.
+
+    """
 
     def __init__(self, stores):
         self.scoring_store = stores["scoring"]
+        self.document = CachedDocument(self.compute)
+        self.scoring_store.add_history_callback(self.document.invalidate)
+        # The epoch of the versions, the version of the history, the
+        # version in which each change in it was added (in the same
+        # order), and the last version in which some changes were
+        # removed.
+        self.epoch = os.urandom(4).hex()
+        self.version = 0
+        self.versions = list()
+        self.reset_version = 0
+        # The versions of the changes, indexed by the change (the same
+        # change can appear more than once).
+        self._versions_by_change = dict()
+
+    def compute(self):
+        result = list(self.scoring_store.get_global_history())
+        self.version += 1
+        old_versions = self._versions_by_change
+        self._versions_by_change = dict()
+        self.versions = list()
+        for change in result:
+            previous = old_versions.get(change)
+            version = previous.pop() if previous else self.version
+            self._versions_by_change.setdefault(change, []).append(version)
+            self.versions.append(version)
+        if any(len(versions) > 0 for versions in old_versions.values()):
+            self.reset_version = self.version
+        return result
 
     def __call__(self, environ, start_response):
         return self.wsgi_app(environ, start_response)
@@ -344,12 +551,32 @@ class HistoryHandler:
         if request.accept_mimetypes.quality("application/json") <= 0:
             raise NotAcceptable()
 
-        result = list(self.scoring_store.get_global_history())
-
-        response = Response()
-        response.status_code = 200
-        response.mimetype = "application/json"
-        response.data = json.dumps(result)
+        epoch, since = None, None
+        if "since" in request.args:
+            try:
+                epoch, since = request.args["since"].split(".")
+                since = int(since)
+            except ValueError:
+                return BadRequest()(environ, start_response)
+
+        self.document.update()
+        # The versions of another run of the server are meaningless.
+        if since is None or epoch != self.epoch \
+                or not self.reset_version <= since <= self.version:
+            response = self.document.make_response(request)
+            if since is not None:
+                response.headers['Reset'] = "1"
+        else:
+            response = Response()
+            response.status_code = 200
+            response.headers['Timestamp'] = \
+                "%0.6f" % self.document.timestamp
+            response.mimetype = "application/json"
+            response.data = json.dumps(
+                [change for change, version
+                 in zip(self.document.value, self.versions)
+                 if version > since])
+        response.headers['Version'] = "%s.%d" % (self.epoch, self.version)
 
         return response(environ, start_response)
 
@@ -358,6 +585,16 @@ class ScoreHandler:
 
     def __init__(self, stores):
         self.scoring_store = stores["scoring"]
+        self.document = CachedDocument(self.compute)
+        self.scoring_store.add_score_callback(self.document.invalidate)
+
+    def compute(self):
+        result = dict()
+        for u_id, tasks in self.scoring_store._scores.items():
+            for t_id, score in tasks.items():
+                if score.get_score() > 0.0:
+                    result.setdefault(u_id, dict())[t_id] = score.get_score()
+        return result
 
     def __call__(self, environ, start_response):
         return self.wsgi_app(environ, start_response)
@@ -369,18 +606,7 @@ class ScoreHandler:
         if request.accept_mimetypes.quality("application/json") <= 0:
             raise NotAcceptable()
 
-        result = dict()
-        for u_id, tasks in self.scoring_store._scores.items():
-            for t_id, score in tasks.items():
-                if score.get_score() > 0.0:
-                    result.setdefault(u_id, dict())[t_id] = score.get_score()
-
-        response = Response()
-        response.status_code = 200
-        response.headers['Timestamp'] = "%0.6f" % time.time()
-        response.mimetype = "application/json"
-        response.data = json.dumps(result)
-
+        response = self.document.make_response(request)
         return response(environ, start_response)
 
 
@@ -609,6 +835,14 @@ def main():
                 os.path.join(config.lib_dir, 'flags', '%(name)s'),
                 os.path.join(config.web_dir, 'img', 'flag.png')),
             '/sublist': SubListHandler(stores),
+            '/bulk': BulkHandler(
+                {"contests": stores["contest"],
+                 "tasks": stores["task"],
+                 "teams": stores["team"],
+                 "users": stores["user"],
+                 "submissions": stores["submission"],
+                 "subchanges": stores["subchange"]},
+                config.username, config.password, config.realm_name),
         }), {'/': config.web_dir})
 
     servers = list()
@@ -628,4 +862,7 @@ def main():
         pass
     finally:
         gevent.joinall(list(gevent.spawn(s.stop) for s in servers))
+        for name in ["contest", "task", "team", "user", "submission",
+                     "subchange"]:
+            stores[name].close()
     return 0
@@ -21,7 +21,7 @@
 
 import heapq
 import logging
-from itertools import zip_longest
+import random
 
 from cmscommon.constants import \
     SCORE_MODE_MAX, SCORE_MODE_MAX_SUBTASK, SCORE_MODE_MAX_TOKENED_LAST
@@ -30,6 +30,65 @@ from cmscommon.constants import \
 logger = logging.getLogger(__name__)
 
 
+class _Node:
+    """A node of the tree of a NumberSet, holding all copies of a value.
+
+    """
+    __slots__ = ("value", "count", "size", "priority", "left", "right")
+
+    def __init__(self, value):
+        self.value = value
+        # How many times value is in the set.
+        self.count = 1
+        # How many values (with repetitions) are in the subtree.
+        self.size = 1
+        self.priority = random.random()
+        self.left = None
+        self.right = None
+
+
+def _size(node):
+    return node.size if node is not None else 0
+
+
+def _update_size(node):
+    node.size = node.count + _size(node.left) + _size(node.right)
+
+
+def _rotate_right(node):
+    top = node.left
+    node.left = top.right
+    top.right = node
+    _update_size(node)
+    _update_size(top)
+    return top
+
+
+def _rotate_left(node):
+    top = node.right
+    node.right = top.left
+    top.left = node
+    _update_size(node)
+    _update_size(top)
+    return top
+
+
+def _merge(left, right):
+    # All the values in left are smaller than those in right.
+    if left is None:
+        return right
+    if right is None:
+        return left
+    if left.priority > right.priority:
+        left.right = _merge(left.right, right)
+        _update_size(left)
+        return left
+    else:
+        right.left = _merge(left, right.left)
+        _update_size(right)
+        return right
+
+
 class NumberSet:
     """A fast data structure on numbers.
 
@@ -37,27 +96,134 @@ class NumberSet:
     - inserting a value
     - removing a value
     - querying the maximum value
+    - querying the k-th smallest value and the rank of a value
 
     It can hold the same value multiple times.
 
-    This data structure could be implemented with a binary tree, but
-    at the moment we're actually using a standard python list.
+    The values are kept in a treap (a binary search tree, balanced by
+    giving random priorities to the nodes), with one node for each
+    distinct value, so that all operations take logarithmic time.
 
     """
     def __init__(self):
-        self._impl = list()
+        self._root = None
+
+    def __len__(self):
+        return _size(self._root)
+
+    def __contains__(self, val):
+        node = self._root
+        while node is not None and node.value != val:
+            node = node.left if val < node.value else node.right
+        return node is not None
 
     def insert(self, val):
-        self._impl.append(val)
+        self._root = self._insert(self._root, val)
+
+    def _insert(self, node, val):
+        if node is None:
+            return _Node(val)
+        node.size += 1
+        if val == node.value:
+            node.count += 1
+        elif val < node.value:
+            node.left = self._insert(node.left, val)
+            if node.left.priority > node.priority:
+                node = _rotate_right(node)
+        else:
+            node.right = self._insert(node.right, val)
+            if node.right.priority > node.priority:
+                node = _rotate_left(node)
+        return node
 
     def remove(self, val):
-        self._impl.remove(val)
+        """Remove one copy of a value.
+
+        val (float): the value to remove.
+
+        raise (ValueError): if the value is not in the set.
+
+        """
+        self._root = self._remove(self._root, val)
+
+    def _remove(self, node, val):
+        # The sizes are updated only after the value is found.
+        if node is None:
+            raise ValueError("NumberSet.remove(x): x not in set")
+        if val < node.value:
+            node.left = self._remove(node.left, val)
+        elif val > node.value:
+            node.right = self._remove(node.right, val)
+        elif node.count > 1:
+            node.count -= 1
+        else:
+            return _merge(node.left, node.right)
+        node.size -= 1
+        return node
+
+    def max(self, default=None):
+        """Return the maximum value.
+
+        default (object): what to return if the set is empty.
+
+        return (float|object): the maximum value, or default.
+
+        """
+        node = self._root
+        if node is None:
+            return default
+        while node.right is not None:
+            node = node.right
+        return node.value
 
     def query(self):
-        return max(self._impl + [0.0])
+        """Return the maximum value, or 0.0 if it is smaller."""
+        return max(self.max(default=0.0), 0.0)
+
+    def kth(self, k):
+        """Return the k-th smallest value (counting from 0).
+
+        k (int): the position of the value, with repetitions.
+
+        return (float): the value.
+
+        raise (IndexError): if there are not enough values.
+
+        """
+        if not 0 <= k < len(self):
+            raise IndexError("NumberSet index out of range")
+        node = self._root
+        while True:
+            left = _size(node.left)
+            if k < left:
+                node = node.left
+            elif k < left + node.count:
+                return node.value
+            else:
+                k -= left + node.count
+                node = node.right
+
+    def rank(self, val):
+        """Return how many values are smaller than the given one.
+
+        val (float): the value.
+
+        return (int): the number of values (with repetitions) smaller
+            than val.
+
+        """
+        rank = 0
+        node = self._root
+        while node is not None:
+            if val <= node.value:
+                node = node.left
+            else:
+                rank += _size(node.left) + node.count
+                node = node.right
+        return rank
 
     def clear(self):
-        del self._impl[:]
+        self._root = None
 
 
 class Score:
@@ -85,23 +251,57 @@ class Score:
         # The set of the scores of the currently released submissions.
         self._released = NumberSet()
 
+        # The set of the scores of all the submissions (only in the
+        # max mode) and, for each subtask, the set of the scores of the
+        # submissions on it (only in the max subtask mode, see
+        # _subtask_scores).
+        self._scores = NumberSet()
+        self._subtasks = list()
+
         # The last submitted submission (with at least one subchange).
         self._last = None
 
         # The history of score changes (the actual "output" of this
-        # object).
+        # object), and how many times it changed.
         self._history = list()
+        self._history_changes = 0
 
         self._score_mode = score_mode
 
+    @staticmethod
+    def _subtask_scores(submission):
+        return [float(score) for score in submission.extra or
+                [submission.score]]
+
+    def _insert_scores(self, submission):
+        if self._score_mode == SCORE_MODE_MAX:
+            self._scores.insert(submission.score)
+        elif self._score_mode == SCORE_MODE_MAX_SUBTASK:
+            for idx, score in enumerate(self._subtask_scores(submission)):
+                if idx == len(self._subtasks):
+                    self._subtasks.append(NumberSet())
+                self._subtasks[idx].insert(score)
+
+    def _remove_scores(self, submission):
+        if self._score_mode == SCORE_MODE_MAX:
+            self._scores.remove(submission.score)
+        elif self._score_mode == SCORE_MODE_MAX_SUBTASK:
+            for idx, score in enumerate(self._subtask_scores(submission)):
+                self._subtasks[idx].remove(score)
+            while len(self._subtasks) > 0 and \
+                    len(self._subtasks[-1]) == 0:
+                self._subtasks.pop()
+
     def append_change(self, change):
-        # Remove from released submission (if needed), apply changes,
-        # add back to released submissions (if needed) and check if
-        # it's the last. Compute the new score and, if it changed,
-        # append it to the history.
+        # Remove from released submission (if needed) and from the
+        # scores, apply changes, add back to released submissions (if
+        # needed) and to the scores and check if it's the last.
+        # Compute the new score and, if it changed, append it to the
+        # history.
         s_id = change.submission
         if self._submissions[s_id].token:
             self._released.remove(self._submissions[s_id].score)
+        self._remove_scores(self._submissions[s_id])
         if change.score is not None:
             self._submissions[s_id].score = change.score
         if change.token is not None:
@@ -110,21 +310,21 @@ class Score:
             self._submissions[s_id].extra = change.extra
         if self._submissions[s_id].token:
             self._released.insert(self._submissions[s_id].score)
+        self._insert_scores(self._submissions[s_id])
         if change.score is not None and \
                 (self._last is None or
                  self._submissions[s_id].time > self._last.time):
             self._last = self._submissions[s_id]
 
         if self._score_mode == SCORE_MODE_MAX:
-            score = max((submission.score
-                         for submission in self._submissions.values()),
-                        default=0.0)
+            score = self._scores.max(default=0.0)
         elif self._score_mode == SCORE_MODE_MAX_SUBTASK:
-            scores_by_submission = (map(float, s.extra or [s.score])
-                                    for s in self._submissions.values())
-            scores_by_subtask = zip_longest(*scores_by_submission,
-                                            fillvalue=0.0)
-            score = float(sum(max(s) for s in scores_by_subtask))
+            # A submission without a score on a subtask counts as 0.0
+            # on it.
+            score = float(sum(
+                subtask.max() if len(subtask) == len(self._submissions)
+                else max(subtask.max(), 0.0)
+                for subtask in self._subtasks))
         elif self._score_mode == SCORE_MODE_MAX_TOKENED_LAST:
             score = max(self._released.query(),
                         self._last.score if self._last is not None else 0.0)
@@ -133,6 +333,7 @@ class Score:
 
         if score != self.get_score():
             self._history.append((change.time, score))
+            self._history_changes += 1
 
     def get_score(self):
         return self._history[-1][1] if len(self._history) > 0 else 0.0
@@ -141,13 +342,17 @@ class Score:
         # Delete everything except the submissions and the subchanges.
         self._last = None
         self._released.clear()
+        self._scores.clear()
+        del self._subtasks[:]
         del self._history[:]
+        self._history_changes += 1
 
         # Reset the submissions at their default value.
         for sub in self._submissions.values():
             sub.score = 0.0
             sub.token = False
             sub.extra = list()
+            self._insert_scores(sub)
 
         # Append each change, one at a time.
         for change in self._changes:
@@ -203,6 +408,7 @@ class Score:
         submission.token = False
         submission.extra = list()
         self._submissions[key] = submission
+        self._insert_scores(submission)
 
     def update_submission(self, key, submission):
         # An updated submission may cause an update in history because
@@ -222,7 +428,10 @@ class Score:
             self.reset_history()
 
     def update_score_mode(self, score_mode):
-        self._score_mode = score_mode
+        # The sets of scores depend on the score mode.
+        if score_mode != self._score_mode:
+            self._score_mode = score_mode
+            self.reset_history()
 
 
 class ScoringStore:
@@ -255,6 +464,7 @@ class ScoringStore:
 
         self._scores = dict()
         self._callbacks = list()
+        self._history_callbacks = list()
 
     def init_store(self):
         """Load the scores from the stores.
@@ -265,7 +475,10 @@ class ScoringStore:
         """
         for key, value in self.submission_store._store.items():
             self.create_submission(key, value)
-        for key, value in sorted(self.subchange_store._store.items()):
+        # Give the subchanges in the order in which Score processes
+        # them, so that each one is just appended to the history.
+        for key, value in sorted(self.subchange_store._store.items(),
+                                 key=lambda item: (item[1].time, item[0])):
             self.create_subchange(key, value)
 
     def add_score_callback(self, callback):
@@ -277,10 +490,29 @@ class ScoringStore:
         """
         self._callbacks.append(callback)
 
+    def add_history_callback(self, callback):
+        """Add a callback to be called when a history changes.
+
+        This includes the changes that do not change the current
+        score, as when a past subchange is updated. Callbacks can be
+        any kind of callable objects. They must accept two arguments:
+        the user and the task.
+
+        """
+        self._history_callbacks.append(callback)
+
     def notify_callbacks(self, user, task, score):
         for call in self._callbacks:
             call(user, task, score)
 
+    def _notify(self, user, task, score_obj, old_score, old_history):
+        new_score = score_obj.get_score()
+        if old_score != new_score:
+            self.notify_callbacks(user, task, new_score)
+        if score_obj._history_changes != old_history:
+            for call in self._history_callbacks:
+                call(user, task)
+
     def create_submission(self, key, submission):
         if submission.user not in self._scores:
             self._scores[submission.user] = dict()
@@ -291,10 +523,10 @@ class ScoringStore:
 
         score_obj = self._scores[submission.user][submission.task]
         old_score = score_obj.get_score()
+        old_history = score_obj._history_changes
         score_obj.create_submission(key, submission)
-        new_score = score_obj.get_score()
-        if old_score != new_score:
-            self.notify_callbacks(submission.user, submission.task, new_score)
+        self._notify(submission.user, submission.task, score_obj,
+                     old_score, old_history)
 
     def update_submission(self, key, old_submission, submission):
         if old_submission.user != submission.user or \
@@ -309,19 +541,19 @@ class ScoringStore:
 
         score_obj = self._scores[submission.user][submission.task]
         old_score = score_obj.get_score()
+        old_history = score_obj._history_changes
         score_obj.update_submission(key, submission)
         score_obj.update_score_mode(task["score_mode"])
-        new_score = score_obj.get_score()
-        if old_score != new_score:
-            self.notify_callbacks(submission.user, submission.task, new_score)
+        self._notify(submission.user, submission.task, score_obj,
+                     old_score, old_history)
 
     def delete_submission(self, key, submission):
         score_obj = self._scores[submission.user][submission.task]
         old_score = score_obj.get_score()
+        old_history = score_obj._history_changes
         score_obj.delete_submission(key)
-        new_score = score_obj.get_score()
-        if old_score != new_score:
-            self.notify_callbacks(submission.user, submission.task, new_score)
+        self._notify(submission.user, submission.task, score_obj,
+                     old_score, old_history)
 
         if len(self._scores[submission.user][submission.task]
                ._submissions) == 0:
@@ -333,10 +565,10 @@ class ScoringStore:
         submission = self.submission_store._store[subchange.submission]
         score_obj = self._scores[submission.user][submission.task]
         old_score = score_obj.get_score()
+        old_history = score_obj._history_changes
         score_obj.create_subchange(key, subchange)
-        new_score = score_obj.get_score()
-        if old_score != new_score:
-            self.notify_callbacks(submission.user, submission.task, new_score)
+        self._notify(submission.user, submission.task, score_obj,
+                     old_score, old_history)
 
     def update_subchange(self, key, old_subchange, subchange):
         if old_subchange.submission != subchange.submission:
@@ -347,10 +579,10 @@ class ScoringStore:
         submission = self.submission_store._store[subchange.submission]
         score_obj = self._scores[submission.user][submission.task]
         old_score = score_obj.get_score()
+        old_history = score_obj._history_changes
         score_obj.update_subchange(key, subchange)
-        new_score = score_obj.get_score()
-        if old_score != new_score:
-            self.notify_callbacks(submission.user, submission.task, new_score)
+        self._notify(submission.user, submission.task, score_obj,
+                     old_score, old_history)
 
     def delete_subchange(self, key, subchange):
         if subchange.submission not in self.submission_store:
@@ -361,10 +593,10 @@ class ScoringStore:
         submission = self.submission_store._store[subchange.submission]
         score_obj = self._scores[submission.user][submission.task]
         old_score = score_obj.get_score()
+        old_history = score_obj._history_changes
         score_obj.delete_subchange(key)
-        new_score = score_obj.get_score()
-        if old_score != new_score:
-            self.notify_callbacks(submission.user, submission.task, new_score)
+        self._notify(submission.user, submission.task, score_obj,
+                     old_score, old_history)
 
     def get_score(self, user, task):
         if user not in self._scores or task not in self._scores[user]:
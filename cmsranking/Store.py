@@ -21,6 +21,7 @@ import logging
 import os
 import re
 
+import gevent
 from gevent.lock import RLock
 
 from cmsranking.Entity import Entity, InvalidKey, InvalidData
@@ -43,7 +44,22 @@ class Store:
     get notified when something changes by providing appropriate
     callbacks.
 
+    The entities are persisted in two files next to the given path: a
+    snapshot (path + ".json", a JSON object with all the entities) and
+    an append-only log of the changes made after it (path + ".log",
+    one JSON object per line). The log is synced to disk at most
+    SYNC_DELAY seconds after a change, with one fsync for all the
+    changes in the meantime, and it is compacted into a new snapshot
+    when it becomes larger than the store. Older versions stored one
+    file per entity in the directory at path: these are read only if
+    there is no snapshot yet.
+
     """
+    # Maximum time (in seconds) before a change is synced to disk.
+    SYNC_DELAY = 0.1
+    # Minimum number of records in the log before compacting it.
+    COMPACTION_MIN_RECORDS = 1000
+
     def __init__(self, entity, path, all_stores, depends=None):
         """Initialize an empty EntityStore.
 
@@ -52,6 +68,7 @@ class Store:
 
         entity (type): the class definition of the entities that will
             be stored
+        path (str): the path of the data, without extension.
 
         """
         if not issubclass(entity, Entity):
@@ -66,35 +83,200 @@ class Store:
         self._update_callbacks = list()
         self._delete_callbacks = list()
 
-    def load_from_disk(self):
-        """Load the initial data for this store from the disk.
+        self._snapshot_path = path + ".json"
+        self._log_path = path + ".log"
+        # The log file, opened for appending, the number of records in
+        # it, and the greenlet that will sync it (if any is pending).
+        self._log = None
+        self._log_records = 0
+        self._syncer = None
+
+    def _load_item(self, key, data, location):
+        """Add to the store an entity read from the disk.
+
+        key (str): the key of the entity.
+        data (object): the properties of the entity.
+        location (str): where the entity comes from, for the logs.
 
         """
         try:
-            os.mkdir(self._path)
-        except OSError:
-            # it's ok: it means the directory already exists
-            pass
+            item = self._entity()
+            item.set(data)
+        except InvalidData as exc:
+            logger.error(str(exc), exc_info=False,
+                         extra={'location': location})
+            return
+        item.key = key
+        self._store[key] = item
 
+    def _load_legacy(self):
+        """Load the entities stored with one file per entity.
+
+        return (bool): whether the directory of the entities exists.
+
+        """
+        if not os.path.isdir(self._path):
+            return False
         try:
             for name in os.listdir(self._path):
                 # TODO check that the key is '[A-Za-z0-9_]+'
                 if name[-5:] == '.json' and name[:-5] != '':
-                    with open(os.path.join(self._path, name), 'rb') as rec:
-                        item = self._entity()
-                        item.set(json.load(rec))
-                        item.key = name[:-5]
-                        self._store[name[:-5]] = item
+                    location = os.path.join(self._path, name)
+                    try:
+                        with open(location, 'rb') as rec:
+                            data = json.load(rec)
+                    except ValueError:
+                        logger.error("Invalid JSON", exc_info=False,
+                                     extra={'location': location})
+                        continue
+                    self._load_item(name[:-5], data, location)
         except OSError:
-            # the path isn't a directory or is inaccessible
-            logger.error("Path is not a directory or is not accessible "
-                         "(or other I/O error occurred)", exc_info=True)
-        except ValueError:
-            logger.error("Invalid JSON", exc_info=False,
-                         extra={'location': os.path.join(self._path, name)})
-        except InvalidData as exc:
-            logger.error(str(exc), exc_info=False,
-                         extra={'location': os.path.join(self._path, name)})
+            # the path is inaccessible
+            logger.error("Path is not accessible (or other I/O error "
+                         "occurred)", exc_info=True)
+        return True
+
+    def load_from_disk(self):
+        """Load the initial data for this store from the disk.
+
+        Read the snapshot in one go, then apply the changes in the
+        log, and compact them into a new snapshot if there were any.
+        If there is no snapshot, migrate the entities stored with one
+        file per entity, if any.
+
+        raise (OSError): if the snapshot cannot be read.
+        raise (ValueError): if the snapshot is not valid JSON; it is
+            not overwritten by a new one in these cases.
+
+        """
+        compact = False
+        try:
+            with open(self._snapshot_path, 'rb') as snapshot:
+                data = json.load(snapshot)
+        except FileNotFoundError:
+            if self._load_legacy():
+                compact = True
+                logger.info("Migrating %d entities from %s to %s.",
+                            len(self._store), self._path,
+                            self._snapshot_path)
+        else:
+            for key, value in data.items():
+                self._load_item(key, value, self._snapshot_path)
+
+        try:
+            with open(self._log_path, 'rb') as log:
+                for line in log:
+                    compact = True
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # Most likely the last record, truncated by a
+                        # crash while writing it.
+                        logger.warning("Invalid JSON, ignoring the rest "
+                                       "of the log", exc_info=False,
+                                       extra={'location': self._log_path})
+                        break
+                    if "data" in record:
+                        self._load_item(record["key"], record["data"],
+                                        self._log_path)
+                    else:
+                        self._store.pop(record["key"], None)
+        except FileNotFoundError:
+            pass
+        except OSError:
+            # Do not empty the log, as it was not read.
+            compact = False
+            logger.error("Log is not accessible (or other I/O error "
+                         "occurred)", exc_info=True)
+
+        if compact:
+            with LOCK:
+                self._compact()
+
+    def _append(self, records):
+        """Append some changes to the log.
+
+        The log is synced to disk later, together with the changes
+        that follow in the next SYNC_DELAY seconds.
+
+        records ([dict]): the changes, as a "key" and, unless it is a
+            deletion, the new "data".
+
+        """
+        try:
+            if self._log is None:
+                self._log = open(self._log_path, 'at', encoding="utf-8")
+            self._log.write("".join(json.dumps(record) + "\n"
+                                    for record in records))
+        except OSError:
+            logger.error("I/O error occured while writing the log",
+                         exc_info=True)
+            return
+        self._log_records += len(records)
+        if self._syncer is None:
+            self._syncer = gevent.spawn_later(self.SYNC_DELAY, self.sync)
+
+    def sync(self):
+        """Write to disk the changes that were not synced yet.
+
+        Compact the log into a new snapshot if it is too large.
+
+        """
+        with LOCK:
+            if self._syncer is not None \
+                    and self._syncer is not gevent.getcurrent():
+                self._syncer.kill(block=False)
+            self._syncer = None
+            if self._log_records > max(self.COMPACTION_MIN_RECORDS,
+                                       len(self._store)):
+                self._compact()
+            elif self._log is not None:
+                try:
+                    self._log.flush()
+                    os.fsync(self._log.fileno())
+                except OSError:
+                    logger.error("I/O error occured while syncing the log",
+                                 exc_info=True)
+
+    def close(self):
+        """Compact the log into a new snapshot and close it.
+
+        """
+        with LOCK:
+            if self._syncer is not None:
+                self._syncer.kill(block=False)
+                self._syncer = None
+            self._compact()
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+
+    def _compact(self):
+        """Write a snapshot of the store and empty the log.
+
+        The snapshot replaces the old one atomically, and only then
+        the log is emptied: replaying it on top of the new snapshot
+        gives the same result, in case of a crash in the middle.
+
+        """
+        tmp_path = self._snapshot_path + ".tmp"
+        try:
+            with open(tmp_path, 'wt', encoding="utf-8") as snapshot:
+                # json.dumps uses the C encoder, json.dump does not.
+                snapshot.write(json.dumps(dict(
+                    (key, value.get())
+                    for key, value in self._store.items())))
+                snapshot.flush()
+                os.fsync(snapshot.fileno())
+            os.replace(tmp_path, self._snapshot_path)
+            if self._log is not None:
+                self._log.close()
+            self._log = open(self._log_path, 'at', encoding="utf-8")
+            self._log.truncate(0)
+            self._log_records = 0
+        except OSError:
+            logger.error("I/O error occured while writing the snapshot",
+                         exc_info=True)
 
     def add_create_callback(self, callback):
         """Add a callback to be called when entities are created.
@@ -153,13 +335,7 @@ class Store:
             for callback in self._create_callbacks:
                 callback(key, item)
             # reflect changes on the persistent storage
-            try:
-                path = os.path.join(self._path, key + '.json')
-                with open(path, 'wt', encoding="utf-8") as rec:
-                    json.dump(self._store[key].get(), rec)
-            except OSError:
-                logger.error("I/O error occured while creating entity",
-                             exc_info=True)
+            self._append([{"key": key, "data": item.get()}])
 
     def update(self, key, data):
         """Update an entity.
@@ -192,13 +368,7 @@ class Store:
             for callback in self._update_callbacks:
                 callback(key, old_item, item)
             # reflect changes on the persistent storage
-            try:
-                path = os.path.join(self._path, key + '.json')
-                with open(path, 'wt', encoding="utf-8") as rec:
-                    json.dump(self._store[key].get(), rec)
-            except OSError:
-                logger.error("I/O error occured while updating entity",
-                             exc_info=True)
+            self._append([{"key": key, "data": item.get()}])
 
     def merge_list(self, data_dict):
         """Merge a list of entities.
@@ -245,15 +415,10 @@ class Store:
                 else:
                     for callback in self._update_callbacks:
                         callback(key, old_value, value)
-                # reflect changes on the persistent storage
-                try:
-                    path = os.path.join(self._path, key + '.json')
-                    with open(path, 'wt', encoding="utf-8") as rec:
-                        json.dump(value.get(), rec)
-                except OSError:
-                    logger.error(
-                        "I/O error occured while merging entity lists",
-                        exc_info=True)
+
+            # reflect changes on the persistent storage
+            self._append([{"key": key, "data": value.get()}
+                          for key, value in item_dict.items()])
 
     def delete(self, key):
         """Delete an entity.
@@ -282,10 +447,7 @@ class Store:
             for callback in self._delete_callbacks:
                 callback(key, old_value)
             # reflect changes on the persistent storage
-            try:
-                os.remove(os.path.join(self._path, key + '.json'))
-            except OSError:
-                logger.error("Unable to delete entity", exc_info=True)
+            self._append([{"key": key}])
 
     def delete_list(self):
         """Delete all entities.
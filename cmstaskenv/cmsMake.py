@@ -23,17 +23,21 @@
 import argparse
 import copy
 import functools
+import json
 import logging
 import os
 import shutil
 import subprocess
 import sys
 import tempfile
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
 import yaml
 
 from cms import utf8_decoder
 from cms.grading.languagemanager import SOURCE_EXTS, filename_to_language
+from cmscommon.digest import bytes_digest, path_digest
 from cmscommon.terminal import move_cursor, add_color_to_string, \
     colors, directions
 from cmstaskenv.Test import test_testcases, clean_test_env
@@ -61,12 +65,21 @@ STUB_BASENAME = 'stub'
 INPUT_DIRNAME = 'input'
 OUTPUT_DIRNAME = 'output'
 RESULT_DIRNAME = 'result'
+STATE_JSON = '.cmsMake.json'
 
 DATA_DIRS = [os.path.join('.', 'cmstaskenv', 'data'),
              os.path.join('/', 'usr', 'local', 'share', 'cms', 'cmsMake')]
 
 logger = logging.getLogger()
 
+# Whether the progress messages are erased once done; not when actions
+# run in parallel, as the lines to erase may belong to other actions.
+erase_progress = True
+
+# The testing of the solutions uses global state (see cmstaskenv.Test),
+# so only one solution is tested at a time.
+test_lock = threading.Lock()
+
 
 def detect_data_dir():
     for _dir in DATA_DIRS:
@@ -97,6 +110,15 @@ def basename2(string, suffixes):
         return None, None
 
 
+def erase_lines(amount=1):
+    """Erase the last amount lines of progress messages.
+
+    """
+    if erase_progress:
+        for _ in range(amount):
+            move_cursor(directions.UP, erase=True, stream=sys.stderr)
+
+
 def call(base_dir, args, stdin=None, stdout=None, stderr=None, env=None):
     print("> Executing command %s in dir %s" %
           (" ".join(args), base_dir), file=sys.stderr)
@@ -238,7 +260,7 @@ def build_sols_list(base_dir, task_type, in_out_files, yaml_conf):
                     new_srcs, new_exe, for_evaluation=for_evaluation)
                 for command in compilation_commands:
                     call(tempdir, command)
-                    move_cursor(directions.UP, erase=True, stream=sys.stderr)
+                    erase_lines()
                 shutil.copyfile(os.path.join(tempdir, new_exe),
                                 os.path.join(base_dir, exe))
                 shutil.copymode(os.path.join(tempdir, new_exe),
@@ -247,16 +269,18 @@ def build_sols_list(base_dir, task_type, in_out_files, yaml_conf):
                 shutil.rmtree(tempdir)
 
         def test_src(exe, lang, assume=None):
-            # Solution names begin with sol/ and end with _EVAL, we strip that
-            print(
-                "Testing solution",
-                add_color_to_string(exe[4:-5], colors.BLACK, bold=True)
-            )
-            test_testcases(
-                base_dir,
-                exe,
-                language=lang,
-                assume=assume)
+            with test_lock:
+                # Solution names begin with sol/ and end with _EVAL, we
+                # strip that
+                print(
+                    "Testing solution",
+                    add_color_to_string(exe[4:-5], colors.BLACK, bold=True)
+                )
+                test_testcases(
+                    base_dir,
+                    exe,
+                    language=lang,
+                    assume=assume)
 
         actions.append(
             (srcs,
@@ -392,11 +416,9 @@ def build_gen_list(base_dir, task_type, yaml_conf):
 
     sol_exe = os.path.join(SOL_DIRNAME, SOL_FILENAME)
 
-    # Count non-trivial lines in GEN and establish which external
-    # files are needed for input generation
+    # Count non-trivial lines in GEN
     testcases = list(iter_GEN(os.path.join(base_dir, gen_GEN)))
     testcase_num = len(testcases)
-    copy_files = [x[1] for x in testcases if x[0]]
 
     def compile_src(src, exe, lang, assume=None):
         if lang.source_extension in ['.cpp', '.c', '.pas']:
@@ -405,56 +427,44 @@ def build_gen_list(base_dir, task_type, yaml_conf):
             for command in commands:
                 call(base_dir, command)
         elif lang.source_extension in ['.py', '.sh']:
-            os.symlink(os.path.basename(src), exe)
+            if os.path.lexists(os.path.join(base_dir, exe)):
+                os.remove(os.path.join(base_dir, exe))
+            os.symlink(os.path.basename(src), os.path.join(base_dir, exe))
         else:
             raise Exception("Wrong generator/validator language!")
 
-    # Question: why, differently from outputs, inputs have to be
-    # created all together instead of selectively over those that have
-    # been changed since last execution? This is a waste of time,
-    # usually generating inputs is a pretty long thing. Answer:
-    # because cmsMake architecture, which is based on file timestamps,
-    # doesn't make us able to understand which lines of gen/GEN have
-    # been changed. Douch! We'll have to think better this thing for
-    # the new format we're developing.
-    def make_input(assume=None):
-        n = 0
-        try:
-            os.makedirs(input_dir)
-        except OSError:
-            pass
-        for (is_copy, line, st) in testcases:
-            print(
-                "Generating",
-                add_color_to_string("input # %d" % n, colors.BLACK,
-                                    stream=sys.stderr, bold=True),
-                file=sys.stderr
-            )
-            new_input = os.path.join(input_dir, 'input%d.txt' % (n))
-            if is_copy:
-                # Copy the file
-                print("> Copy input file from:", line)
-                copy_input = os.path.join(base_dir, line)
-                shutil.copyfile(copy_input, new_input)
-            else:
-                # Call the generator
-                with open(new_input, 'wb') as fout:
-                    call(base_dir,
-                         [gen_exe] + line.split(),
-                         stdout=fout)
-            command = [validator_exe, new_input]
-            if st != 0:
-                command.append("%s" % st)
-            call(base_dir, command)
-            n += 1
-            for _ in range(3):
-                move_cursor(directions.UP, erase=True, stream=sys.stderr)
+    # Each input is generated (and validated) by its own action, which
+    # depends on the line of gen/GEN that describes it (see the recipe
+    # in the list of actions) and not on the whole file, so that only
+    # the inputs whose lines have changed are generated again.
+    def make_input(n, is_copy, line, st, assume=None):
+        os.makedirs(input_dir, exist_ok=True)
+        print(
+            "Generating",
+            add_color_to_string("input # %d" % n, colors.BLACK,
+                                stream=sys.stderr, bold=True),
+            file=sys.stderr
+        )
+        new_input = os.path.join(input_dir, 'input%d.txt' % (n))
+        if is_copy:
+            # Copy the file
+            print("> Copy input file from:", line)
+            copy_input = os.path.join(base_dir, line)
+            shutil.copyfile(copy_input, new_input)
+        else:
+            # Call the generator
+            with open(new_input, 'wb') as fout:
+                call(base_dir,
+                     [gen_exe] + line.split(),
+                     stdout=fout)
+        command = [validator_exe, new_input]
+        if st != 0:
+            command.append("%s" % st)
+        call(base_dir, command)
+        erase_lines(3)
 
     def make_output(n, assume=None):
-        try:
-            os.makedirs(output_dir)
-        except OSError:
-            pass
+        os.makedirs(output_dir, exist_ok=True)
         print(
             "Generating",
             add_color_to_string("output # %d" % n, colors.BLACK,
@@ -495,7 +505,7 @@ def build_gen_list(base_dir, task_type, yaml_conf):
             if task_type != ['Communication', '']:
                 call(temp_dir, [os.path.join(temp_dir, SOL_FILENAME)],
                      stdin=fin, stdout=fout)
-                move_cursor(directions.UP, erase=True, stream=sys.stderr)
+                erase_lines()
 
         finally:
             if fin is not None:
@@ -506,7 +516,7 @@ def build_gen_list(base_dir, task_type, yaml_conf):
         os.rename(copied_outfile, outfile)
         shutil.rmtree(temp_dir)
 
-        move_cursor(directions.UP, erase=True, stream=sys.stderr)
+        erase_lines()
 
     actions = []
     actions.append(([gen_src],
@@ -518,11 +528,13 @@ def build_gen_list(base_dir, task_type, yaml_conf):
                     functools.partial(compile_src, validator_src,
                                       validator_exe, validator_lang),
                     "compile the validator"))
-    actions.append(([gen_GEN, gen_exe, validator_exe] + copy_files,
-                    [os.path.join(INPUT_DIRNAME, 'input%d.txt' % (x))
-                     for x in range(0, testcase_num)],
-                    make_input,
-                    "input generation"))
+    for n, (is_copy, line, st) in enumerate(testcases):
+        actions.append(([line, validator_exe] if is_copy
+                        else [gen_exe, validator_exe],
+                        [os.path.join(INPUT_DIRNAME, 'input%d.txt' % (n))],
+                        functools.partial(make_input, n, is_copy, line, st),
+                        "input generation",
+                        json.dumps([is_copy, line, st])))
 
     for n in range(testcase_num):
         actions.append(([os.path.join(INPUT_DIRNAME, 'input%d.txt' % (n)),
@@ -540,20 +552,26 @@ def build_gen_list(base_dir, task_type, yaml_conf):
 def build_action_list(base_dir, task_type, yaml_conf):
     """Build a list of actions that cmsMake is able to do here. Each
     action is described by a tuple (infiles, outfiles, callable,
-    description) where:
+    description[, recipe]) where:
 
     1) infiles is a list of files this action depends on;
 
     2) outfiles is a list of files this action produces; it is
-    intended that this action can be skipped if all the outfiles is
-    newer than all the infiles; moreover, the outfiles get deleted
-    when the action is cleaned;
+    intended that this action can be skipped if all the outfiles exist
+    and the content of the infiles (and the recipe) did not change
+    since they were produced; moreover, the outfiles get deleted when
+    the action is cleaned;
 
     3) callable is a callable Python object that, when called,
     performs the action;
 
     4) description is a human-readable description of what this
-    action does.
+    action does;
+
+    5) recipe, optional, is a string describing how the outfiles are
+    produced from the infiles, when it is not fixed (e.g., the
+    arguments of the generator): the action is not skipped if it
+    changed.
 
     """
     actions = []
@@ -574,6 +592,10 @@ def clean(base_dir, generated_list):
             pass
 
     # Delete other things
+    try:
+        os.remove(os.path.join(base_dir, STATE_JSON))
+    except OSError:
+        pass
     try:
         os.rmdir(os.path.join(base_dir, INPUT_DIRNAME))
     except OSError:
@@ -598,96 +620,224 @@ def build_execution_tree(actions):
     """Given a set of actions as described in the docstring of
     build_action_list(), builds an execution tree and the list of all
     the buildable files. The execution tree is a dictionary that maps
-    each builable or source file to the tuple (infiles, callable),
-    where infiles and callable are as in the docstring of
-    build_action_list().
+    each builable or source file to the tuple (infiles, callable,
+    outfiles, recipe), where the elements are as in the docstring of
+    build_action_list() (the recipe being None if not given).
 
     """
     exec_tree = {}
     generated_list = []
     src_list = set()
     for action in actions:
+        recipe = action[4] if len(action) > 4 else None
         for exe in action[1]:
             if exe in exec_tree:
                 raise Exception("Target %s not unique" % (exe))
-            exec_tree[exe] = (action[0], action[2])
+            exec_tree[exe] = (action[0], action[2], action[1], recipe)
             generated_list.append(exe)
         for src in action[0]:
             src_list.add(src)
     for src in src_list:
         if src not in exec_tree:
-            exec_tree[src] = ([], noop)
+            exec_tree[src] = ([], noop, [src], None)
     return exec_tree, generated_list
 
 
-def execute_target(base_dir, exec_tree, target,
-                   already_executed=None, stack=None,
-                   debug=False, assume=None):
-    # Initialization
-    if debug:
-        print(">> Target %s is requested" % (target))
-    if already_executed is None:
-        already_executed = set()
-    if stack is None:
-        stack = set()
-
-    # Get target information
-    deps = exec_tree[target][0]
-    action = exec_tree[target][1]
-
-    # If this target is already in the stack, we have a circular
-    # dependency
-    if target in stack:
-        raise Exception("Circular dependency detected")
-
-    # If the target was already made in another subtree, we have
-    # nothing to do
-    if target in already_executed:
-        if debug:
-            print(">> Target %s has already been built, ignoring..." %
-                  (target))
-        return
+class BuildState:
+    """The content hashes that cmsMake uses to decide what to rebuild.
 
-    # Otherwise, do a step of the DFS to make dependencies
-    if debug:
-        print(">> Building dependencies for target %s" % (target))
-    already_executed.add(target)
-    stack.add(target)
-    for dep in deps:
-        execute_target(base_dir, exec_tree, dep,
-                       already_executed, stack, assume=assume)
-    stack.remove(target)
-    if debug:
-        print(">> Dependencies built for target %s" % (target))
+    They are stored in STATE_JSON in the directory of the task: for
+    each file, its digest, with the modification time and the size it
+    had when it was computed (so that the files that did not change
+    are not read again); for each target, the digest of the recipe and
+    of the infiles it was last produced from.
 
-    # Check if the action really needs to be done (i.e., there is one
-    # dependency more recent than the generated file)
-    dep_times = max(
-        [0] + [os.stat(os.path.join(base_dir, dep)).st_mtime for dep in deps])
-    try:
-        gen_time = os.stat(os.path.join(base_dir, target)).st_mtime
-    except OSError:
-        gen_time = 0
-    if gen_time >= dep_times:
+    """
+
+    def __init__(self, base_dir):
+        self.base_dir = base_dir
+        self.path = os.path.join(base_dir, STATE_JSON)
+        self.lock = threading.Lock()
+        try:
+            with open(self.path, "rt", encoding="utf-8") as f:
+                state = json.load(f)
+            self.files = state["files"]
+            self.targets = state["targets"]
+        except (OSError, ValueError, KeyError):
+            self.files = {}
+            self.targets = {}
+
+    def save(self):
+        with self.lock:
+            state = {"files": self.files, "targets": self.targets}
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump(state, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    def file_digest(self, filename):
+        """Return the digest of the content of a file.
+
+        filename (str): the path of the file, relative to the
+            directory of the task.
+
+        return (str): its digest.
+
+        """
+        path = os.path.join(self.base_dir, filename)
+        stat = os.stat(path)
+        with self.lock:
+            entry = self.files.get(filename)
+        if entry is not None and entry[:2] == [stat.st_mtime_ns, stat.st_size]:
+            return entry[2]
+        digest = path_digest(path)
+        with self.lock:
+            self.files[filename] = [stat.st_mtime_ns, stat.st_size, digest]
+        return digest
+
+    def action_digest(self, deps, recipe):
+        """Return the digest of what an action produces its outfiles from.
+
+        deps ([str]): the infiles of the action.
+        recipe (str|None): the recipe of the action.
+
+        return (str): the digest of the recipe and of the infiles.
+
+        """
+        return bytes_digest(json.dumps(
+            [recipe, [[dep, self.file_digest(dep)] for dep in deps]])
+            .encode("utf-8"))
+
+    def is_up_to_date(self, targets, digest):
+        """Return whether the targets were produced from digest.
+
+        targets ([str]): the outfiles of an action.
+        digest (str): the digest returned by action_digest.
+
+        return (bool): whether all the targets exist and were
+            produced by the action with the same recipe and infiles.
+
+        """
+        with self.lock:
+            return all(
+                self.targets.get(target) == digest
+                and os.path.exists(os.path.join(self.base_dir, target))
+                for target in targets)
+
+    def forget(self, targets):
+        with self.lock:
+            for target in targets:
+                self.targets.pop(target, None)
+
+    def record(self, targets, digest):
+        with self.lock:
+            for target in targets:
+                self.targets[target] = digest
+
+
+def execute_action(state, action, debug=False, assume=None):
+    """Perform an action, unless its outfiles are up to date.
+
+    state (BuildState): the content hashes.
+    action ((list, callable, list, str|None)): the infiles, the
+        callable, the outfiles and the recipe of the action.
+
+    """
+    deps, function, targets, recipe = action
+    digest = state.action_digest(deps, recipe)
+    if state.is_up_to_date(targets, digest):
         if debug:
-            print(">> Target %s is already new enough, not building" %
-                  (target))
+            print(">> Targets %s are already up to date, not building" %
+                  (", ".join(targets)))
         return
 
-    # At last: actually make the so long desired action :-)
     if debug:
-        print(">> Acutally building target %s" % (target))
-    action(assume=assume)
+        print(">> Actually building targets %s" % (", ".join(targets)))
+    # If the action fails, the targets may be left half-written.
+    state.forget(targets)
+    function(assume=assume)
+    state.record(targets, digest)
     if debug:
-        print(">> Target %s finished to build" % (target))
+        print(">> Targets %s finished to build" % (", ".join(targets)))
 
 
 def execute_multiple_targets(base_dir, exec_tree, targets,
-                             debug=False, assume=None):
-    already_executed = set()
+                             debug=False, assume=None, jobs=1):
+    """Make the given targets, and their dependencies.
+
+    The actions are run as soon as all the actions they depend on are
+    done, up to jobs at a time, in threads: they spend their time
+    waiting for the commands they run (compilers, generators,
+    solutions...) to complete.
+
+    base_dir (str): the directory of the task.
+    exec_tree (dict): the execution tree, as returned by
+        build_execution_tree().
+    targets ([str]): the targets to make.
+    jobs (int): the maximum number of actions to run at the same time.
+
+    """
+    # Find the actions needed, each after those it depends on, and
+    # the actions that depend on each of them.
+    actions = {}
+    dependents = {}
+    stack = set()
+
+    def visit(target):
+        deps, function, _, _ = exec_tree[target]
+        # Nothing to do for the source files.
+        if function is noop or function in actions:
+            return
+        if function in stack:
+            raise Exception("Circular dependency detected")
+        stack.add(function)
+        for dep in deps:
+            visit(dep)
+        stack.remove(function)
+        actions[function] = exec_tree[target]
+        dependents[function] = []
+        for dep in set(exec_tree[dep][1] for dep in deps) - {noop}:
+            dependents[dep].append(function)
+
     for target in targets:
-        execute_target(base_dir, exec_tree, target,
-                       already_executed, debug=debug, assume=assume)
+        if debug:
+            print(">> Target %s is requested" % (target))
+        visit(target)
+    missing = {function: set(exec_tree[dep][1] for dep in action[0]) - {noop}
+               for function, action in actions.items()}
+
+    state = BuildState(base_dir)
+    failure = None
+    try:
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            running = {}
+            while True:
+                if failure is None:
+                    for function in [f for f, deps in missing.items()
+                                     if len(deps) == 0]:
+                        del missing[function]
+                        running[executor.submit(
+                            execute_action, state, actions[function],
+                            debug=debug, assume=assume)] = function
+                if len(running) == 0:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    function = running.pop(future)
+                    try:
+                        future.result()
+                    except Exception as error:
+                        # Let the running actions finish, but do not
+                        # start new ones.
+                        if failure is None:
+                            failure = error
+                        continue
+                    for dependent in dependents[function]:
+                        missing[dependent].discard(function)
+    finally:
+        state.save()
+    if failure is not None:
+        raise failure
 
 
 def main():
@@ -711,6 +861,9 @@ def main():
                        help="answer no to all questions")
     parser.add_argument("-d", "--debug", action="store_true", default=False,
                         help="enable debug messages")
+    parser.add_argument("-j", "--jobs", action="store", type=int, default=1,
+                        help="number of actions to run in parallel "
+                        "(1 by default)")
     parser.add_argument("targets", action="store", type=utf8_decoder,
                         nargs="*", metavar="target", help="target to build")
     options = parser.parse_args()
@@ -723,6 +876,12 @@ def main():
 
     assume = options.assume
 
+    if options.jobs < 1:
+        parser.error("The number of jobs must be positive")
+    if options.jobs > 1:
+        global erase_progress
+        erase_progress = False
+
     task_type = detect_task_type(base_dir)
     yaml_conf = parse_task_yaml(base_dir)
     actions = build_action_list(base_dir, task_type, yaml_conf)
@@ -750,7 +909,7 @@ def main():
         try:
             execute_multiple_targets(base_dir, exec_tree,
                                      generated_list, debug=options.debug,
-                                     assume=assume)
+                                     assume=assume, jobs=options.jobs)
 
         # After all work, possibly clean the left-overs of testing
         finally:
@@ -760,7 +919,7 @@ def main():
         try:
             execute_multiple_targets(base_dir, exec_tree,
                                      options.targets, debug=options.debug,
-                                     assume=assume)
+                                     assume=assume, jobs=options.jobs)
 
         # After all work, possibly clean the left-overs of testing
         finally:
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Micro-benchmarks for the hot paths of CMS.
+
+Each module in this package is a script (run it with python -m) that
+measures one component in isolation and prints a small report. They
+are not run as part of the test suites.
+
+"""
+
+import statistics
+import time
+
+
+def measure(func, repetitions):
+    """Call a function many times, measuring each call.
+
+    func (function): the function to call, without arguments.
+    repetitions (int): how many times to call it.
+
+    return ([float]): the duration of each call, in seconds.
+
+    """
+    durations = []
+    for _ in range(repetitions):
+        start = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def report(name, durations, size=None, unit="MB"):
+    """Print a one-line summary of some measurements.
+
+    name (str): what was measured.
+    durations ([float]): the duration of each run, in seconds.
+    size (float|None): if given, the amount of data (in unit)
+        processed by each run, used to print the throughput.
+    unit (str): the unit of size.
+
+    """
+    line = "%-40s min %9.3f ms  median %9.3f ms  max %9.3f ms" % (
+        name, min(durations) * 1000, statistics.median(durations) * 1000,
+        max(durations) * 1000)
+    if size is not None:
+        line += "  %9.1f %s/s" % (size / statistics.median(durations), unit)
+    print(line)
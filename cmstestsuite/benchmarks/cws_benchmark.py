@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Benchmark for the request throughput of ContestWebServer.
+
+Serve, in process, the pages that the contestants request most often
+(the overview, the description of a task and the notifications) to
+logged in contestants, and report the time each request took and the
+number of SQL statements it needed.
+
+This uses (and wipes) the same database as the unit tests.
+
+"""
+
+import argparse
+import json
+import sys
+import unittest
+
+# Needs to be first to allow for monkey patching the DB connection string.
+from cmstestsuite.unit_tests.databasemixin import DatabaseMixin
+
+from sqlalchemy import event
+from werkzeug.test import Client
+from werkzeug.wrappers import BaseResponse
+
+from cms import config
+from cms.db import engine
+from cms.server.contest.server import ContestWebServer
+from cmscommon.binary import hex_to_bin
+from cmscommon.datetime import make_timestamp
+from cmstestsuite.benchmarks import measure, report
+
+# After cms.server.contest, which patches collections for tornado.
+try:
+    import tornado4.web as tornado_web
+except ImportError:
+    import tornado.web as tornado_web
+
+
+class ContestWebServerBenchmark(DatabaseMixin, unittest.TestCase):
+
+    def prepare(self, num_users, num_tasks):
+        """Create a contest and the clients of its contestants.
+
+        return ([Client], [str]): a client for each contestant, with
+            its login cookie set, and the names of the tasks.
+
+        """
+        contest = self.add_contest(languages=[])
+        tasks = []
+        for num in range(num_tasks):
+            task = self.add_task(contest=contest, num=num)
+            task.active_dataset = self.add_dataset(
+                task=task, time_limit=1.0, memory_limit=256 * 1024 * 1024,
+                task_type="Batch",
+                task_type_parameters=["alone", ["", ""], "diff"],
+                score_type="Sum", score_type_parameters=100)
+            self.add_statement(task=task, language="en")
+            tasks.append(task)
+        participations = [
+            self.add_participation(
+                contest=contest,
+                user=self.add_user(password="plaintext:pass"))
+            for _ in range(num_users)]
+        self.session.commit()
+
+        service = ContestWebServer(0, contest.id)
+        secret = hex_to_bin(config.secret_key)
+        clients = []
+        for participation in participations:
+            client = Client(service, BaseResponse)
+            cookie = json.dumps([participation.user.username,
+                                 participation.user.password,
+                                 make_timestamp()])
+            client.set_cookie(
+                "localhost", contest.name + "_login",
+                tornado_web.create_signed_value(
+                    secret, contest.name + "_login", cookie).decode("ascii"))
+            clients.append(client)
+        return clients, [task.name for task in tasks]
+
+    def run_benchmark(self, num_users, num_tasks, num_requests):
+        clients, task_names = self.prepare(num_users, num_tasks)
+        pages = [("overview", lambda i: "/"),
+                 ("task description",
+                  lambda i: "/tasks/%s/description"
+                  % task_names[i % len(task_names)]),
+                 ("notifications", lambda i: "/notifications")]
+
+        statements = [0]
+
+        def count_statements(*args):
+            statements[0] += 1
+
+        event.listen(engine, "before_cursor_execute", count_statements)
+        try:
+            for name, url in pages:
+                start = statements[0]
+                durations = []
+                for i in range(num_requests):
+                    client = clients[i % len(clients)]
+
+                    def request():
+                        response = client.get(
+                            url(i),
+                            environ_base={"REMOTE_ADDR": "127.0.0.1"})
+                        assert response.status_code == 200, \
+                            response.status_code
+
+                    durations += measure(request, 1)
+                report(name, durations, size=1, unit="requests")
+                print("%-40s %.1f SQL statements per request" % (
+                    "", (statements[0] - start) / num_requests))
+        finally:
+            event.remove(engine, "before_cursor_execute", count_statements)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the request throughput of "
+                    "ContestWebServer.")
+    parser.add_argument(
+        "-u", "--users", action="store", type=int, default=100,
+        help="number of contestants (default 100)")
+    parser.add_argument(
+        "-t", "--tasks", action="store", type=int, default=5,
+        help="number of tasks (default 5)")
+    parser.add_argument(
+        "-r", "--requests", action="store", type=int, default=1000,
+        help="number of requests for each page (default 1000)")
+    args = parser.parse_args()
+
+    benchmark = ContestWebServerBenchmark()
+    ContestWebServerBenchmark.setUpClass()
+    benchmark.setUp()
+    try:
+        benchmark.run_benchmark(args.users, args.tasks, args.requests)
+    finally:
+        benchmark.tearDown()
+        ContestWebServerBenchmark.tearDownClass()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Benchmark for the transfers of the database backend of FileCacher.
+
+Store files of a few sizes in the database with put_file_from_path,
+and retrieve them (with an empty cache) with get_file_to_path. Report
+the throughput of each and the number of SQL statements run on the
+large objects.
+
+This uses (and wipes) the same database as the unit tests.
+
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+# Needs to be first to allow for monkey patching the DB connection string.
+from cmstestsuite.unit_tests.databasemixin import DatabaseMixin
+
+from cms.db import LargeObject
+from cms.db.filecacher import FileCacher
+from cmstestsuite.benchmarks import measure, report
+
+
+class FileCacherBenchmark(DatabaseMixin, unittest.TestCase):
+
+    def run_benchmark(self, size, repetitions):
+        file_cacher = FileCacher()
+        statements = [0]
+        execute = LargeObject._execute
+
+        def counting(*args, **kwargs):
+            statements[0] += 1
+            return execute(*args, **kwargs)
+
+        size_mb = size / (1024 * 1024)
+        with tempfile.TemporaryDirectory() as tmp, \
+                patch.object(LargeObject, "_execute", counting):
+            src_path = os.path.join(tmp, "src")
+            dst_path = os.path.join(tmp, "dst")
+
+            put_durations = []
+            put_statements = 0
+            digests = []
+            for _ in range(repetitions):
+                # Different contents, so that each is really stored.
+                with open(src_path, "wb") as f:
+                    f.write(os.urandom(size))
+                statements[0] = 0
+                put_durations += measure(
+                    lambda: digests.append(
+                        file_cacher.put_file_from_path(src_path)), 1)
+                put_statements += statements[0]
+                # Empty the cache for the retrievals.
+                file_cacher.drop(digests[-1])
+
+            get_durations = []
+            get_statements = 0
+            for digest in digests:
+                statements[0] = 0
+                get_durations += measure(
+                    lambda: file_cacher.get_file_to_path(digest, dst_path),
+                    1)
+                get_statements += statements[0]
+                file_cacher.drop(digest)
+
+        report("put_file_from_path, %.2f MB" % size_mb, put_durations,
+               size=size_mb)
+        print("%-40s %.1f SQL statements per file" % (
+            "", put_statements / repetitions))
+        report("get_file_to_path, %.2f MB" % size_mb, get_durations,
+               size=size_mb)
+        print("%-40s %.1f SQL statements per file" % (
+            "", get_statements / repetitions))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the database backend of FileCacher.")
+    parser.add_argument(
+        "-s", "--sizes", action="store", type=float, nargs="+",
+        default=[0.01, 1, 100],
+        help="sizes of the files, in MB (default 0.01 1 100)")
+    parser.add_argument(
+        "-r", "--repetitions", action="store", type=int, default=5,
+        help="number of transfers for each size (default 5)")
+    args = parser.parse_args()
+
+    benchmark = FileCacherBenchmark()
+    FileCacherBenchmark.setUpClass()
+    try:
+        benchmark.setUp()
+        for size in args.sizes:
+            benchmark.run_benchmark(int(size * 1024 * 1024),
+                                    args.repetitions)
+        benchmark.tearDown()
+    finally:
+        FileCacherBenchmark.tearDownClass()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Benchmark for the priority queue of the triggered services.
+
+Fill a queue with many operations, as ES does when a dataset is
+reevaluated, and measure pushing, popping, removing and the status
+calls used by the admins.
+
+"""
+
+import argparse
+import random
+import sys
+
+from cms.io import PriorityQueue
+from cms.service.esoperations import ESOperation
+from cmscommon.datetime import make_datetime
+from cmstestsuite.benchmarks import measure, report
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the priority queue.")
+    parser.add_argument(
+        "-n", "--operations", action="store", type=int, default=500000,
+        help="number of operations in the queue (default 500000)")
+    parser.add_argument(
+        "-r", "--repetitions", action="store", type=int, default=20,
+        help="number of status calls (default 20)")
+    args = parser.parse_args()
+
+    rnd = random.Random(0)
+    operations = [ESOperation(ESOperation.EVALUATION, i // 50, 1,
+                              "%03d" % (i % 50))
+                  for i in range(args.operations)]
+    queue = PriorityQueue()
+
+    def push_all():
+        for i, operation in enumerate(operations):
+            queue.push(operation, rnd.randrange(5), make_datetime(i))
+
+    n = args.operations / 1000
+    report("push", measure(push_all, 1), size=n, unit="kop")
+    report("get_summary", measure(queue.get_summary, args.repetitions))
+    report("get_status, first 100",
+           measure(lambda: queue.get_status(limit=100), args.repetitions))
+    report("get_status, all", measure(queue.get_status, 1))
+
+    removed = rnd.sample(operations, len(operations) // 10)
+    report("remove 10%",
+           measure(lambda: [queue.remove(op) for op in removed], 1),
+           size=len(removed) / 1000, unit="kop")
+
+    def pop_all():
+        while not queue.empty():
+            queue.pop()
+
+    report("pop", measure(pop_all, 1),
+           size=n - len(removed) / 1000, unit="kop")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
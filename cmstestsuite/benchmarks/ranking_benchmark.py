@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Benchmark for the scoring of the ranking web server.
+
+Fill the stores of RWS with a synthetic contest, as if they had been
+loaded from disk, and measure the replay of the history that RWS does
+at startup (ScoringStore.init_store), for each score mode.
+
+"""
+
+import argparse
+import random
+import sys
+
+from cmscommon.constants import \
+    SCORE_MODE_MAX, SCORE_MODE_MAX_SUBTASK, SCORE_MODE_MAX_TOKENED_LAST
+from cmsranking.Scoring import ScoringStore
+from cmsranking.Store import Store
+from cmsranking.Subchange import Subchange
+from cmsranking.Submission import Submission
+from cmsranking.Task import Task
+from cmstestsuite.benchmarks import measure, report
+
+
+def make_stores(score_mode, args):
+    """Return the stores of RWS with a synthetic contest in them."""
+    rnd = random.Random(0)
+    stores = dict()
+    for name, entity in [("subchange", Subchange),
+                         ("submission", Submission),
+                         ("task", Task)]:
+        stores[name] = Store(entity, "/nonexistent", stores)
+
+    def add(name, key, data):
+        item = stores[name]._entity()
+        item.set(data)
+        item.key = key
+        stores[name]._store[key] = item
+
+    for t in range(args.tasks):
+        add("task", "t%d" % t, {
+            "name": "Task %d" % t, "short_name": "t%d" % t,
+            "contest": "c", "max_score": 100.0, "score_precision": 2,
+            "extra_headers": [], "score_mode": score_mode, "order": t})
+    for u in range(args.users):
+        for t in range(args.tasks):
+            for s in range(args.submissions):
+                time = 60 * s + t
+                submission = "%d_%d_%d" % (u, t, s)
+                add("submission", submission,
+                    {"user": "u%d" % u, "task": "t%d" % t, "time": time})
+                # Results arrive some time after the submission, and
+                # some of them are scored again.
+                for c in range(args.subchanges):
+                    extra = ["%d" % rnd.randrange(11)
+                             for _ in range(args.subtasks)]
+                    data = {"submission": submission,
+                            "time": time + 10 * c + 1,
+                            "score": float(sum(map(int, extra))),
+                            "extra": extra}
+                    if c == 0 and rnd.random() < 0.2:
+                        data["token"] = True
+                    add("subchange", "%s_%d" % (submission, c), data)
+    return stores
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the scoring of the ranking web server.")
+    parser.add_argument(
+        "-u", "--users", action="store", type=int, default=5000,
+        help="number of users (default 5000)")
+    parser.add_argument(
+        "-t", "--tasks", action="store", type=int, default=3,
+        help="number of tasks (default 3)")
+    parser.add_argument(
+        "-s", "--submissions", action="store", type=int, default=20,
+        help="number of submissions of each user on each task "
+             "(default 20)")
+    parser.add_argument(
+        "-c", "--subchanges", action="store", type=int, default=3,
+        help="number of subchanges of each submission (default 3)")
+    parser.add_argument(
+        "--subtasks", action="store", type=int, default=10,
+        help="number of subtasks of each task (default 10)")
+    args = parser.parse_args()
+
+    for score_mode in [SCORE_MODE_MAX, SCORE_MODE_MAX_SUBTASK,
+                       SCORE_MODE_MAX_TOKENED_LAST]:
+        stores = make_stores(score_mode, args)
+        changes = len(stores["subchange"]._store) / 1000
+        report("init_store, %s" % score_mode,
+               measure(lambda: ScoringStore(stores).init_store(), 1),
+               size=changes, unit="kchanges")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Benchmark for the RPC protocol.
+
+Connect a client and a server on localhost, and measure the latency
+of small calls and the throughput of calls carrying a large job group,
+with the line-based protocol and with the binary protocol (with and
+without compression).
+
+"""
+
+import argparse
+import contextlib
+import json
+import sys
+from unittest.mock import patch
+
+from gevent.server import StreamServer
+
+from cms import Address, ServiceCoord
+from cms.db import Executable
+from cms.grading.Job import EvaluationJob, JobGroup
+from cms.io import RemoteServiceClient, RemoteServiceServer, rpc_method
+from cms.io.rpc import RemoteServiceBase
+from cms.service.esoperations import ESOperation
+from cmstestsuite.benchmarks import measure, report
+
+
+class EchoService:
+
+    @rpc_method
+    def echo(self, value):
+        return value
+
+
+def job_group(num_jobs):
+    """Return an exported job group as sent by ES to the workers."""
+    jobs = []
+    for i in range(num_jobs):
+        operation = ESOperation(ESOperation.EVALUATION, 1000 + i, 42,
+                                "%03d" % i)
+        jobs.append(EvaluationJob(
+            operation=operation, task_type="Batch",
+            task_type_parameters=["alone", ["", ""], "diff"],
+            language="C++17 / g++", info="evaluate submission %d" % i,
+            executables={"sol": Executable("sol", "%040x" % i)},
+            input="%040x" % (2 * i), output="%040x" % (2 * i + 1),
+            time_limit=1.0, memory_limit=256 * 1024 * 1024))
+    return JobGroup(jobs).export_to_dict()
+
+
+def connect(port):
+    with patch("cms.io.rpc.get_service_address",
+               return_value=Address("127.0.0.1", port)):
+        client = RemoteServiceClient(ServiceCoord("EchoService", 0))
+    client.connect()
+    client._connection_event.wait()
+    # Wait for the negotiation to finish.
+    client.echo(value=None).get()
+    return client
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the RPC protocol.")
+    parser.add_argument(
+        "-c", "--calls", action="store", type=int, default=2000,
+        help="number of small calls (default 2000)")
+    parser.add_argument(
+        "-j", "--jobs", action="store", type=int, default=1000,
+        help="number of jobs in the large job group (default 1000)")
+    parser.add_argument(
+        "-r", "--repetitions", action="store", type=int, default=50,
+        help="number of calls with the large job group (default 50)")
+    args = parser.parse_args()
+
+    service = EchoService()
+    server = StreamServer(
+        ("127.0.0.1", 0),
+        lambda sock, address:
+            RemoteServiceServer(service, address).handle(sock))
+    server.start()
+
+    value = job_group(args.jobs)
+    size = len(json.dumps(value)) / (1024 * 1024)
+    print("%-40s %.3f MB per job group" % ("", size))
+    for name, context in [
+            ("line-based", patch.object(RemoteServiceServer,
+                                        "_accept_negotiation",
+                                        return_value=False)),
+            ("binary", patch.object(RemoteServiceBase,
+                                    "COMPRESSION_THRESHOLD", sys.maxsize)),
+            ("binary+zlib", contextlib.nullcontext())]:
+        with context:
+            client = connect(server.server_port)
+            # Measure the size on the wire of a large call.
+            sent = []
+            write = client._writer.write
+            with patch.object(client._writer, "write",
+                              lambda data: sent.append(len(data))
+                              or write(data)):
+                client.echo(value=value).get()
+
+            report("small calls, %s" % name,
+                   measure(lambda: client.echo(value=42).get(), args.calls))
+            # Each call carries the job group twice.
+            report("job group calls, %s" % name,
+                   measure(lambda: client.echo(value=value).get(),
+                           args.repetitions),
+                   size=2 * size)
+            print("%-40s %.3f MB per job group on the wire" % (
+                "", sum(sent) / (1024 * 1024)))
+            client.disconnect()
+
+    server.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
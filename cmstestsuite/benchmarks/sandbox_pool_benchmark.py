@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Benchmark for the per-job overhead of the sandboxes.
+
+Simulate many tiny jobs, each creating a sandbox, putting a few files
+in it and deleting it, with and without the sandbox pool. Report the
+latency of each job and the number of isolate invocations it needed.
+
+This needs the sandbox configured in cms.conf (usually isolate) to be
+available.
+
+"""
+
+import argparse
+import sys
+from unittest.mock import patch
+
+from cms.grading import Sandbox
+from cms.grading.Sandbox import sandbox_pool
+from cms.grading.tasktypes import create_sandbox, delete_sandbox
+from cmstestsuite.benchmarks import measure, report
+
+
+def run_job(files):
+    sandbox = create_sandbox(None, name="evaluate")
+    for i in range(files):
+        sandbox.create_file_from_string("input%d.txt" % i, b"1 2\n")
+    delete_sandbox(sandbox)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the creation and deletion of sandboxes.")
+    parser.add_argument(
+        "-j", "--jobs", action="store", type=int, default=200,
+        help="number of jobs to simulate (default 200)")
+    parser.add_argument(
+        "-f", "--files", action="store", type=int, default=3,
+        help="number of files to put in each sandbox (default 3)")
+    args = parser.parse_args()
+
+    calls = [0]
+
+    def counting(func):
+        def wrapper(*args, **kwargs):
+            calls[0] += 1
+            return func(*args, **kwargs)
+        return wrapper
+
+    subprocess = Sandbox.subprocess
+    with patch.object(subprocess, "call", counting(subprocess.call)), \
+            patch.object(subprocess, "check_output",
+                         counting(subprocess.check_output)):
+        for size in [0, 1]:
+            sandbox_pool.resize(size)
+            calls[0] = 0
+            durations = measure(lambda: run_job(args.files), args.jobs)
+            invocations = calls[0]
+            sandbox_pool.clear()
+            report("job with%s sandbox pool" % ("" if size else "out"),
+                   durations)
+            print("%-40s %.1f sandbox invocations per job" % (
+                "", invocations / args.jobs))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
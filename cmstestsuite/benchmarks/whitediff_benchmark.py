@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Benchmark for the white diff comparator.
+
+Compare pairs of equivalent outputs (the second one has different
+whitespaces than the first) of different shapes, and report the
+throughput of the comparison.
+
+"""
+
+import argparse
+import random
+import sys
+from io import BytesIO
+
+from cms.grading.steps.whitediff import _white_diff
+from cmstestsuite.benchmarks import measure, report
+
+
+def _numbers(count):
+    return [b"%d" % random.randint(-10 ** 9, 10 ** 9) for _ in range(count)]
+
+
+def large_output(size):
+    """Lines of a few numbers each, as a typical large output."""
+    lines = []
+    total = 0
+    while total < size:
+        line = b" ".join(_numbers(10))
+        lines.append(line)
+        total += len(line) + 1
+    return lines
+
+
+def many_lines_output(size):
+    """A single short token per line."""
+    lines = []
+    total = 0
+    while total < size:
+        line = _numbers(1)[0]
+        lines.append(line)
+        total += len(line) + 1
+    return lines
+
+
+def long_line_output(size):
+    """A single line with all the tokens."""
+    tokens = _numbers(size // 10)
+    return [b" ".join(tokens)]
+
+
+def make_pair(lines):
+    """Return an output and an equivalent one with other whitespaces."""
+    output = b"\n".join(lines) + b"\n"
+    res = b"\r\n".join(line.replace(b" ", b" \t ") + b"  "
+                       for line in lines) + b"\n\n\n"
+    return output, res
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the white diff comparator.")
+    parser.add_argument(
+        "-s", "--size", action="store", type=int, default=20,
+        help="size of each output, in MB (default 20)")
+    parser.add_argument(
+        "-r", "--repetitions", action="store", type=int, default=5,
+        help="number of comparisons for each shape (default 5)")
+    args = parser.parse_args()
+
+    random.seed(42)
+    for name, generator in [("large output", large_output),
+                            ("many-line output", many_lines_output),
+                            ("long-line output", long_line_output)]:
+        output, res = make_pair(generator(args.size * 1024 * 1024))
+
+        def compare():
+            assert _white_diff(BytesIO(output), BytesIO(res))
+
+        report("white diff, %s" % name,
+               measure(compare, args.repetitions),
+               size=(len(output) + len(res)) / (1024 * 1024))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Benchmark for EvaluationService.write_results.
+
+Write to the DB the results of the evaluation of many submissions, in
+batches of the size used by the result cache of ES, and report the
+latency of each batch and the number of SQL statements it needed.
+
+This uses (and wipes) the same database as the unit tests.
+
+"""
+
+import argparse
+import sys
+import unittest
+from unittest.mock import Mock, patch
+
+# Needs to be first to allow for monkey patching the DB connection string.
+from cmstestsuite.unit_tests.databasemixin import DatabaseMixin
+
+from sqlalchemy import event
+
+from cms.db import engine
+from cms.grading.Job import EvaluationJob
+from cms.service.EvaluationService import EvaluationService, Result
+from cms.service.esoperations import ESOperation
+from cmstestsuite.benchmarks import measure, report
+
+
+class WriteResultsBenchmark(DatabaseMixin, unittest.TestCase):
+
+    def prepare(self, num_submissions, num_testcases):
+        """Create compiled submissions and their evaluation results.
+
+        return ([(ESOperation, Result)]): one successful result for
+            each submission and testcase.
+
+        """
+        contest = self.add_contest()
+        participation = self.add_participation(contest=contest)
+        task = self.add_task(contest=contest)
+        dataset = self.add_dataset(task=task)
+        task.active_dataset = dataset
+        testcases = [self.add_testcase(dataset)
+                     for _ in range(num_testcases)]
+        submissions = [
+            self.add_submission_with_results(task, participation, True)[0]
+            for _ in range(num_submissions)]
+        self.session.commit()
+
+        items = []
+        for submission in submissions:
+            for testcase in testcases:
+                operation = ESOperation(ESOperation.EVALUATION, submission.id,
+                                        dataset.id, testcase.codename)
+                job = EvaluationJob(
+                    operation=operation, success=True, outcome="1.0",
+                    text=["Output is correct"], shard=0,
+                    sandboxes=["/tmp/sandbox"],
+                    plus={"execution_time": 0.01,
+                          "execution_wall_clock_time": 0.02,
+                          "execution_memory": 1 << 20})
+                items.append((operation, Result(job, True)))
+        return items
+
+    def run_benchmark(self, num_submissions, num_testcases, batch_size):
+        items = self.prepare(num_submissions, num_testcases)
+
+        with patch("cms.io.triggeredservice.TriggeredService"
+                   ".start_sweeper"):
+            service = EvaluationService(0)
+        service.scoring_service = Mock()
+
+        statements = [0]
+
+        def count_statements(*args):
+            statements[0] += 1
+
+        event.listen(engine, "before_cursor_execute", count_statements)
+        durations = []
+        try:
+            for i in range(0, len(items), batch_size):
+                batch = items[i:i + batch_size]
+                start = statements[0]
+                durations += measure(
+                    lambda: service.write_results(batch), 1)
+                statements.append(statements[0] - start)
+        finally:
+            event.remove(engine, "before_cursor_execute", count_statements)
+
+        report("write_results (%d results per batch)" % batch_size,
+               durations)
+        per_batch = statements[1:]
+        print("%-40s %.1f SQL statements per batch" % (
+            "", sum(per_batch) / len(per_batch)))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark EvaluationService.write_results.")
+    parser.add_argument(
+        "-s", "--submissions", action="store", type=int, default=200,
+        help="number of submissions to write results for (default 200)")
+    parser.add_argument(
+        "-t", "--testcases", action="store", type=int, default=50,
+        help="number of testcases per submission (default 50)")
+    parser.add_argument(
+        "-b", "--batch-size", action="store", type=int,
+        default=EvaluationService.RESULT_CACHE_SIZE,
+        help="number of results written together (default %d)" %
+        EvaluationService.RESULT_CACHE_SIZE)
+    args = parser.parse_args()
+
+    benchmark = WriteResultsBenchmark()
+    WriteResultsBenchmark.setUpClass()
+    try:
+        benchmark.setUp()
+        benchmark.run_benchmark(args.submissions, args.testcases,
+                                args.batch_size)
+        benchmark.tearDown()
+    finally:
+        WriteResultsBenchmark.tearDownClass()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for the handlers of the ranking web server.
+
+"""
+
+import gzip
+import json
+import os
+import unittest
+
+from werkzeug.test import Client
+from werkzeug.wrappers import BaseResponse
+
+from cmscommon.constants import SCORE_MODE_MAX
+from cmsranking.RankingWebServer import BulkHandler, HistoryHandler, \
+    ScoreHandler
+from cmsranking.Scoring import ScoringStore
+from cmsranking.Store import Store
+from cmsranking.Subchange import Subchange
+from cmsranking.Submission import Submission
+from cmsranking.Task import Task
+from cmstestsuite.unit_tests.filesystemmixin import FileSystemMixin
+
+
+class TestHandlers(FileSystemMixin, unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.stores = dict()
+        for name, entity in [("task", Task), ("submission", Submission),
+                             ("subchange", Subchange)]:
+            self.stores[name] = Store(
+                entity, os.path.join(self.base_dir, name), self.stores)
+        self.stores["scoring"] = ScoringStore(self.stores)
+        self.stores["task"].create("t", {
+            "name": "T", "short_name": "t", "contest": "c",
+            "max_score": 100.0, "score_precision": 0, "extra_headers": [],
+            "order": 0, "score_mode": SCORE_MODE_MAX})
+        self.score_client = Client(ScoreHandler(self.stores), BaseResponse)
+        self.history_client = Client(HistoryHandler(self.stores),
+                                     BaseResponse)
+
+    def tearDown(self):
+        for name in ["task", "submission", "subchange"]:
+            self.stores[name].close()
+        super().tearDown()
+
+    @staticmethod
+    def get(client, url, **headers):
+        headers["Accept"] = "application/json"
+        return client.get(url, headers=headers)
+
+    def score(self, submission, time, score, user="u"):
+        if submission not in self.stores["submission"]:
+            self.stores["submission"].create(
+                submission, {"user": user, "task": "t", "time": time})
+        self.stores["subchange"].create(
+            "%s_%d" % (submission, time),
+            {"submission": submission, "time": time, "score": score})
+
+    def test_scores(self):
+        response = self.get(self.score_client, "/")
+        self.assertEqual(json.loads(response.data), {})
+        etag = response.headers["ETag"]
+
+        self.score("s1", 10, 50.0)
+        response = self.get(self.score_client, "/")
+        self.assertEqual(json.loads(response.data), {"u": {"t": 50.0}})
+        self.assertNotEqual(response.headers["ETag"], etag)
+        etag = response.headers["ETag"]
+
+        # Not modified, as the score did not change.
+        self.score("s2", 20, 40.0)
+        response = self.get(self.score_client, "/",
+                            **{"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+
+        response = self.get(self.score_client, "/",
+                            **{"Accept-Encoding": "gzip"})
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertEqual(json.loads(gzip.decompress(response.data)),
+                         {"u": {"t": 50.0}})
+
+    def test_history(self):
+        self.score("s1", 10, 50.0)
+        self.score("s2", 20, 60.0)
+        response = self.get(self.history_client, "/")
+        self.assertEqual(json.loads(response.data),
+                         [["u", "t", 10, 50.0], ["u", "t", 20, 60.0]])
+        version = response.headers["Version"]
+
+        # A submission made before the last one, but scored after it.
+        self.score("s3", 15, 70.0, user="v")
+        response = self.get(self.history_client, "/?since=%s" % version)
+        self.assertEqual(json.loads(response.data), [["v", "t", 15, 70.0]])
+        self.assertNotIn("Reset", response.headers)
+        version = response.headers["Version"]
+        response = self.get(self.history_client, "/?since=%s" % version)
+        self.assertEqual(json.loads(response.data), [])
+
+        # A change in the past that does not change the current score,
+        # but removes a change from the history.
+        self.stores["subchange"].update(
+            "s1_10", {"submission": "s1", "time": 10, "score": 55.0})
+        expected = [["u", "t", 10, 55.0], ["v", "t", 15, 70.0],
+                    ["u", "t", 20, 60.0]]
+        response = self.get(self.history_client, "/")
+        self.assertEqual(json.loads(response.data), expected)
+        response = self.get(self.history_client, "/?since=%s" % version)
+        self.assertEqual(json.loads(response.data), expected)
+        self.assertEqual(response.headers["Reset"], "1")
+
+        response = self.get(self.history_client, "/?since=x")
+        self.assertEqual(response.status_code, 400)
+
+    def test_history_restart(self):
+        for i in range(3):
+            self.score("s%d" % i, 10 + i, 50.0 + i)
+            response = self.get(self.history_client, "/")
+        version = response.headers["Version"]
+
+        # A new run of the server, which has seen fewer versions.
+        history_client = Client(HistoryHandler(self.stores), BaseResponse)
+        response = self.get(history_client, "/")
+        self.assertNotEqual(response.headers["Version"], version)
+        response = self.get(history_client, "/?since=%s" % version)
+        self.assertEqual(json.loads(response.data),
+                         [["u", "t", 10, 50.0], ["u", "t", 11, 51.0],
+                          ["u", "t", 12, 52.0]])
+        self.assertEqual(response.headers["Reset"], "1")
+
+        # Even with the same epoch, versions not yet reached are reset.
+        epoch = response.headers["Version"].split(".")[0]
+        response = self.get(history_client, "/?since=%s.100" % epoch)
+        self.assertEqual(response.headers["Reset"], "1")
+
+    def test_history_timestamp(self):
+        self.score("s1", 10, 50.0)
+        response = self.get(self.history_client, "/")
+        timestamp = response.headers["Timestamp"]
+
+        # The history is computed again, but it did not change.
+        self.score("s2", 20, 40.0)
+        self.stores["subchange"].delete("s2_20")
+        response = self.get(self.history_client, "/")
+        self.assertEqual(response.headers["Timestamp"], timestamp)
+
+    def test_bulk(self):
+        client = Client(BulkHandler(
+            {"submissions": self.stores["submission"],
+             "subchanges": self.stores["subchange"]},
+            "user", "pass", "realm"), BaseResponse)
+
+        def put(data):
+            return client.put(
+                "/", data=gzip.compress(json.dumps(data).encode("utf-8")),
+                content_type="application/json",
+                headers={"Authorization": "Basic dXNlcjpwYXNz",
+                         "Content-Encoding": "gzip"})
+
+        response = put([
+            ["submissions", {"s1": {"user": "u", "task": "t", "time": 10}}],
+            ["subchanges", {"s1_10": {"submission": "s1", "time": 10,
+                                      "score": 50.0}}]])
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.stores["scoring"].get_score("u", "t"), 50.0)
+
+        response = put([["users", {}]])
+        self.assertEqual(response.status_code, 400)
+        response = client.put("/", data="[]",
+                              content_type="application/json")
+        self.assertEqual(response.status_code, 401)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for the scoring of the ranking web server.
+
+"""
+
+import random
+import unittest
+from itertools import zip_longest
+
+from cmscommon.constants import \
+    SCORE_MODE_MAX, SCORE_MODE_MAX_SUBTASK, SCORE_MODE_MAX_TOKENED_LAST
+from cmsranking.Subchange import Subchange
+from cmsranking.Submission import Submission
+from cmsranking.Scoring import NumberSet, Score
+
+
+class TestNumberSet(unittest.TestCase):
+
+    def setUp(self):
+        self.set = NumberSet()
+
+    def test_empty(self):
+        self.assertEqual(len(self.set), 0)
+        self.assertEqual(self.set.query(), 0.0)
+        self.assertIsNone(self.set.max())
+        with self.assertRaises(IndexError):
+            self.set.kth(0)
+        with self.assertRaises(ValueError):
+            self.set.remove(1.0)
+
+    def test_query(self):
+        self.set.insert(-1.0)
+        self.assertEqual(self.set.max(), -1.0)
+        self.assertEqual(self.set.query(), 0.0)
+        self.set.insert(2.5)
+        self.set.insert(2.5)
+        self.set.remove(2.5)
+        self.assertEqual(self.set.query(), 2.5)
+        self.set.remove(2.5)
+        self.assertEqual(self.set.query(), 0.0)
+
+    def test_random(self):
+        rnd = random.Random(42)
+        expected = []
+        for _ in range(5000):
+            if len(expected) > 0 and rnd.random() < 0.4:
+                val = rnd.choice(expected)
+                expected.remove(val)
+                self.set.remove(val)
+            else:
+                val = float(rnd.randrange(100))
+                expected.append(val)
+                self.set.insert(val)
+            expected.sort()
+            self.assertEqual(len(self.set), len(expected))
+            self.assertEqual(self.set.max(), max(expected, default=None))
+            k = rnd.randrange(len(expected) + 1)
+            if k < len(expected):
+                self.assertEqual(self.set.kth(k), expected[k])
+            val = float(rnd.randrange(101))
+            self.assertEqual(self.set.rank(val),
+                             sum(1 for v in expected if v < val))
+
+
+class TestScore(unittest.TestCase):
+    """Compare the score with the one computed from all submissions."""
+
+    @staticmethod
+    def expected_score(score_mode, submissions, last):
+        if score_mode == SCORE_MODE_MAX:
+            return max((s.score for s in submissions), default=0.0)
+        elif score_mode == SCORE_MODE_MAX_SUBTASK:
+            scores_by_subtask = zip_longest(
+                *(map(float, s.extra or [s.score]) for s in submissions),
+                fillvalue=0.0)
+            return float(sum(max(s) for s in scores_by_subtask))
+        else:
+            return max([0.0] + [s.score for s in submissions if s.token]
+                       + [last.score if last is not None else 0.0])
+
+    def check_random(self, score_mode):
+        rnd = random.Random(score_mode)
+        score = Score(score_mode)
+        submissions = []
+        last = None
+        for t in range(2000):
+            if len(submissions) == 0 or rnd.random() < 0.1:
+                submission = Submission()
+                submission.user = "u"
+                submission.task = "t"
+                submission.time = t
+                key = "s%d" % t
+                submissions.append(submission)
+                score.create_submission(key, submission)
+                continue
+            idx = rnd.randrange(len(submissions))
+            submission = submissions[idx]
+            change = Subchange()
+            change.key = "c%d" % t
+            change.submission = "s%d" % submission.time
+            change.time = t
+            if rnd.random() < 0.8:
+                change.score = float(rnd.randrange(100))
+                if last is None or submission.time > last.time:
+                    last = submission
+            if rnd.random() < 0.2:
+                change.token = True
+            if rnd.random() < 0.5:
+                change.extra = ["%d" % rnd.randrange(30)
+                                for _ in range(rnd.randrange(1, 5))]
+            score.create_subchange(change.key, change)
+            self.assertEqual(
+                score.get_score(),
+                self.expected_score(score_mode, submissions, last))
+
+        # Replaying all the changes gives the same score.
+        expected = score.get_score()
+        score.reset_history()
+        self.assertEqual(score.get_score(), expected)
+
+    def test_max(self):
+        self.check_random(SCORE_MODE_MAX)
+
+    def test_max_subtask(self):
+        self.check_random(SCORE_MODE_MAX_SUBTASK)
+
+    def test_max_tokened_last(self):
+        self.check_random(SCORE_MODE_MAX_TOKENED_LAST)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for the persistence of the stores of the ranking web server.
+
+"""
+
+import json
+import os
+import unittest
+from unittest.mock import patch
+
+import gevent
+
+from cmsranking.Contest import Contest
+from cmsranking.Store import Store
+from cmstestsuite.unit_tests.filesystemmixin import FileSystemMixin
+
+
+def contest(name):
+    return {"name": name, "begin": 0, "end": 100, "score_precision": 0}
+
+
+class TestStore(FileSystemMixin, unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.path = os.path.join(self.base_dir, "contests")
+        self.store = self.load()
+
+    def tearDown(self):
+        self.store.close()
+        super().tearDown()
+
+    def load(self):
+        store = Store(Contest, self.path, dict())
+        store.load_from_disk()
+        return store
+
+    def assertStoredEqual(self, expected):
+        self.store.sync()
+        self.assertEqual(self.load().retrieve_list(), expected)
+
+    def test_create_update_delete(self):
+        self.store.create("a", contest("A"))
+        self.store.create("b", contest("B"))
+        self.assertStoredEqual({"a": contest("A"), "b": contest("B")})
+        self.store.update("a", contest("AA"))
+        self.store.delete("b")
+        self.assertStoredEqual({"a": contest("AA")})
+        self.store.merge_list({"a": contest("A"), "c": contest("C")})
+        self.assertStoredEqual({"a": contest("A"), "c": contest("C")})
+
+    def test_delayed_sync(self):
+        with patch.object(Store, "SYNC_DELAY", 0.01):
+            self.store.create("a", contest("A"))
+            self.store.create("b", contest("B"))
+            gevent.sleep(0.05)
+        with open(self.path + ".log", "rt", encoding="utf-8") as f:
+            self.assertEqual(len(f.readlines()), 2)
+
+    def test_close(self):
+        self.store.create("a", contest("A"))
+        self.store.close()
+        # The log was compacted in the snapshot.
+        self.assertEqual(os.path.getsize(self.path + ".log"), 0)
+        with open(self.path + ".json", "rt", encoding="utf-8") as f:
+            self.assertEqual(json.load(f), {"a": contest("A")})
+
+    def test_compaction(self):
+        with patch.object(Store, "COMPACTION_MIN_RECORDS", 3):
+            for i in range(3):
+                self.store.update("a", contest("A%d" % i)) \
+                    if i > 0 else self.store.create("a", contest("A0"))
+            self.store.sync()
+            self.assertGreater(os.path.getsize(self.path + ".log"), 0)
+            self.store.create("b", contest("B"))
+            self.store.sync()
+            self.assertEqual(os.path.getsize(self.path + ".log"), 0)
+        self.assertStoredEqual({"a": contest("A2"), "b": contest("B")})
+
+    def test_truncated_log(self):
+        self.store.create("a", contest("A"))
+        self.store.create("b", contest("B"))
+        self.store.sync()
+        with open(self.path + ".log", "r+b") as f:
+            f.truncate(os.path.getsize(self.path + ".log") - 5)
+        self.assertEqual(self.load().retrieve_list(), {"a": contest("A")})
+
+    def test_migration(self):
+        self.store.close()
+        os.remove(self.path + ".json")
+        os.remove(self.path + ".log")
+        os.mkdir(self.path)
+        for key in ["a", "b"]:
+            with open(os.path.join(self.path, key + ".json"), "wt",
+                      encoding="utf-8") as f:
+                json.dump(contest(key.upper()), f)
+        self.store = self.load()
+        self.assertEqual(self.store.retrieve_list(),
+                         {"a": contest("A"), "b": contest("B")})
+        # The entities are now in the snapshot.
+        os.remove(os.path.join(self.path, "a.json"))
+        self.assertEqual(self.load().retrieve_list(),
+                         {"a": contest("A"), "b": contest("B")})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for the execution of the actions of cmsMake.
+
+"""
+
+import functools
+import os
+import threading
+import unittest
+
+from cmstaskenv.cmsMake import build_execution_tree, \
+    execute_multiple_targets
+from cmstestsuite.unit_tests.filesystemmixin import FileSystemMixin
+
+
+class TestExecuteMultipleTargets(FileSystemMixin, unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.write_file("src", b"source")
+        self.lock = threading.Lock()
+        self.executed = []
+
+    def concatenate(self, infiles, outfile, assume=None):
+        """Write to outfile the content of the infiles."""
+        with self.lock:
+            self.executed.append(outfile)
+        content = b"".join(open(self.get_path(infile), "rb").read()
+                           for infile in infiles)
+        self.write_file(outfile, content)
+
+    def failing(self, assume=None):
+        raise RuntimeError("failed")
+
+    def action(self, infiles, outfile, recipe=None):
+        return (infiles, [outfile],
+                functools.partial(self.concatenate, infiles, outfile),
+                "concatenate", recipe)
+
+    def make(self, actions, jobs=4):
+        self.executed = []
+        exec_tree, generated_list = build_execution_tree(actions)
+        execute_multiple_targets(self.base_dir, exec_tree, generated_list,
+                                 jobs=jobs)
+        return sorted(self.executed)
+
+    def read(self, inner_path):
+        with open(self.get_path(inner_path), "rb") as f:
+            return f.read()
+
+    def actions(self, recipe=None):
+        return [self.action(["a%d" % i for i in range(10)], "all"),
+                self.action(["b"], "c")] + \
+            [self.action(["src"], "a%d" % i, recipe if i == 0 else None)
+             for i in range(10)] + \
+            [self.action(["src", "a0"], "b")]
+
+    def test_build(self):
+        self.assertEqual(len(self.make(self.actions())), 13)
+        self.assertEqual(self.read("all"), b"source" * 10)
+        self.assertEqual(self.read("c"), b"sourcesource")
+
+    def test_serial(self):
+        self.assertEqual(len(self.make(self.actions(), jobs=1)), 13)
+        self.assertEqual(self.read("c"), b"sourcesource")
+
+    def test_incremental(self):
+        self.make(self.actions())
+        self.assertEqual(self.make(self.actions()), [])
+
+        # Only a0, whose recipe changed: its content did not, so what
+        # depends on it is not made again.
+        self.assertEqual(self.make(self.actions(recipe="new")), ["a0"])
+
+        # Everything, as the content of src changed.
+        self.write_file("src", b"new source")
+        self.assertEqual(len(self.make(self.actions(recipe="new"))), 13)
+        self.assertEqual(self.read("c"), b"new source" * 2)
+
+        # Targets that are missing are made again.
+        os.remove(self.get_path("c"))
+        self.assertEqual(self.make(self.actions(recipe="new")), ["c"])
+
+    def test_failure(self):
+        actions = self.actions()
+        actions[-1] = (["src", "a0"], ["b"], self.failing, "fail")
+        with self.assertRaises(RuntimeError):
+            self.make(actions)
+        executed = set(self.executed)
+        self.assertNotIn("c", executed)
+
+        # What was made is not made again.
+        self.assertEqual(self.make(self.actions()),
+                         sorted({"all", "b", "c"} - executed))
+
+    def test_circular(self):
+        with self.assertRaises(Exception):
+            self.make([self.action(["x"], "y"), self.action(["y"], "x")])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for the skipped evaluations of the results of a dataset."""
+
+import unittest
+
+# Needs to be first to allow for monkey patching the DB connection string.
+from cmstestsuite.unit_tests.databasemixin import DatabaseMixin
+
+from cms.db import SubmissionResult
+
+
+class TestSkippedEvaluations(DatabaseMixin, unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.contest = self.add_contest()
+        self.participation = self.add_participation(contest=self.contest)
+        self.task = self.add_task(contest=self.contest)
+        self.dataset = self.add_dataset(task=self.task)
+        self.task.active_dataset = self.dataset
+        self.testcases = [self.add_testcase(self.dataset) for _ in range(2)]
+
+        # A submission with a skipped testcase, and one without.
+        self.skipped_sr = self.add_evaluated_result([0.0, None])
+        self.complete_sr = self.add_evaluated_result([1.0, 1.0])
+        self.session.commit()
+
+    def tearDown(self):
+        self.session.close()
+        self.delete_data()
+        super().tearDown()
+
+    def add_evaluated_result(self, outcomes):
+        submission = self.add_submission(self.task, self.participation)
+        sr = self.add_submission_result(submission, self.dataset)
+        sr.set_compilation_outcome(True)
+        for testcase, outcome in zip(self.testcases, outcomes):
+            self.add_evaluation(sr, testcase,
+                                outcome=None if outcome is None
+                                else str(outcome))
+        sr.set_evaluation_outcome()
+        sr.score = 0.0
+        return sr
+
+    def outcomes(self, sr):
+        return sorted(evaluation.outcome is None
+                      for evaluation in sr.evaluations)
+
+    def test_drop_skipped_evaluations(self):
+        self.assertEqual(self.dataset.drop_skipped_evaluations(), 1)
+        self.session.commit()
+        self.session.expire_all()
+
+        self.assertFalse(self.skipped_sr.evaluated())
+        self.assertIsNone(self.skipped_sr.score)
+        self.assertEqual(self.outcomes(self.skipped_sr), [False])
+        self.assertTrue(self.complete_sr.evaluated())
+        self.assertEqual(self.outcomes(self.complete_sr), [False, False])
+
+        self.assertEqual(self.dataset.drop_skipped_evaluations(), 0)
+
+    def test_clone_results(self):
+        new_dataset = self.add_dataset(task=self.task)
+        new_dataset.clone_from(self.dataset, clone_results=True)
+        self.session.commit()
+
+        results = {sr.submission_id: sr for sr in self.session
+                   .query(SubmissionResult)
+                   .filter(SubmissionResult.dataset == new_dataset)}
+        skipped_sr = results[self.skipped_sr.submission_id]
+        self.assertFalse(skipped_sr.evaluated())
+        self.assertIsNone(skipped_sr.score)
+        self.assertEqual(self.outcomes(skipped_sr), [False])
+        complete_sr = results[self.complete_sr.submission_id]
+        self.assertTrue(complete_sr.evaluated())
+        self.assertEqual(self.outcomes(complete_sr), [False, False])
+
+        # The original results are untouched.
+        self.assertEqual(self.outcomes(self.skipped_sr), [False, True])
+
+
+if __name__ == "__main__":
+    unittest.main()
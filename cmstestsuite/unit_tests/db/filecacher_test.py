@@ -26,13 +26,18 @@
 import os
 import random
 import shutil
+import stat
+import tempfile
 import unittest
-from io import BytesIO
+from io import BytesIO, StringIO
+from unittest.mock import patch
+
+import gevent.monkey
 
 # Needs to be first to allow for monkey patching the DB connection string.
 from cmstestsuite.unit_tests.databasemixin import DatabaseMixin
 
-from cms.db.filecacher import FileCacher
+from cms.db.filecacher import FileCacher, clonefileobj, copyfileobj
 from cmscommon.digest import Digester, bytes_digest
 
 
@@ -285,6 +290,75 @@ class TestFileCacherBase:
             else:
                 self.fail("Content differ.")
 
+    def test_file_to_disk(self):
+        """Retrieve a file into files on the disk, which might be
+        cloned instead of copied.
+
+        """
+        self.content = bytes(random.getrandbits(8) for _ in range(100))
+        self.digest = self.file_cacher.put_file_content(self.content,
+                                                        "Test #006")
+
+        path = os.path.join(self.file_cacher.temp_dir, "dst")
+        with open(path, "wb") as dst:
+            self.file_cacher.get_file_to_fobj(self.digest, dst)
+            dst.write(b"after")
+        with open(path, "rb") as dst:
+            self.assertEqual(dst.read(), self.content + b"after")
+
+        # A non-empty destination is appended to.
+        with open(path, "ab") as dst:
+            self.file_cacher.get_file_to_fobj(self.digest, dst)
+        with open(path, "rb") as dst:
+            self.assertEqual(dst.read(),
+                             self.content + b"after" + self.content)
+
+    def test_existing(self):
+        """Ask the backend which files it stores."""
+        self.content = bytes(random.getrandbits(8) for _ in range(100))
+        self.digest = self.file_cacher.put_file_content(self.content,
+                                                        "Test #008")
+        self.assertEqual(
+            self.file_cacher.backend.existing([self.digest, "0" * 40]),
+            {self.digest})
+
+    def test_link_file(self):
+        """Retrieve a file as a read-only hard link to the cache."""
+        self.content = bytes(random.getrandbits(8) for _ in range(100))
+        self.digest = self.file_cacher.put_file_content(self.content,
+                                                        "Test #007")
+        self.cache_path = os.path.join(self.cache_base_path, self.digest)
+        os.unlink(self.cache_path)
+
+        path = os.path.join(self.file_cacher.temp_dir, "link")
+        self.assertTrue(self.file_cacher.link_file_to_path(self.digest, path))
+        self.assertTrue(os.path.samefile(path, self.cache_path))
+        self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o444)
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), self.content)
+
+        # The destination must not exist.
+        self.assertFalse(
+            self.file_cacher.link_file_to_path(self.digest, path))
+
+    def test_cached_path(self):
+        """Retrieve the path of a file in the cache."""
+        self.content = bytes(random.getrandbits(8) for _ in range(100))
+        self.digest = self.file_cacher.put_file_content(self.content,
+                                                        "Test #009")
+        self.cache_path = os.path.join(self.cache_base_path, self.digest)
+        os.unlink(self.cache_path)
+
+        path = self.file_cacher.get_cached_path(self.digest)
+        self.assertTrue(os.path.isabs(path))
+        self.assertTrue(os.path.samefile(path, self.cache_path))
+        self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o444)
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), self.content)
+
+        with self.assertRaises(KeyError):
+            self.file_cacher.get_cached_path("0" * 40)
+
     def test_big_file(self):
         """Put a ~10MB file into the storage (using a specially
         crafted file-like object).
@@ -378,5 +452,344 @@ class TestFileCacherFS(TestFileCacherBase, unittest.TestCase):
         shutil.rmtree("fs-storage", ignore_errors=True)
 
 
+class TestFileCacherEviction(unittest.TestCase):
+    """Tests for the eviction of files from a bounded cache."""
+
+    def setUp(self):
+        super().setUp()
+        self.file_cacher = FileCacher(path="fs-storage")
+        self.file_cacher.max_size = 3000
+        self.time = 1000000
+
+    def tearDown(self):
+        shutil.rmtree("fs-storage", ignore_errors=True)
+
+    def cache_path(self, digest):
+        return os.path.join(self.file_cacher.file_dir, digest)
+
+    def put(self, cache_only=False):
+        """Add to the cache a 1000B file, newer than all others."""
+        digest = self.file_cacher.put_file_from_fobj(
+            BytesIO(os.urandom(1000)), cache_only=cache_only)
+        self.touch(digest)
+        return digest
+
+    def touch(self, digest):
+        self.time += 1
+        os.utime(self.cache_path(digest), (self.time, self.time))
+
+    def cached(self, digests):
+        return [os.path.exists(self.cache_path(digest))
+                for digest in digests]
+
+    def test_lru(self):
+        digests = [self.put() for _ in range(3)]
+        self.assertEqual(self.cached(digests), [True] * 3)
+
+        # Using the oldest file makes it the most recent.
+        self.file_cacher.get_file(digests[0]).close()
+        self.touch(digests[0])
+        digests.append(self.put())
+
+        # Cache brought down to 90% of the maximum size.
+        self.assertEqual(self.cached(digests), [True, False, False, True])
+        stats = self.file_cacher.get_cache_stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["evictions"], 2)
+        self.assertEqual(stats["evicted_bytes"], 2000)
+        self.assertEqual(stats["size"], 2000)
+
+        # Evicted files are downloaded again.
+        self.file_cacher.get_file(digests[1]).close()
+        self.assertEqual(self.file_cacher.get_cache_stats()["misses"], 1)
+        self.assertTrue(os.path.exists(self.cache_path(digests[1])))
+
+    def test_pinned(self):
+        digests = [self.put() for _ in range(3)]
+        self.file_cacher.pin(digests[:1])
+        digests.append(self.put())
+
+        self.assertEqual(self.cached(digests), [True, False, False, True])
+
+    def test_pinned_by_processes(self):
+        """The files pinned by each running process are protected."""
+        digests = [self.put() for _ in range(3)]
+        self.file_cacher.pin(digests[:1])
+        # Another running process (our parent) pins another file.
+        with open(os.path.join(self.file_cacher.file_dir,
+                               "pinned.%d" % os.getppid()), "wt") as f:
+            f.write("%s\n" % digests[1])
+        # A process that is not running anymore, whose file is ignored.
+        dead = os.path.join(self.file_cacher.file_dir, "pinned.999999999")
+        with open(dead, "wt") as f:
+            f.write("%s\n" % digests[2])
+        digests.append(self.put(cache_only=True))
+
+        self.assertEqual(self.cached(digests), [True, True, False, True])
+        self.assertFalse(os.path.exists(dead))
+
+    def test_over_limit_backoff(self):
+        """When nothing can be evicted, don't retry at every file."""
+        self.file_cacher.EVICTION_TARGET = 0.5
+        for _ in range(4):
+            self.put(cache_only=True)
+        self.assertEqual(self.file_cacher.get_cache_stats()["size"], 4000)
+
+        with patch.object(self.file_cacher, "evict_cache",
+                          wraps=self.file_cacher.evict_cache) as evict:
+            # Still within the margin of the last eviction.
+            self.put(cache_only=True)
+            self.assertEqual(evict.call_count, 0)
+            # Unpinning files may allow to evict some.
+            self.file_cacher.pin([])
+            digest = self.file_cacher.put_file_from_fobj(
+                BytesIO(os.urandom(1000)))
+            self.assertEqual(evict.call_count, 1)
+            self.assertEqual(self.cached([digest]), [False])
+            self.put(cache_only=True)
+            self.assertEqual(evict.call_count, 1)
+            self.put(cache_only=True)
+            self.assertEqual(evict.call_count, 2)
+
+    def test_cache_only(self):
+        """Files not in the backend are never evicted."""
+        digests = [self.put(cache_only=True), self.put(), self.put()]
+        digests.append(self.put())
+
+        self.assertEqual(self.cached(digests), [True, False, False, True])
+
+    def test_cached_path_evicted(self):
+        """A file evicted while getting its path is loaded again."""
+        digest = self.put()
+        load = self.file_cacher._load
+        evictions = [digest]
+
+        def load_and_evict(digest, cache_only):
+            fobj = load(digest, cache_only)
+            if evictions:
+                self.file_cacher.drop(evictions.pop())
+            return fobj
+
+        with patch.object(self.file_cacher, "_load", load_and_evict):
+            path = self.file_cacher.get_cached_path(digest)
+        self.assertEqual(path, os.path.abspath(self.cache_path(digest)))
+        self.assertTrue(os.path.exists(path))
+
+    def test_cached_path_always_evicted(self):
+        """A file that cannot stay in the cache has no path."""
+        digest = self.put()
+        load = self.file_cacher._load
+
+        def load_and_evict(digest, cache_only):
+            fobj = load(digest, cache_only)
+            self.file_cacher.drop(digest)
+            return fobj
+
+        with patch.object(self.file_cacher, "_load", load_and_evict):
+            self.assertIsNone(self.file_cacher.get_cached_path(digest))
+
+    def test_unbounded(self):
+        self.file_cacher.max_size = 0
+        digests = [self.put() for _ in range(4)]
+        self.assertEqual(self.cached(digests), [True] * 4)
+        self.assertIsNone(self.file_cacher.get_cache_stats()["size"])
+
+
+class TestFSBackend(unittest.TestCase):
+    """Tests for the layout of the file-system backend."""
+
+    def setUp(self):
+        super().setUp()
+        self.file_cacher = FileCacher(path="fs-storage")
+        self.backend = self.file_cacher.backend
+
+    def tearDown(self):
+        shutil.rmtree("fs-storage", ignore_errors=True)
+
+    def put_flat(self, content):
+        """Store a file in the root, as before the sharding."""
+        digest = bytes_digest(content)
+        with open(os.path.join("fs-storage", digest), "wb") as f:
+            f.write(content)
+        return digest
+
+    def test_sharded(self):
+        content = os.urandom(100)
+        digest = self.file_cacher.put_file_content(content)
+
+        self.assertTrue(os.path.isfile(
+            os.path.join("fs-storage", digest[:2], digest)))
+        self.assertEqual(self.backend.list(), [(digest, "")])
+        with self.backend.get_file(digest) as f:
+            self.assertEqual(f.read(), content)
+
+    def test_migrate(self):
+        content = os.urandom(100)
+        digest = self.put_flat(content)
+        # A relative link, as made by setup_fs_storage.sh.
+        os.mkdir("fs-storage-orig")
+        self.addCleanup(shutil.rmtree, "fs-storage-orig")
+        link_content = os.urandom(100)
+        link_digest = bytes_digest(link_content)
+        with open(os.path.join("fs-storage-orig", "file"), "wb") as f:
+            f.write(link_content)
+        os.symlink(os.path.join("..", "fs-storage-orig", "file"),
+                   os.path.join("fs-storage", link_digest))
+
+        # Files in the root are found before the migration...
+        self.assertCountEqual(self.backend.existing([digest, link_digest]),
+                              [digest, link_digest])
+        self.assertEqual(self.backend.migrate(), 2)
+
+        # ... and in their subdirectory after it.
+        self.assertCountEqual(os.listdir("fs-storage"),
+                              {digest[:2], link_digest[:2]})
+        self.assertCountEqual(self.backend.list(),
+                              [(digest, ""), (link_digest, "")])
+        for d, c in [(digest, content), (link_digest, link_content)]:
+            with self.backend.get_file(d) as f:
+                self.assertEqual(f.read(), c)
+        self.assertEqual(self.backend.migrate(), 0)
+
+    def corrupt(self, digest):
+        with open(os.path.join("fs-storage", digest[:2], digest), "ab") as f:
+            f.write(b"corrupted")
+
+    def test_check_integrity(self):
+        digests = [self.file_cacher.put_file_content(os.urandom(100))
+                   for _ in range(3)]
+        self.assertTrue(self.file_cacher.check_backend_integrity())
+
+        self.corrupt(digests[0])
+        self.assertFalse(self.file_cacher.check_backend_integrity())
+        self.assertFalse(
+            self.file_cacher.check_backend_integrity(delete=True))
+        self.assertTrue(self.file_cacher.check_backend_integrity())
+        self.assertCountEqual(self.backend.list(),
+                              [(d, "") for d in digests[1:]])
+
+    def test_check_integrity_resume(self):
+        digests = [self.file_cacher.put_file_content(os.urandom(100))
+                   for _ in range(3)]
+        self.corrupt(digests[0])
+        progress_path = os.path.join("fs-storage", ".progress")
+
+        self.assertFalse(self.file_cacher.check_backend_integrity(
+            progress_path=progress_path))
+        with open(progress_path, "rt", encoding="utf-8") as f:
+            self.assertEqual(len(f.readlines()), 3)
+
+        # A new check with the same progress file doesn't read any
+        # file, but remembers the corrupted one.
+        with patch("cms.db.filecacher._compute_digest") as compute:
+            self.assertFalse(self.file_cacher.check_backend_integrity(
+                progress_path=progress_path))
+            compute.assert_not_called()
+            self.assertFalse(self.file_cacher.check_backend_integrity(
+                delete=True, progress_path=progress_path))
+        self.assertCountEqual(self.backend.list(),
+                              [(d, "") for d in digests[1:]])
+
+    def test_check_integrity_truncated_progress(self):
+        """A line cut short by an interruption is checked again."""
+        digests = [self.file_cacher.put_file_content(os.urandom(100))
+                   for _ in range(3)]
+        progress_path = os.path.join("fs-storage", ".progress")
+        with open(progress_path, "wt", encoding="utf-8") as f:
+            f.write("%s %s\n" % (digests[0], digests[0]))
+            f.write("%s %s" % (digests[1], digests[1][:10]))
+
+        self.assertTrue(self.file_cacher.check_backend_integrity(
+            progress_path=progress_path))
+        with open(progress_path, "rt", encoding="utf-8") as f:
+            self.assertCountEqual(
+                f.read().splitlines(),
+                ["%s %s" % (digest, digest) for digest in digests])
+        self.assertCountEqual(self.backend.list(),
+                              [(d, "") for d in digests])
+
+    def test_check_integrity_parallel(self):
+        if gevent.monkey.is_module_patched("threading"):
+            self.skipTest("The process pool needs real threads.")
+        digests = [self.file_cacher.put_file_content(os.urandom(100))
+                   for _ in range(20)]
+        self.assertTrue(
+            self.file_cacher.check_backend_integrity(processes=2))
+        self.corrupt(digests[5])
+        self.assertFalse(
+            self.file_cacher.check_backend_integrity(processes=2))
+
+
+class TestCopyFileObj(unittest.TestCase):
+    """Tests for copyfileobj."""
+
+    def test_growing_buffer(self):
+        content = os.urandom(1000)
+        src = BytesIO(content)
+        reads = []
+        readinto = src.readinto
+        src.readinto = lambda buf: reads.append(len(buf)) or readinto(buf)
+        dst = BytesIO()
+
+        copyfileobj(src, dst, 100, 400)
+
+        self.assertEqual(dst.getvalue(), content)
+        # The last read only finds the end of the file.
+        self.assertEqual(reads, [100, 200, 400, 400, 400])
+
+    def test_text(self):
+        dst = StringIO()
+        copyfileobj(StringIO("some text" * 100), dst, 64, 256)
+        self.assertEqual(dst.getvalue(), "some text" * 100)
+
+
+class TestCloneFileObj(unittest.TestCase):
+
+    def setUp(self):
+        self.base_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.base_dir)
+        self.content = bytes(random.getrandbits(8) for _ in range(1000))
+        self.source = os.path.join(self.base_dir, "source")
+        with open(self.source, "wb") as f:
+            f.write(self.content)
+        self.destination = os.path.join(self.base_dir, "destination")
+
+    @staticmethod
+    def fake_clone(destination_fd, request, source_fd):
+        """Clone like the ioctl would, without moving the offsets."""
+        size = os.fstat(source_fd).st_size
+        os.pwrite(destination_fd, os.pread(source_fd, size, 0), 0)
+
+    def test_positions(self):
+        with patch("cms.db.filecacher.fcntl.ioctl", self.fake_clone), \
+                open(self.source, "rb") as src, \
+                open(self.destination, "wb") as dst:
+            self.assertTrue(clonefileobj(src, dst))
+            # The same positions as after copyfileobj.
+            self.assertEqual(src.tell(), len(self.content))
+            self.assertEqual(dst.tell(), len(self.content))
+            dst.write(b"more")
+        with open(self.destination, "rb") as f:
+            self.assertEqual(f.read(), self.content + b"more")
+
+    def test_not_at_beginning(self):
+        with patch("cms.db.filecacher.fcntl.ioctl", self.fake_clone), \
+                open(self.source, "rb") as src, \
+                open(self.destination, "wb") as dst:
+            src.read(10)
+            self.assertFalse(clonefileobj(src, dst))
+            self.assertEqual(src.tell(), 10)
+            self.assertEqual(dst.tell(), 0)
+
+    def test_unsupported(self):
+        with patch("cms.db.filecacher.fcntl.ioctl",
+                   side_effect=OSError()), \
+                open(self.source, "rb") as src, \
+                open(self.destination, "wb") as dst:
+            self.assertFalse(clonefileobj(src, dst))
+            self.assertEqual(src.tell(), 0)
+            self.assertEqual(dst.tell(), 0)
+
+
 if __name__ == "__main__":
     unittest.main()
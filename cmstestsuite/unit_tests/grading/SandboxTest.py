@@ -20,9 +20,15 @@
 """Tests for general utility functions."""
 
 import io
+import os
+import stat
+import tempfile
 import unittest
+from unittest.mock import MagicMock, patch
 
-from cms.grading.Sandbox import Truncator
+from cms import config, rmtree
+from cms.grading.Sandbox import IsolateSandbox, SandboxInterfaceException, \
+    SandboxPool, Truncator
 
 
 class TestTruncator(unittest.TestCase):
@@ -62,5 +68,196 @@ class TestTruncator(unittest.TestCase):
         self.perform_truncator_test(100, 40, 7)
 
 
+class TestSandboxPool(unittest.TestCase):
+    """Test the class SandboxPool."""
+
+    def setUp(self):
+        self.pool = SandboxPool(2)
+
+    def new_sandbox(self, resettable=True):
+        sandbox = MagicMock()
+        sandbox.reset.return_value = resettable
+        return sandbox
+
+    def test_empty(self):
+        self.assertIsNone(self.pool.acquire(None, "evaluate"))
+
+    def test_reuse(self):
+        sandbox = self.new_sandbox()
+        self.assertTrue(self.pool.release(sandbox))
+        sandbox.reset.assert_called_once_with()
+
+        file_cacher = MagicMock()
+        self.assertIs(self.pool.acquire(file_cacher, "check"), sandbox)
+        self.assertIs(sandbox.file_cacher, file_cacher)
+        self.assertEqual(sandbox.name, "check")
+        self.assertIsNone(self.pool.acquire(file_cacher, "check"))
+        sandbox.cleanup.assert_not_called()
+
+    def test_full(self):
+        sandboxes = [self.new_sandbox() for _ in range(3)]
+        self.assertEqual([self.pool.release(s) for s in sandboxes],
+                         [True, True, False])
+        sandboxes[2].reset.assert_not_called()
+
+    def test_disabled(self):
+        pool = SandboxPool()
+        sandbox = self.new_sandbox()
+        self.assertFalse(pool.release(sandbox))
+        sandbox.reset.assert_not_called()
+
+    def test_not_resettable(self):
+        sandbox = self.new_sandbox(resettable=False)
+        self.assertFalse(self.pool.release(sandbox))
+        self.assertIsNone(self.pool.acquire(None))
+
+    def test_resize_and_clear(self):
+        sandboxes = [self.new_sandbox() for _ in range(2)]
+        for sandbox in sandboxes:
+            self.pool.release(sandbox)
+
+        self.pool.resize(1)
+        self.assertEqual(
+            sum(s.cleanup.call_count for s in sandboxes), 1)
+        self.pool.clear()
+        for sandbox in sandboxes:
+            sandbox.cleanup.assert_called_once_with(delete=True)
+        self.assertIsNone(self.pool.acquire(None))
+
+
+class TestIsolateSandbox(unittest.TestCase):
+    """Test the file management of IsolateSandbox, without running
+    isolate.
+
+    """
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(rmtree, self.temp_dir)
+        patcher = patch.object(config, "temp_dir", self.temp_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch.object(IsolateSandbox, "box_ids_in_use", set())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        # Isolate prints the path of the box it creates.
+        self.isolate_dir = os.path.join(self.temp_dir, "isolate")
+        os.makedirs(os.path.join(self.isolate_dir, "box"))
+        patcher = patch("cms.grading.Sandbox.subprocess")
+        self.subprocess = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.subprocess.check_output.return_value = \
+            ("%s\n" % self.isolate_dir).encode()
+
+        # A file cacher with a single file, linked or copied from here.
+        self.cached_file = os.path.join(self.temp_dir, "cached")
+        with open(self.cached_file, "wb") as f:
+            f.write(b"input")
+        os.chmod(self.cached_file, 0o444)
+        self.file_cacher = MagicMock()
+        self.file_cacher.link_file_to_path.side_effect = \
+            lambda digest, path: os.link(self.cached_file, path) or True
+        self.file_cacher.get_file_to_fobj.side_effect = \
+            lambda digest, fobj: fobj.write(b"input")
+
+        self.sandbox = IsolateSandbox(self.file_cacher, name="evaluate")
+        self.subprocess.reset_mock()
+
+    def mode(self, path):
+        return stat.S_IMODE(os.stat(self.sandbox.relative_path(path)).st_mode)
+
+    def test_linked_file(self):
+        with patch.object(config, "hardlink_sandbox_files", True):
+            self.sandbox.create_file_from_storage("input.txt", "digest")
+            self.sandbox.create_file_from_storage("exe", "digest",
+                                                  executable=True)
+
+        self.assertTrue(os.path.samefile(
+            self.sandbox.relative_path("input.txt"), self.cached_file))
+        self.assertFalse(os.path.samefile(
+            self.sandbox.relative_path("exe"), self.cached_file))
+        self.assertEqual(self.mode("exe"), 0o755)
+
+        # The permissions of the cached file are never changed.
+        self.sandbox.allow_writing_all()
+        self.assertEqual(self.mode("exe"), 0o777)
+        self.sandbox.allow_writing_only(["input.txt", "output.txt"])
+        self.assertEqual(self.mode("output.txt"), 0o722)
+        self.assertEqual(self.mode("input.txt"), 0o444)
+
+        self.assertTrue(self.sandbox.reset())
+        with open(self.cached_file, "rb") as f:
+            self.assertEqual(f.read(), b"input")
+
+    def test_hard_link_by_contestant(self):
+        """A hard link made in the sandbox does not keep a file writable."""
+        self.sandbox.allow_writing_only(["output.txt"])
+        os.link(self.sandbox.relative_path("output.txt"),
+                self.sandbox.relative_path("link"))
+        self.sandbox.allow_writing_none()
+        self.assertEqual(self.mode("output.txt"), 0o755)
+
+    def test_copied_file(self):
+        with patch.object(config, "hardlink_sandbox_files", False):
+            self.sandbox.create_file_from_storage("input.txt", "digest")
+
+        self.file_cacher.link_file_to_path.assert_not_called()
+        self.assertFalse(os.path.samefile(
+            self.sandbox.relative_path("input.txt"), self.cached_file))
+        self.assertEqual(self.mode("input.txt"), 0o644)
+
+    def test_reset(self):
+        with open(self.sandbox.relative_path("output.txt"), "wb") as f:
+            f.write(b"secret")
+        os.mkdir(self.sandbox.relative_path("dir"))
+        with open(os.path.join(self.isolate_dir, "box", "leftover"),
+                  "wb") as f:
+            f.write(b"secret")
+        with open(self.sandbox.cmd_file, "wt") as f:
+            f.write("command\n")
+        self.sandbox.exec_num = 3
+        self.sandbox.timeout = 1.0
+        self.sandbox.stdin_file = "input.txt"
+        self.sandbox.set_multiprocess(True)
+        self.sandbox.add_mapped_directory("/fifo")
+
+        self.assertTrue(self.sandbox.reset())
+
+        self.assertEqual(os.listdir(self.sandbox.relative_path("")), [])
+        self.assertEqual(os.listdir(os.path.join(self.isolate_dir, "box")),
+                         [])
+        self.assertFalse(os.path.exists(self.sandbox.cmd_file))
+        self.assertEqual(self.sandbox.exec_num, -1)
+        self.assertIsNone(self.sandbox.timeout)
+        self.assertIsNone(self.sandbox.stdin_file)
+        self.assertEqual(self.sandbox.max_processes, 1)
+        self.assertNotIn("/fifo", [src for src, _, _ in self.sandbox.dirs])
+        # The box was not touched.
+        self.subprocess.check_output.assert_not_called()
+        self.subprocess.call.assert_not_called()
+
+    def test_reset_unknown_box(self):
+        self.sandbox._box_dir = None
+        self.assertFalse(self.sandbox.reset())
+
+    def test_box_ids(self):
+        """Box ids in use are not assigned to other sandboxes."""
+        # The next id in the sequence is the one in use.
+        with patch.object(IsolateSandbox, "next_id", self.sandbox.box_id):
+            other = IsolateSandbox(None, name="check")
+        self.assertNotEqual(other.box_id, self.sandbox.box_id)
+        other.cleanup(delete=True)
+        self.assertNotIn(other.box_id, IsolateSandbox.box_ids_in_use)
+        self.assertIn(self.sandbox.box_id, IsolateSandbox.box_ids_in_use)
+
+    def test_box_ids_exhausted(self):
+        """No sandbox is created when all the box ids are in use."""
+        with patch.object(IsolateSandbox, "box_ids_in_use", set(range(10))):
+            with self.assertRaises(SandboxInterfaceException):
+                IsolateSandbox(None, name="check")
+        self.subprocess.check_output.assert_not_called()
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -157,6 +157,59 @@ class TestGroupMin(ScoreTypeTestMixin, unittest.TestCase):
         self.assertComputeScore(gmin.compute_score(sr),
                                 s2 + s3 * 0.1, 0.0, [0, s2, s3 * 0.1])
 
+    def test_testcases_to_skip(self):
+        parameters = [[10, "1_*"], [30, "2_*"], [60, "[23]_*"]]
+        gmin = GroupMin(parameters, self._public_testcases)
+
+        self.assertEqual(gmin.testcases_to_skip({}), set())
+        self.assertEqual(gmin.testcases_to_skip({"1_0": 0.5}), set())
+        self.assertEqual(gmin.testcases_to_skip({"1_0": 0.0}), {"1_1"})
+        # 2_0 decides both groups containing it.
+        self.assertEqual(gmin.testcases_to_skip({"2_0": 0.0}),
+                         {"2_1", "3_0", "3_1"})
+        # 2_* are also in the second subtask, which is not decided yet.
+        self.assertEqual(gmin.testcases_to_skip({"3_0": 0.0}), {"3_1"})
+        self.assertEqual(gmin.testcases_to_skip({"2_0": 1.0, "3_0": 0.0}),
+                         {"3_1"})
+
+    def test_compute_score_skipped(self):
+        s1, s2, s3 = 10.5, 30.5, 59
+        parameters = [[s1, "1_*"], [s2, "2_*"], [s3, "3_*"]]
+        gmin = GroupMin(parameters, self._public_testcases)
+        sr = self.get_submission_result(self._public_testcases)
+
+        # The score is the same as if the skipped testcases were correct.
+        self.set_outcome(sr, "1_1", 0.0)
+        self.set_outcome(sr, "1_0", None)
+        self.set_outcome(sr, "3_0", 0.0)
+        self.set_outcome(sr, "3_1", None)
+        scores = gmin.compute_score(sr)
+        self.assertComputeScore(scores, s2, 0.0, [0, s2, 0])
+
+        # Skipped testcases are shown as such, and do not block the
+        # restricted feedback.
+        testcases = scores[1][0]["testcases"]
+        self.assertEqual([tc["outcome"] for tc in testcases],
+                         ["Skipped", "Not correct"])
+        self.assertEqual([tc["show_in_restricted_feedback"]
+                          for tc in testcases], [True, True])
+
+    def test_compute_score_skipped_regrouped(self):
+        """Skipped testcases in a group without a decisive outcome (as
+        after a change of the groups) count as failed.
+
+        """
+        s1, s2 = 10.5, 30.5
+        parameters = [[s1, "1_*|3_0"], [s2, "2_*|3_1"]]
+        gmin = GroupMin(parameters, self._public_testcases)
+        sr = self.get_submission_result(self._public_testcases)
+
+        # 3_1 was skipped because 3_0 failed, but they are now in
+        # different groups.
+        self.set_outcome(sr, "3_0", 0.0)
+        self.set_outcome(sr, "3_1", None)
+        self.assertComputeScore(gmin.compute_score(sr), 0.0, 0.0, [0, 0])
+
 
 if __name__ == "__main__":
     unittest.main()
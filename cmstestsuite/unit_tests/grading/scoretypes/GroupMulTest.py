@@ -157,6 +157,14 @@ class TestGroupMul(ScoreTypeTestMixin, unittest.TestCase):
                                 s2 + s3 * 0.5 * 0.1, 0.0,
                                 [0, s2, s3 * 0.5 * 0.1])
 
+    def test_testcases_to_skip(self):
+        parameters = [[10, "1_*"], [30, "2_*"], [60, "3_*"]]
+        gmul = GroupMul(parameters, self._public_testcases)
+
+        self.assertEqual(gmul.testcases_to_skip({"1_0": 0.5}), set())
+        self.assertEqual(gmul.testcases_to_skip({"1_0": 0.0, "2_1": 0.0}),
+                         {"1_1", "2_0"})
+
 
 if __name__ == "__main__":
     unittest.main()
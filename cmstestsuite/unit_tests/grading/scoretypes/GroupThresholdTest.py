@@ -173,6 +173,16 @@ class TestGroupThreshold(ScoreTypeTestMixin, unittest.TestCase):
         self.assertComputeScore(st.compute_score(sr),
                                 s2, 0.0, [0, s2, 0])
 
+    def test_testcases_to_skip(self):
+        parameters = [[10, "1_*", 10], [30, "2_*", 20], [60, "3_*", 30]]
+        st = GroupThreshold(parameters, self._public_testcases)
+
+        self.assertEqual(st.testcases_to_skip({"1_0": 5.5, "2_0": 15.5}),
+                         set())
+        # Both 0 and outcomes above the threshold make the group fail.
+        self.assertEqual(st.testcases_to_skip({"1_0": 0.0, "2_0": 25.5}),
+                         {"1_1", "2_1"})
+
 
 if __name__ == "__main__":
     unittest.main()
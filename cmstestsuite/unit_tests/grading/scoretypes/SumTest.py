@@ -78,6 +78,20 @@ class TestSum(ScoreTypeTestMixin, unittest.TestCase):
         self.assertComputeScore(st.compute_score(sr),
                                 testcase_score * 2.2, testcase_score * 0.2, [])
 
+    def test_compute_score_skipped(self):
+        """Evaluations skipped under another score type count as failed."""
+        testcase_score = 10.5
+        st = Sum(testcase_score, self._public_testcases)
+        sr = self.get_submission_result(self._public_testcases)
+
+        self.set_outcome(sr, "1", None)
+        self.set_outcome(sr, "2", 0.5)
+        scores = st.compute_score(sr)
+        self.assertComputeScore(scores, testcase_score * 2.5, 0.0, [])
+        self.assertEqual([tc["outcome"] for tc in scores[1]],
+                         ["Correct", "Skipped", "Partially correct",
+                          "Correct"])
+
 
 if __name__ == "__main__":
     unittest.main()
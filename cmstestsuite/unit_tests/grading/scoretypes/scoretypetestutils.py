@@ -44,6 +44,7 @@ class ScoreTypeTestMixin:
         evaluation = Mock()
         evaluation.codename = codename
         evaluation.outcome = outcome
+        evaluation.skipped.return_value = outcome is None
         evaluation.execution_memory = 100
         evaluation.execution_time = 0.5
         evaluation.text = "Nothing to report"
@@ -54,6 +55,7 @@ class ScoreTypeTestMixin:
         for evaluation in sr.evaluations:
             if evaluation.codename == codename:
                 evaluation.outcome = outcome
+                evaluation.skipped.return_value = outcome is None
                 return
         raise ValueError("set_outcome called for non-existing codename %s."
                          % codename)
@@ -26,7 +26,9 @@ from datetime import timedelta
 # Needs to be first to allow for monkey patching the DB connection string.
 from cmstestsuite.unit_tests.databasemixin import DatabaseMixin
 
-from cms.grading.scoring import task_score
+from cms.db import ParticipationTaskScore
+from cms.grading.scoring import get_task_scores, task_score, \
+    update_task_scores
 from cmscommon.constants import \
     SCORE_MODE_MAX, SCORE_MODE_MAX_SUBTASK, SCORE_MODE_MAX_TOKENED_LAST
 from cmscommon.datetime import make_datetime
@@ -382,5 +384,72 @@ class TestTaskScoreMax(TaskScoreMixin, unittest.TestCase):
         self.assertEqual(self.call(rounded=True), (44.44, False))
 
 
+class TestTaskScores(TaskScoreMixin, unittest.TestCase):
+    """Tests for the cache of the scores on the tasks."""
+
+    def setUp(self):
+        super().setUp()
+        self.task.score_mode = SCORE_MODE_MAX_TOKENED_LAST
+        self.session.flush()
+        self.key = (self.participation.id, self.task.id)
+
+    def get(self):
+        return get_task_scores(self.session, self.participation.contest)
+
+    def cached(self):
+        return self.session.query(ParticipationTaskScore).get(self.key)
+
+    def test_no_submissions(self):
+        self.assertEqual(self.get(), {})
+
+    def test_cached(self):
+        self.add_result(self.at(1), 44.4)
+        self.add_result(self.at(2), 22.2)
+        self.session.flush()
+        self.assertEqual(self.get(), {self.key: (22.2, False)})
+        self.assertEqual(self.cached().score, 22.2)
+
+        # The cache is used when nothing changed.
+        self.cached().score = 11.1
+        self.assertEqual(self.get(), {self.key: (11.1, False)})
+
+    def test_stale(self):
+        self.add_result(self.at(1), 44.4)
+        self.session.flush()
+        self.assertEqual(self.get(), {self.key: (44.4, False)})
+
+        # A token changes the score for this score mode.
+        self.add_token(timestamp=self.at(1),
+                       submission=self.participation.submissions[0])
+        self.add_result(self.at(2), 22.2)
+        self.session.flush()
+        self.assertEqual(self.get(), {self.key: (44.4, False)})
+
+        # A submission not scored yet makes the score partial.
+        self.add_submission(participation=self.participation,
+                            task=self.task, timestamp=self.at(3))
+        self.session.flush()
+        self.assertEqual(self.get(), {self.key: (44.4, True)})
+
+        # A different active dataset, without results.
+        self.task.active_dataset = self.add_dataset(task=self.task)
+        self.session.flush()
+        self.assertEqual(self.get(), {self.key: (0.0, True)})
+
+    def test_update(self):
+        result = self.add_result(self.at(1), 44.4)
+        self.session.flush()
+        self.assertEqual(self.get(), {self.key: (44.4, False)})
+
+        # A score changed without anything else changing, as when a
+        # submission is scored again: only an update refreshes it.
+        self.participation.submissions[0].get_result().score = 55.5
+        self.session.flush()
+        self.assertEqual(self.get(), {self.key: (44.4, False)})
+        self.assertEqual(update_task_scores(self.session, {self.key}),
+                         {self.key: (55.5, False)})
+        self.assertEqual(self.get(), {self.key: (55.5, False)})
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -18,8 +18,10 @@
 
 """Tests for whitediff.py."""
 
+import random
 import unittest
 from io import BytesIO
+from unittest.mock import patch
 
 from cms.grading.steps import _WHITES, _white_diff
 
@@ -68,5 +70,53 @@ class TestWhiteDiff(unittest.TestCase):
         self.assertFalse(self._diff("1\n\n2", "1\n2"))
 
 
+class TestWhiteDiffChunked(TestWhiteDiff):
+    """Same tests, but with chunks so small that every token and run
+    of whitespaces crosses a chunk boundary.
+
+    """
+
+    def setUp(self):
+        patcher = patch("cms.grading.steps.whitediff._CHUNK_SIZE", 1)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class TestWhiteDiffAgainstLines(unittest.TestCase):
+    """Compare with a straightforward line by line implementation."""
+
+    ALPHABET = [b"1", b"a", b"\xe4"] + _WHITES + [b"\n"] * 3
+
+    @staticmethod
+    def _line_diff(s1, s2):
+        lines1 = [line.split() for line in s1.split(b"\n")]
+        lines2 = [line.split() for line in s2.split(b"\n")]
+        while len(lines1) > 0 and lines1[-1] == []:
+            lines1.pop()
+        while len(lines2) > 0 and lines2[-1] == []:
+            lines2.pop()
+        return lines1 == lines2
+
+    def _random_output(self, rng):
+        return b"".join(rng.choice(self.ALPHABET)
+                        for _ in range(rng.randint(0, 12)))
+
+    def test_random(self):
+        rng = random.Random(42)
+        for chunk_size in [1, 2, 3, 5, 1024]:
+            with patch("cms.grading.steps.whitediff._CHUNK_SIZE",
+                       chunk_size):
+                for _ in range(500):
+                    s1 = self._random_output(rng)
+                    # Make equal outputs likely enough.
+                    s2 = s1 if rng.random() < 0.3 \
+                        else self._random_output(rng)
+                    s2 = s2.replace(b" ", rng.choice(_WHITES[:2] + [b"  "]))
+                    self.assertEqual(
+                        _white_diff(BytesIO(s1), BytesIO(s2)),
+                        self._line_diff(s1, s2),
+                        "%r %r (chunk size %d)" % (s1, s2, chunk_size))
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -19,9 +19,16 @@
 """Tests for the utilities for task types."""
 
 import unittest
+from io import BytesIO
+from unittest.mock import MagicMock, patch
 
+from cms import config
 from cms.grading import Language
-from cms.grading.tasktypes import is_manager_for_compilation
+from cms.grading.Job import EvaluationJob
+from cms.grading.Sandbox import SandboxPool
+from cms.grading.tasktypes import create_sandbox, delete_sandbox, \
+    is_manager_for_compilation
+from cms.grading.tasktypes.util import eval_output
 
 
 class TestLanguage(Language):
@@ -91,5 +98,80 @@ class TestIsManagerForCompilation(unittest.TestCase):
         self.assertIsNotForCompilation("test.srcext1.")
 
 
+class TestSandboxReuse(unittest.TestCase):
+
+    def setUp(self):
+        patcher = patch.object(config, "keep_sandbox", False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch("cms.grading.tasktypes.util.sandbox_pool",
+                        SandboxPool(1))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch("cms.grading.tasktypes.util.Sandbox",
+                        MagicMock(side_effect=lambda *args, **kwargs:
+                                  MagicMock()))
+        self.Sandbox = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.file_cacher = MagicMock()
+
+    def test_reuse(self):
+        sandbox = create_sandbox(self.file_cacher, name="evaluate")
+        delete_sandbox(sandbox, success=True)
+        sandbox.cleanup.assert_not_called()
+
+        self.assertIs(create_sandbox(self.file_cacher, name="check"),
+                      sandbox)
+        self.assertEqual(sandbox.name, "check")
+        self.Sandbox.assert_called_once_with(self.file_cacher,
+                                             name="evaluate")
+
+    def test_failed_job_not_reused(self):
+        sandbox = create_sandbox(self.file_cacher, name="evaluate")
+        delete_sandbox(sandbox, success=False)
+        sandbox.cleanup.assert_called_once_with(delete=False)
+
+        self.assertIsNot(create_sandbox(self.file_cacher, name="evaluate"),
+                         sandbox)
+
+    def test_kept_sandbox_not_reused(self):
+        sandbox = create_sandbox(self.file_cacher, name="evaluate")
+        delete_sandbox(sandbox, success=True, keep_sandbox=True)
+        sandbox.cleanup.assert_called_once_with(delete=False)
+        sandbox.reset.assert_not_called()
+
+
+class TestEvalOutputWhiteDiff(unittest.TestCase):
+
+    def setUp(self):
+        self.files = {"correct": b"1 2\n", "equivalent": b"1  2",
+                      "wrong": b"1 3\n"}
+        self.file_cacher = MagicMock()
+        self.file_cacher.get_file.side_effect = \
+            lambda digest: BytesIO(self.files[digest])
+        self.job = EvaluationJob(output="correct")
+
+    def test_same_digest(self):
+        """Identical files are not even read."""
+        success, outcome, _ = eval_output(
+            self.file_cacher, self.job, None, user_output_digest="correct")
+        self.assertTrue(success)
+        self.assertEqual(outcome, 1.0)
+        self.file_cacher.get_file.assert_not_called()
+
+    def test_equivalent(self):
+        success, outcome, _ = eval_output(
+            self.file_cacher, self.job, None,
+            user_output_digest="equivalent")
+        self.assertTrue(success)
+        self.assertEqual(outcome, 1.0)
+
+    def test_wrong(self):
+        success, outcome, _ = eval_output(
+            self.file_cacher, self.job, None, user_output_digest="wrong")
+        self.assertTrue(success)
+        self.assertEqual(outcome, 0.0)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -20,6 +20,7 @@
 
 """
 
+import random
 import unittest
 
 import gevent
@@ -175,6 +176,100 @@ class TestPriorityQueue(unittest.TestCase):
         self.assertFalse(self.item_b in self.queue)
         self.queue._verify()
 
+    def test_many_items(self):
+        """Test a long sequence of random operations.
+
+        Timestamps are mostly, but not always, increasing, as in real
+        usage. The order of the queue is checked against a sorted
+        list of (priority, timestamp, index) tuples.
+
+        """
+        rnd = random.Random(42)
+        expected = {}
+        for i in range(2000):
+            item = FakeQueueItem(str(i))
+            priority = rnd.randrange(5)
+            timestamp = make_datetime(i if rnd.random() < 0.8
+                                      else rnd.randrange(i + 1))
+            self.queue.push(item, priority, timestamp)
+            expected[item] = (priority, timestamp, i)
+
+            if rnd.random() < 0.3 and len(expected) > 0:
+                removed = rnd.choice(list(expected))
+                self.queue.remove(removed)
+                del expected[removed]
+            if rnd.random() < 0.1 and len(expected) > 0:
+                changed = rnd.choice(list(expected))
+                priority = rnd.randrange(5)
+                self.queue.set_priority(changed, priority)
+                expected[changed] = (priority,) + expected[changed][1:]
+            if rnd.random() < 0.2 and len(expected) > 0:
+                top = self.queue.pop()
+                self.assertEqual(
+                    top.item, min(expected, key=expected.__getitem__))
+                del expected[top.item]
+        self.assertTrue(self.queue._verify())
+
+        order = sorted(expected, key=expected.__getitem__)
+        self.assertEqual([entry["item"]["_title"]
+                          for entry in self.queue.get_status()],
+                         [str(item) for item in order])
+        while len(expected) > 0:
+            top = self.queue.pop()
+            self.assertEqual(top.item, order[len(order) - len(expected)])
+            del expected[top.item]
+        self.assertTrue(self.queue._verify())
+
+    def test_get_status_page(self):
+        """Test that get_status returns the right page, in order."""
+        self.queue.push(self.item_a, PriorityQueue.PRIORITY_LOW,
+                        timestamp=make_datetime(1))
+        self.queue.push(self.item_b, PriorityQueue.PRIORITY_MEDIUM,
+                        timestamp=make_datetime(10))
+        self.queue.push(self.item_c, PriorityQueue.PRIORITY_MEDIUM,
+                        timestamp=make_datetime(5))
+        self.queue.push(self.item_d, PriorityQueue.PRIORITY_HIGH,
+                        timestamp=make_datetime(20))
+
+        def names(status):
+            return [entry["item"]["_title"] for entry in status]
+
+        self.assertEqual(names(self.queue.get_status()),
+                         ["d", "c", "b", "a"])
+        self.assertEqual(names(self.queue.get_status(1, 2)), ["c", "b"])
+        self.assertEqual(names(self.queue.get_status(3, 2)), ["a"])
+        self.assertEqual(names(self.queue.get_status(limit=0)), [])
+        self.assertEqual(self.queue.get_status(0, 1),
+                         [{"item": {"_title": "d"},
+                           "priority": PriorityQueue.PRIORITY_HIGH,
+                           "timestamp": 20}])
+
+    def test_get_summary(self):
+        """Test that the summary counts the entries by priority."""
+        self.assertEqual(self.queue.get_summary(),
+                         {"length": 0, "priorities": []})
+
+        self.queue.push(self.item_a, PriorityQueue.PRIORITY_LOW,
+                        timestamp=make_datetime(1))
+        self.queue.push(self.item_b, PriorityQueue.PRIORITY_MEDIUM,
+                        timestamp=make_datetime(10))
+        self.queue.push(self.item_c, PriorityQueue.PRIORITY_MEDIUM,
+                        timestamp=make_datetime(5))
+        self.queue.remove(self.item_c)
+        self.assertEqual(self.queue.get_summary(), {
+            "length": 2,
+            "priorities": [
+                {"priority": PriorityQueue.PRIORITY_MEDIUM,
+                 "count": 1, "oldest": 10},
+                {"priority": PriorityQueue.PRIORITY_LOW,
+                 "count": 1, "oldest": 1},
+            ]})
+
+        self.queue.pop()
+        self.queue.pop()
+        self.assertEqual(self.queue.get_summary(),
+                         {"length": 0, "priorities": []})
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -22,7 +22,9 @@
 
 """
 
+import json
 import socket
+import struct
 import unittest
 from unittest.mock import Mock, patch
 
@@ -429,6 +431,59 @@ class TestRPC(unittest.TestCase):
         self.assertFalse(self.servers[0].connected)
         sock.close()
 
+    def test_binary_protocol(self):
+        client = self.get_client(ServiceCoord("Foo", 0))
+        result = client.echo(value=42)
+        result.wait()
+        self.assertTrue(result.successful())
+        self.assertTrue(client._binary)
+        self.assertEqual(client._compression, "zlib")
+        self.assertTrue(self.servers[0]._binary)
+        self.assertEqual(self.servers[0]._compression, "zlib")
+
+    def test_binary_protocol_compressed(self):
+        client = self.get_client(ServiceCoord("Foo", 0))
+        # Long enough to be compressed.
+        value = ["Hello World"] * 10000
+        result = client.echo(value=value)
+        result.wait()
+        self.assertTrue(result.successful())
+        self.assertEqual(result.value, value)
+
+    @patch.object(RemoteServiceServer, "_accept_negotiation",
+                  return_value=False)
+    def test_line_protocol_old_server(self, unused_mock):
+        # A server not supporting the binary protocol answers the
+        # negotiation with an error, and the client keeps the old one.
+        client = self.get_client(ServiceCoord("Foo", 0))
+        result = client.echo(value="Hello World")
+        result.wait()
+        self.assertTrue(result.successful())
+        self.assertEqual(result.value, "Hello World")
+        self.assertFalse(client._binary)
+        self.assertFalse(self.servers[0]._binary)
+
+    def test_line_protocol_old_client(self):
+        sock = gevent.socket.create_connection((self.host, self.port))
+        sock.sendall(b'{"__id": "foo", "__method": "echo", '
+                     b'"__data": {"value": 42}}\r\n')
+        response = sock.makefile('rb').readline()
+        self.assertEqual(json.loads(response.decode('utf-8')),
+                         {"__id": "foo", "__data": 42, "__error": None})
+        self.assertFalse(self.servers[0]._binary)
+        sock.close()
+
+    def test_send_too_long_frame(self):
+        sock = gevent.socket.create_connection((self.host, self.port))
+        sock.sendall(b'{"__id": "foo", "__method": "__negotiate", '
+                     b'"__data": {"framing": ["binary"]}}\r\n')
+        sock.makefile('rb').readline()
+        sock.sendall(struct.pack("!IB", 16 * 1024 * 1024, 0))
+        self.sleep()
+        # Messages too long cause the connection to be closed.
+        self.assertFalse(self.servers[0].connected)
+        sock.close()
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for the RPC methods of AdminWebServer.
+
+"""
+
+import unittest
+from unittest.mock import patch
+
+# Needs to be first to allow for monkey patching the DB connection string.
+from cmstestsuite.unit_tests.databasemixin import DatabaseMixin
+
+from cms.server.admin.server import AdminWebServer
+from cms.service.EvaluationService import EvaluationService
+
+
+class TestSubmissionsStatus(DatabaseMixin, unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        AdminWebServer._submissions_status_cache = None
+        self.contest = self.add_contest()
+        self.participation = self.add_participation(contest=self.contest)
+        self.task = self.add_task(contest=self.contest)
+        self.dataset = self.add_dataset(task=self.task)
+        self.other_dataset = self.add_dataset(task=self.task)
+        self.task.active_dataset = self.dataset
+
+        other_contest = self.add_contest()
+        other_task = self.add_task(contest=other_contest)
+        other_task.active_dataset = self.add_dataset(task=other_task)
+        self.add_submission(
+            other_task, self.add_participation(contest=other_contest))
+
+    def tearDown(self):
+        self.delete_data()
+        super().tearDown()
+
+    def add_result(self, dataset=None):
+        submission = self.add_submission(self.task, self.participation)
+        return self.add_submission_result(
+            submission, dataset if dataset is not None else self.dataset)
+
+    def test_statuses(self):
+        self.add_submission(self.task, self.participation)
+        self.add_result(self.other_dataset)
+        self.add_result()
+        self.add_result().compilation_tries = \
+            EvaluationService.MAX_COMPILATION_TRIES
+        self.add_result().set_compilation_outcome(False)
+        self.add_result().set_compilation_outcome(True)
+        result = self.add_result()
+        result.set_compilation_outcome(True)
+        result.evaluation_tries = EvaluationService.MAX_EVALUATION_TRIES
+        result = self.add_result()
+        result.set_compilation_outcome(True)
+        result.set_evaluation_outcome()
+        result = self.add_result()
+        result.set_compilation_outcome(True)
+        result.set_evaluation_outcome()
+        result.score = result.public_score = 1.0
+        result.score_details = result.public_score_details = []
+        result.ranking_score_details = []
+        self.session.commit()
+
+        self.assertEqual(
+            AdminWebServer.submissions_status(self.contest.id),
+            {"compiling": 3, "max_compilations": 1, "compilation_fail": 1,
+             "evaluating": 1, "max_evaluations": 1, "scoring": 1,
+             "scored": 1, "total": 9})
+        self.assertEqual(
+            AdminWebServer.submissions_status(None)["total"], 10)
+        self.assertEqual(
+            AdminWebServer.submissions_status_by_task()[self.task.id][:3],
+            (self.task.name, self.contest.id, 7))
+
+    def test_cache(self):
+        self.add_result()
+        self.session.commit()
+        self.assertEqual(
+            AdminWebServer.submissions_status(self.contest.id)["total"], 1)
+        self.add_result()
+        self.session.commit()
+        self.assertEqual(
+            AdminWebServer.submissions_status(self.contest.id)["total"], 1)
+        with patch.object(AdminWebServer, "SUBMISSIONS_STATUS_TTL", -1.0):
+            self.assertEqual(
+                AdminWebServer.submissions_status(self.contest.id)["total"],
+                2)
+
+
+if __name__ == "__main__":
+    unittest.main()
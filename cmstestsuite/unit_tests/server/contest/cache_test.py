@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for the cache of the contests and participations of CWS.
+
+"""
+
+import unittest
+from unittest.mock import patch
+
+# Needs to be first to allow for monkey patching the DB connection string.
+from cmstestsuite.unit_tests.databasemixin import DatabaseMixin
+
+from sqlalchemy import event
+
+from cms.db import Session, engine
+from cms.server.contest.cache import ContestCache
+from cmscommon.datetime import make_datetime
+
+
+class TestContestCache(DatabaseMixin, unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.contest = self.add_contest()
+        self.task = self.add_task(contest=self.contest)
+        self.task.active_dataset = self.add_dataset(task=self.task)
+        self.participation = self.add_participation(contest=self.contest)
+        self.session.commit()
+        self.username = self.participation.user.username
+        self.cache = ContestCache()
+
+        self.sessions = []
+        self.statements = 0
+        event.listen(engine, "before_cursor_execute", self.count_statement)
+
+    def tearDown(self):
+        event.remove(engine, "before_cursor_execute", self.count_statement)
+        for session in self.sessions:
+            session.close()
+        super().tearDown()
+
+    def new_session(self):
+        session = Session()
+        self.sessions.append(session)
+        return session
+
+    def count_statement(self, *args):
+        self.statements += 1
+
+    def cached_contest(self, **kwargs):
+        """Return the contest in a new session, and the statements run."""
+        statements = self.statements
+        contest = self.cache.get_contest(self.new_session(), **kwargs)
+        if contest is not None:
+            # Access what the pages use.
+            for task in contest.tasks:
+                task.active_dataset.time_limit
+                list(task.statements)
+        return contest, self.statements - statements
+
+    def cached_participation(self):
+        statements = self.statements
+        participation = self.cache.get_participation(
+            self.new_session(), self.contest, self.username)
+        if participation is not None:
+            participation.user.username
+            participation.team
+        return participation, self.statements - statements
+
+    def test_contest(self):
+        contest, statements = self.cached_contest(contest_id=self.contest.id)
+        self.assertEqual(contest.name, self.contest.name)
+        self.assertGreater(statements, 0)
+        contest, statements = self.cached_contest(contest_id=self.contest.id)
+        self.assertEqual([t.name for t in contest.tasks], [self.task.name])
+        self.assertEqual(statements, 0)
+
+        contest, statements = self.cached_contest(name=self.contest.name)
+        self.assertEqual(contest.id, self.contest.id)
+        contest, statements = self.cached_contest(name=self.contest.name)
+        self.assertEqual(statements, 0)
+
+    def test_missing(self):
+        contest, _ = self.cached_contest(name="missing")
+        self.assertIsNone(contest)
+        # Not found yet, it could be created at any time.
+        contest, statements = self.cached_contest(name="missing")
+        self.assertGreater(statements, 0)
+
+    def test_invalidate(self):
+        self.cached_contest(contest_id=self.contest.id)
+        self.cached_participation()
+        self.contest.description = "new"
+        self.session.commit()
+        contest, _ = self.cached_contest(contest_id=self.contest.id)
+        self.assertNotEqual(contest.description, "new")
+
+        self.cache.invalidate()
+        contest, _ = self.cached_contest(contest_id=self.contest.id)
+        self.assertEqual(contest.description, "new")
+        _, statements = self.cached_participation()
+        self.assertGreater(statements, 0)
+
+    def test_participation(self):
+        participation, statements = self.cached_participation()
+        self.assertEqual(participation.id, self.participation.id)
+        self.assertGreater(statements, 0)
+        _, statements = self.cached_participation()
+        self.assertEqual(statements, 0)
+
+        self.cached_contest(contest_id=self.contest.id)
+        self.participation.starting_time = make_datetime()
+        self.session.commit()
+        self.cache.invalidate(self.contest.id, self.username)
+        participation, _ = self.cached_participation()
+        self.assertEqual(participation.starting_time,
+                         self.participation.starting_time)
+        # The contest is still cached.
+        _, statements = self.cached_contest(contest_id=self.contest.id)
+        self.assertEqual(statements, 0)
+
+    def test_expiry(self):
+        self.cached_participation()
+        with patch.object(ContestCache, "CACHE_TTL", -1.0):
+            _, statements = self.cached_participation()
+        self.assertGreater(statements, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
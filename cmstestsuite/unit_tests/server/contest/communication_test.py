@@ -28,7 +28,8 @@ from cmstestsuite.unit_tests.databasemixin import DatabaseMixin
 
 from cms.db import Question
 from cms.server.contest.communication import accept_question, \
-    QuestionsNotAllowed, UnacceptableQuestion, get_communications
+    CommunicationWatcher, QuestionsNotAllowed, UnacceptableQuestion, \
+    get_communications
 from cmscommon.datetime import make_datetime, make_timestamp
 
 
@@ -212,5 +213,103 @@ class TestGetCommunications(DatabaseMixin, unittest.TestCase):
         self.verify(ts, 5, [a_d, m_d, q_d])
 
 
+class TestCommunicationWatcher(DatabaseMixin, unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.timestamp = make_datetime()
+        self.contest = self.add_contest()
+        self.participation = self.add_participation(contest=self.contest)
+        self.other_participation = self.add_participation(
+            contest=self.contest)
+        self.session.flush()
+        self.watcher = CommunicationWatcher()
+
+    def at(self, timestamp):
+        return self.timestamp + timedelta(seconds=timestamp)
+
+    def get_latest(self, participation=None):
+        if participation is None:
+            participation = self.participation
+        return self.watcher.get_latest(self.session, participation)
+
+    def test_no_elements(self):
+        self.assertIsNone(self.get_latest())
+
+    def test_lookup(self):
+        self.add_announcement(timestamp=self.at(1), contest=self.contest)
+        self.add_message(timestamp=self.at(3),
+                         participation=self.participation)
+        q = self.add_question(question_timestamp=self.at(0),
+                              participation=self.participation)
+        q.reply_timestamp = self.at(2)
+        self.session.flush()
+        self.assertEqual(self.get_latest(), make_timestamp(self.at(3)))
+        self.assertEqual(self.get_latest(self.other_participation),
+                         make_timestamp(self.at(1)))
+
+    def test_notify(self):
+        self.assertIsNone(self.get_latest())
+        self.assertIsNone(self.get_latest(self.other_participation))
+
+        # Not looked up again, the report is needed.
+        self.add_message(timestamp=self.at(1),
+                         participation=self.participation)
+        self.session.flush()
+        self.assertIsNone(self.get_latest())
+        self.watcher.notify(participation_id=self.participation.id,
+                            timestamp=make_timestamp(self.at(1)))
+        self.assertEqual(self.get_latest(), make_timestamp(self.at(1)))
+        self.assertIsNone(self.get_latest(self.other_participation))
+
+        # Announcements are for all the participations of the contest.
+        self.watcher.notify(contest_id=self.contest.id,
+                            timestamp=make_timestamp(self.at(2)))
+        self.assertEqual(self.get_latest(), make_timestamp(self.at(2)))
+        self.assertEqual(self.get_latest(self.other_participation),
+                         make_timestamp(self.at(2)))
+
+    def test_check(self):
+        self.assertIsNone(self.get_latest())
+        self.assertIsNone(self.get_latest(self.other_participation))
+        subscriber = self.watcher.subscribe(self.participation)
+        other_subscriber = self.watcher.subscribe(self.other_participation)
+
+        # The report of the message is lost.
+        self.add_message(timestamp=self.at(1),
+                         participation=self.participation)
+        self.session.flush()
+        self.assertIsNone(self.get_latest())
+        self.watcher._last_check -= CommunicationWatcher.CHECK_INTERVAL
+        self.assertEqual(self.get_latest(), make_timestamp(self.at(1)))
+        self.assertTrue(self.watcher.wait(subscriber, 0.01))
+        self.assertFalse(self.watcher.wait(other_subscriber, 0.01))
+
+        # Already known, it does not wake up anyone again.
+        self.watcher._last_check -= CommunicationWatcher.CHECK_INTERVAL
+        self.assertEqual(self.get_latest(), make_timestamp(self.at(1)))
+        self.assertFalse(self.watcher.wait(subscriber, 0.01))
+
+    def test_wait(self):
+        subscriber = self.watcher.subscribe(self.participation)
+        other_subscriber = self.watcher.subscribe(self.other_participation)
+        self.assertFalse(self.watcher.wait(subscriber, 0.01))
+
+        self.watcher.notify(participation_id=self.participation.id,
+                            timestamp=make_timestamp(self.at(1)))
+        self.assertTrue(self.watcher.wait(subscriber, 0.01))
+        self.assertFalse(self.watcher.wait(subscriber, 0.01))
+        self.assertFalse(self.watcher.wait(other_subscriber, 0.01))
+
+        self.watcher.notify(username=self.participation.user.username)
+        self.assertTrue(self.watcher.wait(subscriber, 0.01))
+        self.assertFalse(self.watcher.wait(other_subscriber, 0.01))
+
+        # Announcements are for all the participations of the contest.
+        self.watcher.notify(contest_id=self.contest.id,
+                            timestamp=make_timestamp(self.at(2)))
+        self.assertTrue(self.watcher.wait(subscriber, 0.01))
+        self.assertTrue(self.watcher.wait(other_subscriber, 0.01))
+
 if __name__ == "__main__":
     unittest.main()
@@ -17,17 +17,21 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import io
+import os
 import random
+import tempfile
 import unittest
-from unittest.mock import Mock
+from unittest.mock import Mock, patch
 
+import gevent.socket
+from gevent import pywsgi
 from werkzeug.http import quote_header_value
 from werkzeug.test import Client, EnvironBuilder
 from werkzeug.wrappers import Response
 from werkzeug.wsgi import responder
 
 from cms.db.filecacher import TombstoneError
-from cms.server.file_middleware import FileServerMiddleware
+from cms.server.file_middleware import FileServerMiddleware, WSGIHandler
 from cmscommon.digest import bytes_digest
 
 
@@ -86,6 +90,7 @@ class TestFileByDigestMiddleware(unittest.TestCase):
         self.assertGreater(response.cache_control.max_age, 0)
         self.assertTrue(response.cache_control.private)
         self.assertFalse(response.cache_control.public)
+        self.assertEqual(response.content_length, len(self.content))
         self.assertEqual(response.get_data(), self.content)
 
         self.file_cacher.get_file.assert_called_once_with(self.digest)
@@ -160,5 +165,149 @@ class TestFileByDigestMiddleware(unittest.TestCase):
         self.assertEqual(response.status_code, 416)
 
 
+class TestFileServerMiddlewareSendfileHeader(TestFileByDigestMiddleware):
+    """Tests for the files served by the reverse proxy."""
+
+    def setUp(self):
+        super().setUp()
+        self.path = "/cache/" + self.digest
+        self.file_cacher.get_cached_path = Mock(return_value=self.path)
+        self.set_middleware("X-Accel-Redirect", "/cms-files/")
+
+    def set_middleware(self, header, prefix):
+        self.wsgi_app = FileServerMiddleware(
+            self.file_cacher, self.wrapped_wsgi_app,
+            sendfile_header=header, sendfile_prefix=prefix)
+        self.client = Client(self.wsgi_app, Response)
+
+    def test_success(self):
+        response = self.request()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, self.mimetype)
+        self.assertEqual(
+            response.headers.get("content-disposition"),
+            "attachment; filename=%s" % quote_header_value(self.filename))
+        self.assertTupleEqual(response.get_etag(), (self.digest, False))
+        self.assertEqual(response.headers.get("X-Accel-Redirect"),
+                         "/cms-files/" + self.digest)
+        self.assertEqual(response.get_data(), b"")
+
+        self.file_cacher.get_cached_path.assert_called_once_with(
+            self.digest)
+        self.file_cacher.get_file.assert_not_called()
+
+    def test_no_prefix(self):
+        self.set_middleware("X-Sendfile", None)
+
+        response = self.request()
+
+        self.assertEqual(response.headers.get("X-Sendfile"), self.path)
+
+    def test_not_kept_in_cache(self):
+        self.file_cacher.get_cached_path.return_value = None
+
+        response = self.request()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("X-Accel-Redirect", response.headers)
+        self.assertEqual(response.get_data(), self.content)
+
+    def test_not_found(self):
+        self.file_cacher.get_cached_path.side_effect = KeyError()
+
+        response = self.request()
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_tombstone(self):
+        self.file_cacher.get_cached_path.side_effect = TombstoneError()
+
+        response = self.request()
+
+        self.assertEqual(response.status_code, 503)
+
+    def test_conditional_request(self):
+        response = self.request(headers=[("If-None-Match", self.digest)])
+        self.assertEqual(response.status_code, 304)
+        self.assertNotIn("X-Accel-Redirect", response.headers)
+
+    def test_conditional_request_no_match(self):
+        response = self.request(headers=[("If-None-Match", "not the etag")])
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("X-Accel-Redirect", response.headers)
+
+    def test_range_request(self):
+        # Left to the proxy.
+        response = self.request(headers=[("Range", "bytes=256-767")])
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("X-Accel-Redirect", response.headers)
+
+    test_range_request_end_overflows = test_range_request
+    test_range_request_start_overflows = test_range_request
+
+
+class TestWSGIHandler(unittest.TestCase):
+    """Tests for the files sent by the server with sendfile."""
+
+    def setUp(self):
+        # Larger than the buffers of the sockets, so that sendfile has
+        # to wait for the client to read.
+        self.content = os.urandom(4 * 1024 * 1024)
+        with tempfile.NamedTemporaryFile(delete=False) as f:
+            f.write(self.content)
+        self.path = f.name
+
+        file_cacher = Mock()
+        file_cacher.get_file = Mock(
+            side_effect=lambda digest: open(self.path, "rb"))
+        file_cacher.get_size = Mock(return_value=len(self.content))
+        self.server = pywsgi.WSGIServer(
+            ("127.0.0.1", 0),
+            FileServerMiddleware(file_cacher, self.wrapped_wsgi_app),
+            handler_class=WSGIHandler, log=None)
+        self.server.start()
+
+    def tearDown(self):
+        self.server.stop()
+        os.remove(self.path)
+
+    @responder
+    def wrapped_wsgi_app(self, environ, start_response):
+        return Response(
+            headers={FileServerMiddleware.DIGEST_HEADER: "digest"})
+
+    def get(self, headers=b""):
+        """Return the headers and the body of the response."""
+        sock = gevent.socket.create_connection(self.server.address)
+        try:
+            sock.sendall(b"GET / HTTP/1.0\r\n" + headers + b"\r\n")
+            data = b""
+            while True:
+                chunk = sock.recv(64 * 1024)
+                if not chunk:
+                    break
+                data += chunk
+        finally:
+            sock.close()
+        headers, _, body = data.partition(b"\r\n\r\n")
+        return headers, body
+
+    def test_sendfile(self):
+        with patch("os.sendfile", wraps=os.sendfile) as sendfile:
+            headers, body = self.get()
+        self.assertTrue(headers.startswith(b"HTTP/1.1 200 "))
+        self.assertIn(b"Content-Length: %d" % len(self.content), headers)
+        self.assertEqual(body, self.content)
+        sendfile.assert_called()
+
+    def test_range_request(self):
+        with patch("os.sendfile", wraps=os.sendfile) as sendfile:
+            headers, body = self.get(b"Range: bytes=256-767\r\n")
+        self.assertTrue(headers.startswith(b"HTTP/1.1 206 "))
+        self.assertEqual(body, self.content[256:768])
+        sendfile.assert_not_called()
+
+
 if __name__ == "__main__":
     unittest.main()
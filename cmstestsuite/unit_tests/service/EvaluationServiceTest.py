@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for the evaluation service.
+
+"""
+
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import Mock, patch
+
+# Needs to be first to allow for monkey patching the DB connection string.
+from cmstestsuite.unit_tests.databasemixin import DatabaseMixin
+
+from cms import config
+from cms.db import Evaluation, SubmissionResult
+from cms.grading.Job import CompilationJob, EvaluationJob
+from cms.grading.scoretypes import SCORE_TYPES
+from cms.grading.scoretypes.GroupMin import GroupMin
+from cms.service.EvaluationService import EvaluationExecutor, \
+    EvaluationService, Result
+from cms.service.esoperations import ESOperation
+
+
+class TestWriteResults(DatabaseMixin, unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+
+        self.contest = self.add_contest()
+        self.participation = self.add_participation(contest=self.contest)
+        self.task = self.add_task(contest=self.contest)
+        self.dataset = self.add_dataset(task=self.task)
+        self.task.active_dataset = self.dataset
+        self.testcases = [self.add_testcase(self.dataset) for _ in range(3)]
+        self.session.commit()
+
+        patcher = patch("cms.io.triggeredservice.TriggeredService"
+                        ".start_sweeper")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.service = EvaluationService(0)
+        self.service.scoring_service = Mock()
+
+    def tearDown(self):
+        self.session.close()
+        self.delete_data()
+        super().tearDown()
+
+    def add_compiled_submission(self):
+        submission, results = self.add_submission_with_results(
+            self.task, self.participation, True)
+        self.session.commit()
+        return submission, results[0]
+
+    def evaluation_result(self, submission, testcase, success=True,
+                          outcome="1.0"):
+        operation = ESOperation(ESOperation.EVALUATION, submission.id,
+                                self.dataset.id, testcase.codename)
+        job = EvaluationJob(operation=operation, success=success,
+                            outcome=outcome, text=["Output is correct"],
+                            plus={"execution_time": 0.1}, shard=0,
+                            sandboxes=["/tmp/sandbox"])
+        return operation, Result(job, success)
+
+    def evaluations(self, submission_result):
+        self.session.expire_all()
+        return self.session.query(Evaluation)\
+            .filter(Evaluation.submission_id ==
+                    submission_result.submission_id)\
+            .filter(Evaluation.dataset_id == submission_result.dataset_id)\
+            .all()
+
+    def test_complete_evaluation(self):
+        """All testcases are evaluated, the result is finalized."""
+        submission, sr = self.add_compiled_submission()
+
+        self.service.write_results([
+            self.evaluation_result(submission, testcase)
+            for testcase in self.testcases])
+
+        evaluations = self.evaluations(sr)
+        self.assertCountEqual([e.testcase_id for e in evaluations],
+                              [t.id for t in self.testcases])
+        for evaluation in evaluations:
+            self.assertEqual(evaluation.outcome, "1.0")
+            self.assertEqual(evaluation.text, ["Output is correct"])
+            self.assertEqual(evaluation.execution_time, 0.1)
+            self.assertEqual(evaluation.evaluation_sandbox, "/tmp/sandbox")
+        self.assertTrue(sr.evaluated())
+        self.service.scoring_service.new_evaluation.assert_called_once_with(
+            submission_id=submission.id, dataset_id=self.dataset.id)
+
+    def test_partial_evaluation(self):
+        """Only some testcases are evaluated, the result is not final."""
+        submission, sr = self.add_compiled_submission()
+
+        self.service.write_results([
+            self.evaluation_result(submission, self.testcases[0])])
+
+        self.assertEqual(len(self.evaluations(sr)), 1)
+        self.assertFalse(sr.evaluated())
+        self.service.scoring_service.new_evaluation.assert_not_called()
+
+    def test_many_submissions(self):
+        """Results for many submissions are written together."""
+        submissions = [self.add_compiled_submission() for _ in range(5)]
+
+        self.service.write_results([
+            self.evaluation_result(submission, testcase)
+            for submission, _ in submissions
+            for testcase in self.testcases])
+
+        for _, sr in submissions:
+            self.assertEqual(len(self.evaluations(sr)), 3)
+            self.assertTrue(sr.evaluated())
+        self.assertEqual(
+            self.service.scoring_service.new_evaluation.call_count, 5)
+
+    def test_existing_evaluation(self):
+        """A result for an evaluated testcase is ignored."""
+        submission, sr = self.add_compiled_submission()
+        self.add_evaluation(sr, self.testcases[0])
+        self.session.commit()
+
+        self.service.write_results([
+            self.evaluation_result(submission, testcase)
+            for testcase in self.testcases])
+
+        self.assertEqual(len(self.evaluations(sr)), 3)
+        self.assertTrue(sr.evaluated())
+
+    def test_failed_evaluation(self):
+        """A failed evaluation increases the tries and writes nothing."""
+        submission, sr = self.add_compiled_submission()
+
+        self.service.write_results([
+            self.evaluation_result(submission, self.testcases[0],
+                                   success=False)])
+
+        self.assertEqual(len(self.evaluations(sr)), 0)
+        self.assertEqual(sr.evaluation_tries, 1)
+
+    def test_short_circuit_evaluation(self):
+        """The testcases that cannot change the score are skipped."""
+        self.dataset.score_type = "GroupMin"
+        self.dataset.score_type_parameters = [[40, 1], [60, 2]]
+        self.session.commit()
+        testcases = sorted(self.testcases, key=lambda t: t.codename)
+        submission, sr = self.add_compiled_submission()
+        skipped_operation = ESOperation(ESOperation.EVALUATION, submission.id,
+                                        self.dataset.id, testcases[2].codename)
+        self.service.enqueue(skipped_operation, 0, None)
+
+        with patch.object(config, "short_circuit_evaluation", True), \
+                patch.dict(SCORE_TYPES, {"GroupMin": GroupMin}):
+            self.service.write_results([
+                self.evaluation_result(submission, testcases[0]),
+                self.evaluation_result(submission, testcases[1],
+                                       outcome="0.0")])
+
+        evaluations = {e.testcase_id: e for e in self.evaluations(sr)}
+        self.assertEqual(len(evaluations), 3)
+        self.assertFalse(evaluations[testcases[1].id].skipped())
+        self.assertTrue(evaluations[testcases[2].id].skipped())
+        self.assertEqual(evaluations[testcases[2].id].text,
+                         ["Not evaluated"])
+        self.assertTrue(sr.evaluated())
+        self.assertNotIn(skipped_operation, self.service.get_executor())
+        self.service.scoring_service.new_evaluation.assert_called_once_with(
+            submission_id=submission.id, dataset_id=self.dataset.id)
+
+    def test_short_circuit_evaluation_disabled(self):
+        """Without short-circuit evaluation, nothing is skipped."""
+        self.dataset.score_type = "GroupMin"
+        self.dataset.score_type_parameters = [[40, 1], [60, 2]]
+        self.session.commit()
+        testcases = sorted(self.testcases, key=lambda t: t.codename)
+        submission, sr = self.add_compiled_submission()
+
+        self.service.write_results([
+            self.evaluation_result(submission, testcases[1], outcome="0.0")])
+
+        self.assertEqual(len(self.evaluations(sr)), 1)
+        self.assertFalse(sr.evaluated())
+
+    def test_compilation(self):
+        """A compilation creates the submission result."""
+        submission = self.add_submission(self.task, self.participation)
+        self.session.commit()
+        operation = ESOperation(ESOperation.COMPILATION, submission.id,
+                                self.dataset.id)
+        job = CompilationJob(operation=operation, success=True,
+                             compilation_success=False, text=["Failed"],
+                             plus={}, shard=0, sandboxes=[])
+
+        self.service.write_results([(operation, Result(job, True))])
+
+        self.session.expire_all()
+        sr = SubmissionResult.get_from_id(
+            (submission.id, self.dataset.id), self.session)
+        self.assertIsNotNone(sr)
+        self.assertTrue(sr.compilation_failed())
+
+
+
+class TestMissingOperations(DatabaseMixin, unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+
+        self.contest = self.add_contest()
+        self.participation = self.add_participation(contest=self.contest)
+        self.task = self.add_task(contest=self.contest)
+        self.dataset = self.add_dataset(task=self.task)
+        self.task.active_dataset = self.dataset
+        self.session.commit()
+
+        patcher = patch("cms.io.triggeredservice.TriggeredService"
+                        ".start_sweeper")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.service = EvaluationService(0)
+
+    def tearDown(self):
+        self.session.close()
+        self.delete_data()
+        super().tearDown()
+
+    def add_uncompiled_submission(self):
+        submission = self.add_submission(self.task, self.participation)
+        self.session.commit()
+        return submission
+
+    def sweep(self):
+        """Run a sweep, return the number of operations it enqueued."""
+        return self.service._missing_operations()
+
+    def test_full_then_incremental(self):
+        s1 = self.add_uncompiled_submission()
+        s2 = self.add_uncompiled_submission()
+
+        self.assertEqual(self.sweep(), 2)
+        self.assertTrue(self.service._last_sweep_status["full"])
+        self.assertEqual(
+            self.service._last_sweep_status["submissions_in_window"], 2)
+        self.assertEqual(self.service._sweep_min_submission_id, s1.id)
+
+        # The operations are already in the queue.
+        self.assertEqual(self.sweep(), 0)
+        self.assertFalse(self.service._last_sweep_status["full"])
+
+        # Once s1 has nothing left to do, the window starts at s2.
+        self.add_submission_result(s1, self.dataset).set_compilation_outcome(
+            False)
+        self.session.commit()
+        self.sweep()
+        self.assertEqual(self.service._sweep_min_submission_id, s2.id)
+        self.assertEqual(
+            self.service._last_sweep_status["submissions_in_window"], 2)
+        self.sweep()
+        self.assertEqual(
+            self.service._last_sweep_status["submissions_in_window"], 1)
+
+    def test_holding_object_released(self):
+        s1 = self.add_uncompiled_submission()
+        for _ in range(EvaluationService.MAX_SWEEP_HOLDS):
+            self.sweep()
+            self.assertEqual(self.service._sweep_min_submission_id, s1.id)
+
+        # s1 keeps having operations: it is left to the full sweeps.
+        self.sweep()
+        self.assertEqual(self.service._sweep_min_submission_id, s1.id + 1)
+        s2 = self.add_uncompiled_submission()
+        self.assertEqual(self.sweep(), 1)
+        self.assertEqual(
+            self.service._last_sweep_status["submissions_in_window"], 1)
+        self.assertEqual(self.service._sweep_min_submission_id, s2.id)
+
+        # A full sweep still finds it, but it does not hold the mark.
+        self.service.search_operations_not_done()
+        self.sweep()
+        self.assertTrue(self.service._last_sweep_status["full"])
+        self.assertEqual(self.service._sweep_min_submission_id, s2.id)
+
+    def test_lower_low_water_mark(self):
+        s1 = self.add_uncompiled_submission()
+        for _ in range(EvaluationService.MAX_SWEEP_HOLDS + 1):
+            self.sweep()
+        self.assertGreater(self.service._sweep_min_submission_id, s1.id)
+
+        # Invalidated submissions are looked at again, and hold the
+        # mark as new ones.
+        self.service._lower_sweep_low_water_mark([s1.id])
+        self.assertEqual(self.service._sweep_min_submission_id, s1.id)
+        self.sweep()
+        self.assertEqual(self.service._sweep_min_submission_id, s1.id)
+
+    def test_periodic_full_sweep(self):
+        self.add_uncompiled_submission()
+        full_sweeps = []
+        for i in range(2 * EvaluationService.FULL_SWEEP_EVERY):
+            self.sweep()
+            if self.service._last_sweep_status["full"]:
+                full_sweeps.append(i)
+        self.assertEqual(full_sweeps,
+                         [0, EvaluationService.FULL_SWEEP_EVERY])
+
+
+class TestQueueStatus(unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.executor = EvaluationExecutor(Mock())
+        self.time = datetime(2020, 1, 1)
+
+    def enqueue(self, submission_id, codename, priority):
+        self.time += timedelta(seconds=1)
+        operation = ESOperation(ESOperation.EVALUATION, submission_id, 1,
+                                codename)
+        self.executor.enqueue(operation, priority, self.time)
+        return operation
+
+    def page(self, offset=0, limit=None):
+        return [(entry["item"]["object_id"], entry["item"]["multiplicity"],
+                 entry["priority"])
+                for entry in self.executor.get_cumulative_status(offset,
+                                                                 limit)]
+
+    def test_collected_in_order(self):
+        first = self.enqueue(1, "a", 2)
+        self.enqueue(2, "a", 2)
+        self.enqueue(1, "b", 2)
+        self.enqueue(3, "a", 1)
+        self.enqueue(1, "c", 3)
+
+        self.assertEqual(self.page(), [(3, 1, 1), (1, 2, 2), (2, 1, 2),
+                                       (1, 1, 3)])
+        self.assertEqual(self.page(1, 2), [(1, 2, 2), (2, 1, 2)])
+        self.assertEqual(self.page(3, 10), [(1, 1, 3)])
+
+        self.executor.dequeue(first)
+        self.assertEqual(self.page(1, 1), [(1, 1, 2)])
+        self.executor.dequeue(ESOperation(ESOperation.EVALUATION, 1, 1, "b"))
+        self.assertEqual(self.page(), [(3, 1, 1), (2, 1, 2), (1, 1, 3)])
+        self.assertEqual(len(self.executor.queue_status_cumulative), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
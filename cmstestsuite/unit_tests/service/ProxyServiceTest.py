@@ -25,15 +25,18 @@
 import gevent.monkey
 gevent.monkey.patch_all()  # noqa
 
+import gzip
+import json
 import unittest
-from unittest.mock import patch, PropertyMock
+from unittest.mock import Mock, patch, PropertyMock
 
 import gevent
+import requests.exceptions
 
 # Needs to be first to allow for monkey patching the DB connection string.
 from cmstestsuite.unit_tests.databasemixin import DatabaseMixin
 
-from cms.service.ProxyService import ProxyService
+from cms.service.ProxyService import ProxyExecutor, ProxyService
 from cmscommon.constants import SCORE_MODE_MAX
 
 
@@ -49,7 +52,7 @@ class TestProxyService(DatabaseMixin, unittest.TestCase):
         self.score_type.max_score = 100
         self.score_type.ranking_headers = ["100"]
 
-        patcher = patch("requests.put")
+        patcher = patch("requests.Session.put")
         self.requests_put = patcher.start()
         self.addCleanup(patcher.stop)
         self.requests_put.return_value.status_code = 200
@@ -94,13 +97,39 @@ class TestProxyService(DatabaseMixin, unittest.TestCase):
         result.ranking_score_details = ["100"]
         return result
 
+    def sent_types(self):
+        """Return the entity types sent to the bulk endpoint, in order."""
+        types = []
+        for args, kwargs in self.requests_put.call_args_list:
+            self.assertTrue(args[0].endswith("bulk/"))
+            self.assertEqual(kwargs["headers"]["content-encoding"], "gzip")
+            types.extend(name for name, _ in
+                         json.loads(gzip.decompress(kwargs["data"])))
+        return types
+
     def test_startup(self):
         """Test that data is sent in the right order at startup."""
         ProxyService(0, self.contest.id)
 
         gevent.sleep(0.1)
 
-        urls = [args[0] for args, _ in self.requests_put.call_args_list]
+        types = self.sent_types()
+        self.assertEqual(types[0], "contests")
+        self.assertCountEqual(types[1:4], ["users", "teams", "tasks"])
+        self.assertEqual(types[4:6], ["submissions", "subchanges"])
+
+    def test_startup_no_bulk(self):
+        """Test the data sent to a ranking without bulk endpoint."""
+        def put(url, **kwargs):
+            return Mock(status_code=404 if url.endswith("bulk/") else 200)
+        self.requests_put.side_effect = put
+
+        ProxyService(0, self.contest.id)
+
+        gevent.sleep(0.1)
+
+        urls = [args[0] for args, _ in self.requests_put.call_args_list
+                if not args[0].endswith("bulk/")]
 
         self.assertTrue(urls[0].endswith("contests/"))
         self.assertTrue(any(urls[i].endswith("users/") for i in [1, 2, 3]))
@@ -109,6 +138,40 @@ class TestProxyService(DatabaseMixin, unittest.TestCase):
         self.assertTrue(urls[4].endswith("submissions/"))
         self.assertTrue(urls[5].endswith("subchanges/"))
 
+    @patch.object(ProxyExecutor, "MIN_FAILURE_WAIT", 0.01)
+    def test_retry(self):
+        """Test that data is sent again after a failure."""
+        self.requests_put.side_effect = [
+            requests.exceptions.ConnectionError(),
+            Mock(status_code=503)] + [Mock(status_code=200)] * 10
+
+        ProxyService(0, self.contest.id)
+
+        gevent.sleep(0.2)
+
+        types = self.sent_types()
+        # The first batch was sent three times.
+        self.assertEqual(types[0], "contests")
+        self.assertIn("subchanges", types)
+        self.assertEqual(types.count("contests"), 3)
+
+    @patch.object(ProxyExecutor, "MIN_FAILURE_WAIT", 0.01)
+    @patch.object(ProxyExecutor, "MAX_SERVER_ERRORS", 3)
+    def test_drop_after_server_errors(self):
+        """Test that data the ranking always fails on is dropped."""
+        self.requests_put.side_effect = \
+            [Mock(status_code=500)] * 3 + [Mock(status_code=200)] * 10
+
+        with self.assertLogs("cms.service.ProxyService", "ERROR") as logs:
+            ProxyService(0, self.contest.id)
+            gevent.sleep(0.2)
+
+        types = self.sent_types()
+        # The first batch was dropped, and the others sent.
+        self.assertEqual(types.count("contests"), 3)
+        self.assertIn("subchanges", types)
+        self.assertIn("contests %s" % self.contest.name, logs.output[0])
+
 
 if __name__ == "__main__":
     unittest.main()
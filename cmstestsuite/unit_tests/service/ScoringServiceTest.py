@@ -27,14 +27,16 @@ import gevent.monkey
 gevent.monkey.patch_all()  # noqa
 
 import unittest
-from unittest.mock import patch, PropertyMock
+from unittest.mock import Mock, patch, PropertyMock
 
 import gevent
 
 # Needs to be first to allow for monkey patching the DB connection string.
 from cmstestsuite.unit_tests.databasemixin import DatabaseMixin
 
-from cms.service.ScoringService import ScoringService
+from cms.io import QueueEntry
+from cms.service.ScoringService import ScoringExecutor, ScoringService
+from cms.service.scoringoperations import ScoringOperation
 from cmstestsuite.unit_tests.testidgenerator import unique_long_id, \
     unique_unicode_id
 
@@ -136,6 +138,45 @@ class TestScoringService(DatabaseMixin, unittest.TestCase):
         # Asserts that compute_score was called.
         self.score_type.compute_score.assert_not_called()
 
+    def test_new_evaluation_batch_notifies_once(self):
+        """A batch of results on the active dataset is notified at once.
+
+        """
+        srs = [self.new_sr_to_score() for _ in range(3)]
+        for sr in srs:
+            sr.submission.task.active_dataset = sr.dataset
+        self.session.commit()
+
+        proxy_service = Mock()
+        executor = ScoringExecutor(proxy_service)
+        executor.execute([
+            QueueEntry(ScoringOperation(sr.submission_id, sr.dataset_id),
+                       None, None, i)
+            for i, sr in enumerate(srs)])
+
+        proxy_service.submissions_scored.assert_called_once()
+        self.assertCountEqual(
+            proxy_service.submissions_scored.call_args[1]["submission_ids"],
+            [sr.submission_id for sr in srs])
+
+    def test_new_evaluation_missing_does_not_block(self):
+        """A missing result does not prevent scoring the others.
+
+        """
+        sr = self.new_sr_to_score()
+        self.session.commit()
+
+        service = ScoringService(0)
+        service.new_evaluation(unique_long_id(), sr.dataset_id)
+        service.new_evaluation(sr.submission_id, sr.dataset_id)
+
+        gevent.sleep(0.1)  # Needed to trigger the score loop.
+
+        self.assertCountEqual(self.call_args,
+                              [(sr.submission_id, sr.dataset_id)])
+        self.session.expire(sr)
+        self.assertEqual(sr.score, self.score_info[0])
+
 
 if __name__ == "__main__":
     unittest.main()
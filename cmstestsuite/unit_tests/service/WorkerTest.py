@@ -22,10 +22,13 @@
 """
 
 import unittest
-from unittest.mock import Mock, call
+from unittest.mock import MagicMock, Mock, call, patch
 
 import gevent
 
+# Needs to be first to allow for monkey patching the DB connection string.
+from cmstestsuite.unit_tests.databasemixin import DatabaseMixin
+
 import cms.service.Worker
 from cms.grading import JobException
 from cms.grading.Job import JobGroup, EvaluationJob
@@ -129,6 +132,7 @@ class TestWorker(unittest.TestCase):
         cms.service.Worker.get_task_type.assert_has_calls(calls_b)
         self.assertEquals(task_type_b.call_count, n_jobs_b)
 
+    @patch("cms.service.Worker.config.worker_prefetch_depth", 0)
     def test_execute_job_subsequent_locked(self):
         """Executes a long job, then another one that should fail
         because of the lock.
@@ -159,6 +163,39 @@ class TestWorker(unittest.TestCase):
                          cms.service.Worker.get_task_type.mock_calls)
         cms.service.Worker.get_task_type.assert_has_calls(calls_a)
 
+    @patch("cms.service.Worker.config.worker_prefetch_depth", 1)
+    def test_execute_job_subsequent_queued(self):
+        """Executes a long job, then another one that waits for the
+        first, then a third one that should fail because the queue is
+        full.
+
+        """
+        task_type = FakeTaskType([0.01, 0.01])
+        cms.service.Worker.get_task_type = Mock(return_value=task_type)
+
+        jobs_a, calls_a = TestWorker.new_jobs(1, prefix="a")
+        jobs_b, calls_b = TestWorker.new_jobs(1, prefix="b")
+        jobs_c, calls_c = TestWorker.new_jobs(1, prefix="c")
+
+        def call(jobs):
+            job_group = JobGroup([jobs[0]])
+            return JobGroup.import_from_dict(
+                self.service.execute_job_group(job_group.export_to_dict()))
+
+        first_greenlet = gevent.spawn(call, jobs_a)
+        gevent.sleep(0)  # To ensure we call jobgroup_a first.
+        second_greenlet = gevent.spawn(call, jobs_b)
+        gevent.sleep(0)  # To ensure jobgroup_b is queued.
+
+        with self.assertRaises(JobException):
+            call(jobs_c)
+
+        self.assertTrue(first_greenlet.get().jobs[0].success)
+        self.assertTrue(second_greenlet.get().jobs[0].success)
+        self.assertNotIn(calls_c[0],
+                         cms.service.Worker.get_task_type.mock_calls)
+        cms.service.Worker.get_task_type.assert_has_calls(calls_a + calls_b)
+
     def test_execute_job_failure_releases_lock(self):
         """After a failure, the worker should be able to accept another job.
 
@@ -283,6 +320,89 @@ class TestWorker(unittest.TestCase):
         return job_groups, calls
 
 
+class TestWorkerPrecache(DatabaseMixin, unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.contest = self.add_contest()
+        participation = self.add_participation(contest=self.contest)
+        self.files = []
+        for _ in range(2):
+            task = self.add_task(contest=self.contest)
+            dataset = self.add_dataset(task=task)
+            task.active_dataset = dataset
+            manager = self.add_manager(dataset)
+            testcase = self.add_testcase(dataset)
+            self.files.append(
+                [manager.digest, testcase.input, testcase.output])
+        # The second task received a submission, so its files are
+        # needed first.
+        self.add_submission(task, participation)
+        self.session.commit()
+
+        self.service = Worker(0)
+        self.file_cacher = MagicMock()
+        self.service.file_cacher = self.file_cacher
+
+    def cached_files(self):
+        return [args[0] for args, unused_kwargs
+                in self.file_cacher.cache_file.call_args_list]
+
+    def wait_precache(self):
+        while self.service.precache_status()["state"] != "done":
+            gevent.sleep(0.01)
+
+    def test_priority(self):
+        """The files of the last submitted task are cached first."""
+        self.service.precache_files(self.contest.id)
+        status = self.service.precache_status()
+        self.assertTrue(status["ready"])
+        self.assertCountEqual(self.cached_files()[:3], self.files[1])
+        self.assertCountEqual(self.cached_files()[3:6], self.files[0])
+
+        self.wait_precache()
+        status = self.service.precache_status()
+        self.assertEqual(status["done"], status["total"])
+        self.assertEqual(len(self.cached_files()), status["total"])
+        self.file_cacher.pin.assert_called_once_with(
+            set(self.files[0][1:] + self.files[1][1:]))
+
+    def test_missing_file(self):
+        """Files that cannot be found do not stop the precaching."""
+        self.file_cacher.cache_file.side_effect = KeyError()
+        self.service.precache_files(self.contest.id)
+        self.wait_precache()
+        status = self.service.precache_status()
+        self.assertEqual(status["done"], status["total"])
+
+    def test_other_worker(self):
+        """Another worker precaching in the same cache does the work."""
+        self.file_cacher.precache_lock.return_value = None
+        self.file_cacher.is_cached.return_value = True
+        self.service.precache_files(self.contest.id)
+        status = self.service.precache_status()
+        self.assertTrue(status["ready"])
+        self.assertEqual(status["state"], "done")
+        self.file_cacher.cache_file.assert_not_called()
+
+    @patch.object(Worker, "PRECACHE_WAIT", 0)
+    def test_other_worker_stops(self):
+        """The worker precaches if the other worker stops too early."""
+        self.file_cacher.precache_lock.side_effect = [None, MagicMock()]
+        self.file_cacher.is_cached.return_value = False
+        self.service.precache_files(self.contest.id)
+        self.wait_precache()
+        self.assertCountEqual(self.cached_files()[:3], self.files[1])
+
+    def test_lock_released_on_error(self):
+        """The lock is released if the precaching fails to start."""
+        self.file_cacher.pin.side_effect = OSError()
+        with self.assertRaises(OSError):
+            self.service.precache_files(self.contest.id)
+        lock = self.file_cacher.precache_lock.return_value
+        lock.close.assert_called_once_with()
+
+
 class FakeTaskType:
     def __init__(self, execute_results):
         self.execute_results = execute_results
@@ -27,8 +27,9 @@ import unittest
 from cmstestsuite.unit_tests.databasemixin import DatabaseMixin
 
 from cms.io.priorityqueue import PriorityQueue
-from cms.service.esoperations import ESOperation, get_submissions_operations, \
-    get_user_tests_operations
+from cms.service.esoperations import ESOperation, \
+    get_submissions_operations, get_submissions_window, \
+    get_user_tests_operations, get_user_tests_window
 
 
 class TestESOperations(DatabaseMixin, unittest.TestCase):
@@ -240,6 +241,46 @@ class TestESOperations(DatabaseMixin, unittest.TestCase):
             set(get_submissions_operations(self.session, self.contest.id)),
             expected_operations)
 
+    def test_get_submissions_operations_min_submission_id(self):
+        """Test that submissions before the window are ignored."""
+        old_submission = self.add_submission(self.tasks[0], self.participation)
+        submission = self.add_submission(self.tasks[0], self.participation)
+        self.session.flush()
+        self.assertLess(old_submission.id, submission.id)
+
+        expected_operations = set(
+            self.submission_compilation_operation(submission, dataset)
+            for dataset in submission.task.datasets if self.to_judge(dataset))
+
+        self.assertEqual(
+            set(get_submissions_operations(
+                self.session, self.contest.id, submission.id)),
+            expected_operations)
+
+    def test_get_submissions_window(self):
+        """Test the size and upper end of a window of submissions."""
+        # A submission for a different contest.
+        self.add_submission()
+        self.assertEqual(
+            get_submissions_window(self.session, self.contest.id),
+            (0, None))
+
+        old_submission = self.add_submission(self.tasks[0], self.participation)
+        submission = self.add_submission(self.tasks[1], self.participation)
+        self.session.flush()
+
+        self.assertEqual(
+            get_submissions_window(self.session, self.contest.id),
+            (2, submission.id))
+        self.assertEqual(
+            get_submissions_window(
+                self.session, self.contest.id, old_submission.id + 1),
+            (1, submission.id))
+        self.assertEqual(
+            get_submissions_window(
+                self.session, self.contest.id, submission.id + 1),
+            (0, None))
+
     def submission_compilation_operation(
             self, submission, dataset, result=None):
         active_priority = PriorityQueue.PRIORITY_HIGH \
@@ -395,6 +436,35 @@ class TestESOperations(DatabaseMixin, unittest.TestCase):
             set(get_user_tests_operations(self.session, self.contest.id)),
             expected_operations)
 
+    def test_get_user_tests_operations_min_user_test_id(self):
+        """Test that user tests before the window are ignored."""
+        old_user_test = self.add_user_test(self.tasks[0], self.participation)
+        user_test = self.add_user_test(self.tasks[0], self.participation)
+        self.session.flush()
+        self.assertLess(old_user_test.id, user_test.id)
+
+        expected_operations = set(
+            self.user_test_compilation_operation(user_test, dataset)
+            for dataset in user_test.task.datasets if self.to_judge(dataset))
+
+        self.assertEqual(
+            set(get_user_tests_operations(
+                self.session, self.contest.id, user_test.id)),
+            expected_operations)
+
+    def test_get_user_tests_window(self):
+        """Test the size and upper end of a window of user tests."""
+        user_test = self.add_user_test(self.tasks[0], self.participation)
+        self.session.flush()
+
+        self.assertEqual(
+            get_user_tests_window(self.session, self.contest.id),
+            (1, user_test.id))
+        self.assertEqual(
+            get_user_tests_window(
+                self.session, self.contest.id, user_test.id + 1),
+            (0, None))
+
     def user_test_compilation_operation(self, user_test, dataset, result=None):
         active_priority = PriorityQueue.PRIORITY_HIGH \
             if result is None or result.compilation_tries == 0 \
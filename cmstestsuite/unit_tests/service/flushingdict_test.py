@@ -22,7 +22,7 @@ import unittest
 
 import gevent
 
-from cms.service.flushingdict import FlushingDict
+from cms.service.flushingdict import FlushingDict, Histogram
 
 
 class TestFlushingDict(unittest.TestCase):
@@ -95,6 +95,45 @@ class TestFlushingDict(unittest.TestCase):
         gevent.sleep(TestFlushingDict.FLUSH_LATENCY_SECONDS + 0.1)
         self.assertCountEqual(expected_data, sum(self.received_data, []))
 
+    def test_adaptive_deadline(self):
+        # Flushes are slow, so it is worth waiting for more elements.
+        self.d.flush_duration = TestFlushingDict.FLUSH_LATENCY_SECONDS / 2
+        self.d.add(0, 0)
+        gevent.sleep(TestFlushingDict.FLUSH_LATENCY_SECONDS / 8)
+        self.d.add(1, 1)
+        self.assertEqual(0, len(self.received_data))
+        gevent.sleep(TestFlushingDict.FLUSH_LATENCY_SECONDS / 2)
+        self.assertEqual(1, len(self.received_data))
+        self.assertCountEqual([(0, 0), (1, 1)], self.received_data[0])
+
+    def test_latency_bound(self):
+        # Elements are flushed after the latency even if flushes are
+        # very slow, and even if other elements keep arriving.
+        self.d.flush_duration = 100 * TestFlushingDict.FLUSH_LATENCY_SECONDS
+        self.d.add(0, 0)
+        gevent.sleep(TestFlushingDict.FLUSH_LATENCY_SECONDS / 2)
+        self.d.add(1, 1)
+        gevent.sleep(TestFlushingDict.FLUSH_LATENCY_SECONDS / 2 + 0.1)
+        self.assertEqual(1, len(self.received_data))
+        self.assertCountEqual([(0, 0), (1, 1)], self.received_data[0])
+
+    def test_status(self):
+        self.d.flush_duration = TestFlushingDict.FLUSH_LATENCY_SECONDS
+        self.d.add(0, 0)
+        status = self.d.get_status()
+        self.assertEqual(1, status["pending"])
+        self.assertGreaterEqual(status["oldest"], 0)
+        self.assertEqual(0, status["latency"]["count"])
+
+        gevent.sleep(TestFlushingDict.FLUSH_LATENCY_SECONDS + 0.1)
+        status = self.d.get_status()
+        self.assertEqual(0, status["pending"])
+        self.assertIsNone(status["oldest"])
+        self.assertEqual(1, status["latency"]["count"])
+        self.assertGreaterEqual(status["latency"]["sum"],
+                                TestFlushingDict.FLUSH_LATENCY_SECONDS)
+        self.assertEqual(1, status["duration"]["count"])
+
     def callback(self, data):
         self.received_data.append(data)
 
@@ -103,5 +142,21 @@ class TestFlushingDict(unittest.TestCase):
         self.callback(data)
 
 
+class TestHistogram(unittest.TestCase):
+
+    def test_buckets(self):
+        histogram = Histogram()
+        for value in [0.001, 0.005, 0.3, 0.4, 100.0]:
+            histogram.observe(value)
+        status = histogram.get_status()
+        buckets = dict(status["buckets"])
+        self.assertEqual(2, buckets[0.005])
+        self.assertEqual(2, buckets[0.25])
+        self.assertEqual(4, buckets[0.5])
+        self.assertEqual(4, buckets[Histogram.BUCKETS[-1]])
+        self.assertEqual(5, status["count"])
+        self.assertAlmostEqual(100.706, status["sum"])
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for the worker pool."""
+
+import unittest
+from datetime import timedelta
+from unittest.mock import MagicMock, Mock, patch
+
+from cms import ServiceCoord
+from cms.service.workerpool import WorkerPool
+from cmscommon.datetime import make_datetime
+
+
+class TestWorkerPoolBase(unittest.TestCase):
+
+    NUM_WORKERS = 1
+
+    def setUp(self):
+        super().setUp()
+        # Building the job groups needs the DB.
+        for target in ["cms.service.workerpool.SessionGen",
+                       "cms.service.workerpool.JobGroup"]:
+            patcher = patch(target, MagicMock())
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.service = Mock(contest_id=None)
+        self.service.connect_to.side_effect = \
+            lambda *args, **kwargs: Mock(connected=True)
+        self.pool = WorkerPool(self.service)
+        self.coords = [ServiceCoord("Worker", shard)
+                       for shard in range(self.NUM_WORKERS)]
+        for coord in self.coords:
+            self.pool.add_worker(coord)
+        self.worker = self.pool._worker[0]
+
+    @staticmethod
+    def operations(n=2):
+        return [Mock() for _ in range(n)]
+
+    def finish(self, shard, operations):
+        """Call the callback given with the job group."""
+        for args, kwargs in \
+                self.pool._worker[shard].execute_job_group.call_args_list:
+            if kwargs["callback"].keywords["operations"] is operations:
+                return kwargs["callback"].func, kwargs["plus"]
+        self.fail("Job group not sent.")
+
+
+class TestWorkerPoolPrecaching(TestWorkerPoolBase):
+
+    def setUp(self):
+        super().setUp()
+        self.service.contest_id = 1
+
+    def test_not_ready_while_precaching(self):
+        """Operations are held back until the precaching finishes."""
+        self.pool.on_worker_connected(self.coords[0])
+        self.assertIsNone(self.pool.acquire_worker(self.operations()))
+        self.assertTrue(self.pool.get_status()["0"]["precaching"])
+
+        kwargs = self.worker.precache_files.call_args[1]
+        self.assertEqual(kwargs["contest_id"], 1)
+        kwargs["callback"](None, kwargs["plus"])
+        self.assertEqual(self.pool.acquire_worker(self.operations()), 0)
+        self.assertFalse(self.pool.get_status()["0"]["precaching"])
+
+    def test_ready_after_error(self):
+        """A worker failing to precache can still work."""
+        self.pool.on_worker_connected(self.coords[0])
+        kwargs = self.worker.precache_files.call_args[1]
+        kwargs["callback"](None, kwargs["plus"], error="Error")
+        self.assertEqual(self.pool.acquire_worker(self.operations()), 0)
+
+    def test_no_contest(self):
+        """Without a contest there is nothing to precache."""
+        self.service.contest_id = None
+        self.pool.on_worker_connected(self.coords[0])
+        self.worker.precache_files.assert_not_called()
+        self.assertEqual(self.pool.acquire_worker(self.operations()), 0)
+
+
+@patch("cms.service.workerpool.config.worker_prefetch_depth", 1)
+class TestWorkerPoolPrefetch(TestWorkerPoolBase):
+
+    def test_prefetch(self):
+        """Workers receive job groups until their window is full."""
+        first, second = self.operations(), self.operations()
+        self.assertEqual(self.pool.acquire_worker(first), 0)
+        start_time = self.pool._start_time[0]
+        self.assertEqual(self.pool.acquire_worker(second), 0)
+        self.assertIsNone(self.pool.acquire_worker(self.operations()))
+        self.assertEqual(self.pool._start_time[0], start_time)
+        for operation in first + second:
+            self.assertIn(operation, self.pool)
+
+        self.assertFalse(self.pool.release_worker(0, first))
+        for operation in first:
+            self.assertNotIn(operation, self.pool)
+        self.assertIsNotNone(self.pool._start_time[0])
+        self.assertEqual(self.pool.acquire_worker(self.operations()), 0)
+
+    def test_release(self):
+        """Workers become inactive when all their job groups finish."""
+        first, second = self.operations(), self.operations()
+        self.pool.acquire_worker(first)
+        self.pool.acquire_worker(second)
+        self.assertFalse(self.pool.release_worker(0, second))
+        self.assertFalse(self.pool.release_worker(0, first))
+        self.assertEqual(self.pool.find_worker(WorkerPool.WORKER_INACTIVE), 0)
+        self.assertIsNone(self.pool._start_time[0])
+
+    def test_callback(self):
+        """The job group finished is given to ES."""
+        operations = self.operations()
+        self.pool.acquire_worker(operations)
+        func, plus = self.finish(0, operations)
+        self.assertIs(func, self.service.action_finished)
+        self.assertEqual(plus, 0)
+
+    def test_ignore_operation(self):
+        """Ignored operations are returned with their job group."""
+        first, second = self.operations(), self.operations()
+        self.pool.acquire_worker(first)
+        self.pool.acquire_worker(second)
+        self.pool.ignore_operation(second[1])
+        self.assertFalse(self.pool.release_worker(0, first))
+        self.assertEqual(self.pool.release_worker(0, second), [second[1]])
+
+    def test_disable_worker(self):
+        """Disabling returns all operations, their results are ignored."""
+        first, second = self.operations(), self.operations()
+        self.pool.acquire_worker(first)
+        self.pool.acquire_worker(second)
+        self.pool.ignore_operation(first[0])
+        self.assertCountEqual(self.pool.disable_worker(0),
+                              first[1:] + second)
+        self.assertIs(self.pool.release_worker(0, first), True)
+        self.assertIs(self.pool.release_worker(0, second), True)
+        self.assertIsNone(self.pool.acquire_worker(self.operations()))
+
+        self.pool.enable_worker(0)
+        self.assertEqual(self.pool.acquire_worker(self.operations()), 0)
+
+    def test_check_timeouts(self):
+        """Workers not responding are disabled."""
+        first, second = self.operations(), self.operations()
+        self.pool.acquire_worker(first)
+        self.pool.acquire_worker(second)
+        self.assertEqual(self.pool.check_timeouts(), [])
+        self.pool._start_time[0] = \
+            make_datetime() - 2 * WorkerPool.WORKER_TIMEOUT
+        self.assertCountEqual(self.pool.check_timeouts(), first + second)
+        self.worker.quit.assert_called_once()
+        self.assertIs(self.pool.release_worker(0, first), True)
+        self.assertIsNone(self.pool.acquire_worker(self.operations()))
+
+    def test_check_timeouts_next_job_group(self):
+        """The timeout restarts when a job group finishes."""
+        first, second = self.operations(), self.operations()
+        self.pool.acquire_worker(first)
+        self.pool.acquire_worker(second)
+        self.pool._start_time[0] -= WorkerPool.WORKER_TIMEOUT \
+            - timedelta(seconds=1)
+        self.pool.release_worker(0, first)
+        self.assertEqual(self.pool.check_timeouts(), [])
+
+    def test_check_connections(self):
+        """Operations of disconnected workers are returned."""
+        first, second = self.operations(), self.operations()
+        self.pool.acquire_worker(first)
+        self.pool.acquire_worker(second)
+        self.worker.connected = False
+        self.assertCountEqual(self.pool.check_connections(), first + second)
+        self.assertIs(self.pool.release_worker(0, second), True)
+        self.worker.connected = True
+        self.assertEqual(self.pool.acquire_worker(self.operations()), 0)
+
+
+@patch("cms.service.workerpool.config.worker_prefetch_depth", 1)
+class TestWorkerPoolMany(TestWorkerPoolBase):
+
+    NUM_WORKERS = 3
+
+    def test_idle_first(self):
+        """Idle workers are preferred to prefetching."""
+        shards = [self.pool.acquire_worker(self.operations())
+                  for _ in range(3)]
+        self.assertCountEqual(shards, [0, 1, 2])
+        shards = [self.pool.acquire_worker(self.operations())
+                  for _ in range(3)]
+        self.assertCountEqual(shards, [0, 1, 2])
+        self.assertIsNone(self.pool.acquire_worker(self.operations()))
+
+    def test_no_prefetch(self):
+        """With no prefetch, only idle workers receive job groups."""
+        with patch("cms.service.workerpool.config.worker_prefetch_depth", 0):
+            for _ in range(3):
+                self.assertIsNotNone(
+                    self.pool.acquire_worker(self.operations()))
+            self.assertIsNone(self.pool.acquire_worker(self.operations()))
+
+
+if __name__ == "__main__":
+    unittest.main()